@@ -0,0 +1,128 @@
+"""
+Banco de pruebas de la generacion de Facturae en lote.
+
+Uso (desde la raiz del proyecto):
+
+    python Helpers/benchmark_facturae_lote.py
+    python Helpers/benchmark_facturae_lote.py --facturas 1000 --procesos 4
+
+Opciones:
+    --facturas N    facturas FACe sinteticas del lote (por defecto 1000)
+    --procesos N    procesos de trabajo de export_lote (por defecto segun CPU)
+
+Compara la exportacion factura a factura con FacturaeExporter.export frente a
+FacturaeExporter.export_lote. Todas las facturas van a una administracion
+publica con sus codigos DIR3 y se validan contra el XSD oficial.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.facturae import FacturaeExporter                                  # noqa: E402
+from services.facturae.facturae_exporter import procesos_facturae_por_defecto  # noqa: E402
+
+_EMISOR = {
+    "nombre": "Empresa Demo SL",
+    "nombre_legal": "Empresa Demo SL",
+    "nif": "B12345678",
+    "direccion": "Calle Mayor 1",
+    "cp": "28001",
+    "poblacion": "Madrid",
+    "provincia": "Madrid",
+    "pais": "ES",
+}
+_RECEPTOR = {
+    "nombre": "Ayuntamiento Demo",
+    "nombre_legal": "Ayuntamiento Demo",
+    "nif": "P2800000J",
+    "direccion": "Plaza Mayor 1",
+    "cp": "28002",
+    "poblacion": "Madrid",
+    "provincia": "Madrid",
+    "pais": "ES",
+}
+_RELACION = {
+    "facturae_es_administracion_publica": 1,
+    "facturae_dir3_oficina_contable": "L01280796",
+    "facturae_dir3_organo_gestor": "L01280796",
+    "facturae_dir3_unidad_tramitadora": "L01280796",
+    "facturae_referencia_expediente": "EXP-2026",
+}
+
+
+def factura_sintetica(i: int) -> dict:
+    lineas = []
+    for n in range(1 + i % 5):
+        base = float(50 + (i * 7 + n * 13) % 900)
+        pct = (21, 10, 4)[(i + n) % 3]
+        lineas.append({
+            "concepto": f"Servicio {n + 1} de la factura {i}",
+            "unidades": 1,
+            "precio": base,
+            "base": base,
+            "pct_iva": pct,
+            "cuota_iva": round(base * pct / 100, 2),
+            "pct_irpf": 0,
+            "cuota_irpf": 0,
+        })
+    return {
+        "serie": "FACE",
+        "numero": str(i + 1),
+        "fecha_asiento": "15/09/2026",
+        "fecha_expedicion": "15/09/2026",
+        "fecha_operacion": "15/09/2026",
+        "descripcion": "Servicios a la administracion",
+        "moneda_codigo": "EUR",
+        "lineas": lineas,
+        "retencion_aplica": 0,
+        "retencion_importe": 0.0,
+        "descuento_total_tipo": "",
+        "descuento_total_valor": 0.0,
+    }
+
+
+def trabajos_sinteticos(n: int, carpeta: str) -> list[tuple]:
+    return [
+        (factura_sintetica(i), _EMISOR, _RECEPTOR, os.path.join(carpeta, f"FACE_{i + 1}.xml"), _RELACION)
+        for i in range(n)
+    ]
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Rendimiento de la exportacion Facturae en lote")
+    ap.add_argument("--facturas", type=int, default=1000)
+    ap.add_argument("--procesos", type=int, default=procesos_facturae_por_defecto())
+    args = ap.parse_args()
+
+    exporter = FacturaeExporter()
+    with tempfile.TemporaryDirectory() as tmp:
+        trabajos = trabajos_sinteticos(max(1, args.facturas), tmp)
+        exporter.export(*trabajos[0])  # calentamiento: compila el XSD
+
+        inicio = time.perf_counter()
+        uno_a_uno = [exporter.export(*trabajo) for trabajo in trabajos]
+        t_uno = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        lote = exporter.export_lote(trabajos, procesos=args.procesos)
+        t_lote = time.perf_counter() - inicio
+
+    fallos = sum(not r.ok for r in uno_a_uno) + sum(not r.ok for r in lote)
+    n = len(trabajos)
+    print(f"{n} facturas FACe")
+    print(f"  export uno a uno:          {t_uno:7.2f} s ({n / t_uno:,.0f} facturas/s)")
+    print(f"  export_lote ({args.procesos} procesos):  {t_lote:7.2f} s ({n / t_lote:,.0f} facturas/s)")
+    if fallos:
+        print(f"  {fallos} facturas con errores")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
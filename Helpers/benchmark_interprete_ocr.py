@@ -0,0 +1,88 @@
+"""
+Banco de pruebas de InvoiceInterpreter sobre el corpus de textos OCR.
+
+Uso (desde la raiz del proyecto):
+
+    python Helpers/benchmark_interprete_ocr.py
+    python Helpers/benchmark_interprete_ocr.py --repeticiones 500 --corpus C:\\ruta\\textos
+
+Opciones:
+    --corpus DIR        carpeta con textos .txt anonimizados
+                        (por defecto tests/fixtures/ocr_textos)
+    --repeticiones N    veces que se interpreta cada texto (por defecto 200)
+    --detalle           muestra el tiempo medio de cada detector
+
+Cada repeticion añade una linea distinta al texto para que ninguna
+interpretacion reutilice el contexto preparado de la anterior.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.ocr import invoice_interpreter                         # noqa: E402
+from services.ocr.invoice_interpreter import InvoiceInterpreter      # noqa: E402
+
+_CORPUS_DEFECTO = Path(__file__).resolve().parent.parent / "tests" / "fixtures" / "ocr_textos"
+_DETECTORES = (
+    "_detectar_nif", "_detectar_nombre_proveedor", "_detectar_numero_factura",
+    "_detectar_fecha", "_detectar_fecha_vencimiento", "_detectar_total",
+    "_detectar_lineas_iva", "_detectar_retenciones", "_linea_iva_fallback",
+)
+
+
+def cargar_corpus(carpeta: Path) -> list[str]:
+    return [p.read_text(encoding="utf-8") for p in sorted(carpeta.glob("*.txt"))]
+
+
+def medir(textos: list[str], repeticiones: int) -> float:
+    """Facturas interpretadas por segundo."""
+    lote = [f"{texto}\n-- {i}" for i in range(repeticiones) for texto in textos]
+    interprete = InvoiceInterpreter()
+    inicio = time.perf_counter()
+    for texto in lote:
+        interprete.interpretar(texto)
+    return len(lote) / (time.perf_counter() - inicio)
+
+
+def medir_detectores(textos: list[str], repeticiones: int) -> dict[str, float]:
+    """Microsegundos medios por texto de cada detector, preparando el texto
+    en cada llamada como en una interpretacion aislada."""
+    resultados = {}
+    for nombre in _DETECTORES:
+        detector = getattr(invoice_interpreter, nombre)
+        inicio = time.perf_counter()
+        for i in range(repeticiones):
+            for texto in textos:
+                detector(f"{texto}\n-- {i}")
+        resultados[nombre] = (time.perf_counter() - inicio) * 1e6 / (repeticiones * len(textos))
+    return resultados
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Rendimiento de InvoiceInterpreter")
+    ap.add_argument("--corpus", type=Path, default=_CORPUS_DEFECTO)
+    ap.add_argument("--repeticiones", type=int, default=200)
+    ap.add_argument("--detalle", action="store_true")
+    args = ap.parse_args()
+
+    textos = cargar_corpus(args.corpus)
+    if not textos:
+        print(f"No hay textos .txt en {args.corpus}")
+        return 1
+    medir(textos, 5)  # calentamiento
+    velocidad = medir(textos, max(1, args.repeticiones))
+    print(f"{len(textos)} textos x {args.repeticiones}: {velocidad:,.0f} facturas/s")
+    if args.detalle:
+        for nombre, us in medir_detectores(textos, max(1, args.repeticiones // 4)).items():
+            print(f"  {nombre:<30} {us:8.1f} us")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
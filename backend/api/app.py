@@ -8,7 +8,7 @@ from pathlib import Path
 
 from fastapi import Depends, FastAPI, File, Form, HTTPException, Query, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, HTMLResponse, Response
+from fastapi.responses import FileResponse, HTMLResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from sqlalchemy import delete, select, text, update
@@ -356,10 +356,7 @@ _ALLOWED_OCR_MIMETYPES = {"application/pdf", "image/jpeg", "image/png", "image/t
 _MAX_OCR_BYTES = 20 * 1024 * 1024  # 20 MB
 
 
-@app.post("/api/v1/ocr/invoices/analyze", dependencies=[workstation_or_internal])
-async def ocr_analyze_invoice(
-    file: UploadFile = File(...),
-):
+async def _leer_fichero_ocr(file: UploadFile) -> bytes:
     content = await file.read()
     if len(content) > _MAX_OCR_BYTES:
         raise HTTPException(413, "El fichero supera el limite de 20 MB")
@@ -367,6 +364,14 @@ async def ocr_analyze_invoice(
     ext = Path(file.filename or "").suffix.lower()
     if ct not in _ALLOWED_OCR_MIMETYPES and ext not in {".pdf", ".jpg", ".jpeg", ".png", ".tif", ".tiff"}:
         raise HTTPException(415, "Tipo de fichero no admitido para OCR")
+    return content
+
+
+@app.post("/api/v1/ocr/invoices/analyze", dependencies=[workstation_or_internal])
+async def ocr_analyze_invoice(
+    file: UploadFile = File(...),
+):
+    content = await _leer_fichero_ocr(file)
     try:
         from backend.api.ocr_service import analyze_invoice
         result = analyze_invoice(content, file.filename or "documento.pdf")
@@ -377,6 +382,39 @@ async def ocr_analyze_invoice(
         raise HTTPException(502, "Error en el servicio OCR") from exc
 
 
+@app.post("/api/v1/ocr/invoices/batch", status_code=202, dependencies=[workstation_or_internal])
+async def ocr_batch_submit(files: list[UploadFile] = File(...)):
+    from backend.api.ocr_batch import crear_lote
+
+    ficheros = [(file.filename or "documento.pdf", await _leer_fichero_ocr(file)) for file in files]
+    try:
+        return crear_lote(ficheros)
+    except RuntimeError as exc:
+        raise HTTPException(503, str(exc)) from exc
+    except ValueError as exc:
+        raise HTTPException(422, str(exc)) from exc
+
+
+@app.get("/api/v1/ocr/invoices/batch/{job_id}", dependencies=[workstation_or_internal])
+def ocr_batch_status(job_id: str, desde: int = Query(0, ge=0)):
+    from backend.api.ocr_batch import estado_lote
+
+    estado = estado_lote(job_id, desde)
+    if estado is None:
+        raise HTTPException(404, "Lote OCR no encontrado o caducado")
+    return estado
+
+
+@app.get("/api/v1/ocr/invoices/batch/{job_id}/stream", dependencies=[workstation_or_internal])
+def ocr_batch_stream(job_id: str):
+    from backend.api.ocr_batch import flujo_lote
+
+    lineas = flujo_lote(job_id)
+    if lineas is None:
+        raise HTTPException(404, "Lote OCR no encontrado o caducado")
+    return StreamingResponse(lineas, media_type="application/x-ndjson", headers={"Cache-Control": "no-cache"})
+
+
 @app.post("/api/v1/integrations/signrequest/send", dependencies=[workstation_or_internal])
 async def integration_signrequest_send(
     file: UploadFile = File(...), firmantes: str = Form(...), asunto: str = Form(""),
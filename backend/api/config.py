@@ -53,6 +53,7 @@ class Settings:
     azure_doc_intelligence_endpoint: str
     azure_doc_intelligence_key: str
     azure_doc_intelligence_model_id: str
+    azure_doc_intelligence_concurrency: int
     azure_ocr_training_connection_string: str
     azure_ocr_training_container: str
 
@@ -135,6 +136,9 @@ def get_settings() -> Settings:
         azure_doc_intelligence_endpoint=os.getenv("AZURE_DOC_INTELLIGENCE_ENDPOINT", ""),
         azure_doc_intelligence_key=os.getenv("AZURE_DOC_INTELLIGENCE_KEY", ""),
         azure_doc_intelligence_model_id=os.getenv("AZURE_DOC_INTELLIGENCE_MODEL_ID", "prebuilt-invoice"),
+        azure_doc_intelligence_concurrency=max(
+            1, int(os.getenv("AZURE_DOC_INTELLIGENCE_CONCURRENCY", "4")),
+        ),
         azure_ocr_training_connection_string=os.getenv("AZURE_OCR_TRAINING_CONNECTION_STRING", ""),
         azure_ocr_training_container=os.getenv("AZURE_OCR_TRAINING_CONTAINER", "facturas-entrenamiento"),
     )
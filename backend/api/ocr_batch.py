@@ -0,0 +1,193 @@
+"""
+Lotes OCR del backend: muchos ficheros en una sola peticion.
+
+``crear_lote`` registra los ficheros, lanza los analisis de Azure en paralelo
+(hasta AZURE_DOC_INTELLIGENCE_CONCURRENCY a la vez) y devuelve enseguida el
+identificador del lote. El escritorio consulta el estado (``estado_lote``) o
+recibe cada resultado en cuanto termina (``flujo_lote``, NDJSON).
+
+Los lotes viven en memoria del proceso y caducan a los ``TTL_LOTE_S``
+segundos de terminar; el escritorio debe recoger los resultados antes.
+"""
+from __future__ import annotations
+
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from backend.api.config import get_settings
+
+TTL_LOTE_S = 30 * 60
+MAX_FICHEROS_LOTE = 50
+# Tope de espera de un flujo NDJSON antes de cerrar; el cliente puede
+# reanudar por sondeo.
+ESPERA_FLUJO_MAX_S = 15 * 60
+
+
+@dataclass
+class _Fichero:
+    indice: int
+    nombre: str
+    contenido: bytes | None
+    estado: str = "pendiente"
+    resultado: dict | None = None
+    error: str = ""
+
+    def to_dict(self) -> dict:
+        datos = {"indice": self.indice, "nombre": self.nombre, "estado": self.estado}
+        if self.estado == "ok":
+            datos["resultado"] = self.resultado
+        elif self.estado == "error":
+            datos["error"] = self.error
+        return datos
+
+
+@dataclass
+class _Lote:
+    id: str
+    ficheros: list[_Fichero]
+    creado: float = field(default_factory=time.monotonic)
+    terminado_en: float | None = None
+    # Orden en que terminan los ficheros, para servirlos en flujo.
+    orden: list[int] = field(default_factory=list)
+    cambio: threading.Condition = field(default_factory=threading.Condition)
+
+    @property
+    def terminado(self) -> bool:
+        return len(self.orden) == len(self.ficheros)
+
+    def resumen(self, desde: int = 0) -> dict:
+        with self.cambio:
+            completados = list(self.orden)
+            return {
+                "job_id": self.id,
+                "total": len(self.ficheros),
+                "completados": len(completados),
+                "terminado": self.terminado,
+                "resultados": [self.ficheros[i].to_dict() for i in completados[max(0, desde):]],
+            }
+
+
+_lotes: dict[str, _Lote] = {}
+_lock = threading.Lock()
+_ejecutor: ThreadPoolExecutor | None = None
+
+
+def _ejecutor_analisis() -> ThreadPoolExecutor:
+    global _ejecutor
+    with _lock:
+        if _ejecutor is None:
+            _ejecutor = ThreadPoolExecutor(
+                max_workers=get_settings().azure_doc_intelligence_concurrency,
+                thread_name_prefix="ocr-lote",
+            )
+        return _ejecutor
+
+
+def _purgar_caducados() -> None:
+    ahora = time.monotonic()
+    with _lock:
+        for job_id in [
+            job_id for job_id, lote in _lotes.items()
+            if lote.terminado_en is not None and ahora - lote.terminado_en > TTL_LOTE_S
+        ]:
+            del _lotes[job_id]
+
+
+def _analizar(lote: _Lote, fichero: _Fichero) -> None:
+    from backend.api.ocr_service import iniciar_analisis, resultado_analisis
+
+    with lote.cambio:
+        fichero.estado = "procesando"
+    try:
+        resultado, error = resultado_analisis(iniciar_analisis(fichero.contenido)), ""
+    except RuntimeError as exc:
+        resultado, error = None, str(exc)
+    except Exception as exc:
+        resultado, error = None, f"Error en el servicio OCR: {exc}"
+    with lote.cambio:
+        fichero.contenido = None
+        fichero.estado = "ok" if resultado is not None else "error"
+        fichero.resultado = resultado
+        fichero.error = error
+        lote.orden.append(fichero.indice)
+        if lote.terminado:
+            lote.terminado_en = time.monotonic()
+        lote.cambio.notify_all()
+
+
+def crear_lote(ficheros: list[tuple[str, bytes]]) -> dict:
+    """Registra el lote y encola un analisis por fichero.
+
+    Lanza RuntimeError si Azure no esta configurado y ValueError si el lote
+    esta vacio o supera MAX_FICHEROS_LOTE.
+    """
+    if not ficheros:
+        raise ValueError("El lote no contiene ficheros")
+    if len(ficheros) > MAX_FICHEROS_LOTE:
+        raise ValueError(f"El lote admite como maximo {MAX_FICHEROS_LOTE} ficheros")
+    if not get_settings().azure_doc_intelligence_key:
+        raise RuntimeError("Azure OCR no configurado")
+    _purgar_caducados()
+    lote = _Lote(
+        id=uuid.uuid4().hex,
+        ficheros=[_Fichero(i, nombre, contenido) for i, (nombre, contenido) in enumerate(ficheros)],
+    )
+    with _lock:
+        _lotes[lote.id] = lote
+    ejecutor = _ejecutor_analisis()
+    for fichero in lote.ficheros:
+        ejecutor.submit(_analizar, lote, fichero)
+    return {
+        "job_id": lote.id,
+        "total": len(lote.ficheros),
+        "ficheros": [{"indice": f.indice, "nombre": f.nombre} for f in lote.ficheros],
+    }
+
+
+def _lote(job_id: str) -> _Lote | None:
+    _purgar_caducados()
+    with _lock:
+        return _lotes.get(job_id)
+
+
+def estado_lote(job_id: str, desde: int = 0) -> dict | None:
+    """Resultados terminados a partir de la posicion ``desde``, o None si el
+    lote no existe o ya caduco."""
+    lote = _lote(job_id)
+    return lote.resumen(desde) if lote else None
+
+
+def flujo_lote(job_id: str, espera_max_s: float = ESPERA_FLUJO_MAX_S):
+    """Generador NDJSON: una linea por fichero en el orden en que terminan y
+    una linea final con el resumen. None si el lote no existe."""
+    lote = _lote(job_id)
+    if lote is None:
+        return None
+
+    def _lineas():
+        enviados = 0
+        limite = time.monotonic() + espera_max_s
+        while True:
+            with lote.cambio:
+                while enviados == len(lote.orden) and not lote.terminado:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        break
+                    lote.cambio.wait(min(restante, 5.0))
+                nuevos = [lote.ficheros[i].to_dict() for i in lote.orden[enviados:]]
+                terminado = lote.terminado
+            for item in nuevos:
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+            enviados += len(nuevos)
+            if terminado or (not nuevos and time.monotonic() >= limite):
+                yield json.dumps({
+                    "job_id": lote.id, "total": len(lote.ficheros),
+                    "completados": enviados, "terminado": terminado,
+                }) + "\n"
+                return
+
+    return _lineas()
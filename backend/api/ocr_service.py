@@ -6,11 +6,14 @@ del servidor; el escritorio nunca accede a ellas directamente.
 
 Exporta:
   analyze_invoice(content, filename) -> dict
+  iniciar_analisis(content) -> poller
+  resultado_analisis(poller) -> dict
   ocr_available() -> bool
 """
 from __future__ import annotations
 
 import re
+import threading
 
 from backend.api.config import get_settings
 
@@ -319,38 +322,46 @@ def ocr_available() -> bool:
     return bool(get_settings().azure_doc_intelligence_key)
 
 
-def analyze_invoice(content: bytes, filename: str) -> dict:
-    """
-    Analiza una factura con Azure Document Intelligence.
+_lock_cliente = threading.Lock()
+_cliente_cache: tuple[tuple[str, str], object] | None = None
 
-    Parametros:
-      content          — bytes del fichero PDF o imagen
-      filename         — nombre original del fichero (solo informativo)
-    Devuelve un dict con la misma estructura que OcrInvoiceResult.to_dict()
-    mas el campo motor="azure_backend".
 
-    Lanza RuntimeError si las credenciales no estan configuradas.
-    Lanza cualquier excepcion del SDK de Azure si el servicio falla.
-    """
+def _cliente():
+    """Cliente Azure compartido: reutiliza sus conexiones HTTPS entre
+    analisis. Se recrea si cambian endpoint o clave."""
+    global _cliente_cache
     from azure.ai.documentintelligence import DocumentIntelligenceClient
     from azure.core.credentials import AzureKeyCredential
 
     settings = get_settings()
     if not settings.azure_doc_intelligence_key:
         raise RuntimeError("Azure OCR no configurado")
+    clave = (settings.azure_doc_intelligence_endpoint, settings.azure_doc_intelligence_key)
+    with _lock_cliente:
+        if _cliente_cache is None or _cliente_cache[0] != clave:
+            _cliente_cache = (clave, DocumentIntelligenceClient(
+                endpoint=clave[0], credential=AzureKeyCredential(clave[1]),
+            ))
+        return _cliente_cache[1]
 
-    model_id = settings.azure_doc_intelligence_model_id or "prebuilt-invoice"
 
-    client = DocumentIntelligenceClient(
-        endpoint=settings.azure_doc_intelligence_endpoint,
-        credential=AzureKeyCredential(settings.azure_doc_intelligence_key),
-    )
+def _model_id() -> str:
+    return get_settings().azure_doc_intelligence_model_id or "prebuilt-invoice"
 
-    poller = client.begin_analyze_document(
-        model_id,
+
+def iniciar_analisis(content: bytes):
+    """Envia el documento a Azure y devuelve el poller sin esperar al
+    resultado. Lanza RuntimeError si las credenciales no estan configuradas."""
+    return _cliente().begin_analyze_document(
+        _model_id(),
         body=content,
         content_type="application/octet-stream",
     )
+
+
+def resultado_analisis(poller) -> dict:
+    """Espera al analisis iniciado con iniciar_analisis y lo mapea."""
+    model_id = _model_id()
     result = poller.result()
 
     if not result.documents:
@@ -378,3 +389,19 @@ def analyze_invoice(content: bytes, filename: str) -> dict:
     doc = result.documents[0]
     texto = str(getattr(result, "content", "") or "")
     return _mapear_documento(doc, model_id=model_id, texto=texto)
+
+
+def analyze_invoice(content: bytes, filename: str) -> dict:
+    """
+    Analiza una factura con Azure Document Intelligence.
+
+    Parametros:
+      content          — bytes del fichero PDF o imagen
+      filename         — nombre original del fichero (solo informativo)
+    Devuelve un dict con la misma estructura que OcrInvoiceResult.to_dict()
+    mas el campo motor="azure_backend".
+
+    Lanza RuntimeError si las credenciales no estan configuradas.
+    Lanza cualquier excepcion del SDK de Azure si el servicio falla.
+    """
+    return resultado_analisis(iniciar_analisis(content))
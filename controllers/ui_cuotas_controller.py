@@ -1,42 +1,20 @@
 """Controller para el modulo de Cuotas Periodicas.
 
 Gestiona el CRUD de cuotas y la logica de generacion de facturas borrador.
-Reutiliza la logica de numeracion de FacturasEmitidasController.
+La generacion en bloque esta en services.cuotas_periodicas_service.
 """
 from __future__ import annotations
 
-import hashlib
 import json
-from datetime import date, datetime
+from datetime import date
 
-
-def _parse_fecha_ddmmyyyy(txt: str) -> date | None:
-    """Convierte dd/mm/yyyy a date. Devuelve None si no es valido."""
-    try:
-        return datetime.strptime(str(txt).strip(), "%d/%m/%Y").date()
-    except Exception:
-        return None
+from services.cuotas_periodicas_service import GeneradorCuotas
 
 
 def _date_to_ddmmyyyy(d: date) -> str:
     return d.strftime("%d/%m/%Y")
 
 
-def _calcular_periodos(periodicidad: str, inicio: date, fin: date) -> list[str]:
-    """Genera lista de strings YYYY-MM desde inicio hasta fin (inclusive) segun periodicidad."""
-    step = {"mensual": 1, "bimestral": 2, "trimestral": 3, "semestral": 6, "anual": 12}.get(periodicidad, 1)
-    periodos = []
-    y, m = inicio.year, inicio.month
-    fin_ym = (fin.year, fin.month)
-    while (y, m) <= fin_ym:
-        periodos.append(f"{y:04d}-{m:02d}")
-        m += step
-        while m > 12:
-            m -= 12
-            y += 1
-    return periodos
-
-
 class CuotasController:
     def __init__(self, gestor, codigo: str, ejercicio: int, empresa_conf: dict,
                  facturas_controller=None):
@@ -69,10 +47,10 @@ class CuotasController:
     def refresh_cuotas(self):
         if not self._view:
             return
-        cuotas = self._gestor.listar_cuotas_periodicas(self._codigo, self._ejercicio)
+        cuotas = self._gestor.listar_cuotas_con_periodos(self._codigo, self._ejercicio)
         # Enriquecer con ultimo periodo generado
         for c in cuotas:
-            periodos = self._gestor.listar_periodos_generados(c["id"])
+            periodos = c.pop("periodos_generados")
             c["_ultimo_periodo"] = periodos[-1] if periodos else ""
             c["_num_generadas"] = len(periodos)
         self._view.set_cuotas(cuotas)
@@ -237,70 +215,43 @@ class CuotasController:
 
     def calcular_cuotas_pendientes(self, hasta: date | None = None) -> list[dict]:
         """Devuelve lista de dicts {cuota, periodos_pendientes} para todas las cuotas activas."""
-        if hasta is None:
-            hasta = date.today()
-        cuotas = self._gestor.listar_cuotas_periodicas(self._codigo, self._ejercicio)
-        resultado = []
-        for c in cuotas:
-            if not c.get("activa"):
-                continue
-            inicio = _parse_fecha_ddmmyyyy(c.get("fecha_inicio") or "")
-            if not inicio:
-                continue
-            fin_str = c.get("fecha_fin") or ""
-            if fin_str:
-                fin = _parse_fecha_ddmmyyyy(fin_str)
-                if fin is None:
-                    fin = hasta
-                else:
-                    fin = min(fin, hasta)
-            else:
-                fin = hasta
-            if inicio > fin:
-                continue
-            esperados = _calcular_periodos(c.get("periodicidad", "mensual"), inicio, fin)
-            generados = set(self._gestor.listar_periodos_generados(c["id"]))
-            pendientes = [p for p in esperados if p not in generados]
-            if pendientes:
-                resultado.append({"cuota": c, "periodos": pendientes})
-        return resultado
+        return GeneradorCuotas(self._gestor).pendientes(self._codigo, self._ejercicio, hasta)
 
     def generar_pendientes(self):
-        """Abre el dialogo de generacion y ejecuta la generacion de los seleccionados."""
+        """Abre el dialogo de generacion, muestra el plan y lo graba de una vez."""
         if not self._ensure_write():
             return
-        pendientes = self.calcular_cuotas_pendientes()
+        generador = GeneradorCuotas(self._gestor)
+        pendientes = generador.pendientes(self._codigo, self._ejercicio)
         if not pendientes:
             self._view.show_info("Cuotas", "No hay periodos pendientes de generar.")
             return
         params = self._view.open_generar_dialog(pendientes)
         if not params:
             return
-        fecha_factura = params["fecha_factura"]
         seleccionados = params["seleccionados"]  # list of (cuota_id, periodo)
         if not seleccionados:
             self._view.show_info("Cuotas", "No se ha seleccionado ningun periodo.")
             return
-        generadas = 0
-        errores = []
-        # Agrupar por cuota para procesar en orden
-        by_cuota: dict[str, list[str]] = {}
-        for cid, periodo in seleccionados:
-            by_cuota.setdefault(cid, []).append(periodo)
-        for cid, periodos in by_cuota.items():
-            cuota = self._gestor.get_cuota_periodica(cid)
-            if not cuota:
-                continue
-            periodos_sorted = sorted(periodos)
-            for periodo in periodos_sorted:
-                try:
-                    self._generar_factura_desde_cuota(cuota, periodo, fecha_factura)
-                    generadas += 1
-                except Exception as exc:
-                    errores.append(f"{cuota.get('nombre', cid)} / {periodo}: {exc}")
-        msg = f"Se han generado {generadas} factura(s) en borrador."
+        plan = generador.previsualizar(
+            [p["cuota"] for p in pendientes], seleccionados, params["fecha_factura"]
+        )
+        if not plan.grabables:
+            self._view.show_info("Cuotas", "No se puede generar ninguna factura.\n\n" + plan.resumen())
+            return
+        if not self._view.ask_confirm("Generar cuotas", plan.resumen() + "\n\nConfirmar?"):
+            return
+        try:
+            ids = generador.aplicar(plan)
+        except Exception as exc:
+            self._view.show_warning("Cuotas", f"No se ha generado ninguna factura:\n{exc}")
+            return
+        errores = plan.por_accion("error")
+        msg = f"Se han generado {len(ids)} factura(s) en borrador."
         if errores:
-            msg += f"\n\nErrores ({len(errores)}):\n" + "\n".join(errores[:5])
+            msg += f"\n\nSin generar ({len(errores)}):\n" + "\n".join(
+                f"{i.cuota.get('nombre', i.cuota['id'])} / {i.periodo}: {i.error}" for i in errores[:5]
+            )
         self._view.show_info("Cuotas - Generacion completada", msg)
         # Refrescar la vista de facturas si es posible
         if self._facturas_ctrl:
@@ -310,140 +261,6 @@ class CuotasController:
                 pass
         self.refresh_cuotas()
 
-    def _resolver_tercero_id(self, tercero_id: str, nif: str) -> str:
-        """Devuelve tercero_id resuelto: usa el de la cuota, o busca por NIF, o lanza ValueError."""
-        if tercero_id:
-            # Validar que el tercero aun existe
-            try:
-                t = self._gestor.get_tercero(str(tercero_id))
-                if t:
-                    return str(tercero_id)
-            except Exception:
-                pass
-        # Intentar resolver por NIF
-        nif_clean = str(nif or "").strip()
-        if nif_clean:
-            try:
-                t = self._gestor.get_tercero_by_nif(nif_clean)
-                if t:
-                    return str(t["id"])
-            except Exception:
-                pass
-            raise ValueError(
-                f"No existe un tercero global con NIF {nif_clean}. "
-                "Crealo primero en el maestro de terceros antes de generar esta factura."
-            )
-        raise ValueError(
-            "La cuota no tiene tercero ni NIF asignado. "
-            "Edita la cuota y asigna un cliente antes de generar."
-        )
-
-    def _generar_factura_desde_cuota(self, cuota: dict, periodo: str, fecha_factura: str):
-        """Crea una factura borrador en facturas_emitidas_docs a partir de una cuota.
-
-        Para los campos no definidos en la cuota (subcuenta_cliente, cuenta_bancaria,
-        plantillas) aplica fallbacks desde terceros_empresas y la configuracion de empresa.
-        """
-        # Parsear lineas_json
-        lineas_raw = cuota.get("lineas_json") or "[]"
-        if isinstance(lineas_raw, list):
-            lineas = lineas_raw
-        else:
-            try:
-                lineas = json.loads(lineas_raw)
-            except Exception:
-                lineas = []
-        # Normalizar nombres de campo: la vista de facturas usa "unidades" y
-        # "precio"; cuotas antiguas pueden haber guardado "cantidad" y
-        # "precio_unitario". Se asegura la presencia de los campos canónicos.
-        lineas_norm = []
-        for ln in lineas:
-            if not isinstance(ln, dict):
-                continue
-            nl = dict(ln)
-            if "unidades" not in nl:
-                nl["unidades"] = nl.get("cantidad", 1.0)
-            if "precio" not in nl:
-                nl["precio"] = nl.get("precio_unitario", 0.0)
-            lineas_norm.append(nl)
-        lineas = lineas_norm
-
-        # ── Resolver tercero_id (obligatorio) ────────────────────────────────
-        tercero_id = self._resolver_tercero_id(
-            str(cuota.get("tercero_id") or "").strip(),
-            str(cuota.get("nif") or "").strip(),
-        )
-
-        # ── Fallbacks desde tercero y empresa ────────────────────────────────
-        subcuenta_cliente = str(cuota.get("subcuenta_cliente") or "").strip()
-        if not subcuenta_cliente and tercero_id:
-            try:
-                rel = self._gestor.get_tercero_empresa(self._codigo, tercero_id, self._ejercicio)
-                subcuenta_cliente = str((rel or {}).get("subcuenta_cliente") or "").strip()
-            except Exception:
-                pass
-
-        cuenta_bancaria = str(cuota.get("cuenta_bancaria") or "").strip()
-        if not cuenta_bancaria:
-            try:
-                emp = self._gestor.get_empresa(self._codigo, self._ejercicio) or self._empresa_conf
-                cuenta_bancaria = str(emp.get("cuenta_bancaria") or "").strip()
-            except Exception:
-                pass
-
-        # ── Plantillas: usar las de la cuota; si no hay, buscar defaults de empresa ──
-        plantilla_emitidas = str(cuota.get("plantilla_emitidas") or "").strip()
-        plantilla_word = str(cuota.get("plantilla_word") or "").strip()
-        if not plantilla_emitidas or not plantilla_word:
-            try:
-                pls = self._gestor.listar_emitidas(self._codigo, self._ejercicio)
-                if pls and not plantilla_emitidas:
-                    plantilla_emitidas = str(pls[0].get("nombre") or "").strip()
-            except Exception:
-                pass
-
-        # ID deterministico: el mismo (cuota, periodo) siempre produce el mismo fid.
-        # Asi, si un intento anterior creo un borrador pero fallo al registrar el
-        # periodo, el siguiente intento actualiza ese borrador en vez de duplicarlo.
-        _fid_key = f"cuota:{cuota['id']}:{periodo}"
-        fid = str(int(hashlib.md5(_fid_key.encode()).hexdigest()[:15], 16))
-        doc = {
-            "id": fid,
-            "codigo_empresa": cuota["codigo_empresa"],
-            "ejercicio": cuota["ejercicio"],
-            "tercero_id": tercero_id or None,
-            "serie": cuota.get("serie") or "",
-            "numero": "",
-            "fecha_asiento": fecha_factura,
-            "fecha_expedicion": fecha_factura,
-            "fecha_operacion": fecha_factura,
-            "tipo_operacion": cuota.get("tipo_operacion") or "01",
-            "modelo_fiscal": cuota.get("modelo_fiscal") or "",
-            "nif": cuota.get("nif") or "",
-            "nombre": cuota.get("nombre") or "",
-            "descripcion": cuota.get("descripcion") or "",
-            "observaciones": cuota.get("observaciones") or "",
-            "subcuenta_cliente": subcuenta_cliente,
-            "forma_pago": cuota.get("forma_pago") or "",
-            "cuenta_bancaria": cuenta_bancaria,
-            "plantilla_word": plantilla_word,
-            "plantilla_emitidas": plantilla_emitidas,
-            "retencion_aplica": cuota.get("retencion_aplica") or 0,
-            "retencion_pct": cuota.get("retencion_pct"),
-            "descuento_total_tipo": cuota.get("descuento_total_tipo"),
-            "descuento_total_valor": cuota.get("descuento_total_valor"),
-            "moneda_codigo": cuota.get("moneda_codigo"),
-            "moneda_simbolo": cuota.get("moneda_simbolo"),
-            "lineas": lineas,
-            "borrador": 1,
-            "generada": 0,
-            "fecha_generacion": "",
-            "enviado": 0,
-        }
-        self._gestor.upsert_factura_emitida(doc)
-        fecha_hoy = datetime.now().strftime("%d/%m/%Y")
-        self._gestor.registrar_periodo_generado(cuota["id"], periodo, fid, fecha_hoy)
-
     # ── Helpers ───────────────────────────────────────────────────────────────
 
     def _listar_series_activas(self) -> list[str]:
@@ -2,17 +2,28 @@ import os
 import shutil
 import sys
 import subprocess
-from contextlib import contextmanager
+import threading
+from contextlib import contextmanager, nullcontext
 from datetime import datetime, timezone
 from pathlib import Path
 import traceback
 
+from models.indice_facturas import IndiceFacturas
 from procesos.facturas_emitidas import generar_emitidas
 from services.import_a3_empresa import leer_numero_asiento_desde_a3
 from services.facturae import FacturaeExporter
+from services.albaranes_facturacion_service import (
+    FacturadorAlbaranes,
+    agrupar_por_cliente,
+    formatear_fecha_descripcion,
+)
+from services.exportacion_documentos_service import exportar_albaranes, exportar_facturas
 from procesos.facturas_word import (
     build_context_emitida,
     generar_pdf_desde_plantilla_word,
+    generar_pdfs_desde_plantilla_word,
+    enviar_pdf_desde_plantilla_word,
+    huella_pdf,
 )
 from utils.utilidades import (
     aplicar_descuento_total_lineas,
@@ -23,9 +34,17 @@ from utils.utilidades import (
     load_app_config,
     load_monedas,
 )
+from utils.ui_facturas_emitidas_helpers import to_float
 from utils.validaciones import inferir_pais_desde_identificacion, normalizar_nif_cif
 
 
+def _ej(valor):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return None
+
+
 class FacturasEmitidasController:
     def __init__(
         self, gestor, codigo, ejercicio, empresa_conf, view,
@@ -38,7 +57,7 @@ class FacturasEmitidasController:
         self._view = view
         self._allow_all_years = bool(allow_all_years)
         self._incluir_origen_ocr = bool(incluir_origen_ocr)
-        self._facturas_cache = []
+        self._facturas_cache = IndiceFacturas(anio_de=self._year_from_factura)
         self._facturae_exporter = FacturaeExporter()
 
     @contextmanager
@@ -120,19 +139,49 @@ class FacturasEmitidasController:
 
     def refresh_facturas(self):
         try:
-            self._facturas_cache = self._listar_facturas_base()
+            facturas = self._listar_facturas_base()
         except Exception:
             _reconectar = getattr(self._gestor, "reconnect", None)
             if callable(_reconectar):
                 _reconectar()
-                self._facturas_cache = self._listar_facturas_base()
+                facturas = self._listar_facturas_base()
             else:
                 raise
+        self._facturas_cache = IndiceFacturas(facturas, anio_de=self._year_from_factura)
+        self._mostrar_facturas()
+
+    def _recargar_facturas(self, ids):
+        """Relee solo las facturas ``ids`` tras modificarlas y repinta la lista.
+
+        Las que ya no existen o dejan de corresponder a esta vista salen de la
+        cache; el resto se sustituye sin volver a cargar todas las facturas.
+        """
+        ids = [str(fid) for fid in ids or [] if fid]
+        cache = self._facturas_cache
+        leidas = {
+            str(fac.get("id")): fac
+            for fac in self._gestor.listar_facturas_emitidas_por_ids(self._codigo, ids)
+            if self._factura_en_vista(fac)
+        }
+        for fid in ids:
+            if fid in leidas:
+                cache.actualizar(leidas[fid])
+            else:
+                cache.quitar(fid)
+        self._mostrar_facturas()
+        if len(leidas) > 1:
+            self.precalentar_pdfs(list(leidas.values()))
+
+    def _factura_en_vista(self, fac: dict) -> bool:
+        """Mismo criterio que ``_listar_facturas_base`` para una sola factura."""
+        if not self._allow_all_years and _ej(fac.get("ejercicio")) != _ej(self._ejercicio):
+            return False
+        return self._incluir_origen_ocr or str(fac.get("origen_factura") or "facturacion") != "ocr"
+
+    def _mostrar_facturas(self):
         if self._allow_all_years:
-            years = sorted({y for y in (self._year_from_factura(f) for f in self._facturas_cache) if y is not None})
-            self._view.set_facturas_years(years)
-        series = [str(f.get("serie") or "").strip() for f in self._facturas_cache if f.get("serie")]
-        self._view.set_facturas_series(series)
+            self._view.set_facturas_years(self._facturas_cache.anios())
+        self._view.set_facturas_series(self._facturas_cache.series())
         self.apply_facturas_filter()
         self._view.set_detalle_lineas([])
         emp = self._gestor.get_empresa(self._codigo, self._ejercicio)
@@ -145,13 +194,7 @@ class FacturasEmitidasController:
         serie_filter   = self._view.get_facturas_serie_filter()
         cliente_filter = self._view.get_facturas_cliente_filter()
         estado_filter  = self._view.get_facturas_estado_filter()
-        for fac in self._facturas_cache:
-            if year_filter is not None:
-                if self._year_from_factura(fac) != year_filter:
-                    continue
-            if serie_filter is not None:
-                if str(fac.get("serie") or "").strip() != serie_filter:
-                    continue
+        for fac in self._facturas_cache.filtrar(year_filter, serie_filter):
             if cliente_filter:
                 nombre = (fac.get("nombre") or "").lower()
                 nif = (fac.get("nif") or "").lower()
@@ -224,7 +267,7 @@ class FacturasEmitidasController:
                 result["codigo_empresa"] = self._codigo
                 self._gestor.upsert_factura_emitida(result)
                 self._incrementar_numeracion_por_factura(result, rectificativa=False)
-            self.refresh_facturas()
+            self._recargar_facturas([result.get("id")])
 
     def nueva_rectificativa(self):
         if not self._ensure_write():
@@ -270,7 +313,7 @@ class FacturasEmitidasController:
                 result["codigo_empresa"] = self._codigo
                 self._gestor.upsert_factura_emitida(result)
                 self._incrementar_numeracion_por_factura(result, rectificativa=True)
-            self.refresh_facturas()
+            self._recargar_facturas([result.get("id")])
 
     def confirmar_borrador(self):
         """Convierte borradores seleccionados en facturas con numero asignado."""
@@ -280,25 +323,38 @@ class FacturasEmitidasController:
         if not sel:
             self._view.show_info("Gest2A3Eco", "Selecciona una o mas facturas borrador.")
             return
-        confirmadas = 0
+        # Los numeros de cada serie y año se reservan de una vez antes de
+        # grabar, en el orden de la seleccion.
+        grupos: dict[tuple, list[dict]] = {}
         for fid in sel:
             fac = self._get_factura_by_id(fid)
             if not fac or not fac.get("borrador"):
                 continue
             fecha_base = fac.get("fecha_asiento") or fac.get("fecha_expedicion") or datetime.now().strftime("%d/%m/%Y")
+            year = self._year_from_fecha_txt(fecha_base)
             serie_pref = str(fac.get("serie") or "").strip() or None
-            sugerido, serie_sug, year = self._proximo_numero_por_fecha(fecha_base, rectificativa=False, nombre_serie=serie_pref)
-            fac["numero"] = sugerido
-            fac["serie"] = serie_sug
-            fac["borrador"] = 0
-            if year is not None:
-                fac["ejercicio"] = year
-            self._gestor.upsert_factura_emitida(fac)
-            self._incrementar_numeracion_por_factura(fac, rectificativa=False)
-            confirmadas += 1
+            serie = self._serie_for_year(year, rectificativa=False, nombre_serie=serie_pref)
+            grupos.setdefault((year, serie), []).append(fac)
+        confirmadas = 0
+        for (year, serie), facturas in grupos.items():
+            cambios = []
+            try:
+                with self._numeros_reservados(year, serie, len(facturas), rectificativa=False) as numeros:
+                    for fac, numero in zip(facturas, numeros):
+                        cambio = dict(fac, numero=numero, serie=serie, borrador=0)
+                        if year is not None:
+                            cambio["ejercicio"] = year
+                        cambios.append(cambio)
+                    self._gestor.upsert_facturas_emitidas(cambios)
+            except Exception as e:
+                self._view.show_error("Gest2A3Eco", f"No se pudieron confirmar los borradores de la serie {serie}:\n{e}")
+                break
+            for fac, cambio in zip(facturas, cambios):
+                fac.update(cambio)
+            confirmadas += len(cambios)
         if confirmadas:
             self._view.show_info("Gest2A3Eco", f"{confirmadas} factura(s) confirmada(s) con numero asignado.")
-            self.refresh_facturas()
+            self._recargar_facturas(sel)
         else:
             self._view.show_info("Gest2A3Eco", "Las facturas seleccionadas no son borradores.")
 
@@ -373,7 +429,7 @@ class FacturasEmitidasController:
             else:
                 result["borrador"] = 1 if es_borrador else 0
                 self._gestor.upsert_factura_emitida(result)
-            self.refresh_facturas()
+            self._recargar_facturas([result.get("id")])
 
         while True:
             if idx < 0 or idx >= len(all_ids):
@@ -439,7 +495,7 @@ class FacturasEmitidasController:
                 result["borrador"] = 0
                 self._gestor.upsert_factura_emitida(result)
                 self._incrementar_numeracion_por_factura(result, rectificativa=False)
-            self.refresh_facturas()
+            self._recargar_facturas([result.get("id")])
 
     def rectificar(self):
         if not self._ensure_write():
@@ -481,7 +537,7 @@ class FacturasEmitidasController:
             result = self._ajustar_numero_por_fecha_si_aplica(result, sugerido, serie_sug, rectificativa=True)
             self._gestor.upsert_factura_emitida(result)
             self._incrementar_numeracion_por_factura(result, rectificativa=True)
-            self.refresh_facturas()
+            self._recargar_facturas([result.get("id")])
 
     @staticmethod
     def _reiniciar_estados_nueva_factura(factura: dict) -> None:
@@ -501,6 +557,7 @@ class FacturasEmitidasController:
             "pdf_path": "",
             "pdf_path_a3": "",
             "pdf_generated_at": "",
+            "pdf_huella": "",
         })
 
     def eliminar(self):
@@ -532,7 +589,7 @@ class FacturasEmitidasController:
                 continue
             eje = fac.get("ejercicio") if fac.get("ejercicio") is not None else self._ejercicio
             self._gestor.eliminar_factura_emitida(self._codigo, fid, eje)
-        self.refresh_facturas()
+        self._recargar_facturas(sel)
         self.refresh_albaranes()
 
     def desmarcar_generadas(self):
@@ -583,7 +640,7 @@ class FacturasEmitidasController:
                 self._gestor.desmarcar_facturas_emitidas_generadas(self._codigo, ids, eje)
         else:
             self._gestor.desmarcar_facturas_emitidas_generadas(self._codigo, sel, self._ejercicio)
-        self.refresh_facturas()
+        self._recargar_facturas(sel)
 
     def factura_seleccionada(self):
         sel = self._view.get_selected_ids()
@@ -712,81 +769,52 @@ class FacturasEmitidasController:
                 return
         except Exception:
             pass
-        albaranes = []
-        for aid in sel:
-            alb = self._get_albaran_by_id(aid)
-            if alb:
-                if alb.get("facturado"):
-                    continue
-                albaranes.append(alb)
-        if not albaranes:
+        facturador = FacturadorAlbaranes(self._gestor)
+        grupos = agrupar_por_cliente(facturador.cargar(self._codigo, sel, self._ejercicio))
+        if not grupos:
             self._view.show_warning("Gest2A3Eco", "No hay albaranes pendientes de facturar.")
             return
-        nifs = {normalizar_nif_cif(a.get("nif")) for a in albaranes}
-        if len(nifs) > 1:
-            self._view.show_warning("Gest2A3Eco", "Los albaranes seleccionados tienen distintos clientes.")
+        if len(grupos) > 1 and not self._view.ask_yes_no(
+            "Gest2A3Eco",
+            f"Los albaranes seleccionados son de {len(grupos)} clientes distintos.\n"
+            "Se generara una factura por cliente. Continuar?",
+        ):
             return
-        base = albaranes[0]
-        moneda_codigo = base.get("moneda_codigo", "")
-        moneda_simbolo = base.get("moneda_simbolo", "")
-        if not moneda_codigo:
+        moneda = ("", "")
+        if any(not g[0].get("moneda_codigo") for g in grupos):
             monedas = load_monedas()
             if monedas:
-                moneda_codigo = str(monedas[0].get("codigo") or "").upper()
-                moneda_simbolo = str(monedas[0].get("simbolo") or "")
-        descripcion_factura = self._descripcion_factura_desde_albaranes(albaranes)
-        lineas = self._build_factura_lineas_desde_albaranes(albaranes)
+                moneda = (str(monedas[0].get("codigo") or "").upper(), str(monedas[0].get("simbolo") or ""))
         fecha = datetime.now().strftime("%d/%m/%Y")
-        # Si es un unico albaran, la factura hereda su numero/serie (ya consumio el contador).
-        # Si son varios albaranes agrupados en una factura, se usa el siguiente numero del contador.
-        if len(albaranes) == 1:
-            numero_fac = str(albaranes[0].get("numero") or "").strip()
-            serie_fac = str(albaranes[0].get("serie") or "").strip()
-            eje_fac = albaranes[0].get("ejercicio") or self._ejercicio
-            incrementar_contador = False
-        else:
-            sugerido, serie_fac, eje_sug = self._proximo_numero_por_fecha(fecha, rectificativa=False)
-            numero_fac = sugerido
-            eje_fac = eje_sug if eje_sug is not None else self._ejercicio
-            incrementar_contador = True
-        factura = {
-            "codigo_empresa": self._codigo,
-            "ejercicio": eje_fac,
-            "tercero_id": base.get("tercero_id"),
-            "serie": serie_fac,
-            "numero": numero_fac,
-            "numero_largo_sii": "",
-            "fecha_asiento": fecha,
-            "fecha_expedicion": fecha,
-            "fecha_operacion": fecha,
-            "tipo_operacion": base.get("tipo_operacion") or "01",
-            "modelo_fiscal": base.get("modelo_fiscal") or "",
-            "nif": normalizar_nif_cif(base.get("nif", "")),
-            "nombre": base.get("nombre", ""),
-            "descripcion": descripcion_factura,
-            "subcuenta_cliente": base.get("subcuenta_cliente", ""),
-            "forma_pago": base.get("forma_pago", ""),
-            "cuenta_bancaria": base.get("cuenta_bancaria", ""),
-            "moneda_codigo": moneda_codigo,
-            "moneda_simbolo": moneda_simbolo,
-            "plantilla_word": base.get("plantilla_word") or "",
-            "plantilla_emitidas": base.get("plantilla_emitidas") or self._default_plantilla_emitidas_name(eje_fac),
-            "retencion_aplica": bool(base.get("retencion_aplica")),
-            "retencion_pct": base.get("retencion_pct"),
-            "retencion_base": base.get("retencion_base"),
-            "retencion_importe": base.get("retencion_importe"),
-            "lineas": lineas,
-            "generada": False,
-            "fecha_generacion": "",
-        }
-        fid = self._gestor.upsert_factura_emitida(factura)
-        if incrementar_contador:
-            self._incrementar_numeracion_por_factura(factura, rectificativa=False)
-        fecha_gen = datetime.now().strftime("%Y-%m-%d %H:%M")
-        self._gestor.marcar_albaranes_facturados(self._codigo, [a.get("id") for a in albaranes], fid, fecha_gen, self._ejercicio)
-        self.refresh_facturas()
+        # Un unico albaran hereda su numero/serie (ya consumio el contador); las
+        # facturas que agrupan varios toman numeros reservados de una vez.
+        eje_sug = self._year_from_fecha_txt(fecha)
+        eje_fac = eje_sug if eje_sug is not None else self._ejercicio
+        agrupadas = sum(1 for g in grupos if len(g) > 1)
+        serie_fac = self._serie_for_year(eje_sug, rectificativa=False) if agrupadas else ""
+        try:
+            with self._numeros_reservados(eje_sug, serie_fac, agrupadas) if agrupadas else nullcontext([]) as numeros:
+                facturas = facturador.preparar(
+                    self._codigo,
+                    grupos,
+                    fecha,
+                    eje_fac,
+                    serie=serie_fac,
+                    numeros=numeros,
+                    moneda=moneda,
+                    plantilla_por_defecto=self._default_plantilla_emitidas_name,
+                )
+                fids = facturador.facturar(self._codigo, self._ejercicio, facturas)
+        except Exception as e:
+            self._view.show_error("Gest2A3Eco", f"No se pudieron facturar los albaranes:\n{e}")
+            return
+        self._recargar_facturas(fids)
         self.refresh_albaranes()
-        self._view.show_info("Gest2A3Eco", f"Factura generada desde albaranes:\n{factura.get('numero','')}")
+        numeros_txt = "\n".join(str(f.get("numero", "")) for f, _ids in facturas)
+        if len(facturas) == 1:
+            self._view.show_info("Gest2A3Eco", f"Factura generada desde albaranes:\n{numeros_txt}")
+        else:
+            self._view.show_info("Gest2A3Eco", f"{len(facturas)} facturas generadas desde albaranes:\n{numeros_txt}")
 
     def imprimir_albaran(self):
         sel = self._view.get_selected_albaran_ids()
@@ -903,22 +931,33 @@ class FacturasEmitidasController:
         errores = []
         try:
             with self._busy_dialog(f"Generando PDF ({len(facturas)} facturas), por favor espere..."):
+                # Los contextos se preparan aqui (leen la base de datos); el
+                # relleno de plantillas y la conversion van en paralelo.
+                trabajos = []
                 for fac in facturas:
                     tmp = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
                     tmp.close()
                     tmp_files.append(tmp.name)
-
                     try:
-                        self._generar_pdf_word(fac, tmp.name)
+                        template_path, context = self._plantilla_y_contexto_word(fac)
                     except Exception as e:
+                        trabajos.append((fac, tmp.name, None, e))
+                        continue
+                    trabajos.append((fac, tmp.name, (template_path, context, tmp.name), None))
+                resultados = iter(generar_pdfs_desde_plantilla_word(
+                    [t[2] for t in trabajos if t[2] is not None]
+                ))
+                for fac, tmp_name, trabajo, error in trabajos:
+                    if trabajo is not None:
+                        error = next(resultados)
+                    if error is not None:
                         num = fac.get("numero", fac.get("id", "?"))
-                        self._log_pdf_error(f"Error al generar PDF factura {num}.", e, "", tmp.name)
-                        errores.append(f"Factura {num}: {e}")
-                        tmp_files.pop()
+                        self._log_pdf_error(f"Error al generar PDF factura {num}.", error, "", tmp_name)
+                        errores.append(f"Factura {num}: {error}")
                         continue
 
                     try:
-                        reader = PdfReader(tmp.name)
+                        reader = PdfReader(tmp_name)
                         for page in reader.pages:
                             writer.add_page(page)
                     except Exception as e:
@@ -944,7 +983,11 @@ class FacturasEmitidasController:
                     pass
 
     def generar_facturae(self):
-        sel = self._view.get_selected_ids()
+        marcadas = self._view.get_marked_ids()
+        if len(marcadas) > 1:
+            self._generar_facturae_lote(marcadas)
+            return
+        sel = marcadas or self._view.get_selected_ids()
         if not sel:
             self._view.show_info("Gest2A3Eco", "Selecciona una factura emitida.")
             return
@@ -962,7 +1005,7 @@ class FacturasEmitidasController:
             upd["facturae_error"] = "\n".join(errores)
             upd["facturae_generated_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             self._persist_factura_if_allowed(upd)
-            self.refresh_facturas()
+            self._recargar_facturas([fac.get("id")])
             self._view.show_error("Gest2A3Eco", "No se puede generar Facturae/FACe:\n\n- " + "\n- ".join(errores))
             return
 
@@ -976,13 +1019,13 @@ class FacturasEmitidasController:
         if not result.ok:
             upd = self._facturae_exporter.build_factura_persistence_update(fac, result)
             self._persist_factura_if_allowed(upd)
-            self.refresh_facturas()
+            self._recargar_facturas([fac.get("id")])
             self._view.show_error("Gest2A3Eco", "No se pudo generar el XML Facturae:\n\n- " + "\n- ".join(result.errors))
             return
 
         upd = self._facturae_exporter.build_factura_persistence_update(fac, result)
         self._persist_factura_if_allowed(upd)
-        self.refresh_facturas()
+        self._recargar_facturas([fac.get("id")])
         self._view.show_info("Gest2A3Eco", f"XML Facturae generado:\n{result.output_path}\n\n{result.warning}")
         if self._view.ask_yes_no("Gest2A3Eco", "Abrir la carpeta destino del XML Facturae?"):
             try:
@@ -990,6 +1033,45 @@ class FacturasEmitidasController:
             except Exception as exc:
                 self._view.show_warning("Gest2A3Eco", f"No se pudo abrir la carpeta destino:\n{exc}")
 
+    def _generar_facturae_lote(self, ids):
+        facturas = [f for f in (self._get_factura_by_id(fid) for fid in ids) if f]
+        if not facturas:
+            self._view.show_error("Gest2A3Eco", "No se encontraron facturas validas.")
+            return
+        carpeta = self._view.ask_facturae_directory()
+        if not carpeta:
+            return
+
+        emisor = self._empresa_facturae()
+        nif_emisor = self._safe_filename(normalizar_nif_cif(emisor.get("nif", ""))) or "SINNIF"
+        trabajos = []
+        for fac in facturas:
+            numero = self._safe_filename(self._numero_factura_contable(fac)) or str(fac.get("id"))
+            trabajos.append((
+                fac,
+                emisor,
+                self._cliente_factura(fac),
+                str(Path(carpeta) / f"FACTURAE_{nif_emisor}_{numero}.xml"),
+                self._cliente_relacion_factura(fac),
+            ))
+        with self._busy_dialog(f"Generando Facturae ({len(trabajos)} facturas), por favor espere..."):
+            resultados = self._facturae_exporter.export_lote(trabajos)
+
+        errores = []
+        for fac, result in zip(facturas, resultados):
+            self._persist_factura_if_allowed(self._facturae_exporter.build_factura_persistence_update(fac, result))
+            if not result.ok:
+                num = self._numero_factura_contable(fac) or fac.get("id", "?")
+                errores.append(f"Factura {num}: " + "; ".join(result.errors))
+        self._recargar_facturas([fac.get("id") for fac in facturas])
+
+        generadas = len(facturas) - len(errores)
+        msg = f"XML Facturae generados: {generadas} de {len(facturas)}\n{carpeta}"
+        if errores:
+            self._view.show_warning("Gest2A3Eco", msg + "\n\nErrores:\n" + "\n".join(errores))
+        else:
+            self._view.show_info("Gest2A3Eco", f"{msg}\n\n{FacturaeExporter.unsigned_warning}")
+
     def abrir_pdf(self):
         sel = self._view.get_selected_ids()
         if not sel:
@@ -1157,7 +1239,7 @@ class FacturasEmitidasController:
             self._gestor.marcar_factura_emitida_enviada(
                 self._codigo, fac.get("id"), fecha_envio, canal, eje
             )
-            self.refresh_facturas()
+            self._recargar_facturas([fac.get("id")])
 
     @staticmethod
     def _split_email_addresses(value: str) -> list[str]:
@@ -1209,24 +1291,18 @@ class FacturasEmitidasController:
                 return
 
         ndig = int(self._empresa_conf.get("digitos_plan") or 8)
-        terceros = self._gestor.listar_terceros()
-        terceros_by_nif = {
-            normalizar_nif_cif(t.get("nif")): t
-            for t in terceros
-            if normalizar_nif_cif(t.get("nif"))
-        }
-        terceros_empresa = self._gestor.listar_terceros_por_empresa(self._codigo, self._ejercicio)
-        for t in terceros_empresa:
-            nif = normalizar_nif_cif(t.get("nif"))
-            if nif:
-                terceros_by_nif[nif] = t
         plantillas_cache = {}
         no_tpl_years = set()
         registros = []
         with self._busy_dialog("Generando suenlace.dat, por favor espere..."):
             facturas_sel = self._prepare_facturas_for_suenlace(facturas_sel)
-            for fac in facturas_sel:
-                rows = self._factura_to_rows(fac)
+            filas_por_factura = [(fac, self._factura_to_rows(fac)) for fac in facturas_sel]
+            terceros_by_nif = self._gestor.get_terceros_by_nifs(
+                self._codigo,
+                self._ejercicio,
+                [r.get("NIF Cliente Proveedor") or r.get("NIF") for _, rows in filas_por_factura for r in rows],
+            )
+            for fac, rows in filas_por_factura:
                 if not rows:
                     continue
                 plantilla = self._plantilla_emitidas_for_factura(fac, plantillas_cache, no_tpl_years)
@@ -1268,7 +1344,7 @@ class FacturasEmitidasController:
         else:
             self._gestor.marcar_facturas_emitidas_generadas(self._codigo, sel, fecha_gen, self._ejercicio)
         self._view.clear_marked_ids(sel)
-        self.refresh_facturas()
+        self._recargar_facturas(sel)
         self._view.show_info("Gest2A3Eco", f"Fichero generado:\n{save_path}")
 
     def capturar_numero_asiento_desde_a3(self):
@@ -1329,7 +1405,7 @@ class FacturasEmitidasController:
                     sin_asiento.append(num_factura or str(fid))
             else:
                 sin_asiento.append(num_factura or str(fid))
-        self.refresh_facturas()
+        self._recargar_facturas(sel)
         partes = []
         if actualizadas:
             partes.append("Asientos capturados:\n" + "\n".join(f"  {r}" for r in actualizadas))
@@ -1349,7 +1425,7 @@ class FacturasEmitidasController:
             self._view.show_warning("Gest2A3Eco", "Marca o selecciona al menos una factura.")
             return
         self._gestor.enviar_facturas_emitidas_a_contabilidad(self._codigo, self._ejercicio, sel)
-        self.refresh_facturas()
+        self._recargar_facturas(sel)
         self._view.show_info("Gest2A3Eco", f"{len(sel)} factura(s) enviadas al módulo de contabilidad.")
 
     def ver_asiento_factura(self):
@@ -1379,16 +1455,17 @@ class FacturasEmitidasController:
             gestor=self._gestor,
             codigo_empresa=self._codigo,
             ndig=ndig,
-            on_save=lambda _f: self.refresh_facturas(),
+            on_save=lambda _f: self._recargar_facturas([fac.get("id")]),
         )
 
     def _get_factura_by_id(self, fid):
-        for f in self._facturas_cache or []:
-            if str(f.get("id")) == str(fid):
-                return f
-        for f in self._listar_facturas_base():
-            if str(f.get("id")) == str(fid):
-                return f
+        fac = self._facturas_cache.get(fid)
+        if fac is not None:
+            return fac
+        for fac in self._gestor.listar_facturas_emitidas_por_ids(self._codigo, [fid]):
+            if self._factura_en_vista(fac):
+                self._facturas_cache.actualizar(fac)
+                return fac
         return None
 
     def _listar_facturas_base(self):
@@ -1427,14 +1504,8 @@ class FacturasEmitidasController:
         return None
 
     def _get_albaran_by_id(self, aid):
-        return next(
-            (
-                a
-                for a in self._gestor.listar_albaranes_emitidas(self._codigo, self._ejercicio)
-                if str(a.get("id")) == str(aid)
-            ),
-            None,
-        )
+        encontrados = self._gestor.listar_albaranes_emitidas_por_ids(self._codigo, [aid], self._ejercicio)
+        return encontrados[0] if encontrados else None
 
     def _albaranes_de_factura(self, fac: dict) -> list[dict]:
         factura_id = str(fac.get("id") or "").strip()
@@ -1447,78 +1518,8 @@ class FacturasEmitidasController:
             if str(alb.get("factura_id") or "").strip() == factura_id
         ]
 
-    def _descripcion_factura_desde_albaranes(self, albaranes: list[dict]) -> str:
-        albaranes = [a for a in (albaranes or []) if a]
-        if not albaranes:
-            return "Factura correspondiente al albaran."
-        if len(albaranes) == 1:
-            alb = albaranes[0]
-            numero = str(alb.get("numero") or "").strip()
-            fecha = self._format_fecha_descripcion(alb.get("fecha_asiento") or alb.get("fecha_expedicion"))
-            return f"Factura correspondiente al albaran {numero} de fecha {fecha}."
-        refs = []
-        for alb in albaranes:
-            numero = str(alb.get("numero") or "").strip()
-            fecha = self._format_fecha_descripcion(alb.get("fecha_asiento") or alb.get("fecha_expedicion"))
-            refs.append(f"{numero} de fecha {fecha}".strip())
-        return f"Factura correspondiente a los albaranes: {'; '.join(refs)}."
-
-    def _build_factura_lineas_desde_albaranes(self, albaranes: list[dict]) -> list[dict]:
-        descripcion = self._descripcion_factura_desde_albaranes(albaranes)
-        grouped = {}
-        for alb in albaranes or []:
-            for ln in alb.get("lineas", []) or []:
-                if str(ln.get("tipo") or "").strip().lower() == "obs":
-                    continue
-                key = (
-                    self._round4(self._to_float(ln.get("pct_iva"))),
-                    self._round4(self._to_float(ln.get("pct_re"))),
-                    self._round4(self._to_float(ln.get("pct_irpf"))),
-                )
-                item = grouped.setdefault(
-                    key,
-                    {
-                        "concepto": descripcion,
-                        "tipo": "",
-                        "unidades": 1.0,
-                        "precio": 0.0,
-                        "base": 0.0,
-                        "pct_iva": 0.0,
-                        "cuota_iva": 0.0,
-                        "pct_re": 0.0,
-                        "cuota_re": 0.0,
-                        "pct_irpf": 0.0,
-                        "cuota_irpf": 0.0,
-                    },
-                )
-                item["base"] += self._to_float(ln.get("base"))
-                item["cuota_iva"] += self._to_float(ln.get("cuota_iva"))
-                item["cuota_re"] += self._to_float(ln.get("cuota_re"))
-                item["cuota_irpf"] += self._to_float(ln.get("cuota_irpf"))
-                item["pct_iva"] = self._round4(self._to_float(ln.get("pct_iva")))
-                item["pct_re"] = self._round4(self._to_float(ln.get("pct_re")))
-                item["pct_irpf"] = self._round4(self._to_float(ln.get("pct_irpf")))
-        out = []
-        for item in grouped.values():
-            item["base"] = self._round2(item["base"])
-            item["cuota_iva"] = self._round2(item["cuota_iva"])
-            item["cuota_re"] = self._round2(item["cuota_re"])
-            item["cuota_irpf"] = self._round2(item["cuota_irpf"])
-            item["precio"] = item["base"]
-            out.append(item)
-        return out
-
     def _format_fecha_descripcion(self, fecha_txt: str) -> str:
-        value = str(fecha_txt or "").strip()
-        if not value:
-            return ""
-        for fmt_in in ("%d/%m/%Y", "%Y-%m-%d", "%Y/%m/%d", "%d-%m-%Y"):
-            try:
-                dt = datetime.strptime(value, fmt_in)
-                return dt.strftime("%d/%m/%Y")
-            except Exception:
-                continue
-        return value
+        return formatear_fecha_descripcion(fecha_txt)
 
     def _albaran_app_pdf_path(self, alb: dict) -> str:
         pdf_dir = str(get_default_output_dir())
@@ -1661,25 +1662,57 @@ class FacturasEmitidasController:
 
     def _incrementar_numeracion_por_factura(self, fac: dict, rectificativa: bool = False):
         year = self._year_from_factura(fac)
-        eje = year if year is not None else self._ejercicio
         serie_usada = str(fac.get("serie") or "").strip()
         if not serie_usada:
             serie_usada = self._serie_for_year(year, rectificativa=rectificativa)
-        try:
-            self._gestor.incrementar_serie_num(self._codigo, eje, serie_usada)
-        except Exception:
-            pass
+        self._reservar_numeros(year, serie_usada, 1, rectificativa=rectificativa)
+
+    @contextmanager
+    def _numeros_reservados(self, year: int | None, serie: str, n: int, rectificativa: bool = False):
+        """Reserva ``n`` numeros consecutivos de la serie para grabarlos en el bloque.
+
+        Si el bloque falla, los numeros se devuelven a la serie y el contador
+        de la empresa no avanza, asi que una grabacion fallida no deja huecos.
+        Los errores de la base de datos no se ocultan: solo se usa el contador
+        de la empresa cuando la serie no existe en ``series_emitidas``.
+        """
+        eje = year if year is not None else self._ejercicio
+        reservados = self._gestor.reservar_numeros_serie(self._codigo, eje, serie, n)
+        de_serie = reservados is not None
         # Mantener compatibilidad actualizando también empresas
         emp = self._empresa_for_year(year)
         key = "siguiente_num_emitidas_rect" if rectificativa else "siguiente_num_emitidas"
         try:
-            emp[key] = int(emp.get(key, 1)) + 1
+            actual = int(emp.get(key, 1))
+        except Exception:
+            actual = 1
+        if not de_serie:
+            # Sin la serie en series_emitidas manda el contador de la empresa,
+            # igual que en _siguiente_num_for_year.
+            reservados = range(actual, actual + n)
+        try:
+            yield [f"{num:06d}" for num in reservados]
         except Exception:
-            emp[key] = 2
+            if de_serie:
+                try:
+                    self._gestor.devolver_numeros_serie(self._codigo, eje, serie, reservados)
+                except Exception:
+                    import logging as _logging
+                    _logging.getLogger(__name__).exception(
+                        "No se pudieron devolver los numeros %s-%s de la serie %s",
+                        reservados.start, reservados.stop - 1, serie,
+                    )
+            raise
+        emp[key] = actual + n
         self._gestor.upsert_empresa(emp)
         if year == self._ejercicio:
             self._empresa_conf.update(emp)
 
+    def _reservar_numeros(self, year: int | None, serie: str, n: int, rectificativa: bool = False) -> list[str]:
+        """Reserva ``n`` numeros consecutivos de la serie con una sola sentencia."""
+        with self._numeros_reservados(year, serie, n, rectificativa=rectificativa) as numeros:
+            return numeros
+
     def _ajustar_numero_por_fecha_si_aplica(self, fac: dict, numero_sugerido: str, serie_sugerida: str, rectificativa: bool = False):
         num_actual = str(fac.get("numero") or "")
         serie_actual = str(fac.get("serie") or "")
@@ -2061,8 +2094,7 @@ class FacturasEmitidasController:
                 pass
         self._persist_factura_if_allowed(upd)
 
-    def _generar_pdf_word(self, fac: dict, out_path: str, default_template: str | None = None) -> None:
-        """Genera un PDF usando siempre la plantilla Word. Lanza excepcion si no hay plantilla o falla."""
+    def _plantilla_y_contexto_word(self, fac: dict, default_template: str | None = None) -> tuple[str, dict]:
         template_path = self._docx_template_path(fac, warn_missing=False, default_filename=default_template or "factura_emitida_template.docx")
         if not os.path.exists(template_path):
             raise FileNotFoundError(
@@ -2072,7 +2104,11 @@ class FacturasEmitidasController:
             )
         cliente = self._cliente_factura(fac)
         tot = self._totales_factura(fac)
-        context = build_context_emitida(self._empresa_conf_for_word(), fac, cliente, tot)
+        return template_path, build_context_emitida(self._empresa_conf_for_word(), fac, cliente, tot)
+
+    def _generar_pdf_word(self, fac: dict, out_path: str, default_template: str | None = None) -> None:
+        """Genera un PDF usando siempre la plantilla Word. Lanza excepcion si no hay plantilla o falla."""
+        template_path, context = self._plantilla_y_contexto_word(fac, default_template)
         generar_pdf_desde_plantilla_word(
             template_path=template_path,
             context=context,
@@ -2083,9 +2119,9 @@ class FacturasEmitidasController:
     def _resolve_app_pdf(self, fac: dict) -> str:
         """Devuelve la ruta del PDF en la carpeta de la app, generandolo si no existe o esta obsoleto.
 
-        Si la factura tiene updated_at mas reciente que pdf_generated_at, el PDF
-        se considera obsoleto y se regenera automaticamente. Las facturas
-        antiguas sin estas marcas se regeneran una vez al abrirlas o enviarlas.
+        El PDF esta obsoleto cuando cambia la huella de lo que lo determina
+        (contexto de la plantilla, plantilla y logo; ver ``huella_pdf``). Volver
+        a guardar la factura sin cambiar nada de eso no obliga a regenerarlo.
         """
         import logging as _logging
         _pdf_log = _logging.getLogger(__name__)
@@ -2093,99 +2129,143 @@ class FacturasEmitidasController:
         app_path = self._app_pdf_path(fac)
         if not app_path:
             return ""
+        try:
+            template_path, context = self._plantilla_y_contexto_word(fac)
+            huella = huella_pdf(template_path, context)
+        except Exception as e:
+            self._log_pdf_error("Error al preparar el PDF.", e, "", app_path)
+            return ""
 
         if os.path.exists(app_path):
-            pdf_obsoleto = False
+            guardada = str(fac.get("pdf_huella") or "").strip()
+            if guardada == huella:
+                return app_path
+            if not guardada and self._pdf_vigente_sin_huella(fac):
+                # PDF anterior a las huellas y posterior a la ultima
+                # modificacion: se adopta sin regenerarlo.
+                self._registrar_pdf_generado(fac, app_path, huella, fac.get("pdf_generated_at"))
+                return app_path
+            _pdf_log.info(
+                "PDF obsoleto para factura id=%s (huella %s -> %s); regenerando: %s",
+                fac.get("id"), guardada[:12] or "-", huella[:12], app_path,
+            )
+            try:
+                os.unlink(app_path)
+            except Exception as _e:
+                _pdf_log.warning("No se pudo eliminar PDF obsoleto %s: %s", app_path, _e)
+
+        try:
+            generar_pdf_desde_plantilla_word(
+                template_path=template_path,
+                context=context,
+                out_pdf_path=app_path,
+                guardar_docx=False,
+            )
+        except Exception as e:
+            self._log_pdf_error("Error al generar PDF.", e, "", app_path)
+            return ""
+        if os.path.exists(app_path):
+            self._registrar_pdf_generado(fac, app_path, huella)
+            return app_path
+        return ""
+
+    @staticmethod
+    def _pdf_vigente_sin_huella(fac: dict) -> bool:
+        """Criterio previo a las huellas: generado despues del ultimo guardado."""
+        fac_updated = str(fac.get("updated_at") or "").strip()
+        pdf_generated = str(fac.get("pdf_generated_at") or "").strip()
+        if not pdf_generated:
+            return False
+        if not fac_updated:
+            return True
+        try:
+            fac_dt = datetime.strptime(fac_updated.replace("T", " ").replace("Z", "").strip()[:19], "%Y-%m-%d %H:%M:%S")
+            pdf_dt = datetime.strptime(pdf_generated.replace("T", " ").replace("Z", "").strip()[:19], "%Y-%m-%d %H:%M:%S")
+        except Exception:
+            return False
+        return fac_dt <= pdf_dt
+
+    def _registrar_pdf_generado(
+        self, fac: dict, app_path: str, huella: str | None, generado_en: str | None = None
+    ) -> None:
+        """Guarda ruta, fecha y huella del PDF sin regrabar el resto de la factura."""
+        # updated_at se guarda en UTC en el gestor. Mantener la misma base
+        # temporal evita considerar vigente un PDF antiguo durante el
+        # desfase horario local (una o dos horas en Espana).
+        generado_en = generado_en or datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0).isoformat()
+        fac.update({"pdf_path": app_path, "pdf_generated_at": generado_en, "pdf_huella": huella})
+        if not self._can_write() or not fac.get("id"):
+            return
+        self._gestor.marcar_pdf_factura_emitida(self._codigo, fac["id"], app_path, generado_en, huella)
+
+    def precalentar_pdfs(self, facturas: list[dict]) -> int:
+        """Regenera en segundo plano los PDF ya existentes que han quedado obsoletos.
+
+        Pensado para despues de cambios masivos: al abrir o enviar esas
+        facturas el PDF ya estara al dia. Aqui solo se leen la empresa y los
+        clientes, que usan la conexion de la ventana; rutas, contexto, huella
+        y conversion van en un hilo. Devuelve cuantas facturas se revisan.
+        """
+        pendientes = [fac for fac in facturas if fac and fac.get("pdf_path")]
+        if not pendientes:
+            return 0
+        try:
+            empresa = self._empresa_conf_for_word()
+        except Exception:
+            return 0
+        trabajos = []
+        for fac in pendientes:
             try:
-                pdf_mtime = datetime.fromtimestamp(os.path.getmtime(app_path))
+                trabajos.append((fac, self._cliente_factura(fac), self._totales_factura(fac)))
             except Exception:
-                pdf_mtime = None
-
-            # Comprobar si la factura fue modificada despues de que se genero el PDF.
-            # Las bases antiguas no tienen estas marcas: en ese caso se fuerza
-            # una regeneracion unica para no reutilizar un PDF cuyo origen se
-            # desconoce.
-            if not pdf_obsoleto and pdf_mtime:
-                fac_updated = str(fac.get("updated_at") or "").strip()
-                pdf_generated = str(fac.get("pdf_generated_at") or "").strip()
-                if not pdf_generated:
-                    pdf_obsoleto = True
-                elif fac_updated:
-                    try:
-                        fac_str = fac_updated.replace("T", " ").replace("Z", "").strip()[:19]
-                        fac_dt = datetime.strptime(fac_str, "%Y-%m-%d %H:%M:%S")
-                        pdf_str = pdf_generated.replace("T", " ").replace("Z", "").strip()[:19]
-                        pdf_dt = datetime.strptime(pdf_str, "%Y-%m-%d %H:%M:%S")
-                        if fac_dt > pdf_dt:
-                            pdf_obsoleto = True
-                            _pdf_log.info(
-                                "PDF obsoleto para factura id=%s (updated_at=%s > pdf_generated_at=%s);"
-                                " regenerando: %s",
-                                fac.get("id"), fac_dt, pdf_dt, app_path,
-                            )
-                    except Exception:
-                        pass
-
-            # Comprobar si el generador Word o el controlador fueron actualizados
-            if not pdf_obsoleto and pdf_mtime:
-                try:
-                    import procesos.facturas_word as _fw_mod
-                    import inspect as _inspect
-                    _code_files = [_inspect.getfile(_fw_mod), __file__]
-                    for _cf in _code_files:
-                        try:
-                            _cf_mtime = datetime.fromtimestamp(os.path.getmtime(_cf))
-                        except Exception:
-                            continue
-                        if _cf_mtime > pdf_mtime:
-                            pdf_obsoleto = True
-                            _pdf_log.info(
-                                "PDF obsoleto para factura id=%s: %s actualizado"
-                                " (%s > pdf %s); regenerando: %s",
-                                fac.get("id"), os.path.basename(_cf), _cf_mtime, pdf_mtime, app_path,
-                            )
-                            break
-                except Exception:
-                    pass
+                continue
+        if trabajos:
+            threading.Thread(
+                target=self._precalentar_en_segundo_plano,
+                args=(empresa, trabajos),
+                name="precalentar-pdf",
+                daemon=True,
+            ).start()
+        return len(trabajos)
+
+    def _precalentar_en_segundo_plano(self, empresa: dict, trabajos: list[tuple[dict, dict, dict]]) -> None:
+        for fac, cliente, tot in trabajos:
+            try:
+                app_path = self._app_pdf_path(fac)
+                if not app_path or not os.path.exists(app_path):
+                    continue
+                template_path = self._docx_template_path(fac)
+                if not os.path.exists(template_path):
+                    continue
+                context = build_context_emitida(empresa, fac, cliente, tot)
+                huella = huella_pdf(template_path, context)
+            except Exception:
+                continue
+            if huella == str(fac.get("pdf_huella") or "").strip():
+                continue
+            tmp_path = app_path + ".tmp.pdf"
+            futuro = enviar_pdf_desde_plantilla_word(template_path, context, tmp_path)
 
-            # Comprobar si la config de empresa cambio despues de que se genero el PDF
-            if not pdf_obsoleto:
+            def _terminado(f, fac=fac, app_path=app_path, tmp_path=tmp_path, huella=huella):
                 try:
-                    emp_fresh = self._gestor.get_empresa(self._codigo, self._ejercicio) or {}
-                    emp_cached = self._empresa_conf or {}
-                    _addr_fields = ("direccion", "cp", "poblacion", "provincia", "nombre", "cif")
-                    if any(str(emp_fresh.get(f) or "") != str(emp_cached.get(f) or "") for f in _addr_fields):
-                        pdf_obsoleto = True
-                        _pdf_log.info(
-                            "PDF obsoleto para factura id=%s: config empresa ha cambiado; regenerando: %s",
-                            fac.get("id"), app_path,
-                        )
+                    self._view.after(0, self._pdf_precalentado, fac, app_path, tmp_path, huella, f)
                 except Exception:
                     pass
 
-            if pdf_obsoleto:
-                try:
-                    os.unlink(app_path)
-                except Exception as _e:
-                    _pdf_log.warning("No se pudo eliminar PDF obsoleto %s: %s", app_path, _e)
-            else:
-                return app_path
+            futuro.add_done_callback(_terminado)
 
+    def _pdf_precalentado(self, fac: dict, app_path: str, tmp_path: str, huella: str, futuro) -> None:
         try:
-            self._generar_pdf_word(fac, app_path)
+            futuro.result()
+            os.replace(tmp_path, app_path)
         except Exception as e:
-            self._log_pdf_error("Error al generar PDF.", e, "", app_path)
-            return ""
-        if os.path.exists(app_path):
-            upd = dict(fac)
-            upd["pdf_path"] = app_path
-            # updated_at se guarda en UTC en el gestor. Mantener la misma base
-            # temporal evita considerar vigente un PDF antiguo durante el
-            # desfase horario local (una o dos horas en Espana).
-            upd["pdf_generated_at"] = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0).isoformat()
-            self._persist_factura_if_allowed(upd)
-            return app_path
-        return ""
+            self._log_pdf_error("Error al regenerar PDF en segundo plano.", e, "", app_path)
+            try:
+                os.unlink(tmp_path)
+            except Exception:
+                pass
+            return
+        self._registrar_pdf_generado(fac, app_path, huella)
 
     def _ensure_app_pdf(self, fac: dict) -> None:
         pdf_ref = self._pdf_ref_base(fac.get("pdf_ref") or "")
@@ -2222,14 +2302,17 @@ class FacturasEmitidasController:
             except Exception:
                 pass
         try:
-            self._generar_pdf_word(fac, app_path)
+            template_path, context = self._plantilla_y_contexto_word(fac)
+            generar_pdf_desde_plantilla_word(
+                template_path=template_path,
+                context=context,
+                out_pdf_path=app_path,
+                guardar_docx=False,
+            )
         except Exception as e:
             self._log_pdf_error("_ensure_app_pdf: error Word.", e, "", app_path)
             return
-        upd = dict(fac)
-        upd["pdf_path"] = app_path
-        upd["pdf_generated_at"] = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0).isoformat()
-        self._persist_factura_if_allowed(upd)
+        self._registrar_pdf_generado(fac, app_path, huella_pdf(template_path, context))
 
     def _ensure_a3_pdf(self, fac: dict) -> None:
         import logging as _logging
@@ -2388,19 +2471,7 @@ class FacturasEmitidasController:
             pass
 
     def _to_float(self, x) -> float:
-        try:
-            if x is None or x == "":
-                return 0.0
-            if isinstance(x, (int, float)) and not isinstance(x, bool):
-                return float(x)
-            s = str(x).strip().replace("\\xa0", " ")
-            if "." in s and "," in s:
-                s = s.replace(".", "").replace(",", ".")
-            elif "," in s:
-                s = s.replace(",", ".")
-            return float(s)
-        except Exception:
-            return 0.0
+        return to_float(x)
 
     def _retencion_importe(self, fac: dict) -> float:
         if not fac:
@@ -2506,165 +2577,79 @@ class FacturasEmitidasController:
     # ------------------- Exportacion Excel -------------------
 
     def exportar_facturas_excel(self, fecha_desde: str, fecha_hasta: str, cliente_filter: str):
-        from tkinter import filedialog
-        import openpyxl
-        from openpyxl.styles import Font, PatternFill, Alignment
-        from utils.ui_facturas_emitidas_helpers import parse_date_ui
-
-        filepath = filedialog.asksaveasfilename(
-            defaultextension=".xlsx",
-            filetypes=[("Excel", "*.xlsx")],
-            initialfile=f"facturas_{self._ejercicio}.xlsx",
-            parent=self._view,
-        )
+        filepath = self._ruta_exportacion(f"facturas_{self._ejercicio}.xlsx")
         if not filepath:
             return
-
-        desde = None
-        hasta = None
-        try:
-            if fecha_desde:
-                desde = parse_date_ui(fecha_desde)
-        except Exception:
-            pass
-        try:
-            if fecha_hasta:
-                hasta = parse_date_ui(fecha_hasta)
-        except Exception:
-            pass
-
-        rows = []
-        for fac in self._facturas_cache:
-            if cliente_filter:
-                nombre = (fac.get("nombre") or "").lower()
-                nif = (fac.get("nif") or "").lower()
-                if cliente_filter not in nombre and cliente_filter not in nif:
-                    continue
-            if desde or hasta:
-                try:
-                    fd = parse_date_ui(fac.get("fecha_asiento", ""))
-                    if desde and fd < desde:
-                        continue
-                    if hasta and fd > hasta:
-                        continue
-                except Exception:
-                    pass
-            rows.append(fac)
-
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Facturas"
-        headers = ["Ejercicio", "Serie", "Numero", "Fecha", "Cliente", "NIF", "Base", "IVA", "RE", "Total", "Generada"]
-        hdr_font = Font(bold=True, color="FFFFFF")
-        hdr_fill = PatternFill("solid", fgColor="2563EB")
-        hdr_align = Alignment(horizontal="center")
-        for ci, h in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=ci, value=h)
-            cell.font = hdr_font
-            cell.fill = hdr_fill
-            cell.alignment = hdr_align
-        for fac in rows:
-            tots = self._totales_factura(fac)
-            ws.append([
-                fac.get("ejercicio", ""),
-                str(fac.get("serie") or "").strip(),
-                str(fac.get("numero") or "").strip(),
-                fac.get("fecha_asiento", ""),
-                fac.get("nombre", ""),
-                fac.get("nif", ""),
-                tots["base"],
-                tots["iva"],
-                tots["re"],
-                tots["total"],
-                "Si" if fac.get("generada") else "No",
-            ])
-        col_widths = [10, 8, 14, 12, 35, 16, 12, 12, 10, 12, 10]
-        for ci, w in enumerate(col_widths, 1):
-            ws.column_dimensions[ws.cell(1, ci).column_letter].width = w
-        wb.save(filepath)
-        self._view.show_info("Gest2A3Eco", f"Exportadas {len(rows)} facturas.")
+        desde, hasta = self._rango_fechas_exportacion(fecha_desde, fecha_hasta)
+        self._exportar_en_segundo_plano(
+            lambda: self._gestor.iterar_facturas_emitidas(
+                self._codigo,
+                None if self._allow_all_years else self._ejercicio,
+                cliente=cliente_filter,
+                desde=desde,
+                hasta=hasta,
+                excluir_ocr=not self._incluir_origen_ocr,
+            ),
+            lambda facturas: exportar_facturas(filepath, facturas, self._totales_factura),
+            "Exportadas {n} facturas.",
+        )
 
     def exportar_albaranes_excel(self, fecha_desde: str, fecha_hasta: str, cliente_filter: str):
+        filepath = self._ruta_exportacion(f"albaranes_{self._ejercicio}.xlsx")
+        if not filepath:
+            return
+        desde, hasta = self._rango_fechas_exportacion(fecha_desde, fecha_hasta)
+        self._exportar_en_segundo_plano(
+            lambda: self._gestor.iterar_albaranes_emitidas(
+                self._codigo, self._ejercicio, cliente=cliente_filter, desde=desde, hasta=hasta,
+            ),
+            lambda albaranes: exportar_albaranes(filepath, albaranes, self._totales_factura),
+            "Exportados {n} albaranes.",
+        )
+
+    def _ruta_exportacion(self, nombre: str) -> str:
         from tkinter import filedialog
-        import openpyxl
-        from openpyxl.styles import Font, PatternFill, Alignment
-        from utils.ui_facturas_emitidas_helpers import parse_date_ui
 
-        filepath = filedialog.asksaveasfilename(
+        return filedialog.asksaveasfilename(
             defaultextension=".xlsx",
-            filetypes=[("Excel", "*.xlsx")],
-            initialfile=f"albaranes_{self._ejercicio}.xlsx",
+            filetypes=[("Excel", "*.xlsx"), ("CSV (mas rapido)", "*.csv")],
+            initialfile=nombre,
             parent=self._view,
         )
-        if not filepath:
-            return
 
-        desde = None
-        hasta = None
-        try:
-            if fecha_desde:
-                desde = parse_date_ui(fecha_desde)
-        except Exception:
-            pass
+    def _rango_fechas_exportacion(self, fecha_desde: str, fecha_hasta: str):
+        from utils.ui_facturas_emitidas_helpers import parse_date_ui
+
+        desde = parse_date_ui(fecha_desde) if fecha_desde else None
+        hasta = parse_date_ui(fecha_hasta) if fecha_hasta else None
+        return desde, hasta
+
+    def _exportar_en_segundo_plano(self, leer, exportar, mensaje: str) -> None:
+        """Lee las filas en la ventana y escribe el fichero en un hilo.
+
+        La conexion a la base de datos es compartida con la ventana, asi que
+        el hilo solo recibe las filas ya leidas y no vuelve a consultarla.
+        """
         try:
-            if fecha_hasta:
-                hasta = parse_date_ui(fecha_hasta)
-        except Exception:
-            pass
+            filas = list(leer())
+        except Exception as exc:
+            self._exportacion_terminada(0, exc, mensaje)
+            return
 
-        albaranes = self._gestor.listar_albaranes_emitidas(self._codigo, self._ejercicio)
-        facturas_map = {
-            str(f.get("id")): str(f.get("numero") or "").strip()
-            for f in self._gestor.listar_facturas_emitidas(self._codigo, self._ejercicio)
-        }
+        def worker():
+            try:
+                n, error = exportar(filas), None
+            except Exception as exc:
+                n, error = 0, exc
+            try:
+                self._view.after(0, self._exportacion_terminada, n, error, mensaje)
+            except Exception:
+                pass
 
-        rows = []
-        for alb in albaranes:
-            if cliente_filter:
-                nombre = (alb.get("nombre") or "").lower()
-                nif = (alb.get("nif") or "").lower()
-                if cliente_filter not in nombre and cliente_filter not in nif:
-                    continue
-            if desde or hasta:
-                try:
-                    fd = parse_date_ui(alb.get("fecha_asiento", ""))
-                    if desde and fd < desde:
-                        continue
-                    if hasta and fd > hasta:
-                        continue
-                except Exception:
-                    pass
-            rows.append(alb)
-
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Albaranes"
-        headers = ["Numero", "Fecha", "Cliente", "NIF", "Base", "IVA", "RE", "Total", "Facturado", "Factura"]
-        hdr_font = Font(bold=True, color="FFFFFF")
-        hdr_fill = PatternFill("solid", fgColor="2563EB")
-        hdr_align = Alignment(horizontal="center")
-        for ci, h in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=ci, value=h)
-            cell.font = hdr_font
-            cell.fill = hdr_fill
-            cell.alignment = hdr_align
-        for alb in rows:
-            tots = self._totales_factura(alb)
-            factura_txt = facturas_map.get(str(alb.get("factura_id") or ""), "")
-            ws.append([
-                str(alb.get("numero") or "").strip(),
-                alb.get("fecha_asiento", ""),
-                alb.get("nombre", ""),
-                alb.get("nif", ""),
-                tots["base"],
-                tots["iva"],
-                tots["re"],
-                tots["total"],
-                "Si" if alb.get("facturado") else "No",
-                factura_txt,
-            ])
-        col_widths = [18, 12, 35, 16, 12, 12, 10, 12, 10, 14]
-        for ci, w in enumerate(col_widths, 1):
-            ws.column_dimensions[ws.cell(1, ci).column_letter].width = w
-        wb.save(filepath)
-        self._view.show_info("Gest2A3Eco", f"Exportados {len(rows)} albaranes.")
+        threading.Thread(target=worker, name="exportar-excel", daemon=True).start()
+
+    def _exportacion_terminada(self, n: int, error, mensaje: str) -> None:
+        if error is not None:
+            self._view.show_error("Gest2A3Eco", f"No se pudo exportar:\n{error}")
+            return
+        self._view.show_info("Gest2A3Eco", mensaje.format(n=n))
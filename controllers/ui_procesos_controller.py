@@ -241,17 +241,9 @@ class ProcesosController:
             if not rows:
                 return
 
-            # Usar solo listar_terceros_por_empresa: ya hace JOIN con terceros_empresas
-            # y trae subcuenta_proveedor, subcuenta_cliente, subcuenta_gasto, subcuenta_ingreso.
-            terceros_empresa = self._gestor.listar_terceros_por_empresa(self._codigo, self._ejercicio)
-            terceros_by_nif: dict[str, dict] = {}
-            for t in terceros_empresa:
-                # Intentar primero nif_normalizado (ya limpio en BD), luego nif normalizado al vuelo
-                nif_norm = str(t.get("nif_normalizado") or "").strip().upper()
-                if not nif_norm:
-                    nif_norm = self._norm_nif(t.get("nif"))
-                if nif_norm:
-                    terceros_by_nif[nif_norm] = t
+            # Los terceros de la empresa traen subcuenta_proveedor, subcuenta_cliente,
+            # subcuenta_gasto y subcuenta_ingreso; los globales no tienen subcuentas.
+            terceros_by_nif = self._terceros_de_filas(rows)
 
             es_emitidas = "emitidas" in tipo
             sub_key = "subcuenta_cliente" if es_emitidas else "subcuenta_proveedor"
@@ -459,17 +451,7 @@ class ProcesosController:
                         "Revisa la hoja seleccionada, 'Primera fila procesar' y el mapeo de columnas.",
                     )
                     return
-                terceros = self._gestor.listar_terceros()
-                terceros_by_nif = {
-                    self._norm_nif(t.get("nif")): t
-                    for t in terceros
-                    if self._norm_nif(t.get("nif"))
-                }
-                terceros_empresa = self._gestor.listar_terceros_por_empresa(self._codigo, self._ejercicio)
-                for t in terceros_empresa:
-                    nif = self._norm_nif(t.get("nif"))
-                    if nif:
-                        terceros_by_nif[nif] = t
+                terceros_by_nif = self._terceros_de_filas(rows)
                 subcuentas_c_emitidas: list = []
                 registros = generar_emitidas(
                     rows,
@@ -528,17 +510,7 @@ class ProcesosController:
                     "Revisa la hoja seleccionada, 'Primera fila procesar' y el mapeo de columnas.",
                 )
                 return
-            terceros = self._gestor.listar_terceros()
-            terceros_by_nif = {
-                self._norm_nif(t.get("nif")): t
-                for t in terceros
-                if self._norm_nif(t.get("nif"))
-            }
-            terceros_empresa = self._gestor.listar_terceros_por_empresa(self._codigo, self._ejercicio)
-            for t in terceros_empresa:
-                nif = self._norm_nif(t.get("nif"))
-                if nif:
-                    terceros_by_nif[nif] = t
+            terceros_by_nif = self._terceros_de_filas(rows)
             subcuentas_c_recibidas: list = []
             out_lines = generar_recibidas_suenlace(
                 rows,
@@ -617,6 +589,14 @@ class ProcesosController:
     def _norm_nif(self, value) -> str:
         return normalizar_nif_cif(value)
 
+    def _terceros_de_filas(self, rows: list[dict]) -> dict[str, dict]:
+        """Terceros por NIF normalizado, solo de los NIF presentes en ``rows``."""
+        return self._gestor.get_terceros_by_nifs(
+            self._codigo,
+            self._ejercicio,
+            [r.get("NIF Cliente Proveedor") or r.get("NIF") for r in rows],
+        )
+
     def _log_error(self, msg: str, exc: Exception) -> None:
         try:
             base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -1,3 +1,4 @@
+import multiprocessing
 import os
 import sys
 import warnings
@@ -685,4 +686,7 @@ def main():
 
 
 if __name__ == "__main__":
+    # Los lotes Facturae usan procesos de trabajo; en el ejecutable congelado
+    # cada proceso hijo arranca este mismo programa.
+    multiprocessing.freeze_support()
     main()
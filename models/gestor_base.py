@@ -1,10 +1,14 @@
 import json
+import os
 import time
 import re
+import socket
 import uuid
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
+from typing import Callable
 
+from models.indice_cuentas import EN_MAESTRO, EN_PLAN, IndiceCuentas
 from services.terceros_empresa_fiscal_service import validate_tercero_empresa_rel
 from utils.validaciones import (
     inferir_pais_desde_identificacion,
@@ -14,6 +18,75 @@ from utils.validaciones import (
 )
 
 
+# Columnas de la cola persistente de OCR sobre documentos_ocr.
+COLUMNAS_COLA_OCR = (
+    ("cola_prioridad", "INTEGER NOT NULL DEFAULT 0"),
+    ("cola_intentos", "INTEGER NOT NULL DEFAULT 0"),
+    ("cola_proximo_intento", "TEXT"),
+    ("cola_trabajador", "TEXT"),
+    ("cola_bloqueado_en", "TEXT"),
+    ("cola_opciones_json", "TEXT"),
+)
+INDICE_COLA_OCR = (
+    "CREATE INDEX IF NOT EXISTS idx_doc_ocr_cola "
+    "ON documentos_ocr(cola_prioridad DESC, fecha_alta) WHERE estado='en_cola'"
+)
+
+# Filas por sentencia en las inserciones masivas de notif_bandeja.
+_NOTIF_BANDEJA_FILAS_POR_LOTE = 1000
+
+# Vigencia de la subcuenta propuesta a un puesto mientras da de alta el tercero.
+RESERVA_SUBCUENTA_TTL_S = 10 * 60
+# Vida de los indices en memoria de cuentas y subcuentas; acota lo que tarda
+# en verse un cambio hecho desde otro puesto.
+_TTL_INDICES_CUENTAS_S = 120
+_CAMPOS_SUBCUENTA_TERCERO = frozenset(
+    {"subcuenta_cliente", "subcuenta_proveedor", "subcuenta_ingreso", "subcuenta_gasto"}
+)
+
+# Indice inverso subcuenta -> factura (tabla referencias_subcuentas). Por tipo
+# de documento, las filas (codigo_empresa, subcuenta, tipo_doc, doc_id, campo)
+# de los documentos que cumplen {filtro} sobre el alias ``d``.
+_REFERENCIAS_SUBCUENTA_SQL = {
+    "factura_emitida": """
+        SELECT d.codigo_empresa, TRIM(d.subcuenta_cliente), 'factura_emitida', d.id, 'cliente'
+          FROM facturas_emitidas_docs d WHERE {filtro}""",
+    "factura_recibida": """
+        SELECT d.codigo_empresa, TRIM(d.cuenta_gasto), 'factura_recibida', d.id, 'gasto'
+          FROM facturas_recibidas_docs d WHERE {filtro}
+        UNION ALL
+        SELECT d.codigo_empresa, TRIM(d.cuenta_iva), 'factura_recibida', d.id, 'iva'
+          FROM facturas_recibidas_docs d WHERE {filtro}
+        UNION ALL
+        SELECT d.codigo_empresa, TRIM(d.cuenta_proveedor), 'factura_recibida', d.id, 'proveedor'
+          FROM facturas_recibidas_docs d WHERE {filtro}
+        UNION ALL
+        SELECT d.codigo_empresa, TRIM(o.cuenta_base), 'factura_recibida', d.id, 'linea_base'
+          FROM ocr_lineas_fiscales o JOIN facturas_recibidas_docs d ON d.id = o.doc_id
+         WHERE {filtro}
+        UNION ALL
+        SELECT d.codigo_empresa, TRIM(o.cuenta_iva), 'factura_recibida', d.id, 'linea_iva'
+          FROM ocr_lineas_fiscales o JOIN facturas_recibidas_docs d ON d.id = o.doc_id
+         WHERE {filtro}
+        UNION ALL
+        SELECT d.codigo_empresa, TRIM(o.cuenta_retencion), 'factura_recibida', d.id, 'linea_retencion'
+          FROM ocr_lineas_fiscales o JOIN facturas_recibidas_docs d ON d.id = o.doc_id
+         WHERE {filtro}""",
+}
+_INSERTAR_REFERENCIAS_SUBCUENTA = """
+    INSERT OR IGNORE INTO referencias_subcuentas
+        (codigo_empresa, subcuenta, tipo_doc, doc_id, campo)
+    SELECT * FROM ({consulta}) r (codigo_empresa, subcuenta, tipo_doc, doc_id, campo)
+     WHERE r.subcuenta <> ''"""
+# Campos de la factura recibida y, si no hay ninguno, de sus lineas OCR.
+_ETIQUETAS_REFERENCIA_RECIBIDA = (
+    ("gasto", "gasto"), ("iva", "IVA"), ("proveedor", "proveedor"),
+)
+_ETIQUETAS_REFERENCIA_LINEA = (
+    ("linea_base", "base"), ("linea_iva", "IVA"), ("linea_retencion", "retencion"),
+)
+
+
 def _ej_val(v):
     try:
         return int(v)
@@ -21,6 +94,15 @@ def _ej_val(v):
         return None
 
 
+def _sql_fecha_iso(columna: str) -> str:
+    """Expresion SQL que lleva una fecha dd/mm/aaaa, dd-mm-aaaa o aaaa-mm-dd a aaaa-mm-dd."""
+    return (
+        f"CASE WHEN substr({columna}, 3, 1) IN ('/', '-') "
+        f"THEN substr({columna}, 7, 4) || '-' || substr({columna}, 4, 2) || '-' || substr({columna}, 1, 2) "
+        f"ELSE replace(substr({columna}, 1, 10), '/', '-') END"
+    )
+
+
 def _codigo_empresa_a3(v) -> str:
     raw = str(v or "").strip().upper()
     if raw.startswith("E"):
@@ -268,7 +350,8 @@ CREATE TABLE IF NOT EXISTS facturas_emitidas_docs (
   facturae_status TEXT,
   facturae_error TEXT,
   updated_at TEXT,
-  pdf_generated_at TEXT
+  pdf_generated_at TEXT,
+  pdf_huella TEXT
 );
 CREATE TABLE IF NOT EXISTS albaranes_emitidas_docs (
   id TEXT PRIMARY KEY,
@@ -351,6 +434,23 @@ CREATE TABLE IF NOT EXISTS plan_cuentas (
 );
 CREATE INDEX IF NOT EXISTS idx_plan_cuentas_empresa
   ON plan_cuentas(codigo_empresa, ejercicio);
+CREATE TABLE IF NOT EXISTS reservas_subcuentas (
+  codigo_empresa TEXT NOT NULL,
+  subcuenta TEXT NOT NULL,
+  reservado_por TEXT NOT NULL,
+  expira_en TEXT NOT NULL,
+  PRIMARY KEY (codigo_empresa, subcuenta)
+);
+CREATE TABLE IF NOT EXISTS referencias_subcuentas (
+  codigo_empresa TEXT NOT NULL,
+  subcuenta TEXT NOT NULL,
+  tipo_doc TEXT NOT NULL,
+  doc_id TEXT NOT NULL,
+  campo TEXT NOT NULL,
+  PRIMARY KEY (codigo_empresa, subcuenta, tipo_doc, doc_id, campo)
+);
+CREATE INDEX IF NOT EXISTS idx_referencias_subcuentas_doc
+  ON referencias_subcuentas(tipo_doc, doc_id);
 CREATE TABLE IF NOT EXISTS cuentas_bancarias (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   codigo_empresa TEXT NOT NULL,
@@ -584,6 +684,27 @@ CREATE TABLE IF NOT EXISTS documentos_archivo (
 );
 CREATE INDEX IF NOT EXISTS idx_documentos_archivo_empresa
   ON documentos_archivo(codigo_empresa, ejercicio, categoria_id, created_at DESC);
+CREATE TABLE IF NOT EXISTS documentos_contenido (
+  hash_archivo TEXT PRIMARY KEY,
+  ruta_objeto TEXT NOT NULL,
+  tamano INTEGER,
+  referencias INTEGER NOT NULL DEFAULT 0,
+  created_at TEXT NOT NULL,
+  updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ocr_cache_resultados (
+  hash_archivo TEXT NOT NULL,
+  motor TEXT NOT NULL,
+  version_motor TEXT NOT NULL,
+  resultado_json TEXT NOT NULL,
+  tamano INTEGER NOT NULL,
+  aciertos INTEGER NOT NULL DEFAULT 0,
+  ultimo_acceso TEXT NOT NULL,
+  created_at TEXT NOT NULL,
+  PRIMARY KEY (hash_archivo, motor, version_motor)
+);
+CREATE INDEX IF NOT EXISTS idx_ocr_cache_acceso
+  ON ocr_cache_resultados(ultimo_acceso);
 CREATE TABLE IF NOT EXISTS comunicaciones_adjuntos_decisiones (
   graph_message_id TEXT NOT NULL,
   graph_attachment_id TEXT NOT NULL,
@@ -1063,6 +1184,7 @@ class GestorBase:
         self._ensure_column("facturas_emitidas_docs", "facturae_error", "TEXT")
         self._ensure_column("facturas_emitidas_docs", "updated_at", "TEXT")
         self._ensure_column("facturas_emitidas_docs", "pdf_generated_at", "TEXT")
+        self._ensure_column("facturas_emitidas_docs", "pdf_huella", "TEXT")
         self.conn.executescript(
             "CREATE TABLE IF NOT EXISTS series_emitidas ("
             "  id INTEGER PRIMARY KEY AUTOINCREMENT,"
@@ -1145,9 +1267,9 @@ class GestorBase:
         self.conn.execute(
             "UPDATE terceros SET nombre_legal=nombre WHERE nombre_legal IS NULL AND nombre IS NOT NULL"
         )
+        self._renormalizar_nif_terceros()
         self.conn.execute(
-            "UPDATE terceros SET nif_normalizado=UPPER(REPLACE(REPLACE(nif,'-',''),' ',''))"
-            " WHERE nif_normalizado IS NULL AND nif IS NOT NULL AND TRIM(nif)!=''"
+            "CREATE INDEX IF NOT EXISTS idx_terceros_nif_normalizado ON terceros(nif_normalizado)"
         )
         self.conn.execute("UPDATE terceros SET activo=1 WHERE activo IS NULL")
         self.conn.commit()
@@ -1392,6 +1514,12 @@ class GestorBase:
         self._ensure_column("facturas_emitidas_ocr", "subcuenta_cliente", "TEXT")
         self._ensure_column("facturas_emitidas_ocr", "cuenta_ingreso", "TEXT")
         self._ensure_column("facturas_emitidas_ocr", "cuenta_iva", "TEXT")
+        for columna, tipo in COLUMNAS_COLA_OCR:
+            self._ensure_column("documentos_ocr", columna, tipo)
+        # Objeto del almacen por contenido del que el documento tiene referencia.
+        self._ensure_column("documentos_ocr", "ruta_objeto", "TEXT")
+        self._ensure_column("documentos_archivo", "ruta_objeto", "TEXT")
+        self.conn.execute(INDICE_COLA_OCR)
         self.conn.commit()
         self.conn.executescript("""
             CREATE TABLE IF NOT EXISTS cuotas_periodicas (
@@ -1553,18 +1681,45 @@ class GestorBase:
         self.conn.execute("DELETE FROM series_emitidas WHERE id=?", (serie_id,))
         self.conn.commit()
 
-    def incrementar_serie_num(self, codigo: str, ejercicio: int, nombre: str) -> int:
-        """Incrementa el contador de la serie y devuelve el nuevo valor."""
-        self.conn.execute(
-            "UPDATE series_emitidas SET siguiente_num = siguiente_num + 1 WHERE codigo_empresa=? AND ejercicio=? AND nombre=?",
-            (codigo, _ej_val(ejercicio), nombre)
-        )
-        self.conn.commit()
+    def reservar_numeros_serie(self, codigo: str, ejercicio: int, serie: str, n: int = 1) -> range | None:
+        """Reserva ``n`` numeros consecutivos de la serie y los devuelve como rango.
+
+        Un solo ``UPDATE ... RETURNING``: la fila de la serie queda bloqueada
+        durante la sentencia, asi que dos puestos nunca reciben el mismo numero.
+        Devuelve None si la serie no existe.
+        """
+        n = int(n)
+        if n < 1:
+            raise ValueError("Hay que reservar al menos un numero.")
         row = self.conn.execute(
-            "SELECT siguiente_num FROM series_emitidas WHERE codigo_empresa=? AND ejercicio=? AND nombre=?",
-            (codigo, _ej_val(ejercicio), nombre)
+            "UPDATE series_emitidas SET siguiente_num = siguiente_num + ? "
+            "WHERE codigo_empresa=? AND ejercicio=? AND nombre=? RETURNING siguiente_num",
+            (n, codigo, _ej_val(ejercicio), serie),
         ).fetchone()
-        return row[0] if row else 1
+        self.conn.commit()
+        if not row:
+            return None
+        fin = int(row["siguiente_num"])
+        return range(fin - n, fin)
+
+    def devolver_numeros_serie(self, codigo: str, ejercicio: int, serie: str, reservados: range) -> bool:
+        """Deshace una reserva de ``reservar_numeros_serie`` que no se ha usado.
+
+        Solo retrocede el contador si nadie ha reservado despues; en ese caso
+        los numeros quedan como hueco. Devuelve si se han devuelto.
+        """
+        cur = self.conn.execute(
+            "UPDATE series_emitidas SET siguiente_num=? "
+            "WHERE codigo_empresa=? AND ejercicio=? AND nombre=? AND siguiente_num=?",
+            (reservados.start, codigo, _ej_val(ejercicio), serie, reservados.stop),
+        )
+        self.conn.commit()
+        return bool(cur.rowcount)
+
+    def incrementar_serie_num(self, codigo: str, ejercicio: int, nombre: str) -> int:
+        """Incrementa el contador de la serie y devuelve el nuevo valor."""
+        reservados = self.reservar_numeros_serie(codigo, ejercicio, nombre, 1)
+        return reservados.stop if reservados else 1
 
     def get_siguiente_serie_num(self, codigo: str, ejercicio: int, nombre: str) -> int:
         row = self.conn.execute(
@@ -2182,27 +2337,81 @@ class GestorBase:
         Cada elemento de 'cuentas' debe tener {'cuenta': str, 'descripcion': str}.
         Devuelve el número de cuentas guardadas.
         """
+        recuento = self.cargar_plan_cuentas(codigo_empresa, ejercicio, cuentas)
+        return recuento["insertadas"] + recuento["actualizadas"] + recuento["sin_cambios"]
+
+    def _volcar_temporal(self, tabla: str, columnas: str, filas: list[tuple]) -> None:
+        """Crea la tabla temporal ``tabla`` y vuelca ``filas`` con COPY.
+
+        La tabla desaparece con el commit. Si la conexion no admite COPY se
+        rellena con un unico executemany.
+        """
+        self.conn.execute(f"CREATE TEMP TABLE {tabla} ({columnas}) ON COMMIT DROP")
+        nombres = [c.split()[0] for c in columnas.split(",")]
+        copiar = getattr(self.conn, "copiar_filas", None)
+        if copiar is not None:
+            copiar(f"COPY {tabla} ({', '.join(nombres)}) FROM STDIN", filas)
+        elif filas:
+            self.conn.executemany(
+                f"INSERT INTO {tabla} ({', '.join(nombres)})"
+                f" VALUES ({', '.join('?' for _ in nombres)})",
+                filas,
+            )
+
+    def cargar_plan_cuentas(self, codigo_empresa: str, ejercicio: int,
+                            cuentas: list[dict]) -> dict:
+        """Reemplaza el plan de una empresa/ejercicio en una sola transaccion.
+
+        Las cuentas se vuelcan con COPY a una tabla temporal y se fusionan con
+        un INSERT ... ON CONFLICT; las que ya tenian la misma descripcion no
+        se reescriben. Devuelve los recuentos insertadas, actualizadas,
+        sin_cambios y eliminadas.
+        """
         eje = _ej_val(ejercicio)
-        self.conn.execute(
-            "DELETE FROM plan_cuentas WHERE codigo_empresa=? AND ejercicio=?",
-            (codigo_empresa, eje),
-        )
-        normalized = []
-        seen = set()
+        filas = []
+        vistas = set()
         for c in cuentas or []:
             cuenta = str(c.get("cuenta", "")).strip()
-            if not cuenta or cuenta in seen:
+            if not cuenta or cuenta in vistas:
                 continue
-            seen.add(cuenta)
-            normalized.append((codigo_empresa, eje, cuenta, str(c.get("descripcion", "")).strip()))
-        if normalized:
-            self.conn.executemany(
-                "INSERT OR REPLACE INTO plan_cuentas (codigo_empresa, ejercicio, cuenta, descripcion)"
-                " VALUES (?, ?, ?, ?)",
-                normalized,
-            )
-        self.conn.commit()
-        return len(normalized)
+            vistas.add(cuenta)
+            filas.append((cuenta, str(c.get("descripcion", "")).strip()))
+        self._invalidar_indice_cuentas(codigo_empresa)
+        try:
+            self._volcar_temporal("_carga_plan_cuentas", "cuenta TEXT, descripcion TEXT", filas)
+            eliminadas = self.conn.execute(
+                """DELETE FROM plan_cuentas
+                   WHERE codigo_empresa=? AND ejercicio=?
+                     AND cuenta NOT IN (SELECT cuenta FROM _carga_plan_cuentas)""",
+                (codigo_empresa, eje),
+            ).rowcount
+            fila = self.conn.execute(
+                """WITH fusion AS (
+                       INSERT INTO plan_cuentas (codigo_empresa, ejercicio, cuenta, descripcion)
+                       SELECT CAST(? AS TEXT), CAST(? AS INTEGER), cuenta, descripcion
+                         FROM _carga_plan_cuentas
+                       ON CONFLICT (codigo_empresa, ejercicio, cuenta) DO UPDATE
+                          SET descripcion=excluded.descripcion
+                        WHERE plan_cuentas.descripcion IS DISTINCT FROM excluded.descripcion
+                       RETURNING (xmax = 0) AS insertada
+                   )
+                   SELECT COUNT(*) FILTER (WHERE insertada) AS insertadas,
+                          COUNT(*) FILTER (WHERE NOT insertada) AS actualizadas
+                     FROM fusion""",
+                (codigo_empresa, eje),
+            ).fetchone()
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        insertadas = int(fila["insertadas"] or 0)
+        actualizadas = int(fila["actualizadas"] or 0)
+        return {
+            "insertadas": insertadas,
+            "actualizadas": actualizadas,
+            "sin_cambios": len(filas) - insertadas - actualizadas,
+            "eliminadas": max(int(eliminadas or 0), 0),
+        }
 
     def get_plan_cuentas(self, codigo_empresa: str, ejercicio: int) -> list[dict]:
         """Devuelve el plan de cuentas de una empresa/ejercicio ordenado por cuenta."""
@@ -2217,12 +2426,62 @@ class GestorBase:
 
     def buscar_cuentas_en_plan(self, codigo_empresa: str, ejercicio: int, prefijo: str) -> list[str]:
         """Devuelve cuentas del plan que empiezan por 'prefijo'. Util para propuesta de subcuenta."""
-        eje = _ej_val(ejercicio)
-        cur = self.conn.execute(
-            "SELECT cuenta FROM plan_cuentas WHERE codigo_empresa=? AND ejercicio=? AND cuenta LIKE ?",
-            (codigo_empresa, eje, prefijo + "%"),
-        )
-        return [r[0] for r in cur.fetchall()]
+        return [
+            cuenta for cuenta, _desc in
+            self.indice_cuentas(codigo_empresa, ejercicio).por_prefijo(prefijo, EN_PLAN)
+        ]
+
+    def indice_cuentas(self, codigo_empresa: str, ejercicio: int | None = None) -> IndiceCuentas:
+        """Indice en memoria de plan_cuentas y maestro_subcuentas_empresa.
+
+        Sin ``ejercicio`` incluye el plan de todos los ejercicios. Si una
+        cuenta esta en ambas tablas prevalece el nombre del maestro. Se
+        reconstruye tras ``_TTL_INDICES_CUENTAS_S`` o cuando este gestor
+        modifica el plan o el maestro de la empresa.
+        """
+        codigo = str(codigo_empresa)
+        eje = None if ejercicio is None else _ej_val(ejercicio)
+        indices = getattr(self, "_indices_cuentas", None)
+        if indices is None:
+            indices = self._indices_cuentas = {}
+        guardado = indices.get((codigo, eje))
+        if guardado and time.monotonic() - guardado[0] < _TTL_INDICES_CUENTAS_S:
+            return guardado[1]
+        cuentas: dict[str, list] = {}
+        sql = "SELECT cuenta, descripcion FROM plan_cuentas WHERE codigo_empresa=?"
+        params: list = [codigo]
+        if eje is not None:
+            sql += " AND ejercicio=?"
+            params.append(eje)
+        for row in self.conn.execute(sql, params).fetchall():
+            cuenta = str(row["cuenta"] or "").strip()
+            if cuenta and cuenta not in cuentas:
+                cuentas[cuenta] = [str(row["descripcion"] or "").strip(), EN_PLAN]
+        for row in self.conn.execute(
+            "SELECT subcuenta, nombre_subcuenta FROM maestro_subcuentas_empresa WHERE codigo_empresa=?",
+            (codigo,),
+        ).fetchall():
+            cuenta = str(row["subcuenta"] or "").strip()
+            if not cuenta:
+                continue
+            nombre = str(row["nombre_subcuenta"] or "").strip()
+            actual = cuentas.setdefault(cuenta, ["", 0])
+            actual[0] = nombre or actual[0]
+            actual[1] |= EN_MAESTRO
+        indice = IndiceCuentas((c, d, o) for c, (d, o) in cuentas.items())
+        indices[(codigo, eje)] = (time.monotonic(), indice)
+        return indice
+
+    def _invalidar_indice_cuentas(self, codigo_empresa: str | None = None) -> None:
+        """Descarta los indices de la empresa (todos si no se indica)."""
+        indices = getattr(self, "_indices_cuentas", None)
+        if not indices:
+            return
+        if codigo_empresa is None:
+            indices.clear()
+            return
+        for clave in [k for k in indices if k[0] == str(codigo_empresa)]:
+            indices.pop(clave, None)
 
     def get_plan_cuentas_con_terceros(self, codigo_empresa: str, ejercicio: int) -> list[dict]:
         """
@@ -2303,6 +2562,7 @@ class GestorBase:
     def eliminar_plan_cuentas(self, codigo_empresa: str, ejercicio: int) -> None:
         """Elimina el plan de cuentas de una empresa/ejercicio."""
         eje = _ej_val(ejercicio)
+        self._invalidar_indice_cuentas(codigo_empresa)
         self.conn.execute(
             "DELETE FROM plan_cuentas WHERE codigo_empresa=? AND ejercicio=?",
             (codigo_empresa, eje),
@@ -2347,6 +2607,12 @@ class GestorBase:
                 f"DELETE FROM {table} WHERE codigo_empresa=? AND ejercicio=?",
                 (codigo, eje),
             )
+        self.conn.execute(
+            "DELETE FROM referencias_subcuentas WHERE codigo_empresa=? "
+            "AND tipo_doc='factura_emitida' AND doc_id NOT IN "
+            "(SELECT id FROM facturas_emitidas_docs WHERE codigo_empresa=?)",
+            (codigo, codigo),
+        )
         self.conn.execute(
             "DELETE FROM empresas WHERE codigo=? AND ejercicio=?",
             (codigo, eje),
@@ -2376,6 +2642,7 @@ class GestorBase:
             ("facturas_recibidas", "codigo_empresa"),
             ("facturas_emitidas_docs", "codigo_empresa"),
             ("albaranes_emitidas_docs", "codigo_empresa"),
+            ("referencias_subcuentas", "codigo_empresa"),
             ("terceros_empresas", "codigo_empresa"),
             ("usuarios_empresas", "empresa_codigo"),
         )
@@ -2680,18 +2947,7 @@ class GestorBase:
             "ORDER BY fecha_asiento, numero",
             (codigo_empresa,),
         )
-        out = []
-        for r in cur.fetchall():
-            d = self._row_to_dict(r)
-            d["lineas"] = json.loads(d.get("lineas_json") or "[]")
-            d["generada"] = bool(d.get("generada"))
-            d["enviado"] = bool(d.get("enviado"))
-            d["retencion_aplica"] = bool(d.get("retencion_aplica"))
-            d["borrador"] = bool(d.get("borrador"))
-            self._normalizar_campos_factura_emitida(d)
-            d.pop("lineas_json", None)
-            out.append(d)
-        return out
+        return [self._factura_emitida_desde_fila(r) for r in cur.fetchall()]
 
     def quitar_facturas_emitidas_de_contabilidad(self, codigo_empresa: str, ejercicio: int, ids: list):
         """Quita del modulo de contabilidad las facturas en estado pendiente (sin suenlace generado)."""
@@ -2793,18 +3049,19 @@ class GestorBase:
             "SELECT * FROM facturas_emitidas_docs WHERE codigo_empresa=? AND ejercicio=? ORDER BY fecha_asiento, numero",
             (codigo_empresa, _ej_val(ejercicio)),
         )
-        out = []
-        for r in cur.fetchall():
-            d = self._row_to_dict(r)
-            d["lineas"] = json.loads(d.get("lineas_json") or "[]")
-            d["generada"] = bool(d.get("generada"))
-            d["enviado"] = bool(d.get("enviado"))
-            d["retencion_aplica"] = bool(d.get("retencion_aplica"))
-            d["borrador"] = bool(d.get("borrador"))
-            self._normalizar_campos_factura_emitida(d)
-            d.pop("lineas_json", None)
-            out.append(d)
-        return out
+        return [self._factura_emitida_desde_fila(r) for r in cur.fetchall()]
+
+    def listar_facturas_emitidas_por_ids(self, codigo_empresa: str, ids: list) -> list[dict]:
+        """Facturas emitidas concretas, para refrescar solo las que han cambiado."""
+        ids = [str(i) for i in ids or [] if i is not None and str(i).strip()]
+        if not ids:
+            return []
+        qmarks = ",".join("?" for _ in ids)
+        cur = self.conn.execute(
+            f"SELECT * FROM facturas_emitidas_docs WHERE codigo_empresa=? AND id IN ({qmarks})",
+            (codigo_empresa, *ids),
+        )
+        return [self._factura_emitida_desde_fila(r) for r in cur.fetchall()]
 
     def listar_facturas_emitidas_global(self, codigo_empresa: str, ejercicio: int | None = None, tercero_id: str | None = None):
         params = [codigo_empresa]
@@ -2861,6 +3118,50 @@ class GestorBase:
             out.append(d)
         return out
 
+    def _filtros_documentos_export(self, alias: str, codigo_empresa: str, ejercicio, cliente: str, desde, hasta):
+        where = [f"{alias}.codigo_empresa=?"]
+        params: list = [codigo_empresa]
+        if ejercicio is not None:
+            where.append(f"{alias}.ejercicio=?")
+            params.append(_ej_val(ejercicio))
+        cliente = str(cliente or "").strip().lower()
+        if cliente:
+            patron = "%" + cliente.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            where.append(
+                f"(LOWER(COALESCE({alias}.nombre, '')) LIKE ? ESCAPE '\\' "
+                f"OR LOWER(COALESCE({alias}.nif, '')) LIKE ? ESCAPE '\\')"
+            )
+            params.extend([patron, patron])
+        if desde is not None:
+            where.append(f"{_sql_fecha_iso(alias + '.fecha_asiento')} >= ?")
+            params.append(desde.isoformat())
+        if hasta is not None:
+            where.append(f"{_sql_fecha_iso(alias + '.fecha_asiento')} <= ?")
+            params.append(hasta.isoformat())
+        return where, params
+
+    def iterar_facturas_emitidas(self, codigo_empresa: str, ejercicio: int | None = None, cliente: str = "",
+                                 desde=None, hasta=None, excluir_ocr: bool = False, lote: int = 500):
+        """Facturas emitidas filtradas en la base de datos, de ``lote`` en ``lote``.
+
+        Pensado para exportaciones: no carga todo el resultado en memoria.
+        ``cliente`` busca en nombre o NIF; ``desde``/``hasta`` son ``date``.
+        """
+        where, params = self._filtros_documentos_export("f", codigo_empresa, ejercicio, cliente, desde, hasta)
+        if excluir_ocr:
+            where.append("COALESCE(f.origen_factura, 'facturacion') <> 'ocr'")
+        cur = self.conn.execute(
+            "SELECT f.* FROM facturas_emitidas_docs f WHERE " + " AND ".join(where)
+            + f" ORDER BY f.ejercicio, {_sql_fecha_iso('f.fecha_asiento')}, f.numero",
+            tuple(params),
+        )
+        while True:
+            filas = cur.fetchmany(lote)
+            if not filas:
+                break
+            for r in filas:
+                yield self._factura_emitida_desde_fila(r)
+
     def listar_control_facturas_global(self, codigos_empresas: list[str]) -> list[dict]:
         """Devuelve una proyeccion comun de facturas emitidas y recibidas.
 
@@ -2905,6 +3206,17 @@ class GestorBase:
         cur = self.conn.execute(sql, tuple(codigos) * 2)
         return [self._row_to_dict(row) for row in cur.fetchall()]
 
+    def _factura_emitida_desde_fila(self, row) -> dict:
+        d = self._row_to_dict(row)
+        d["lineas"] = json.loads(d.get("lineas_json") or "[]")
+        d["generada"] = bool(d.get("generada"))
+        d["enviado"] = bool(d.get("enviado"))
+        d["retencion_aplica"] = bool(d.get("retencion_aplica"))
+        d["borrador"] = bool(d.get("borrador"))
+        self._normalizar_campos_factura_emitida(d)
+        d.pop("lineas_json", None)
+        return d
+
     def _normalizar_campos_factura_emitida(self, factura: dict):
         if not str(factura.get("tipo_operacion") or "").strip():
             factura["tipo_operacion"] = "01"
@@ -2944,7 +3256,7 @@ class GestorBase:
         out.sort(key=lambda d: (d.get("nombre") or "").lower())
         return out
 
-    def upsert_factura_emitida(self, factura: dict):
+    def upsert_factura_emitida(self, factura: dict, commit: bool = True):
         fid = factura.get("id") or str(int(time.time() * 1000))
         factura["id"] = fid
         self._normalizar_campos_factura_emitida(factura)
@@ -2959,8 +3271,8 @@ class GestorBase:
              subcuenta_cliente, forma_pago, cuenta_bancaria, plantilla_word, plantilla_emitidas, pdf_path, pdf_ref, pdf_path_a3, retencion_aplica, retencion_pct,
              retencion_base, retencion_importe, descuento_total_tipo, descuento_total_valor, moneda_codigo, moneda_simbolo, enviado, fecha_envio, canal_envio, generada, fecha_generacion, lineas_json, borrador,
              subcuenta_ingreso, subcuenta_iva, subcuenta_retencion, facturae_xml_path, facturae_generated_at, facturae_status, facturae_error,
-             updated_at, pdf_generated_at)
-            VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+             updated_at, pdf_generated_at, pdf_huella)
+            VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
             ON CONFLICT(id) DO UPDATE SET
                 codigo_empresa=excluded.codigo_empresa,
                 ejercicio=excluded.ejercicio,
@@ -3009,7 +3321,8 @@ class GestorBase:
                 facturae_status=excluded.facturae_status,
                 facturae_error=excluded.facturae_error,
                 updated_at=excluded.updated_at,
-                pdf_generated_at=excluded.pdf_generated_at
+                pdf_generated_at=excluded.pdf_generated_at,
+                pdf_huella=excluded.pdf_huella
             """,
             (
                 fid,
@@ -3061,6 +3374,7 @@ class GestorBase:
                 factura.get("facturae_error"),
                 self._utc_now(),
                 factura.get("pdf_generated_at"),
+                factura.get("pdf_huella"),
             ),
         )
         if "origen_factura" in factura or "ocr_documento_id" in factura:
@@ -3074,7 +3388,9 @@ class GestorBase:
                 "ocr_documento_id=? WHERE id=?",
                 (origen, factura.get("ocr_documento_id"), fid),
             )
-        self.conn.commit()
+        self._indexar_referencias_subcuenta("factura_emitida", fid)
+        if commit:
+            self.conn.commit()
         return fid
 
     def eliminar_empresa_completa(self, codigo: str) -> int:
@@ -3121,6 +3437,7 @@ class GestorBase:
             ("operaciones", "codigo_empresa"),
             ("plan_cuentas", "codigo_empresa"),
             ("plantillas_documentos", "codigo_empresa"),
+            ("referencias_subcuentas", "codigo_empresa"),
             ("series_emitidas", "codigo_empresa"),
             ("terceros_empresas", "codigo_empresa"),
             ("usuarios_empresas", "empresa_codigo"),
@@ -3190,6 +3507,7 @@ class GestorBase:
                 "DELETE FROM facturas_emitidas_docs WHERE codigo_empresa=? AND ejercicio=? AND id=?",
                 (codigo_empresa, ejercicio_key, factura_id),
             )
+            self._indexar_referencias_subcuenta("factura_emitida", factura_id)
             self.conn.commit()
         except Exception:
             self.conn.rollback()
@@ -3227,6 +3545,23 @@ class GestorBase:
         )
         self.conn.commit()
 
+    def marcar_pdf_factura_emitida(
+        self,
+        codigo_empresa: str,
+        factura_id: str,
+        pdf_path: str,
+        pdf_generated_at: str | None,
+        pdf_huella: str | None,
+    ) -> bool:
+        """Registra el PDF generado sin regrabar la factura ni tocar updated_at."""
+        cur = self.conn.execute(
+            "UPDATE facturas_emitidas_docs SET pdf_path=?, pdf_generated_at=?, pdf_huella=? "
+            "WHERE id=? AND codigo_empresa=?",
+            (pdf_path, pdf_generated_at, pdf_huella, str(factura_id), str(codigo_empresa)),
+        )
+        self.conn.commit()
+        return bool(cur.rowcount)
+
     def marcar_factura_emitida_enviada(self, codigo_empresa: str, factura_id: str, fecha: str, canal: str | None, ejercicio: int):
         self.conn.execute(
             "UPDATE facturas_emitidas_docs SET enviado=1, fecha_envio=?, canal_envio=? WHERE codigo_empresa=? AND ejercicio=? AND id=?",
@@ -3240,15 +3575,47 @@ class GestorBase:
             "SELECT * FROM albaranes_emitidas_docs WHERE codigo_empresa=? AND ejercicio=? ORDER BY fecha_asiento, numero",
             (codigo_empresa, _ej_val(ejercicio)),
         )
-        out = []
-        for r in cur.fetchall():
-            d = self._row_to_dict(r)
-            d["lineas"] = json.loads(d.get("lineas_json") or "[]")
-            d["facturado"] = bool(d.get("facturado"))
-            d["retencion_aplica"] = bool(d.get("retencion_aplica"))
-            d.pop("lineas_json", None)
-            out.append(d)
-        return out
+        return [self._albaran_desde_fila(r) for r in cur.fetchall()]
+
+    def listar_albaranes_emitidas_por_ids(self, codigo_empresa: str, ids: list, ejercicio: int | None = None) -> list[dict]:
+        """Albaranes concretos, sin cargar todos los del ejercicio."""
+        ids = [str(i) for i in ids or [] if i is not None and str(i).strip()]
+        if not ids:
+            return []
+        qmarks = ",".join("?" for _ in ids)
+        sql = f"SELECT * FROM albaranes_emitidas_docs WHERE codigo_empresa=? AND id IN ({qmarks})"
+        params: list = [codigo_empresa, *ids]
+        if ejercicio is not None:
+            sql += " AND ejercicio=?"
+            params.append(_ej_val(ejercicio))
+        cur = self.conn.execute(sql + " ORDER BY fecha_asiento, numero", tuple(params))
+        return [self._albaran_desde_fila(r) for r in cur.fetchall()]
+
+    def iterar_albaranes_emitidas(self, codigo_empresa: str, ejercicio: int | None = None, cliente: str = "",
+                                  desde=None, hasta=None, lote: int = 500):
+        """Albaranes filtrados en la base de datos, con el numero de su factura
+        en ``factura_numero``. Mismos filtros que ``iterar_facturas_emitidas``."""
+        where, params = self._filtros_documentos_export("a", codigo_empresa, ejercicio, cliente, desde, hasta)
+        cur = self.conn.execute(
+            "SELECT a.*, f.numero AS factura_numero FROM albaranes_emitidas_docs a "
+            "LEFT JOIN facturas_emitidas_docs f ON f.id=a.factura_id WHERE " + " AND ".join(where)
+            + f" ORDER BY a.ejercicio, {_sql_fecha_iso('a.fecha_asiento')}, a.numero",
+            tuple(params),
+        )
+        while True:
+            filas = cur.fetchmany(lote)
+            if not filas:
+                break
+            for r in filas:
+                yield self._albaran_desde_fila(r)
+
+    def _albaran_desde_fila(self, row) -> dict:
+        d = self._row_to_dict(row)
+        d["lineas"] = json.loads(d.get("lineas_json") or "[]")
+        d["facturado"] = bool(d.get("facturado"))
+        d["retencion_aplica"] = bool(d.get("retencion_aplica"))
+        d.pop("lineas_json", None)
+        return d
 
     def upsert_albaran_emitida(self, albaran: dict):
         aid = albaran.get("id") or str(int(time.time() * 1000))
@@ -3347,7 +3714,8 @@ class GestorBase:
         )
         self.conn.commit()
 
-    def marcar_albaranes_facturados(self, codigo_empresa: str, ids: list, factura_id: str, fecha: str, ejercicio: int):
+    def marcar_albaranes_facturados(self, codigo_empresa: str, ids: list, factura_id: str, fecha: str, ejercicio: int,
+                                    commit: bool = True):
         ids = ids or []
         if not ids:
             return
@@ -3356,7 +3724,50 @@ class GestorBase:
             f"UPDATE albaranes_emitidas_docs SET facturado=1, factura_id=?, fecha_facturacion=? WHERE codigo_empresa=? AND ejercicio=? AND id IN ({qmarks})",
             (factura_id, fecha, codigo_empresa, _ej_val(ejercicio), *ids),
         )
-        self.conn.commit()
+        if commit:
+            self.conn.commit()
+
+    def upsert_facturas_emitidas(self, facturas: list[dict]) -> list[str]:
+        """Graba varias facturas emitidas en una sola transaccion y devuelve sus ids."""
+        try:
+            ids = [self.upsert_factura_emitida(factura, commit=False) for factura in facturas]
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return ids
+
+    def facturar_albaranes_en_bloque(self, codigo_empresa: str, ejercicio: int, grupos: list[tuple[dict, list]],
+                                     fecha: str) -> list[str]:
+        """Graba una factura por grupo ``(factura, ids_albaranes)`` y marca sus
+        albaranes como facturados en una sola transaccion.
+
+        Devuelve los ids de las facturas en el orden de ``grupos``. Las facturas
+        se graban una a una; los albaranes de todos los grupos se marcan con un
+        unico UPDATE.
+        """
+        try:
+            ids = []
+            factura_por_albaran = {}
+            for factura, albaran_ids in grupos:
+                fid = self.upsert_factura_emitida(factura, commit=False)
+                for albaran_id in albaran_ids or []:
+                    factura_por_albaran[albaran_id] = fid
+                ids.append(fid)
+            if factura_por_albaran:
+                casos = " ".join("WHEN ? THEN ?" for _ in factura_por_albaran)
+                qmarks = ",".join("?" for _ in factura_por_albaran)
+                self.conn.execute(
+                    f"UPDATE albaranes_emitidas_docs SET facturado=1, factura_id=CASE id {casos} END, fecha_facturacion=? "
+                    f"WHERE codigo_empresa=? AND ejercicio=? AND id IN ({qmarks})",
+                    (*[v for par in factura_por_albaran.items() for v in par], fecha, codigo_empresa,
+                     _ej_val(ejercicio), *factura_por_albaran),
+                )
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return ids
 
     # ---------- RECIBIDAS (plantillas) ----------
     def listar_recibidas(self, codigo_empresa: str, ejercicio: int):
@@ -3471,8 +3882,8 @@ class GestorBase:
                nombre_archivo,ruta,hash_archivo,tamano,mime_type,origen,
                comunicacion_id,mensaje_id,graph_message_id,graph_attachment_id,
                correo_remitente,correo_asunto,estado,ocr_documento_id,
-               creado_por,created_at,updated_at)
-            VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+               creado_por,created_at,updated_at,ruta_objeto)
+            VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
             """,
             (
                 documento_id, datos["codigo_empresa"], int(datos["ejercicio"]),
@@ -3484,11 +3895,75 @@ class GestorBase:
                 datos.get("graph_attachment_id"), datos.get("correo_remitente"),
                 datos.get("correo_asunto"), datos.get("estado") or "archivado",
                 datos.get("ocr_documento_id"), datos.get("creado_por"), now, now,
+                datos.get("ruta_objeto") or None,
             ),
         )
+        if datos.get("ruta_objeto"):
+            self.referenciar_contenido_documental(
+                datos["hash_archivo"], datos["ruta_objeto"], datos.get("tamano"),
+                commit=False,
+            )
         self.conn.commit()
         return documento_id
 
+    def referenciar_contenido_documental(
+        self, hash_archivo: str, ruta_objeto: str, tamano: int | None = None,
+        commit: bool = True,
+    ) -> int:
+        """Suma una copia logica al objeto del almacen y devuelve el total."""
+        now = datetime.now().astimezone().isoformat(timespec="seconds")
+        row = self.conn.execute(
+            """
+            INSERT INTO documentos_contenido
+              (hash_archivo,ruta_objeto,tamano,referencias,created_at,updated_at)
+            VALUES (?,?,?,1,?,?)
+            ON CONFLICT(hash_archivo) DO UPDATE SET
+              referencias=documentos_contenido.referencias+1,
+              ruta_objeto=excluded.ruta_objeto,updated_at=excluded.updated_at
+            RETURNING referencias
+            """,
+            (str(hash_archivo), str(ruta_objeto), tamano, now, now),
+        ).fetchone()
+        if commit:
+            self.conn.commit()
+        return int(row["referencias"]) if row else 0
+
+    def liberar_contenido_documental(
+        self, hash_archivo: str, commit: bool = True,
+        al_eliminar_objeto: Callable[[str], None] | None = None,
+    ) -> int | None:
+        """Resta una referencia. Devuelve las restantes o None si el
+        contenido no estaba en el almacen (documentos anteriores).
+
+        Al llegar a cero la fila se borra en la misma transaccion y
+        ``al_eliminar_objeto`` recibe la ruta del objeto antes del commit:
+        mientras tanto la fila sigue bloqueada y una referencia concurrente
+        al mismo hash espera, asi que nunca se borra un objeto reutilizado.
+        """
+        now = datetime.now().astimezone().isoformat(timespec="seconds")
+        try:
+            row = self.conn.execute(
+                "UPDATE documentos_contenido SET "
+                "referencias=CASE WHEN referencias>0 THEN referencias-1 ELSE 0 END,"
+                "updated_at=? WHERE hash_archivo=? RETURNING referencias",
+                (now, str(hash_archivo)),
+            ).fetchone()
+            restantes = int(row["referencias"]) if row else None
+            borrada = self.conn.execute(
+                "DELETE FROM documentos_contenido WHERE hash_archivo=? AND referencias<=0 "
+                "RETURNING ruta_objeto",
+                (str(hash_archivo),),
+            ).fetchone()
+            if borrada and al_eliminar_objeto:
+                al_eliminar_objeto(borrada["ruta_objeto"])
+            if commit:
+                self.conn.commit()
+        except Exception:
+            if commit:
+                self.conn.rollback()
+            raise
+        return restantes
+
     def registrar_decision_adjunto(self, datos: dict) -> None:
         now = datetime.now().astimezone().isoformat(timespec="seconds")
         self.conn.execute(
@@ -3517,16 +3992,30 @@ class GestorBase:
         )
         self.conn.commit()
 
-    def eliminar_documento_archivo(self, documento_id: str) -> dict | None:
+    def eliminar_documento_archivo(
+        self, documento_id: str,
+        al_eliminar_objeto: Callable[[str], None] | None = None,
+    ) -> dict | None:
         documento = self.get_documento_archivo(documento_id)
         if not documento:
             return None
-        self.conn.execute(
-            "UPDATE comunicaciones_adjuntos_decisiones SET documento_id=NULL "
-            "WHERE documento_id=?", (documento_id,),
-        )
-        self.conn.execute("DELETE FROM documentos_archivo WHERE id=?", (documento_id,))
-        self.conn.commit()
+        try:
+            self.conn.execute(
+                "UPDATE comunicaciones_adjuntos_decisiones SET documento_id=NULL "
+                "WHERE documento_id=?", (documento_id,),
+            )
+            self.conn.execute("DELETE FROM documentos_archivo WHERE id=?", (documento_id,))
+            documento["referencias_contenido"] = None
+            # Solo los documentos guardados en el almacen tienen referencia.
+            if documento.get("ruta_objeto"):
+                documento["referencias_contenido"] = self.liberar_contenido_documental(
+                    documento.get("hash_archivo") or "", commit=False,
+                    al_eliminar_objeto=al_eliminar_objeto,
+                )
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
         return documento
 
     # ---------- FIRMA ELECTRONICA ----------
@@ -3965,6 +4454,7 @@ class GestorBase:
                     ),
                 )
             self.conn.execute("DELETE FROM facturas_recibidas_docs WHERE id=?", (str(doc["id"]),))
+            self._indexar_referencias_subcuenta("factura_recibida", doc["id"])
             archivadas += 1
         self.conn.commit()
         return {"archivadas": archivadas, "omitidas_sin_ruta": omitidas}
@@ -4230,11 +4720,13 @@ class GestorBase:
                 now,
             ),
         )
+        self._indexar_referencias_subcuenta("factura_recibida", doc_id)
         self.conn.commit()
         return doc_id
 
     def eliminar_factura_recibida_doc(self, doc_id: str):
         self.conn.execute("DELETE FROM facturas_recibidas_docs WHERE id=?", (str(doc_id),))
+        self._indexar_referencias_subcuenta("factura_recibida", doc_id)
         self.conn.commit()
 
     # ---------- LÍNEAS FISCALES OCR ----------
@@ -4273,6 +4765,7 @@ class GestorBase:
                     linea_id,
                 ),
             )
+            self._indexar_referencias_linea_ocr(linea_id)
             self.conn.commit()
             return linea_id
         cur = self.conn.execute(
@@ -4299,11 +4792,24 @@ class GestorBase:
                 linea.get("tipo_operacion_linea"),
             ),
         )
+        self._indexar_referencias_subcuenta("factura_recibida", linea["doc_id"])
         self.conn.commit()
         return cur.lastrowid
 
+    def _indexar_referencias_linea_ocr(self, linea_id) -> None:
+        row = self.conn.execute(
+            "SELECT doc_id FROM ocr_lineas_fiscales WHERE id=?", (linea_id,),
+        ).fetchone()
+        if row:
+            self._indexar_referencias_subcuenta("factura_recibida", row["doc_id"])
+
     def eliminar_ocr_linea(self, linea_id: int):
+        row = self.conn.execute(
+            "SELECT doc_id FROM ocr_lineas_fiscales WHERE id=?", (linea_id,),
+        ).fetchone()
         self.conn.execute("DELETE FROM ocr_lineas_fiscales WHERE id=?", (linea_id,))
+        if row:
+            self._indexar_referencias_subcuenta("factura_recibida", row["doc_id"])
         self.conn.commit()
 
     def reemplazar_ocr_lineas_doc(self, doc_id: str, lineas: list[dict]):
@@ -4338,6 +4844,7 @@ class GestorBase:
                     linea.get("tipo_operacion_linea"),
                 ),
             )
+        self._indexar_referencias_subcuenta("factura_recibida", doc_id)
         self.conn.commit()
 
     def get_asiento_contable_por_documento(self, documento_id: str):
@@ -4432,17 +4939,42 @@ class GestorBase:
         ).fetchone()
         return self._row_to_dict(row) if row else None
 
+    def generacion_terceros(self) -> int:
+        """Contador que cambia con cada alta/baja de terceros o subcuentas.
+
+        Los indices en memoria (p. ej. el de TercerosOcrService) lo comparan
+        para saber si deben reconstruirse.
+        """
+        return getattr(self, "_generacion_terceros", 0)
+
+    def _invalidar_terceros(self) -> None:
+        self._generacion_terceros = self.generacion_terceros() + 1
+
     def listar_terceros(self):
         cur = self.conn.execute("SELECT * FROM terceros ORDER BY nombre")
         return [self._row_to_dict(r) for r in cur.fetchall()]
 
+    def _renormalizar_nif_terceros(self) -> None:
+        """Recalcula ``nif_normalizado`` con ``normalizar_nif_cif``.
+
+        Las filas antiguas se normalizaron quitando solo guiones y espacios y
+        no casaban con las busquedas por NIF. No confirma: lo hace el llamador.
+        """
+        cambios = []
+        for r in self.conn.execute("SELECT id, nif, nif_normalizado FROM terceros").fetchall():
+            nuevo = normalizar_nif_cif(r["nif"]) or None
+            if r["nif_normalizado"] != nuevo:
+                cambios.append((nuevo, r["id"]))
+        if cambios:
+            self.conn.executemany("UPDATE terceros SET nif_normalizado=? WHERE id=?", cambios)
+
     def upsert_tercero(self, tercero: dict):
+        self._invalidar_terceros()
         tid = tercero.get("id") or str(int(time.time() * 1000))
         tercero["id"] = tid
         nif = tercero.get("nif")
         nif_norm = tercero.get("nif_normalizado")
-        if nif_norm is None:
-            nif_norm = re.sub(r"[^A-Za-z0-9]", "", str(nif or "")).upper() or None
+        nif_norm = normalizar_nif_cif(nif if nif_norm is None else nif_norm) or None
         pais = normalizar_codigo_pais(tercero.get("pais"))
         if not pais:
             pais = inferir_pais_desde_identificacion(nif)
@@ -4506,6 +5038,7 @@ class GestorBase:
         return tid
 
     def eliminar_tercero(self, tercero_id: str):
+        self._invalidar_terceros()
         tid = str(tercero_id)
         cur = self.conn.execute(
             "SELECT COUNT(1) AS n FROM facturas_emitidas_docs WHERE tercero_id=?",
@@ -4590,6 +5123,55 @@ class GestorBase:
                 by_id[tid] = r
         return list(by_id.values())
 
+    def get_terceros_by_nifs(self, codigo_empresa: str, ejercicio: int, nifs) -> dict[str, dict]:
+        """Terceros de los NIF indicados, por NIF normalizado.
+
+        Equivale a cruzar ``listar_terceros`` con ``listar_terceros_por_empresa``
+        pero solo lee esos NIF (indice sobre ``terceros.nif_normalizado``): si el
+        tercero esta dado de alta en la empresa se devuelve con sus subcuentas,
+        si no, la ficha global.
+        """
+        nifs = sorted({n for n in (normalizar_nif_cif(x) for x in nifs or []) if n})
+        if not nifs:
+            return {}
+        qmarks = ",".join("?" for _ in nifs)
+        out = {}
+        cur = self.conn.execute(
+            f"SELECT * FROM terceros WHERE nif_normalizado IN ({qmarks}) ORDER BY nombre",
+            tuple(nifs),
+        )
+        for r in cur.fetchall():
+            t = self._row_to_dict(r)
+            out.setdefault(normalizar_nif_cif(t.get("nif_normalizado")), t)
+        cur = self.conn.execute(
+            f"""
+            SELECT t.*, te.subcuenta_cliente, te.subcuenta_proveedor, te.subcuenta_ingreso, te.subcuenta_gasto,
+                   te.cliente_tipo_operacion_iva, te.cliente_intracomunitaria_clase, te.cliente_iva_deducible, te.cliente_porcentaje_deduccion_iva,
+                   te.proveedor_tipo_operacion_iva, te.proveedor_intracomunitaria_clase, te.proveedor_iva_deducible, te.proveedor_porcentaje_deduccion_iva,
+                   te.facturae_es_administracion_publica, te.facturae_dir3_oficina_contable, te.facturae_dir3_organo_gestor,
+                   te.facturae_dir3_unidad_tramitadora, te.facturae_dir3_organo_proponente, te.facturae_referencia_expediente,
+                   te.facturae_referencia_contrato, te.facturae_referencia_pedido,
+                   te.ejercicio
+            FROM terceros t
+            JOIN terceros_empresas te ON te.tercero_id = t.id
+            WHERE te.codigo_empresa=? AND t.nif_normalizado IN ({qmarks})
+            ORDER BY t.nombre
+            """,
+            (codigo_empresa, *nifs),
+        )
+        # Mismo criterio que listar_terceros_por_empresa: ejercicio 0, despues
+        # el ejercicio pedido y, si no hay ninguno de los dos, cualquier otro.
+        eje = _ej_val(ejercicio)
+        prioridad = {}
+        for r in cur.fetchall():
+            t = self._row_to_dict(r)
+            nif = normalizar_nif_cif(t.get("nif_normalizado"))
+            rango = 0 if t.get("ejercicio") == 0 else 1 if t.get("ejercicio") == eje else 2
+            if rango < prioridad.get(nif, 3):
+                prioridad[nif] = rango
+                out[nif] = t
+        return out
+
     def get_tercero_empresa(self, codigo_empresa: str, tercero_id: str, ejercicio: int):
         cur = self.conn.execute(
             "SELECT * FROM terceros_empresas WHERE codigo_empresa=? AND ejercicio=0 AND tercero_id=?",
@@ -4605,6 +5187,7 @@ class GestorBase:
         return self._row_to_dict(cur.fetchone())
 
     def upsert_tercero_empresa(self, rel: dict):
+        self._invalidar_terceros()
         eje = 0
         rel = validate_tercero_empresa_rel(rel)
         self.conn.execute(
@@ -4691,6 +5274,7 @@ class GestorBase:
         return list(by_codigo.values())
 
     def eliminar_tercero_empresa(self, codigo_empresa: str, tercero_id: str):
+        self._invalidar_terceros()
         tid = str(tercero_id)
         cur = self.conn.execute(
             "SELECT COUNT(1) AS n FROM facturas_emitidas_docs WHERE codigo_empresa=? AND tercero_id=?",
@@ -5295,6 +5879,8 @@ class GestorBase:
 
     def upsert_maestro_subcuenta(self, datos: dict) -> int:
         """Inserta o actualiza una subcuenta en el maestro. Devuelve el id."""
+        self._invalidar_terceros()
+        self._invalidar_indice_cuentas(datos.get("codigo_empresa"))
         now = self._utc_now()
         sub_id = datos.get("id")
         if sub_id:
@@ -5380,6 +5966,97 @@ class GestorBase:
         ).fetchone()
         return row[0] if row else None
 
+    def cargar_maestro_subcuentas(self, codigo_empresa: str, subcuentas: list[dict],
+                                  actualizar: bool = True) -> dict:
+        """Alta/actualizacion masiva de subcuentas importadas (A3, Excel).
+
+        Vuelca las filas con COPY a una tabla temporal y las fusiona con un
+        INSERT ... ON CONFLICT. Solo se tocan los datos que trae la
+        importacion: las cuentas predeterminadas y las observaciones se
+        conservan, y un tercero_id vacio no desvincula la subcuenta. Con
+        ``actualizar=False`` las existentes se dejan como estan.
+        Devuelve los recuentos insertadas, actualizadas y sin_cambios.
+        """
+        codigo = str(codigo_empresa)
+        filas = []
+        vistas = set()
+        for d in subcuentas or []:
+            subcuenta = str(d.get("subcuenta") or "").strip()
+            if not subcuenta or subcuenta in vistas:
+                continue
+            vistas.add(subcuenta)
+            filas.append((
+                subcuenta,
+                d.get("nombre_subcuenta") or "",
+                d.get("tipo_subcuenta"),
+                d.get("nif_snapshot"),
+                d.get("tercero_id"),
+                int(d.get("activo", 1)),
+                d.get("origen") or "manual",
+                int(d.get("creado_en_gest2a3eco", 0)),
+                int(d.get("pendiente_alta_a3", 0)),
+            ))
+        if actualizar:
+            conflicto = """DO UPDATE SET
+                       nombre_subcuenta=excluded.nombre_subcuenta,
+                       tipo_subcuenta=excluded.tipo_subcuenta,
+                       nif_snapshot=excluded.nif_snapshot,
+                       tercero_id=COALESCE(excluded.tercero_id, m.tercero_id),
+                       activo=excluded.activo,
+                       origen=excluded.origen,
+                       pendiente_alta_a3=excluded.pendiente_alta_a3,
+                       updated_at=excluded.updated_at
+                   WHERE (m.nombre_subcuenta, m.tipo_subcuenta, m.nif_snapshot,
+                          m.tercero_id, m.activo, m.origen, m.pendiente_alta_a3)
+                         IS DISTINCT FROM
+                         (excluded.nombre_subcuenta, excluded.tipo_subcuenta,
+                          excluded.nif_snapshot,
+                          COALESCE(excluded.tercero_id, m.tercero_id),
+                          excluded.activo, excluded.origen, excluded.pendiente_alta_a3)"""
+        else:
+            conflicto = "DO NOTHING"
+        now = self._utc_now()
+        self._invalidar_terceros()
+        self._invalidar_indice_cuentas(codigo)
+        try:
+            self._volcar_temporal(
+                "_carga_maestro_subcuentas",
+                "subcuenta TEXT, nombre_subcuenta TEXT, tipo_subcuenta TEXT,"
+                " nif_snapshot TEXT, tercero_id TEXT, activo INTEGER, origen TEXT,"
+                " creado_en_gest2a3eco INTEGER, pendiente_alta_a3 INTEGER",
+                filas,
+            )
+            fila = self.conn.execute(
+                f"""WITH fusion AS (
+                       INSERT INTO maestro_subcuentas_empresa AS m
+                           (codigo_empresa, subcuenta, nombre_subcuenta, tipo_subcuenta,
+                            nif_snapshot, tercero_id, activo, origen, fecha_importacion,
+                            creado_en_gest2a3eco, pendiente_alta_a3, created_at, updated_at)
+                       SELECT CAST(? AS TEXT), subcuenta, nombre_subcuenta, tipo_subcuenta,
+                              nif_snapshot, tercero_id, activo, origen, CAST(? AS TEXT),
+                              creado_en_gest2a3eco, pendiente_alta_a3,
+                              CAST(? AS TEXT), CAST(? AS TEXT)
+                         FROM _carga_maestro_subcuentas
+                       ON CONFLICT (codigo_empresa, subcuenta) {conflicto}
+                       RETURNING (xmax = 0) AS insertada
+                   )
+                   SELECT COUNT(*) FILTER (WHERE insertada) AS insertadas,
+                          COUNT(*) FILTER (WHERE NOT insertada) AS actualizadas
+                     FROM fusion""",
+                (codigo, now, now, now),
+            ).fetchone()
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        insertadas = int(fila["insertadas"] or 0)
+        actualizadas = int(fila["actualizadas"] or 0)
+        return {
+            "insertadas": insertadas,
+            "actualizadas": actualizadas,
+            "sin_cambios": len(filas) - insertadas - actualizadas,
+        }
+
     def get_maestro_subcuenta_por_subcuenta(self, codigo_empresa: str, subcuenta: str) -> dict | None:
         cur = self.conn.execute(
             "SELECT * FROM maestro_subcuentas_empresa WHERE codigo_empresa=? AND subcuenta=?",
@@ -5405,8 +6082,123 @@ class GestorBase:
         )
         return [self._row_to_dict(r) for r in cur.fetchall()]
 
-    def listar_maestro_subcuentas_por_tercero(self, codigo_empresa: str, tercero_id: str) -> list:
-        cur = self.conn.execute(
+    def proponer_subcuenta_libre(
+        self,
+        codigo_empresa: str,
+        prefijo: str,
+        digitos: int,
+        ejercicio: int | None = None,
+        campo_terceros: str | None = None,
+        reservar: bool = False,
+    ) -> str:
+        """Primera subcuenta libre del prefijo calculada en la base de datos.
+
+        Cuentan como ocupadas las del maestro, las de plan_cuentas (del
+        ejercicio o de todos), la columna ``campo_terceros`` de
+        terceros_empresas y las reservadas por otros puestos. El primer hueco
+        se busca con ``LEAD()`` sobre las subcuentas del rango, sin traer las
+        listas a Python.
+
+        Con ``reservar`` la subcuenta queda apartada para este puesto durante
+        ``RESERVA_SUBCUENTA_TTL_S`` en la misma sentencia, de modo que dos
+        puestos que dan de alta terceros a la vez no reciben la misma.
+        """
+        prefijo = str(prefijo or "").strip()
+        digitos = int(digitos)
+        if not prefijo.isdigit() or digitos <= len(prefijo):
+            raise ValueError(f"Prefijo {prefijo!r} no valido para {digitos} digitos.")
+        if campo_terceros and campo_terceros not in _CAMPOS_SUBCUENTA_TERCERO:
+            raise ValueError(f"Campo de subcuenta no valido: {campo_terceros!r}")
+        codigo = str(codigo_empresa)
+        escala = 10 ** (digitos - len(prefijo))
+        primera = int(prefijo) * escala + 1
+        ultima = (int(prefijo) + 1) * escala - 1
+        # BETWEEN acota por indice; LIKE con '_' fija la longitud exacta.
+        rango = (str(primera), str(ultima), prefijo + "_" * (digitos - len(prefijo)))
+        filtro_ejercicio = " AND ejercicio=?" if ejercicio is not None else ""
+        ej = (int(ejercicio),) if ejercicio is not None else ()
+        fuentes = [
+            "SELECT subcuenta FROM maestro_subcuentas_empresa"
+            " WHERE codigo_empresa=? AND subcuenta BETWEEN ? AND ? AND subcuenta LIKE ?",
+            "SELECT cuenta FROM plan_cuentas WHERE codigo_empresa=?" + filtro_ejercicio
+            + " AND cuenta BETWEEN ? AND ? AND cuenta LIKE ?",
+        ]
+        params: list = [codigo, *rango, codigo, *ej, *rango]
+        if campo_terceros:
+            fuentes.append(
+                f"SELECT {campo_terceros} FROM terceros_empresas WHERE codigo_empresa=?"
+                + filtro_ejercicio
+                + f" AND {campo_terceros} BETWEEN ? AND ? AND {campo_terceros} LIKE ?"
+            )
+            params += [codigo, *ej, *rango]
+        ahora = self._utc_now()
+        puesto = self._id_puesto()
+        fuentes.append(
+            "SELECT subcuenta FROM reservas_subcuentas WHERE codigo_empresa=?"
+            " AND subcuenta BETWEEN ? AND ? AND subcuenta LIKE ?"
+            " AND expira_en>? AND reservado_por<>?"
+        )
+        params += [codigo, *rango, ahora, puesto]
+        sql = f"""
+            WITH usadas(c) AS (
+              {" UNION ALL ".join(fuentes)}
+            ),
+            numeros AS (
+              SELECT DISTINCT CAST(c AS BIGINT) AS n FROM usadas WHERE c ~ '^[0-9]+$'
+            ),
+            libre AS (
+              SELECT CASE
+                WHEN NOT EXISTS (SELECT 1 FROM numeros WHERE n=CAST(? AS BIGINT))
+                  THEN CAST(? AS BIGINT)
+                ELSE (
+                  SELECT MIN(n) + 1 FROM (
+                    SELECT n, LEAD(n) OVER (ORDER BY n) AS siguiente FROM numeros
+                  ) huecos
+                  WHERE siguiente IS NULL OR siguiente > n + 1
+                )
+              END AS n
+            )
+        """
+        params += [primera, primera]
+        if reservar:
+            expira = (
+                datetime.fromisoformat(ahora) + timedelta(seconds=RESERVA_SUBCUENTA_TTL_S)
+            ).isoformat()
+            sql += """,
+            reserva AS (
+              INSERT INTO reservas_subcuentas (codigo_empresa, subcuenta, reservado_por, expira_en)
+              SELECT ?, CAST(n AS TEXT), ?, ? FROM libre WHERE n <= ?
+              ON CONFLICT(codigo_empresa, subcuenta) DO UPDATE SET
+                reservado_por=excluded.reservado_por,
+                expira_en=excluded.expira_en
+              WHERE reservas_subcuentas.reservado_por=excluded.reservado_por
+                 OR reservas_subcuentas.expira_en<=?
+              RETURNING subcuenta
+            )
+            SELECT n, (SELECT subcuenta FROM reserva) AS reservada FROM libre
+            """
+            params += [codigo, puesto, expira, ultima, ahora]
+        else:
+            sql += "SELECT n, NULL AS reservada FROM libre"
+        # Si otro puesto reserva el mismo numero entre la lectura y la
+        # insercion, la reserva no devuelve fila y se repite el calculo.
+        for _ in range(5):
+            row = self.conn.execute(sql, params).fetchone()
+            if reservar:
+                self.conn.commit()
+            n = int(row["n"])
+            if n > ultima:
+                raise ValueError(f"No quedan subcuentas libres con el prefijo {prefijo}.")
+            if not reservar or row["reservada"]:
+                return str(n)
+        raise RuntimeError(f"No se pudo reservar una subcuenta con el prefijo {prefijo}.")
+
+    @staticmethod
+    def _id_puesto() -> str:
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def listar_maestro_subcuentas_por_tercero(self, codigo_empresa: str, tercero_id: str) -> list:
+        cur = self.conn.execute(
             "SELECT * FROM maestro_subcuentas_empresa"
             " WHERE codigo_empresa=? AND tercero_id=? ORDER BY subcuenta",
             (str(codigo_empresa), str(tercero_id)),
@@ -5429,9 +6221,35 @@ class GestorBase:
         activo: bool | None = True,
         subcuenta: str | None = None,
     ) -> list[dict]:
+        """Subcuentas del maestro con los datos del tercero y su relacion fiscal.
+
+        Los dialogos de factura la piden cada vez que se abren; el resultado
+        se reutiliza mientras no cambie ``generacion_terceros`` y durante
+        ``_TTL_INDICES_CUENTAS_S`` como maximo.
+        """
         tipos_norm = [str(t).strip() for t in (tipos or []) if str(t).strip()]
         if not tipos_norm:
             return []
+        clave = (
+            str(codigo_empresa), tuple(tipos_norm), activo,
+            None if subcuenta is None else str(subcuenta),
+        )
+        cache = getattr(self, "_cache_subcuentas_facturacion", None)
+        if cache is None or cache[0] != self.generacion_terceros():
+            cache = self._cache_subcuentas_facturacion = (self.generacion_terceros(), {})
+        guardado = cache[1].get(clave)
+        if guardado is None or time.monotonic() - guardado[0] >= _TTL_INDICES_CUENTAS_S:
+            guardado = (time.monotonic(), self._consultar_subcuentas_facturacion(*clave))
+            cache[1][clave] = guardado
+        return [dict(fila) for fila in guardado[1]]
+
+    def _consultar_subcuentas_facturacion(
+        self,
+        codigo_empresa: str,
+        tipos_norm: tuple[str, ...],
+        activo: bool | None,
+        subcuenta: str | None,
+    ) -> list[dict]:
         placeholders = ",".join("?" for _ in tipos_norm)
         clauses = [
             "m.codigo_empresa=?",
@@ -5480,6 +6298,7 @@ class GestorBase:
         return [self._row_to_dict(r) for r in cur.fetchall()]
 
     def marcar_maestro_subcuenta_alta_a3(self, subcuenta_id: int, lote: str | None = None) -> None:
+        self._invalidar_terceros()
         now = self._utc_now()
         self.conn.execute(
             "UPDATE maestro_subcuentas_empresa"
@@ -5491,6 +6310,7 @@ class GestorBase:
     def marcar_subcuenta_enlazada_a3_por_cuenta(
         self, codigo_empresa: str, subcuenta: str, observaciones: str = "", lote: str | None = None
     ) -> None:
+        self._invalidar_terceros()
         now = self._utc_now()
         self.conn.execute(
             """UPDATE maestro_subcuentas_empresa
@@ -5501,106 +6321,121 @@ class GestorBase:
         )
         self.conn.commit()
 
+    def _indexar_referencias_subcuenta(self, tipo_doc: str, doc_id) -> None:
+        """Rehace las filas de referencias_subcuentas de un documento.
+
+        Se llama tras guardar o borrar la factura, dentro de su transaccion.
+        """
+        doc_id = str(doc_id)
+        self.conn.execute(
+            "DELETE FROM referencias_subcuentas WHERE tipo_doc=? AND doc_id=?",
+            (tipo_doc, doc_id),
+        )
+        consulta = _REFERENCIAS_SUBCUENTA_SQL[tipo_doc].format(filtro="d.id=?")
+        self.conn.execute(
+            _INSERTAR_REFERENCIAS_SUBCUENTA.format(consulta=consulta),
+            (doc_id,) * consulta.count("?"),
+        )
+
+    def reconstruir_referencias_subcuentas(self, codigo_empresa: str | None = None) -> None:
+        """Regenera desde las facturas el indice de uso de subcuentas."""
+        codigo = str(codigo_empresa or "").strip()
+        filtro = "d.codigo_empresa=?" if codigo else "1=1"
+        try:
+            if codigo:
+                self.conn.execute(
+                    "DELETE FROM referencias_subcuentas WHERE codigo_empresa=?", (codigo,),
+                )
+            else:
+                self.conn.execute("DELETE FROM referencias_subcuentas")
+            for plantilla in _REFERENCIAS_SUBCUENTA_SQL.values():
+                consulta = plantilla.format(filtro=filtro)
+                self.conn.execute(
+                    _INSERTAR_REFERENCIAS_SUBCUENTA.format(consulta=consulta),
+                    (codigo,) * consulta.count("?"),
+                )
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
     def get_referencias_subcuenta_en_facturas(self, codigo_empresa: str, subcuenta: str) -> list[dict]:
+        """Facturas que usan la subcuenta, leidas del indice referencias_subcuentas."""
         codigo = str(codigo_empresa or "").strip()
         cuenta = str(subcuenta or "").strip()
         if not codigo or not cuenta:
             return []
 
-        refs: list[dict] = []
-        emitidas = self.conn.execute(
-            """
-            SELECT id, ejercicio, serie, numero, nombre
-            FROM facturas_emitidas_docs
-            WHERE codigo_empresa=? AND subcuenta_cliente=?
-            ORDER BY ejercicio, serie, numero, id
-            """,
+        campos_por_doc: dict[tuple[str, str], set[str]] = {}
+        for row in self.conn.execute(
+            "SELECT tipo_doc, doc_id, campo FROM referencias_subcuentas "
+            "WHERE codigo_empresa=? AND subcuenta=?",
             (codigo, cuenta),
-        ).fetchall()
-        for row in emitidas:
-            refs.append(
-                {
-                    "tipo": "factura_emitida",
-                    "id": row["id"],
-                    "ejercicio": row["ejercicio"],
-                    "descripcion": f"Factura emitida {str(row['serie'] or '').strip()}{str(row['numero'] or '').strip()}".strip(),
-                    "nombre": row["nombre"] or "",
-                }
-            )
+        ).fetchall():
+            campos_por_doc.setdefault((row["tipo_doc"], str(row["doc_id"])), set()).add(row["campo"])
+        if not campos_por_doc:
+            return []
 
-        recibidas = self.conn.execute(
-            """
-            SELECT id, ejercicio, numero_factura, proveedor_nombre,
-                   cuenta_gasto, cuenta_iva, cuenta_proveedor
-            FROM facturas_recibidas_docs
-            WHERE codigo_empresa=?
-              AND (cuenta_gasto=? OR cuenta_iva=? OR cuenta_proveedor=?)
-            ORDER BY ejercicio, numero_factura, id
-            """,
-            (codigo, cuenta, cuenta, cuenta),
-        ).fetchall()
-        for row in recibidas:
-            campos = []
-            if str(row["cuenta_gasto"] or "").strip() == cuenta:
-                campos.append("gasto")
-            if str(row["cuenta_iva"] or "").strip() == cuenta:
-                campos.append("IVA")
-            if str(row["cuenta_proveedor"] or "").strip() == cuenta:
-                campos.append("proveedor")
-            refs.append(
-                {
-                    "tipo": "factura_recibida",
-                    "id": row["id"],
-                    "ejercicio": row["ejercicio"],
-                    "descripcion": f"Factura recibida {str(row['numero_factura'] or '').strip()}".strip(),
-                    "nombre": row["proveedor_nombre"] or "",
-                    "campos": campos,
-                }
-            )
+        refs: list[dict] = []
+        emitidas = [d for t, d in campos_por_doc if t == "factura_emitida"]
+        if emitidas:
+            qmarks = ",".join("?" for _ in emitidas)
+            for row in self.conn.execute(
+                f"""
+                SELECT id, ejercicio, serie, numero, nombre
+                FROM facturas_emitidas_docs
+                WHERE codigo_empresa=? AND id IN ({qmarks})
+                ORDER BY ejercicio, serie, numero, id
+                """,
+                (codigo, *emitidas),
+            ).fetchall():
+                refs.append(
+                    {
+                        "tipo": "factura_emitida",
+                        "id": row["id"],
+                        "ejercicio": row["ejercicio"],
+                        "descripcion": f"Factura emitida {str(row['serie'] or '').strip()}{str(row['numero'] or '').strip()}".strip(),
+                        "nombre": row["nombre"] or "",
+                    }
+                )
 
-        ocr_lineas = self.conn.execute(
-            """
-            SELECT o.doc_id, d.ejercicio, d.numero_factura, d.proveedor_nombre,
-                   o.cuenta_base, o.cuenta_iva, o.cuenta_retencion
-            FROM ocr_lineas_fiscales o
-            JOIN facturas_recibidas_docs d ON d.id = o.doc_id
-            WHERE d.codigo_empresa=?
-              AND (o.cuenta_base=? OR o.cuenta_iva=? OR o.cuenta_retencion=?)
-            ORDER BY d.ejercicio, d.numero_factura, o.doc_id
-            """,
-            (codigo, cuenta, cuenta, cuenta),
-        ).fetchall()
-        vistos = {(r["tipo"], str(r["id"])) for r in refs}
-        for row in ocr_lineas:
-            key = ("factura_recibida", str(row["doc_id"]))
-            if key in vistos:
-                continue
-            campos = []
-            if str(row["cuenta_base"] or "").strip() == cuenta:
-                campos.append("base")
-            if str(row["cuenta_iva"] or "").strip() == cuenta:
-                campos.append("IVA")
-            if str(row["cuenta_retencion"] or "").strip() == cuenta:
-                campos.append("retencion")
-            refs.append(
-                {
-                    "tipo": "factura_recibida",
-                    "id": row["doc_id"],
-                    "ejercicio": row["ejercicio"],
-                    "descripcion": f"Factura recibida {str(row['numero_factura'] or '').strip()}".strip(),
-                    "nombre": row["proveedor_nombre"] or "",
-                    "campos": campos,
-                }
-            )
+        recibidas = [d for t, d in campos_por_doc if t == "factura_recibida"]
+        if recibidas:
+            qmarks = ",".join("?" for _ in recibidas)
+            for row in self.conn.execute(
+                f"""
+                SELECT id, ejercicio, numero_factura, proveedor_nombre
+                FROM facturas_recibidas_docs
+                WHERE codigo_empresa=? AND id IN ({qmarks})
+                ORDER BY ejercicio, numero_factura, id
+                """,
+                (codigo, *recibidas),
+            ).fetchall():
+                usados = campos_por_doc[("factura_recibida", str(row["id"]))]
+                campos = [e for c, e in _ETIQUETAS_REFERENCIA_RECIBIDA if c in usados]
+                if not campos:
+                    campos = [e for c, e in _ETIQUETAS_REFERENCIA_LINEA if c in usados]
+                refs.append(
+                    {
+                        "tipo": "factura_recibida",
+                        "id": row["id"],
+                        "ejercicio": row["ejercicio"],
+                        "descripcion": f"Factura recibida {str(row['numero_factura'] or '').strip()}".strip(),
+                        "nombre": row["proveedor_nombre"] or "",
+                        "campos": campos,
+                    }
+                )
         return refs
 
     def eliminar_maestro_subcuenta(self, subcuenta_id: int) -> None:
+        self._invalidar_terceros()
         row = self.conn.execute(
             "SELECT codigo_empresa, subcuenta, tipo_subcuenta, tercero_id FROM maestro_subcuentas_empresa WHERE id=?",
             (int(subcuenta_id),),
         ).fetchone()
         if not row:
             return
+        self._invalidar_indice_cuentas(row["codigo_empresa"])
         refs = self.get_referencias_subcuenta_en_facturas(row["codigo_empresa"], row["subcuenta"])
         if refs:
             detalle = []
@@ -5721,35 +6556,55 @@ class GestorBase:
     # documentos_ocr ──────────────────────────────────────────────────────────
 
     def upsert_documento_ocr(self, doc: dict) -> str:
-        """Inserta o actualiza un documento OCR. Devuelve el id."""
-        self.conn.execute(
-            """
-            INSERT INTO documentos_ocr
-              (id, empresa_id, ruta_original, nombre_archivo, hash_archivo,
-               tipo_documento, estado, fecha_alta, fecha_procesado,
-               motor_ocr, confianza_global, error_ocr, texto_extraido, json_ocr)
-            VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-            ON CONFLICT(id) DO UPDATE SET
-              estado=excluded.estado,
-              fecha_procesado=excluded.fecha_procesado,
-              motor_ocr=excluded.motor_ocr,
-              confianza_global=excluded.confianza_global,
-              error_ocr=excluded.error_ocr,
-              texto_extraido=excluded.texto_extraido,
-              json_ocr=excluded.json_ocr
-            """,
-            (
-                doc["id"], doc.get("empresa_id"), doc.get("ruta_original"),
-                doc.get("nombre_archivo"), doc.get("hash_archivo"),
-                doc.get("tipo_documento", "factura_recibida"),
-                doc.get("estado", "pendiente_revision"),
-                doc.get("fecha_alta"), doc.get("fecha_procesado"),
-                doc.get("motor_ocr", ""), float(doc.get("confianza_global") or 0.0),
-                doc.get("error_ocr", ""), doc.get("texto_extraido", ""),
-                doc.get("json_ocr", ""),
-            ),
-        )
-        self.conn.commit()
+        """Inserta o actualiza un documento OCR. Devuelve el id.
+
+        Con ``ruta_objeto`` el documento pasa a referenciar ese contenido del
+        almacen; la referencia se suma una sola vez, en la misma transaccion.
+        """
+        ruta_objeto = doc.get("ruta_objeto") or None
+        try:
+            previo = None
+            if ruta_objeto:
+                previo = self.conn.execute(
+                    "SELECT ruta_objeto FROM documentos_ocr WHERE id=?", (doc["id"],),
+                ).fetchone()
+            self.conn.execute(
+                """
+                INSERT INTO documentos_ocr
+                  (id, empresa_id, ruta_original, nombre_archivo, hash_archivo,
+                   tipo_documento, estado, fecha_alta, fecha_procesado,
+                   motor_ocr, confianza_global, error_ocr, texto_extraido, json_ocr,
+                   ruta_objeto)
+                VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+                ON CONFLICT(id) DO UPDATE SET
+                  estado=excluded.estado,
+                  fecha_procesado=excluded.fecha_procesado,
+                  motor_ocr=excluded.motor_ocr,
+                  confianza_global=excluded.confianza_global,
+                  error_ocr=excluded.error_ocr,
+                  texto_extraido=excluded.texto_extraido,
+                  json_ocr=excluded.json_ocr,
+                  ruta_objeto=COALESCE(documentos_ocr.ruta_objeto, excluded.ruta_objeto)
+                """,
+                (
+                    doc["id"], doc.get("empresa_id"), doc.get("ruta_original"),
+                    doc.get("nombre_archivo"), doc.get("hash_archivo"),
+                    doc.get("tipo_documento", "factura_recibida"),
+                    doc.get("estado", "pendiente_revision"),
+                    doc.get("fecha_alta"), doc.get("fecha_procesado"),
+                    doc.get("motor_ocr", ""), float(doc.get("confianza_global") or 0.0),
+                    doc.get("error_ocr", ""), doc.get("texto_extraido", ""),
+                    doc.get("json_ocr", ""), ruta_objeto,
+                ),
+            )
+            if ruta_objeto and not (previo and previo["ruta_objeto"]):
+                self.referenciar_contenido_documental(
+                    doc.get("hash_archivo") or "", ruta_objeto, commit=False,
+                )
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
         return doc["id"]
 
     def get_documento_ocr(self, doc_id: str) -> dict | None:
@@ -5774,7 +6629,14 @@ class GestorBase:
         return dict(zip(cols, row))
 
     def listar_documentos_ocr(self, empresa_id: str, estado: str | None = None) -> list[dict]:
-        if estado:
+        if estado == "procesando":
+            # Los documentos en cola se muestran junto a los que ya se analizan.
+            cur = self.conn.execute(
+                "SELECT * FROM documentos_ocr WHERE empresa_id=? "
+                "AND estado IN ('en_cola','procesando') ORDER BY fecha_alta DESC",
+                (empresa_id,),
+            )
+        elif estado:
             cur = self.conn.execute(
                 "SELECT * FROM documentos_ocr WHERE empresa_id=? AND estado=? ORDER BY fecha_alta DESC",
                 (empresa_id, estado),
@@ -5787,22 +6649,234 @@ class GestorBase:
         cols = [c[0] for c in cur.description]
         return [dict(zip(cols, r)) for r in cur.fetchall()]
 
-    def eliminar_documento_ocr(self, doc_id: str) -> bool:
-        """Elimina el trabajo OCR y devuelve su documento de archivo a archivado."""
-        documento = self.get_documento_ocr(doc_id)
-        if not documento:
-            return False
-        now = datetime.now().astimezone().isoformat(timespec="seconds")
+    # cola de documentos_ocr ──────────────────────────────────────────────────
+
+    def encolar_documento_ocr(
+        self, doc_id: str, prioridad: int = 0, opciones: dict | None = None,
+    ) -> None:
+        """Deja el documento pendiente de analizar por los trabajadores OCR."""
         self.conn.execute(
-            "UPDATE documentos_archivo SET ocr_documento_id=NULL,"
-            "estado='archivado',updated_at=? WHERE ocr_documento_id=?",
-            (now, str(doc_id)),
+            "UPDATE documentos_ocr SET estado='en_cola',error_ocr='',"
+            "cola_prioridad=?,cola_intentos=0,cola_proximo_intento=NULL,"
+            "cola_trabajador=NULL,cola_bloqueado_en=NULL,cola_opciones_json=? "
+            "WHERE id=?",
+            (
+                int(prioridad or 0),
+                json.dumps(opciones or {}, ensure_ascii=False),
+                str(doc_id),
+            ),
+        )
+        self.conn.commit()
+
+    def reclamar_documentos_ocr_en_cola(
+        self, trabajador: str, limite: int = 1, empresa_id: str | None = None,
+    ) -> list[dict]:
+        """Pasa a ``procesando`` los siguientes documentos de la cola.
+
+        ``SKIP LOCKED`` permite que varios puestos o hilos reclamen a la vez
+        sin bloquearse ni recibir el mismo documento. Con ``empresa_id`` solo
+        se reclaman los de esa empresa.
+        """
+        ahora = self._utc_now()
+        filtro_empresa = " AND empresa_id=?" if empresa_id else ""
+        params: list = [str(trabajador), ahora, ahora]
+        if empresa_id:
+            params.append(str(empresa_id))
+        params.append(max(1, int(limite)))
+        rows = self.conn.execute(
+            f"""
+            UPDATE documentos_ocr SET estado='procesando',cola_trabajador=?,
+              cola_bloqueado_en=?,cola_intentos=COALESCE(cola_intentos,0)+1
+            WHERE id IN (
+              SELECT id FROM documentos_ocr
+              WHERE estado='en_cola'
+                AND (cola_proximo_intento IS NULL OR cola_proximo_intento<=?){filtro_empresa}
+              ORDER BY COALESCE(cola_prioridad,0) DESC,fecha_alta
+              LIMIT ? FOR UPDATE SKIP LOCKED
+            )
+            RETURNING *
+            """,
+            tuple(params),
+        ).fetchall()
+        self.conn.commit()
+        docs = [self._row_to_dict(row) for row in rows]
+        docs.sort(key=lambda d: (-int(d.get("cola_prioridad") or 0), str(d.get("fecha_alta") or "")))
+        return docs
+
+    def reprogramar_documento_ocr(
+        self, doc_id: str, error: str, max_intentos: int, espera_s: float,
+    ) -> str:
+        """Devuelve a la cola un documento fallido o lo marca como error
+        cuando agota los intentos. Devuelve el estado resultante."""
+        row = self.conn.execute(
+            "SELECT COALESCE(cola_intentos,0) AS intentos FROM documentos_ocr WHERE id=?",
+            (str(doc_id),),
+        ).fetchone()
+        intentos = int(row["intentos"]) if row else max_intentos
+        if intentos >= max_intentos:
+            estado, proximo = "error", None
+        else:
+            estado = "en_cola"
+            proximo = (
+                datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+                + timedelta(seconds=max(0.0, float(espera_s)))
+            ).isoformat()
+        self.conn.execute(
+            "UPDATE documentos_ocr SET estado=?,error_ocr=?,cola_proximo_intento=?,"
+            "cola_trabajador=NULL,cola_bloqueado_en=NULL WHERE id=?",
+            (estado, str(error or ""), proximo, str(doc_id)),
+        )
+        self.conn.commit()
+        return estado
+
+    def liberar_documento_ocr_en_cola(self, doc_id: str) -> None:
+        self.conn.execute(
+            "UPDATE documentos_ocr SET cola_trabajador=NULL,cola_bloqueado_en=NULL "
+            "WHERE id=?", (str(doc_id),),
         )
+        self.conn.commit()
+
+    def recuperar_documentos_ocr_bloqueados(
+        self, bloqueo_max_s: float, max_intentos: int | None = None,
+        empresa_id: str | None = None,
+    ) -> int:
+        """Reencola documentos que un trabajador dejo en ``procesando``
+        (cierre de la aplicacion, caida del puesto...).
+
+        Cada reclamacion ya cuenta como intento: un documento que tumba al
+        trabajador una y otra vez pasa a ``error`` al agotar ``max_intentos``
+        en vez de volver a la cola indefinidamente. Devuelve los reencolados.
+        """
+        limite = (
+            datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+            - timedelta(seconds=max(0.0, float(bloqueo_max_s)))
+        ).isoformat()
+        filtro = (
+            "WHERE estado='procesando' "
+            "AND cola_bloqueado_en IS NOT NULL AND cola_bloqueado_en<?"
+        )
+        params: list = [limite]
+        if empresa_id:
+            filtro += " AND empresa_id=?"
+            params.append(str(empresa_id))
+        try:
+            if max_intentos:
+                self.conn.execute(
+                    "UPDATE documentos_ocr SET estado='error',error_ocr=?,"
+                    f"cola_trabajador=NULL,cola_bloqueado_en=NULL {filtro} "
+                    "AND COALESCE(cola_intentos,0)>=?",
+                    (
+                        f"El analisis se interrumpio {int(max_intentos)} veces sin terminar.",
+                        *params, int(max_intentos),
+                    ),
+                )
+            cursor = self.conn.execute(
+                "UPDATE documentos_ocr SET estado='en_cola',cola_trabajador=NULL,"
+                f"cola_bloqueado_en=NULL {filtro}",
+                tuple(params),
+            )
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return max(0, int(cursor.rowcount or 0))
+
+    # ── Cache de resultados de motores OCR ───────────────────────────────────
+
+    def get_cache_ocr(self, hash_archivo: str, motor: str, version_motor: str) -> str | None:
+        """Devuelve el resultado guardado del motor y anota el acierto."""
+        row = self.conn.execute(
+            "UPDATE ocr_cache_resultados SET aciertos=aciertos+1,ultimo_acceso=? "
+            "WHERE hash_archivo=? AND motor=? AND version_motor=? "
+            "RETURNING resultado_json",
+            (self._utc_now(), str(hash_archivo), str(motor), str(version_motor)),
+        ).fetchone()
+        self.conn.commit()
+        return row["resultado_json"] if row else None
+
+    def guardar_cache_ocr(
+        self, hash_archivo: str, motor: str, version_motor: str, resultado_json: str,
+    ) -> None:
+        ahora = self._utc_now()
         self.conn.execute(
-            "DELETE FROM facturas_recibidas_ocr WHERE documento_id=?", (str(doc_id),)
+            """
+            INSERT INTO ocr_cache_resultados
+              (hash_archivo,motor,version_motor,resultado_json,tamano,aciertos,ultimo_acceso,created_at)
+            VALUES (?,?,?,?,?,0,?,?)
+            ON CONFLICT(hash_archivo,motor,version_motor) DO UPDATE SET
+              resultado_json=excluded.resultado_json,
+              tamano=excluded.tamano,
+              ultimo_acceso=excluded.ultimo_acceso
+            """,
+            (
+                str(hash_archivo), str(motor), str(version_motor), resultado_json,
+                len(resultado_json.encode("utf-8")), ahora, ahora,
+            ),
+        )
+        self.conn.commit()
+
+    def podar_cache_ocr(self, max_bytes: int) -> int:
+        """Elimina los resultados menos usados recientemente hasta que la
+        cache ocupe como mucho ``max_bytes``. Devuelve las filas borradas."""
+        cursor = self.conn.execute(
+            """
+            DELETE FROM ocr_cache_resultados
+            WHERE (hash_archivo,motor,version_motor) IN (
+              SELECT hash_archivo,motor,version_motor FROM (
+                SELECT hash_archivo,motor,version_motor,
+                  SUM(tamano) OVER (ORDER BY ultimo_acceso DESC,created_at DESC) AS acumulado
+                FROM ocr_cache_resultados
+              ) ranking
+              WHERE acumulado>?
+            )
+            """,
+            (max(0, int(max_bytes)),),
         )
-        self.conn.execute("DELETE FROM documentos_ocr WHERE id=?", (str(doc_id),))
         self.conn.commit()
+        return max(0, int(cursor.rowcount or 0))
+
+    def estadisticas_cache_ocr(self) -> dict:
+        row = self.conn.execute(
+            "SELECT COUNT(*) AS entradas,COALESCE(SUM(tamano),0) AS bytes,"
+            "COALESCE(SUM(aciertos),0) AS aciertos FROM ocr_cache_resultados"
+        ).fetchone()
+        return {
+            "entradas": int(row["entradas"]) if row else 0,
+            "bytes": int(row["bytes"]) if row else 0,
+            "aciertos": int(row["aciertos"]) if row else 0,
+        }
+
+    def eliminar_documento_ocr(
+        self, doc_id: str, al_eliminar_objeto: Callable[[str], None] | None = None,
+    ) -> bool:
+        """Elimina el trabajo OCR y devuelve su documento de archivo a archivado.
+
+        Si el documento tenia referencia en el almacen por contenido se libera
+        en la misma transaccion (ver ``liberar_contenido_documental``).
+        """
+        documento = self.get_documento_ocr(doc_id)
+        if not documento:
+            return False
+        now = datetime.now().astimezone().isoformat(timespec="seconds")
+        try:
+            self.conn.execute(
+                "UPDATE documentos_archivo SET ocr_documento_id=NULL,"
+                "estado='archivado',updated_at=? WHERE ocr_documento_id=?",
+                (now, str(doc_id)),
+            )
+            self.conn.execute(
+                "DELETE FROM facturas_recibidas_ocr WHERE documento_id=?", (str(doc_id),)
+            )
+            self.conn.execute("DELETE FROM documentos_ocr WHERE id=?", (str(doc_id),))
+            if documento.get("ruta_objeto"):
+                self.liberar_contenido_documental(
+                    documento.get("hash_archivo") or "", commit=False,
+                    al_eliminar_objeto=al_eliminar_objeto,
+                )
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
         return True
 
     # facturas_recibidas_ocr ──────────────────────────────────────────────────
@@ -6364,6 +7438,13 @@ class GestorBase:
         self._ensure_column("notif_bandeja", "archivada", "INTEGER NOT NULL DEFAULT 0")
         self._ensure_column("notif_bandeja", "enviada_cliente", "INTEGER NOT NULL DEFAULT 0")
         self._ensure_column("notif_bandeja", "fecha_envio_cliente", "TEXT")
+        # v2.2: tiempos por buzon de la sincronizacion en paralelo
+        self._ensure_column("notif_sync_logs", "duracion_ms", "INTEGER")
+        self._ensure_column("notif_sync_logs", "notificaciones_nuevas", "INTEGER NOT NULL DEFAULT 0")
+        # v2.3: marca de agua para la sincronizacion incremental
+        self._ensure_column("notif_buzones", "hwm_fecha_disposicion", "TEXT")
+        self._ensure_column("notif_buzones", "hwm_referencias_json", "TEXT")
+        self._ensure_column("notif_buzones", "hwm_sync_completa", "TEXT")
         self.conn.commit()
 
     def listar_notificaciones(
@@ -6725,6 +7806,31 @@ class GestorBase:
         self.conn.commit()
         return buzon_id
 
+    def actualizar_marca_sync_notif_buzon(
+        self, codigo_empresa: str, buzon_id: str, fecha_disposicion: str | None,
+        referencias: dict, sync_completa: str | None = None,
+    ) -> None:
+        """Guarda la marca de agua de la sincronizacion incremental del buzon.
+
+        ``referencias`` asocia cada referencia ya guardada con ``[firma, fecha]``
+        (ver dehu_playwright._firma_registro). ``sync_completa`` es el momento
+        de la ultima pasada completa, si esta lo ha sido.
+        """
+        campos = "hwm_fecha_disposicion=?, hwm_referencias_json=?, updated_at=?"
+        params = [
+            fecha_disposicion,
+            json.dumps(referencias or {}, ensure_ascii=False, sort_keys=True),
+            self._utc_now(),
+        ]
+        if sync_completa:
+            campos += ", hwm_sync_completa=?"
+            params.append(sync_completa)
+        self.conn.execute(
+            f"UPDATE notif_buzones SET {campos} WHERE id=? AND codigo_empresa=?",
+            (*params, buzon_id, codigo_empresa),
+        )
+        self.conn.commit()
+
     def eliminar_notif_buzon(self, codigo_empresa: str, buzon_id: str) -> None:
         self.conn.execute(
             "DELETE FROM notif_buzones WHERE id=? AND codigo_empresa=?",
@@ -6837,6 +7943,84 @@ class GestorBase:
         self.conn.commit()
         return item_id
 
+    def upsert_notif_bandeja_items(self, items: list[dict]) -> list[str]:
+        """Inserta o actualiza varios items de bandeja en una sola sentencia.
+
+        Usa un INSERT multi-fila con ON CONFLICT y ``RETURNING (xmax = 0)``
+        para saber que filas se han creado (xmax es 0 solo en tuplas recien
+        insertadas). Devuelve los ids nuevos. Un mismo id no puede aparecer
+        dos veces en la sentencia: prevalece la ultima version.
+        """
+        import uuid as _uuid
+        now = self._utc_now()
+        por_id: dict[str, tuple] = {}
+        for item in items:
+            item_id = str(item.get("id") or _uuid.uuid4())
+            por_id[item_id] = (
+                item_id,
+                item.get("codigo_empresa"),
+                int(item.get("ejercicio") or 0),
+                item.get("buzon_id"),
+                item.get("organismo_id"),
+                item.get("asunto", ""),
+                item.get("descripcion"),
+                item.get("tipo_acto"),
+                item.get("referencia"),
+                item.get("nif_interesado"),
+                item.get("nombre_interesado"),
+                item.get("fecha_puesta_disposicion"),
+                item.get("fecha_vencimiento"),
+                item.get("fecha_aceptacion"),
+                item.get("fecha_rechazo"),
+                item.get("estado", "PENDIENTE"),
+                item.get("pdf_path"),
+                item.get("metadatos_json"),
+                item.get("created_at", now),
+                now,
+            )
+        if not por_id:
+            return []
+        filas = list(por_id.values())
+        nuevos: list[str] = []
+        # PostgreSQL admite 65535 parametros por sentencia (20 por fila).
+        for inicio in range(0, len(filas), _NOTIF_BANDEJA_FILAS_POR_LOTE):
+            lote = filas[inicio:inicio + _NOTIF_BANDEJA_FILAS_POR_LOTE]
+            valores = ",".join(["(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)"] * len(lote))
+            cur = self.conn.execute(
+                f"""
+                INSERT INTO notif_bandeja
+                    (id, codigo_empresa, ejercicio, buzon_id, organismo_id,
+                     asunto, descripcion, tipo_acto, referencia,
+                     nif_interesado, nombre_interesado,
+                     fecha_puesta_disposicion, fecha_vencimiento,
+                     fecha_aceptacion, fecha_rechazo, estado,
+                     pdf_path, metadatos_json, created_at, updated_at)
+                VALUES {valores}
+                ON CONFLICT(id) DO UPDATE SET
+                    buzon_id                 = excluded.buzon_id,
+                    organismo_id             = excluded.organismo_id,
+                    asunto                   = excluded.asunto,
+                    descripcion              = excluded.descripcion,
+                    tipo_acto                = excluded.tipo_acto,
+                    referencia               = excluded.referencia,
+                    nif_interesado           = excluded.nif_interesado,
+                    nombre_interesado        = excluded.nombre_interesado,
+                    fecha_puesta_disposicion = excluded.fecha_puesta_disposicion,
+                    fecha_vencimiento        = excluded.fecha_vencimiento,
+                    fecha_aceptacion         = excluded.fecha_aceptacion,
+                    fecha_rechazo            = excluded.fecha_rechazo,
+                    estado                   = excluded.estado,
+                    pdf_path                 = excluded.pdf_path,
+                    metadatos_json           = excluded.metadatos_json,
+                    updated_at               = excluded.updated_at
+                RETURNING id, (xmax = 0) AS nuevo
+                """,
+                tuple(valor for fila in lote for valor in fila),
+            )
+            nuevos.extend(str(row[0]) for row in cur.fetchall() if row[1])
+        self.conn.commit()
+        return nuevos
+
     def cambiar_estado_notif_bandeja(
         self, codigo_empresa: str, item_id: str, estado: str, fecha: str
     ) -> None:
@@ -7006,12 +8190,15 @@ class GestorBase:
             """
             INSERT INTO notif_sync_logs
                 (id, codigo_empresa, organismo_id, buzon_id, fecha_hora,
-                 resultado, error_detalle, notificaciones_detectadas, created_at)
-            VALUES (?,?,?,?,?,?,?,?,?)
+                 resultado, error_detalle, notificaciones_detectadas,
+                 notificaciones_nuevas, duracion_ms, created_at)
+            VALUES (?,?,?,?,?,?,?,?,?,?,?)
             ON CONFLICT(id) DO UPDATE SET
                 resultado                 = excluded.resultado,
                 error_detalle             = excluded.error_detalle,
-                notificaciones_detectadas = excluded.notificaciones_detectadas
+                notificaciones_detectadas = excluded.notificaciones_detectadas,
+                notificaciones_nuevas     = excluded.notificaciones_nuevas,
+                duracion_ms               = excluded.duracion_ms
             """,
             (
                 log_id,
@@ -7022,6 +8209,8 @@ class GestorBase:
                 log.get("resultado", "OK"),
                 log.get("error_detalle"),
                 int(log.get("notificaciones_detectadas") or 0),
+                int(log.get("notificaciones_nuevas") or 0),
+                log.get("duracion_ms"),
                 log.get("created_at", now),
             ),
         )
@@ -7412,6 +8601,103 @@ class GestorBase:
         )
         self.conn.commit()
 
+    def listar_cuotas_con_periodos(
+        self,
+        codigo_empresa: str | None = None,
+        ejercicio: int | None = None,
+        solo_activas: bool = False,
+    ) -> list[dict]:
+        """Cuotas con sus periodos ya generados (``periodos_generados``) en una consulta.
+
+        Sin ``codigo_empresa`` devuelve las cuotas de todas las empresas.
+        """
+        condiciones, params = [], []
+        if codigo_empresa is not None:
+            condiciones.append("c.codigo_empresa=?")
+            params.append(codigo_empresa)
+        if ejercicio is not None:
+            condiciones.append("c.ejercicio=?")
+            params.append(int(ejercicio))
+        if solo_activas:
+            condiciones.append("c.activa=1")
+        where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        rows = self.conn.execute(
+            f"""
+            SELECT c.*, g.periodo AS periodo_generado
+            FROM cuotas_periodicas c
+            LEFT JOIN cuotas_periodicas_generadas g ON g.cuota_id = c.id
+            {where}
+            ORDER BY c.codigo_empresa, c.ejercicio, c.nombre, c.id, g.periodo
+            """,
+            tuple(params),
+        ).fetchall()
+        cuotas: dict[str, dict] = {}
+        for r in rows:
+            d = self._row_to_dict(r)
+            periodo = d.pop("periodo_generado", None)
+            cuota = cuotas.get(d["id"])
+            if cuota is None:
+                cuota = cuotas[d["id"]] = d
+                cuota["periodos_generados"] = []
+            if periodo:
+                cuota["periodos_generados"].append(periodo)
+        return list(cuotas.values())
+
+    def registrar_facturas_cuotas(self, generaciones: list[tuple[dict, str, str]], fecha: str) -> list[str]:
+        """Graba los borradores de cuotas y sus periodos en una sola transaccion.
+
+        ``generaciones`` son tuplas ``(factura, cuota_id, periodo)``. Devuelve
+        los ids de las facturas grabadas.
+        """
+        ids = []
+        try:
+            for factura, _cuota_id, _periodo in generaciones:
+                ids.append(self.upsert_factura_emitida(factura, commit=False))
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO cuotas_periodicas_generadas (cuota_id, periodo, factura_id, fecha_registro) VALUES (?,?,?,?)",
+                [
+                    (str(cuota_id), periodo, str(fid), fecha)
+                    for (_f, cuota_id, periodo), fid in zip(generaciones, ids)
+                ],
+            )
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return ids
+
+    def subcuentas_cliente_por_tercero(self, codigo_empresa: str, tercero_ids) -> dict[str, str]:
+        """Subcuenta de cliente en la empresa de cada tercero existente.
+
+        Los terceros que no existen no aparecen; los que existen sin relacion
+        con la empresa tienen subcuenta vacia. Igual que ``get_tercero_empresa``
+        prima la relacion de ejercicio 0 y despues la del ejercicio mas reciente.
+        """
+        ids = sorted({str(t) for t in tercero_ids or [] if str(t or "").strip()})
+        if not ids:
+            return {}
+        qmarks = ",".join("?" for _ in ids)
+        rows = self.conn.execute(
+            f"""
+            SELECT t.id AS tercero_id, te.ejercicio, te.subcuenta_cliente
+            FROM terceros t
+            LEFT JOIN terceros_empresas te ON te.tercero_id = t.id AND te.codigo_empresa=?
+            WHERE t.id IN ({qmarks})
+            """,
+            (codigo_empresa, *ids),
+        ).fetchall()
+        out: dict[str, str] = {}
+        rango: dict[str, tuple] = {}
+        for r in rows:
+            d = self._row_to_dict(r)
+            tid = str(d["tercero_id"])
+            eje = d.get("ejercicio")
+            clave = (eje is not None, eje == 0, eje or 0)
+            if tid not in rango or clave > rango[tid]:
+                rango[tid] = clave
+                out[tid] = str(d.get("subcuenta_cliente") or "").strip()
+        return out
+
     # ---------------------------------------------------------------- comunicaciones
 
     def listar_comunicaciones(self, codigo_empresa: str) -> list[dict]:
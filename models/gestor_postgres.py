@@ -5,7 +5,13 @@ from __future__ import annotations
 import re
 from collections.abc import Iterable
 
-from models.gestor_base import AUTH_SCHEMA, SCHEMA, GestorBase
+from models.gestor_base import (
+    AUTH_SCHEMA,
+    COLUMNAS_COLA_OCR,
+    INDICE_COLA_OCR,
+    SCHEMA,
+    GestorBase,
+)
 
 
 class DatabasePostgresError(RuntimeError):
@@ -255,6 +261,18 @@ class ConexionPostgres:
         cursor = CursorPostgres(self._conexion.cursor())
         return cursor.executemany(sql, params_seq)
 
+    def copiar_filas(self, sql: str, filas: Iterable):
+        """Vuelca ``filas`` con ``COPY ... FROM STDIN`` en un solo envio."""
+        try:
+            with self._conexion.cursor() as cursor:
+                with cursor.copy(sql) as copia:
+                    for fila in filas:
+                        copia.write_row(fila)
+        except Exception:
+            self._conexion.rollback()
+            raise
+        return self
+
     def executescript(self, script: str):
         for sentencia in _split_sql_script(script):
             self.execute(sentencia)
@@ -343,6 +361,12 @@ class GestorPostgres(GestorBase):
         self._asegurar_esquema_plantillas_firma()
         self._asegurar_esquema_mensajeria_local()
         self._asegurar_esquema_cuotas_periodicas()
+        self._asegurar_esquema_almacen_documental()
+        self._asegurar_esquema_cola_ocr()
+        self._asegurar_esquema_reservas_subcuentas()
+        self._asegurar_esquema_cache_ocr()
+        self._asegurar_esquema_referencias_subcuentas()
+        self._asegurar_indice_nif_terceros()
         columnas = (
             ("empresas", "cuenta_bancaria", "TEXT"),
             ("empresas", "cuentas_bancarias", "TEXT"),
@@ -373,6 +397,7 @@ class GestorPostgres(GestorBase):
             ("ocr_aprendizaje_ejemplos", "marcas_json", "TEXT NOT NULL DEFAULT '{}'"),
             ("facturas_emitidas_docs", "updated_at", "TEXT"),
             ("facturas_emitidas_docs", "pdf_generated_at", "TEXT"),
+            ("facturas_emitidas_docs", "pdf_huella", "TEXT"),
             (
                 "facturas_emitidas_docs", "origen_factura",
                 "TEXT NOT NULL DEFAULT 'facturacion'",
@@ -381,6 +406,13 @@ class GestorPostgres(GestorBase):
             ("albaranes_emitidas_docs", "updated_at", "TEXT"),
             ("albaranes_emitidas_docs", "pdf_generated_at", "TEXT"),
             ("firma_solicitudes", "documento_firmado_archivo_id", "TEXT"),
+            ("notif_sync_logs", "duracion_ms", "INTEGER"),
+            ("notif_sync_logs", "notificaciones_nuevas", "INTEGER NOT NULL DEFAULT 0"),
+            ("notif_buzones", "hwm_fecha_disposicion", "TEXT"),
+            ("notif_buzones", "hwm_referencias_json", "TEXT"),
+            ("notif_buzones", "hwm_sync_completa", "TEXT"),
+            ("documentos_ocr", "ruta_objeto", "TEXT"),
+            ("documentos_archivo", "ruta_objeto", "TEXT"),
         )
         existentes = {
             (str(row["table_name"]), str(row["column_name"]))
@@ -395,7 +427,7 @@ class GestorPostgres(GestorBase):
                     'facturas_recibidas_docs'
                     , 'ocr_aprendizaje_ejemplos', 'facturas_emitidas_docs',
                     'albaranes_emitidas_docs',
-                    'firma_solicitudes'
+                    'firma_solicitudes', 'notif_sync_logs', 'notif_buzones'
                   )
                 """
             ).fetchall()
@@ -809,6 +841,146 @@ class GestorPostgres(GestorBase):
         )
         self.conn.commit()
 
+    def _asegurar_esquema_almacen_documental(self) -> None:
+        """Crea el recuento de referencias del almacen por contenido."""
+        row = self.conn.execute(
+            "SELECT to_regclass('public.documentos_contenido') AS tabla"
+        ).fetchone()
+        if row is None or row.get("tabla"):
+            return
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS documentos_contenido (
+              hash_archivo TEXT PRIMARY KEY,
+              ruta_objeto TEXT NOT NULL,
+              tamano INTEGER,
+              referencias INTEGER NOT NULL DEFAULT 0,
+              created_at TEXT NOT NULL,
+              updated_at TEXT NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+
+    def _asegurar_esquema_cola_ocr(self) -> None:
+        """Añade a documentos_ocr las columnas de la cola de trabajos OCR."""
+        row = self.conn.execute(
+            "SELECT to_regclass('public.documentos_ocr') AS tabla,"
+            "to_regclass('public.idx_doc_ocr_cola') AS indice"
+        ).fetchone()
+        if row is None or not row.get("tabla") or row.get("indice"):
+            return
+        for columna, definicion in COLUMNAS_COLA_OCR:
+            self.conn.execute(
+                f"ALTER TABLE documentos_ocr ADD COLUMN IF NOT EXISTS {columna} {definicion}"
+            )
+        self.conn.execute(INDICE_COLA_OCR)
+        self.conn.commit()
+
+    def _asegurar_esquema_reservas_subcuentas(self) -> None:
+        """Crea las reservas temporales de subcuentas propuestas."""
+        row = self.conn.execute(
+            "SELECT to_regclass('public.reservas_subcuentas') AS tabla"
+        ).fetchone()
+        if row is None or row.get("tabla"):
+            return
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS reservas_subcuentas (
+              codigo_empresa TEXT NOT NULL,
+              subcuenta TEXT NOT NULL,
+              reservado_por TEXT NOT NULL,
+              expira_en TEXT NOT NULL,
+              PRIMARY KEY (codigo_empresa, subcuenta)
+            )
+            """
+        )
+        self.conn.commit()
+
+    def _asegurar_esquema_cache_ocr(self) -> None:
+        """Crea la cache compartida de resultados de motores OCR."""
+        row = self.conn.execute(
+            "SELECT to_regclass('public.ocr_cache_resultados') AS tabla"
+        ).fetchone()
+        if row is None or row.get("tabla"):
+            return
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ocr_cache_resultados (
+              hash_archivo TEXT NOT NULL,
+              motor TEXT NOT NULL,
+              version_motor TEXT NOT NULL,
+              resultado_json TEXT NOT NULL,
+              tamano INTEGER NOT NULL,
+              aciertos INTEGER NOT NULL DEFAULT 0,
+              ultimo_acceso TEXT NOT NULL,
+              created_at TEXT NOT NULL,
+              PRIMARY KEY (hash_archivo, motor, version_motor)
+            )
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_ocr_cache_acceso "
+            "ON ocr_cache_resultados(ultimo_acceso)"
+        )
+        self.conn.commit()
+
+    def _asegurar_esquema_referencias_subcuentas(self) -> None:
+        """Crea el indice de uso de subcuentas y lo rellena con las facturas existentes."""
+        row = self.conn.execute(
+            "SELECT to_regclass('public.referencias_subcuentas') AS tabla"
+        ).fetchone()
+        if row is None or row.get("tabla"):
+            return
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS referencias_subcuentas (
+              codigo_empresa TEXT NOT NULL,
+              subcuenta TEXT NOT NULL,
+              tipo_doc TEXT NOT NULL,
+              doc_id TEXT NOT NULL,
+              campo TEXT NOT NULL,
+              PRIMARY KEY (codigo_empresa, subcuenta, tipo_doc, doc_id, campo)
+            )
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_referencias_subcuentas_doc "
+            "ON referencias_subcuentas(tipo_doc, doc_id)"
+        )
+        self.reconstruir_referencias_subcuentas()
+
+    def _asegurar_indice_nif_terceros(self) -> None:
+        """Indexa ``terceros.nif_normalizado`` para las busquedas por lote de NIF.
+
+        El valor se recalcula con el mismo criterio que ``normalizar_nif_cif``
+        (solo letras y digitos, en mayusculas): las filas antiguas se
+        normalizaron quitando solo guiones y espacios. Antes de escribir se
+        comprueba si queda alguna distinta para no bloquear la tabla en cada
+        arranque.
+        """
+        row = self.conn.execute(
+            "SELECT to_regclass('public.idx_terceros_nif_normalizado') AS indice"
+        ).fetchone()
+        if row is None:
+            return
+        if not row.get("indice"):
+            self.conn.execute("ALTER TABLE terceros ADD COLUMN IF NOT EXISTS nif_normalizado TEXT")
+        normalizado = "NULLIF(UPPER(regexp_replace(COALESCE(nif, ''), '[^A-Za-z0-9]', '', 'g')), '')"
+        pendiente = self.conn.execute(
+            f"SELECT 1 AS hay FROM terceros WHERE nif_normalizado IS DISTINCT FROM {normalizado} LIMIT 1"
+        ).fetchone()
+        if pendiente:
+            self.conn.execute(
+                f"UPDATE terceros SET nif_normalizado={normalizado}"
+                f" WHERE nif_normalizado IS DISTINCT FROM {normalizado}"
+            )
+        if not row.get("indice"):
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_terceros_nif_normalizado ON terceros(nif_normalizado)"
+            )
+        self.conn.commit()
+
     def _asegurar_esquema_plantillas_firma(self) -> None:
         nombres = (
             "plantillas_firma", "plantillas_firma_empresas", "plantillas_firma_campos",
@@ -0,0 +1,80 @@
+"""Indice en memoria de las cuentas de una empresa para autocompletar.
+
+Las cuentas se guardan ordenadas en una lista y la busqueda por prefijo son
+dos ``bisect``, sin recorrer el plan ni consultar la base de datos. Las
+descripciones se internan porque el plan de A3 repite muchas ("Proveedores",
+"Clientes"...). El gestor construye un indice por empresa y ejercicio y lo
+descarta cuando cambian plan_cuentas o maestro_subcuentas_empresa.
+"""
+from __future__ import annotations
+
+import sys
+from bisect import bisect_left
+from typing import Iterable
+
+EN_PLAN = 1
+EN_MAESTRO = 2
+_FIN_PREFIJO = chr(sys.maxunicode)
+
+
+class IndiceCuentas:
+    """Cuentas ordenadas con su descripcion y su origen (plan, maestro o ambos)."""
+
+    __slots__ = ("cuentas", "descripciones", "_origenes", "_plegadas")
+
+    def __init__(self, filas: Iterable[tuple[str, str, int]]):
+        """``filas``: tuplas (cuenta, descripcion, origen) ya sin duplicados."""
+        ordenadas = sorted(filas)
+        self.cuentas: list[str] = [c for c, _d, _o in ordenadas]
+        self.descripciones: list[str] = [sys.intern(d) for _c, d, _o in ordenadas]
+        self._origenes = bytearray(o for _c, _d, o in ordenadas)
+        self._plegadas: list[str] | None = None
+
+    def __len__(self) -> int:
+        return len(self.cuentas)
+
+    def rango(self, prefijo: str) -> tuple[int, int]:
+        """Posiciones [inicio, fin) de las cuentas que empiezan por ``prefijo``."""
+        prefijo = str(prefijo or "")
+        inicio = bisect_left(self.cuentas, prefijo)
+        return inicio, bisect_left(self.cuentas, prefijo + _FIN_PREFIJO, inicio)
+
+    def por_prefijo(
+        self, prefijo: str, origen: int = 0, limite: int | None = None,
+    ) -> list[tuple[str, str]]:
+        """(cuenta, descripcion) que empiezan por ``prefijo``.
+
+        ``origen`` (EN_PLAN, EN_MAESTRO) limita a las cuentas de esa fuente.
+        """
+        inicio, fin = self.rango(prefijo)
+        salida = []
+        for i in range(inicio, fin):
+            if origen and not self._origenes[i] & origen:
+                continue
+            salida.append((self.cuentas[i], self.descripciones[i]))
+            if limite is not None and len(salida) >= limite:
+                break
+        return salida
+
+    def descripcion(self, cuenta: str) -> str | None:
+        i = bisect_left(self.cuentas, str(cuenta))
+        if i < len(self.cuentas) and self.cuentas[i] == cuenta:
+            return self.descripciones[i]
+        return None
+
+    def buscar(self, texto: str, limite: int | None = 50) -> list[tuple[str, str]]:
+        """Autocompletado: por prefijo si ``texto`` es numerico; si no, por
+        fragmento de la descripcion o de la cuenta."""
+        texto = str(texto or "").strip()
+        if not texto or texto.isdigit():
+            return self.por_prefijo(texto, limite=limite)
+        if self._plegadas is None:
+            self._plegadas = [d.casefold() for d in self.descripciones]
+        buscado = texto.casefold()
+        salida = []
+        for i, plegada in enumerate(self._plegadas):
+            if buscado in plegada or buscado in self.cuentas[i]:
+                salida.append((self.cuentas[i], self.descripciones[i]))
+                if limite is not None and len(salida) >= limite:
+                    break
+        return salida
@@ -0,0 +1,93 @@
+"""Facturas en memoria indexadas por id, ejercicio y serie.
+
+La lista de facturas emitidas se carga una vez y despues se actualiza factura
+a factura: buscar una por id es un acceso a diccionario y filtrar por
+ejercicio o serie recorre solo las facturas de ese grupo.
+"""
+from __future__ import annotations
+
+from typing import Callable, Iterable, Iterator
+
+
+def _serie(factura: dict) -> str:
+    return str(factura.get("serie") or "").strip()
+
+
+class IndiceFacturas:
+    """Facturas por id, con indices secundarios por año y por serie.
+
+    ``anio_de(factura)`` calcula el año con el que se filtra (el de la fecha
+    de asiento o, si falta, el ejercicio). El orden de carga se conserva.
+    """
+
+    __slots__ = ("_anio_de", "_por_id", "_claves", "_por_anio", "_por_serie")
+
+    def __init__(
+        self,
+        facturas: Iterable[dict] = (),
+        anio_de: Callable[[dict], int | None] = lambda f: f.get("ejercicio"),
+    ):
+        self._anio_de = anio_de
+        self._por_id: dict[str, dict] = {}
+        # Claves con las que se indexo cada factura: el dict puede modificarse
+        # despues sin que los indices se desincronicen.
+        self._claves: dict[str, tuple[int | None, str]] = {}
+        self._por_anio: dict[int | None, dict[str, None]] = {}
+        self._por_serie: dict[str, dict[str, None]] = {}
+        for factura in facturas:
+            self.actualizar(factura)
+
+    def __len__(self) -> int:
+        return len(self._por_id)
+
+    def __iter__(self) -> Iterator[dict]:
+        return iter(list(self._por_id.values()))
+
+    def get(self, fid) -> dict | None:
+        return self._por_id.get(str(fid))
+
+    def actualizar(self, factura: dict) -> None:
+        """Añade la factura o sustituye la que tenga su mismo id."""
+        fid = str(factura.get("id"))
+        self.quitar(fid)
+        anio, serie = self._anio_de(factura), _serie(factura)
+        self._por_id[fid] = factura
+        self._claves[fid] = (anio, serie)
+        self._por_anio.setdefault(anio, {})[fid] = None
+        self._por_serie.setdefault(serie, {})[fid] = None
+
+    def quitar(self, fid) -> dict | None:
+        fid = str(fid)
+        factura = self._por_id.pop(fid, None)
+        if factura is None:
+            return None
+        anio, serie = self._claves.pop(fid)
+        for indice, clave in ((self._por_anio, anio), (self._por_serie, serie)):
+            grupo = indice.get(clave)
+            if grupo is not None:
+                grupo.pop(fid, None)
+                if not grupo:
+                    del indice[clave]
+        return factura
+
+    def anios(self) -> list[int]:
+        return sorted(a for a in self._por_anio if a is not None)
+
+    def series(self) -> list[str]:
+        return sorted(s for s in self._por_serie if s)
+
+    def filtrar(self, anio: int | None = None, serie: str | None = None) -> list[dict]:
+        """Facturas del año y la serie indicados (None = sin filtrar)."""
+        grupos = []
+        if anio is not None:
+            grupos.append(self._por_anio.get(anio, {}))
+        if serie is not None:
+            grupos.append(self._por_serie.get(serie, {}))
+        if not grupos:
+            return list(self._por_id.values())
+        grupos.sort(key=len)
+        menor, *resto = grupos
+        return [
+            self._por_id[fid] for fid in menor
+            if all(fid in grupo for grupo in resto)
+        ]
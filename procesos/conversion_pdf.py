@@ -0,0 +1,280 @@
+"""Conversion de .docx a PDF con conversores que se reutilizan entre documentos.
+
+Arrancar Word (o LibreOffice) es lo que mas tarda al generar una factura.
+``PoolConversores`` mantiene un conversor vivo por hilo de trabajo y reparte
+entre ellos los documentos; el conversor se cierra al quedar inactivo un rato
+o al cerrar el pool.
+
+El motor se elige con ``GEST2A3ECO_CONVERSOR_PDF`` (``word`` o
+``libreoffice``); por defecto Word en Windows y LibreOffice en el resto.
+
+Benchmark: ``python -m procesos.conversion_pdf plantilla.docx 20 --hilos 4``.
+"""
+from __future__ import annotations
+
+import atexit
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Callable
+
+# Segundos sin trabajo tras los que un hilo cierra su conversor.
+INACTIVIDAD_S = 300
+TIMEOUT_LIBREOFFICE_S = 120
+
+
+class ConversorWord:
+    """Una instancia aislada de Word que se mantiene abierta entre documentos.
+
+    COM exige usarla siempre desde el hilo que la creo.
+    """
+
+    nombre = "word"
+
+    def __init__(self):
+        self._word = None
+
+    def _abrir(self):
+        import pythoncom
+        import win32com.client as _wc
+
+        pythoncom.CoInitialize()
+        word = _wc.DispatchEx("Word.Application")
+        word.Visible = False
+        word.DisplayAlerts = 0   # wdAlertsNone
+        word.ScreenUpdating = False
+        self._word = word
+
+    def convertir(self, docx_path: str, pdf_path: str) -> None:
+        try:
+            self._exportar(docx_path, pdf_path)
+        except Exception:
+            # Word puede haberse cerrado o colgado entre documentos: se
+            # reintenta una vez con una instancia nueva.
+            self.cerrar()
+            self._exportar(docx_path, pdf_path)
+
+    def _exportar(self, docx_path: str, pdf_path: str) -> None:
+        if self._word is None:
+            self._abrir()
+        abs_pdf = os.path.abspath(pdf_path)
+        doc = self._word.Documents.Open(os.path.abspath(docx_path), ReadOnly=False)
+        try:
+            try:
+                doc.ExportAsFixedFormat(abs_pdf, ExportFormat=17)  # wdExportFormatPDF
+            except Exception:
+                doc.SaveAs2(abs_pdf, FileFormat=17)               # fallback
+        finally:
+            try:
+                doc.Close(0)   # wdDoNotSaveChanges
+            except Exception:
+                pass
+
+    def cerrar(self) -> None:
+        if self._word is None:
+            return
+        word, self._word = self._word, None
+        try:
+            word.Quit(0)
+        except Exception:
+            pass
+        try:
+            import pythoncom
+
+            pythoncom.CoUninitialize()
+        except Exception:
+            pass
+
+
+def buscar_libreoffice() -> str | None:
+    for nombre in ("soffice", "libreoffice"):
+        ruta = shutil.which(nombre)
+        if ruta:
+            return ruta
+    for base in (os.environ.get("ProgramFiles"), os.environ.get("ProgramFiles(x86)")):
+        if base:
+            ruta = Path(base) / "LibreOffice" / "program" / "soffice.exe"
+            if ruta.exists():
+                return str(ruta)
+    return None
+
+
+class ConversorLibreOffice:
+    """LibreOffice en modo headless con un perfil de usuario propio.
+
+    Con el perfil propio varios conversores pueden trabajar en paralelo y
+    LibreOffice no tiene que volver a crearlo en cada documento.
+    """
+
+    nombre = "libreoffice"
+
+    def __init__(self, ejecutable: str | None = None):
+        self._ejecutable = ejecutable or buscar_libreoffice()
+        if not self._ejecutable:
+            raise RuntimeError("No se encuentra LibreOffice (soffice) para convertir a PDF.")
+        self._perfil = tempfile.mkdtemp(prefix="gest2a3_lo_")
+
+    def convertir(self, docx_path: str, pdf_path: str) -> None:
+        salida = tempfile.mkdtemp(prefix="pdf_", dir=self._perfil)
+        try:
+            subprocess.run(
+                [
+                    self._ejecutable,
+                    f"-env:UserInstallation={Path(self._perfil, 'perfil').as_uri()}",
+                    "--headless", "--norestore", "--nologo",
+                    "--convert-to", "pdf", "--outdir", salida,
+                    os.path.abspath(docx_path),
+                ],
+                check=True,
+                capture_output=True,
+                timeout=TIMEOUT_LIBREOFFICE_S,
+            )
+            generado = Path(salida) / f"{Path(docx_path).stem}.pdf"
+            if not generado.exists():
+                raise RuntimeError(f"LibreOffice no genero el PDF de {docx_path}")
+            shutil.move(str(generado), os.path.abspath(pdf_path))
+        finally:
+            shutil.rmtree(salida, ignore_errors=True)
+
+    def cerrar(self) -> None:
+        shutil.rmtree(self._perfil, ignore_errors=True)
+
+
+def crear_conversor(motor: str | None = None):
+    motor = (motor or os.environ.get("GEST2A3ECO_CONVERSOR_PDF") or "").strip().lower()
+    if not motor:
+        motor = "word" if sys.platform == "win32" else "libreoffice"
+    if motor == "word":
+        return ConversorWord()
+    if motor == "libreoffice":
+        return ConversorLibreOffice()
+    raise ValueError(f"Conversor PDF desconocido: {motor}")
+
+
+class PoolConversores:
+    """Hilos de trabajo con un conversor persistente cada uno.
+
+    ``enviar(tarea)`` ejecuta ``tarea(conversor)`` en el primer hilo libre y
+    devuelve un ``Future``. El conversor de cada hilo se crea con ``fabrica``
+    al llegar su primer documento.
+    """
+
+    def __init__(self, hilos: int = 1, fabrica: Callable[[], object] = crear_conversor,
+                 inactividad_s: float = INACTIVIDAD_S):
+        self.hilos = max(1, int(hilos))
+        self._fabrica = fabrica
+        self._inactividad_s = inactividad_s
+        self._cola: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._trabajadores: list[threading.Thread] = []
+        self._cerrado = False
+
+    def enviar(self, tarea: Callable[[object], object]) -> Future:
+        futuro: Future = Future()
+        with self._lock:
+            if self._cerrado:
+                raise RuntimeError("El pool de conversion PDF esta cerrado.")
+            if len(self._trabajadores) < self.hilos:
+                hilo = threading.Thread(target=self._trabajar, name="conversor-pdf", daemon=True)
+                self._trabajadores.append(hilo)
+                hilo.start()
+            self._cola.put((futuro, tarea))
+        return futuro
+
+    def convertir(self, docx_path: str, pdf_path: str) -> None:
+        self.enviar(lambda conversor: conversor.convertir(docx_path, pdf_path)).result()
+
+    def _trabajar(self) -> None:
+        conversor = None
+        try:
+            while True:
+                try:
+                    item = self._cola.get(timeout=self._inactividad_s)
+                except queue.Empty:
+                    if conversor is not None:
+                        conversor.cerrar()
+                        conversor = None
+                    continue
+                if item is None:
+                    return
+                futuro, tarea = item
+                if not futuro.set_running_or_notify_cancel():
+                    continue
+                try:
+                    if conversor is None:
+                        conversor = self._fabrica()
+                    futuro.set_result(tarea(conversor))
+                except BaseException as exc:
+                    futuro.set_exception(exc)
+        finally:
+            if conversor is not None:
+                conversor.cerrar()
+
+    def cerrar(self) -> None:
+        with self._lock:
+            if self._cerrado:
+                return
+            self._cerrado = True
+            trabajadores = list(self._trabajadores)
+        for _ in trabajadores:
+            self._cola.put(None)
+        for hilo in trabajadores:
+            hilo.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+
+_pool_compartido: PoolConversores | None = None
+_pool_lock = threading.Lock()
+
+
+def hilos_por_defecto() -> int:
+    return max(1, min(4, os.cpu_count() or 1))
+
+
+def pool_conversores() -> PoolConversores:
+    """Pool de la aplicacion; se cierra al salir del proceso."""
+    global _pool_compartido
+    with _pool_lock:
+        if _pool_compartido is None:
+            _pool_compartido = PoolConversores(hilos=hilos_por_defecto())
+            atexit.register(_pool_compartido.cerrar)
+        return _pool_compartido
+
+
+def _benchmark(argv: list[str]) -> None:
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Mide la conversion .docx -> PDF.")
+    parser.add_argument("docx")
+    parser.add_argument("n", type=int, nargs="?", default=10)
+    parser.add_argument("--hilos", type=int, default=hilos_por_defecto())
+    parser.add_argument("--motor", default=None)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        salidas = [os.path.join(tmp, f"{i}.pdf") for i in range(args.n)]
+        inicio = time.perf_counter()
+        with PoolConversores(args.hilos, lambda: crear_conversor(args.motor)) as pool:
+            futuros = [
+                pool.enviar(lambda c, pdf=pdf: c.convertir(args.docx, pdf)) for pdf in salidas
+            ]
+            for futuro in futuros:
+                futuro.result()
+        total = time.perf_counter() - inicio
+    print(f"{args.n} documentos, {args.hilos} hilos: {total:.2f} s ({total / args.n:.3f} s/doc)")
+
+
+if __name__ == "__main__":
+    _benchmark(sys.argv[1:])
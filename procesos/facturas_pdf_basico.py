@@ -1,6 +1,7 @@
 import os
 import struct
 import sys
+from functools import lru_cache
 from pathlib import Path
 
 from utils.utilidades import aplicar_descuento_total_lineas
@@ -84,12 +85,9 @@ def _resolve_logo_path(path: str, codigo: str | None = None) -> str:
                     return str(candidate)
     return raw
 
-def _logo_jpeg(path: str, codigo: str | None = None):
-    path = _resolve_logo_path(path, codigo)
-    if not path or not os.path.exists(path):
-        return None
-    if not path.lower().endswith((".jpg", ".jpeg")):
-        return None
+@lru_cache(maxsize=16)
+def _leer_logo_jpeg(path: str, mtime_ns: int, size: int):
+    """Datos y dimensiones del JPEG; se cachea mientras el fichero no cambie."""
     try:
         with open(path, "rb") as f:
             data = f.read()
@@ -99,6 +97,13 @@ def _logo_jpeg(path: str, codigo: str | None = None):
                 i += 1
                 continue
             marker = data[i + 1]
+            if marker == 0xFF:
+                i += 1
+                continue
+            if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+                # SOI, TEM y RSTn no llevan longitud de segmento.
+                i += 2
+                continue
             if marker in (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF):
                 if i + 9 >= len(data):
                     break
@@ -114,6 +119,19 @@ def _logo_jpeg(path: str, codigo: str | None = None):
     return None
 
 
+def _logo_jpeg(path: str, codigo: str | None = None):
+    path = _resolve_logo_path(path, codigo)
+    if not path or not os.path.exists(path):
+        return None
+    if not path.lower().endswith((".jpg", ".jpeg")):
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return _leer_logo_jpeg(path, st.st_mtime_ns, st.st_size)
+
+
 def _build_page_stream(empresa_conf: dict, fac: dict, cliente: dict, totales: dict, logo=None) -> bytes:
     """Build the PDF content stream bytes for a single invoice page."""
     def t(x, y, txt, size=11, bold=False):
@@ -296,327 +314,126 @@ def _build_page_stream(empresa_conf: dict, fac: dict, cliente: dict, totales: di
     return "".join(content_parts).encode("latin-1", "ignore")
 
 
-def generar_pdf_multiple(facturas_list: list, out_pdf_path: str) -> None:
-    """
-    Genera un PDF de varias paginas, una por factura.
-    facturas_list: lista de (empresa_conf, fac, cliente, totales)
+class EscritorPdfFacturas:
+    """Escribe un PDF de facturas, una pagina por factura, directamente en disco.
+
+    Cada pagina se vuelca al fichero en cuanto se genera: en memoria solo
+    quedan las posiciones de los objetos (para la tabla xref final) y los
+    numeros de pagina, asi que la memoria no crece con el contenido. Las
+    fuentes se comparten y cada logo se escribe una sola vez por empresa.
     """
-    n = len(facturas_list)
-    if n == 0:
-        return
-    if n == 1:
-        e, f, c, tot = facturas_list[0]
-        generar_pdf_basico(e, f, c, tot, out_pdf_path)
-        return
 
-    # Intentar obtener logo de la primera empresa que lo tenga
-    logo = None
-    for empresa_conf, _f, _c, _t in facturas_list:
-        logo = _logo_jpeg(
+    _CATALOGO = 1
+    _PAGINAS = 2
+
+    def __init__(self, out_pdf_path: str):
+        self._ruta = out_pdf_path
+        self._f = open(out_pdf_path, "wb")
+        # Posicion de cada objeto por numero; 1 y 2 se escriben al cerrar.
+        self._offsets = [0, 0, 0]
+        self._paginas: list[int] = []
+        self._logos: dict[tuple, tuple] = {}
+        self._xobjects: dict[int, int] = {}
+        self._f.write(b"%PDF-1.4\n")
+        f1 = self._escribir("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+        f2 = self._escribir("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold >>")
+        self._fuentes = f"/Font << /F1 {f1} 0 R /F2 {f2} 0 R >>"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.cerrar()
+            return
+        # No se deja un PDF a medias.
+        self._f.close()
+        try:
+            os.unlink(self._ruta)
+        except OSError:
+            pass
+
+    def _escribir(self, cuerpo, num: int | None = None, stream: bytes | None = None) -> int:
+        if num is None:
+            num = len(self._offsets)
+            self._offsets.append(0)
+        self._offsets[num] = self._f.tell()
+        if isinstance(cuerpo, str):
+            cuerpo = cuerpo.encode("latin-1")
+        if stream is None:
+            self._f.write(f"{num} 0 obj ".encode() + cuerpo + b" endobj\n")
+        else:
+            self._f.write(f"{num} 0 obj ".encode() + cuerpo + b" stream\n" + stream + b"endstream\nendobj\n")
+        return num
+
+    def _logo_empresa(self, empresa_conf: dict):
+        """Logo de la empresa y su XObject, resueltos una vez por empresa."""
+        clave = (
             str(empresa_conf.get("logo_path") or "").strip(),
             empresa_conf.get("codigo") or empresa_conf.get("codigo_empresa"),
         )
-        if logo:
-            break
-
-    # Construir streams de contenido para cada pagina
-    streams = []
-    for empresa_conf, fac, cliente, totales in facturas_list:
-        streams.append(_build_page_stream(empresa_conf, fac, cliente, totales, logo=logo))
-
-    # Numeracion de objetos PDF (1-based):
-    #   1          : Catalog
-    #   2          : Pages
-    #   3..2+n     : Page objects (uno por factura)
-    #   3+n..2+2n  : Content streams (uno por factura)
-    #   3+2n       : Font F1
-    #   4+2n       : Font F2
-    #   5+2n       : Logo XObject (solo si hay logo)
-    font_f1_num = 3 + 2 * n
-    font_f2_num = 4 + 2 * n
-    logo_num = 5 + 2 * n if logo else None
-    total_objs = (5 + 2 * n) if logo else (4 + 2 * n)
-
-    # Lista 0-indexed: objs[i] corresponde al objeto PDF numero i+1
-    objs = [None] * total_objs
-
-    # Objeto 1: Catalog
-    objs[0] = f"1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj\n"
-
-    # Objeto 2: Pages
-    kids = " ".join(f"{3 + i} 0 R" for i in range(n))
-    objs[1] = f"2 0 obj << /Type /Pages /Kids [{kids}] /Count {n} >> endobj\n"
-
-    # Objetos 3..2+n: Page objects
-    res_parts = [f"/Font << /F1 {font_f1_num} 0 R /F2 {font_f2_num} 0 R >>"]
-    if logo_num:
-        res_parts.append(f"/XObject << /Im1 {logo_num} 0 R >>")
-    page_res = "/Resources << " + " ".join(res_parts) + " >>"
-    for i in range(n):
-        page_num = 3 + i
-        content_num = 3 + n + i
-        objs[page_num - 1] = (
-            f"{page_num} 0 obj << /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
-            f"/Contents {content_num} 0 R {page_res} >> endobj\n"
-        )
-
-    # Objetos 3+n..2+2n: Content streams
-    for i, stream_bytes in enumerate(streams):
-        stream_num = 3 + n + i
-        header = f"{stream_num} 0 obj << /Length {len(stream_bytes)} >> stream\n".encode()
-        objs[stream_num - 1] = header + stream_bytes + b"endstream\nendobj\n"
-
-    # Fonts
-    objs[font_f1_num - 1] = f"{font_f1_num} 0 obj << /Type /Font /Subtype /Type1 /BaseFont /Helvetica >> endobj\n"
-    objs[font_f2_num - 1] = f"{font_f2_num} 0 obj << /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold >> endobj\n"
-
-    # Logo XObject (opcional)
-    if logo and logo_num:
-        color_space = "/DeviceGray" if logo["components"] == 1 else "/DeviceRGB"
-        objs[logo_num - 1] = (
-            f"{logo_num} 0 obj << /Type /XObject /Subtype /Image "
-            f"/Width {logo['w']} /Height {logo['h']} "
-            f"/ColorSpace {color_space} /BitsPerComponent 8 "
-            f"/Filter /DCTDecode /Length {len(logo['data'])} >> stream\n".encode()
-            + logo["data"]
-            + b"endstream\nendobj\n"
-        )
-
-    with open(out_pdf_path, "wb") as f:
-        f.write(b"%PDF-1.4\n")
-        offsets = []
-        for ob in objs:
-            ob_bytes = ob if isinstance(ob, bytes) else ob.encode("latin-1")
-            offsets.append(f.tell())
-            f.write(ob_bytes)
-        xref_pos = f.tell()
-        f.write(f"xref\n0 {total_objs + 1}\n".encode())
-        f.write(b"0000000000 65535 f \n")
-        for off in offsets:
-            f.write(f"{off:010d} 00000 n \n".encode())
-        f.write(f"trailer << /Size {total_objs + 1} /Root 1 0 R >>\nstartxref\n{xref_pos}\n%%EOF".encode())
+        if clave not in self._logos:
+            logo = _logo_jpeg(*clave)
+            num = None
+            if logo:
+                # Dos empresas con el mismo fichero reciben el mismo dict de
+                # _logo_jpeg (cacheado) y comparten el XObject.
+                contenido = id(logo)
+                num = self._xobjects.get(contenido)
+                if num is None:
+                    color_space = "/DeviceGray" if logo["components"] == 1 else "/DeviceRGB"
+                    num = self._escribir(
+                        f"<< /Type /XObject /Subtype /Image /Width {logo['w']} /Height {logo['h']} "
+                        f"/ColorSpace {color_space} /BitsPerComponent 8 "
+                        f"/Filter /DCTDecode /Length {len(logo['data'])} >>",
+                        stream=logo["data"],
+                    )
+                    self._xobjects[contenido] = num
+            self._logos[clave] = (logo, num)
+        return self._logos[clave]
+
+    def anadir_factura(self, empresa_conf: dict, fac: dict, cliente: dict, totales: dict) -> None:
+        logo, logo_num = self._logo_empresa(empresa_conf or {})
+        stream = _build_page_stream(empresa_conf, fac, cliente, totales, logo=logo)
+        contenido = self._escribir(f"<< /Length {len(stream)} >>", stream=stream)
+        recursos = self._fuentes
+        if logo_num:
+            recursos += f" /XObject << /Im1 {logo_num} 0 R >>"
+        self._paginas.append(self._escribir(
+            f"<< /Type /Page /Parent {self._PAGINAS} 0 R /MediaBox [0 0 595 842] "
+            f"/Contents {contenido} 0 R /Resources << {recursos} >> >>"
+        ))
+
+    def cerrar(self) -> None:
+        if self._f.closed:
+            return
+        kids = " ".join(f"{n} 0 R" for n in self._paginas)
+        self._escribir(f"<< /Type /Pages /Kids [{kids}] /Count {len(self._paginas)} >>", num=self._PAGINAS)
+        self._escribir(f"<< /Type /Catalog /Pages {self._PAGINAS} 0 R >>", num=self._CATALOGO)
+        xref_pos = self._f.tell()
+        total = len(self._offsets)
+        self._f.write(f"xref\n0 {total}\n".encode())
+        self._f.write(b"0000000000 65535 f \n")
+        self._f.write("".join(f"{off:010d} 00000 n \n" for off in self._offsets[1:]).encode())
+        self._f.write(f"trailer << /Size {total} /Root {self._CATALOGO} 0 R >>\nstartxref\n{xref_pos}\n%%EOF".encode())
+        self._f.close()
+
+
+def generar_pdf_multiple(facturas_list, out_pdf_path: str) -> None:
+    """
+    Genera un PDF de varias paginas, una por factura.
+    facturas_list: lista o iterable de (empresa_conf, fac, cliente, totales);
+    con un generador las facturas se leen y escriben de una en una.
+    """
+    facturas = iter(facturas_list)
+    primera = next(facturas, None)
+    if primera is None:
+        return
+    with EscritorPdfFacturas(out_pdf_path) as escritor:
+        escritor.anadir_factura(*primera)
+        for empresa_conf, fac, cliente, totales in facturas:
+            escritor.anadir_factura(empresa_conf, fac, cliente, totales)
 
 
 def generar_pdf_basico(empresa_conf: dict, fac: dict, cliente: dict, totales: dict, out_pdf_path: str) -> None:
-    def t(x, y, txt, size=11, bold=False):
-        font = "F2" if bold else "F1"
-        return f"BT /{font} {size} Tf 1 0 0 1 {x} {y} Tm ({_pdf_escape(txt)}) Tj ET\n"
-
-    moneda_simbolo = str(fac.get("moneda_simbolo") or "").strip()
-
-    def f2s(x, dec=2):
-        base = _fmt_es(x, dec)
-        return f"{base} {moneda_simbolo}".strip() if moneda_simbolo else base
-
-    def _line_desc_text(ln):
-        t = (ln.get("descuento_tipo") or "").strip().lower()
-        try:
-            v = float(ln.get("descuento_valor") or 0)
-        except Exception:
-            v = 0.0
-        if t not in ("pct", "imp") or v <= 0:
-            return ""
-        if t == "pct":
-            return f"{_fmt_es(v, 2)}%"
-        return f2s(v, 2)
-
-    def _calc_descuento_total(lineas):
-        t = (fac.get("descuento_total_tipo") or "").strip().lower()
-        try:
-            v = float(fac.get("descuento_total_valor") or 0)
-        except Exception:
-            v = 0.0
-        if t not in ("pct", "imp") or v <= 0:
-            return 0.0, ""
-        total_base = 0.0
-        for ln in lineas:
-            if str(ln.get("tipo") or "").strip().lower() == "obs":
-                continue
-            total_base += _to_float(ln.get("base"))
-        if total_base <= 0:
-            return 0.0, ""
-        if t == "pct":
-            pct = min(max(v, 0.0), 100.0)
-            return total_base * pct / 100.0, f"Descuento total ({_fmt_es(pct, 2)}%)"
-        return min(abs(v), total_base), "Descuento total"
-
-    y = 800
-    body = []
-    logo = _logo_jpeg(
-        str(empresa_conf.get("logo_path") or "").strip(),
-        empresa_conf.get("codigo") or empresa_conf.get("codigo_empresa"),
-    )
-    logo_cmd = ""
-    if logo:
-        disp_w = 120
-        disp_h = max(40, int(logo["h"] * disp_w / max(logo["w"], 1)))
-        logo_cmd = f"q {disp_w} 0 0 {disp_h} 50 {y - disp_h + 10} cm /Im1 Do Q\n"
-        y -= disp_h + 10
-
-    body.append(t(50, y, "Factura emitida", 16, True))
-    y -= 24
-
-    emitter = empresa_conf or {}
-    body.append(t(50, y, emitter.get("nombre") or "", 12, True))
-    y -= 14
-    body.append(t(50, y, f"CIF: {emitter.get('cif','')}", 10))
-    y -= 12
-    dir_line = ", ".join(filter(None, [emitter.get("direccion"), emitter.get("cp"), emitter.get("poblacion")]))
-    if dir_line:
-        body.append(t(50, y, dir_line, 10))
-        y -= 12
-    prov_line = ", ".join(filter(None, [emitter.get("provincia"), emitter.get("telefono"), emitter.get("email")]))
-    if prov_line:
-        body.append(t(50, y, prov_line, 10))
-        y -= 12
-    info_eje = emitter.get("ejercicio", "")
-    body.append(t(50, y, f"Ejercicio: {info_eje}  Serie: {fac.get('serie','') or '-'}", 10))
-    y -= 18
-
-    box_w, box_h = 260, 70
-    box_x, box_y = 320, y
-    body.append(f"q 1 w {box_x} {box_y - box_h} {box_w} {box_h} re S Q\n")
-    body.append(t(box_x + 8, box_y - 14, "Cliente", 12, True))
-    body.append(t(box_x + 8, box_y - 28, f"{cliente.get('nombre','')}", 10))
-    body.append(t(box_x + 8, box_y - 42, f"NIF: {cliente.get('nif','')}", 10))
-    addr = ", ".join(filter(None, [cliente.get("direccion"), cliente.get("cp"), cliente.get("poblacion")]))
-    if addr:
-        body.append(t(box_x + 8, box_y - 56, addr, 10))
-    contacto = ", ".join(filter(None, [cliente.get("provincia"), cliente.get("telefono"), cliente.get("email")]))
-    if contacto:
-        body.append(t(box_x + 8, box_y - 70, contacto, 10))
-    y = min(y, box_y - box_h - 12)
-
-    y -= 4
-    body.append(t(50, y, f"Factura: {fac.get('numero','')}", 11, True))
-    body.append(t(260, y, f"Fecha: {fac.get('fecha_expedicion') or fac.get('fecha_asiento','')}", 11))
-    obs = fac.get("observaciones") or fac.get("descripcion") or ""
-    if obs:
-        y -= 12
-        body.append(t(50, y, f"Observaciones: {obs}", 10))
-    y -= 16
-
-    headers = [
-        ("Concepto", 50),
-        ("Unid", 260),
-        ("P. unit", 305),
-        ("Dto", 355),
-        ("Base", 400),
-        ("% IVA", 450),
-        ("Cuota IVA", 495),
-        ("% IRPF", 545),
-    ]
-    for txt, x in headers:
-        body.append(t(x, y, txt, 11, True))
-    y -= 12
-
-    lineas_display = list(fac.get("lineas", []))
-    lineas_calc = aplicar_descuento_total_lineas(
-        lineas_display,
-        fac.get("descuento_total_tipo"),
-        fac.get("descuento_total_valor"),
-    )
-    for ln in lineas_display:
-        is_obs = str(ln.get("tipo") or "").strip().lower() == "obs"
-        body.append(t(50, y, str(ln.get("concepto", ""))[:42], 10))
-        body.append(t(260, y, "" if is_obs else _fmt_es(_to_float(ln.get("unidades")), 2), 10))
-        body.append(t(305, y, "" if is_obs else _fmt_es(_to_float(ln.get("precio")), 4), 10))
-        body.append(t(355, y, "" if is_obs else _line_desc_text(ln), 10))
-        body.append(t(400, y, "" if is_obs else f2s(_to_float(ln.get("base")), 2), 10))
-        body.append(t(450, y, "" if is_obs else f"{_fmt_es(_to_float(ln.get('pct_iva')), 2)}%", 10))
-        body.append(t(495, y, "" if is_obs else f2s(_to_float(ln.get("cuota_iva")), 2), 10))
-        body.append(t(545, y, "" if is_obs else f"{_fmt_es(_to_float(ln.get('pct_irpf')), 2)}%", 10))
-        y -= 12
-
-    resumen = {}
-    for ln in lineas_calc:
-        if str(ln.get("tipo") or "").strip().lower() == "obs":
-            continue
-        pct = _round2(_to_float(ln.get("pct_iva")))
-        item = resumen.setdefault(pct, {"base": 0.0, "cuota": 0.0})
-        item["base"] += _to_float(ln.get("base"))
-        item["cuota"] += _to_float(ln.get("cuota_iva"))
-
-    y -= 16
-    if resumen:
-        body.append(t(360, y, "Detalle IVA:", 11, True))
-        y -= 12
-        body.append(t(360, y, "Tipo", 10, True))
-        body.append(t(430, y, "Base", 10, True))
-        body.append(t(500, y, "Cuota", 10, True))
-        y -= 12
-        for pct in sorted(resumen.keys(), reverse=True):
-            item = resumen[pct]
-            body.append(t(360, y, f"{_fmt_es(pct, 2)}%", 10))
-            body.append(t(430, y, f2s(_round2(item["base"]), 2), 10))
-            body.append(t(500, y, f2s(_round2(item["cuota"]), 2), 10))
-            y -= 12
-        y -= 4
-
-    body.append(t(360, y, "Base imponible:", 11, True))
-    body.append(t(500, y, f2s(_round2(totales.get("base")), 2), 11))
-    y -= 14
-    body.append(t(360, y, "IVA:", 11, True))
-    body.append(t(500, y, f2s(_round2(totales.get("iva")), 2), 11))
-    y -= 14
-    if abs(_to_float(totales.get("re"))) > 0.001:
-        body.append(t(360, y, "Recargo Eq.:", 11, True))
-        body.append(t(500, y, f2s(_round2(totales.get("re")), 2), 11))
-        y -= 14
-    if abs(_to_float(totales.get("ret"))) > 0.001:
-        body.append(t(360, y, "IRPF:", 11, True))
-        body.append(t(500, y, f2s(_round2(totales.get("ret")), 2), 11))
-        y -= 16
-    desc_total, desc_label = _calc_descuento_total(lineas_display)
-    if abs(desc_total) > 0.001 and desc_label:
-        body.append(t(360, y, f"{desc_label}:", 11, True))
-        body.append(t(500, y, f2s(_round2(-abs(desc_total)), 2), 11))
-        y -= 16
-    body.append(t(360, y, "Total factura:", 12, True))
-    body.append(t(500, y, f2s(_round2(totales.get("total")), 2), 12, True))
-
-    content_parts = []
-    if logo_cmd:
-        content_parts.append(logo_cmd)
-    content_parts.extend(body)
-    stream = "".join(content_parts).encode("latin-1", "ignore")
-    objs = []
-    objs.append("1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj\n")
-    objs.append("2 0 obj << /Type /Pages /Kids [3 0 R] /Count 1 >> endobj\n")
-    objs.append(None)
-    objs.append(f"4 0 obj << /Length {len(stream)} >> stream\n".encode() + stream + b"endstream\nendobj\n")
-    objs.append("5 0 obj << /Type /Font /Subtype /Type1 /BaseFont /Helvetica >> endobj\n")
-    objs.append("6 0 obj << /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold >> endobj\n")
-
-    xobject_ref = ""
-    if logo:
-        color_space = "/DeviceGray" if logo["components"] == 1 else "/DeviceRGB"
-        objs.append(
-            f"7 0 obj << /Type /XObject /Subtype /Image /Width {logo['w']} /Height {logo['h']} "
-            f"/ColorSpace {color_space} /BitsPerComponent 8 /Filter /DCTDecode /Length {len(logo['data'])} >> stream\n".encode()
-            + logo["data"]
-            + b"endstream\nendobj\n"
-        )
-        xobject_ref = "/XObject << /Im1 7 0 R >>"
-
-    res_parts = ["/Font << /F1 5 0 R /F2 6 0 R >>"]
-    if xobject_ref:
-        res_parts.append(xobject_ref)
-    page_res = "/Resources << " + " ".join(res_parts) + " >>"
-    objs[2] = (
-        "3 0 obj << /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
-        f"/Contents 4 0 R {page_res} >> endobj\n"
-    )
-    with open(out_pdf_path, "wb") as f:
-        f.write(b"%PDF-1.4\n")
-        offsets = []
-        for ob in objs:
-            ob_bytes = ob if isinstance(ob, bytes) else ob.encode("latin-1")
-            offsets.append(f.tell())
-            f.write(ob_bytes)
-        xref_pos = f.tell()
-        f.write(f"xref\n0 {len(objs)+1}\n".encode())
-        f.write(b"0000000000 65535 f \n")
-        for off in offsets:
-            f.write(f"{off:010d} 00000 n \n".encode())
-        f.write(f"trailer << /Size {len(objs)+1} /Root 1 0 R >>\nstartxref\n{xref_pos}\n%%EOF".encode())
+    generar_pdf_multiple([(empresa_conf, fac, cliente, totales)], out_pdf_path)
@@ -16,6 +16,7 @@ from models.facturas_common import (
 )
 from services.terceros_empresa_fiscal_service import split_iva_deducible
 from utils.utilidades import d2
+from utils.validaciones import normalizar_nif_cif
 
 
 def _ajustar_cuenta(raw: Any, ndig: int) -> str:
@@ -82,7 +83,7 @@ def _resolver_cuenta_proveedor(row: Dict[str, Any], conf: Dict[str, Any]) -> str
     return _ajustar_cuenta(base, ndig)
 
 def _norm_nif(nif: Any) -> str:
-    return str(nif or "").strip().upper()
+    return normalizar_nif_cif(nif)
 
 def _datos_tercero(row: Dict[str, Any], terceros_by_nif: Dict[str, Dict[str, Any]] | None):
     nif = _norm_nif(row.get("NIF Cliente Proveedor") or row.get("NIF"))
@@ -1,14 +1,21 @@
 from __future__ import annotations
 
+from concurrent.futures import Future
+from functools import lru_cache, partial
 from pathlib import Path
+import hashlib
+import io
+import json
 import os
 import sys
-from typing import Dict, Any, Tuple
+import threading
+from typing import Dict, Any, Iterable, List, Tuple
 
 from docxtpl import DocxTemplate, InlineImage
 from docx.shared import Mm
 from docx.image.image import Image as DocxImage
 from xml.sax.saxutils import escape as _xml_escape
+from procesos.conversion_pdf import PoolConversores, pool_conversores
 from utils.utilidades import aplicar_descuento_total_lineas
 
 
@@ -259,8 +266,67 @@ DEFAULT_LOGO_MAX_HEIGHT_MM = 12
 MAX_LOGO_EDGE_PX = 2000
 
 
+# Forma parte de la huella de los PDF: subirla cuando cambie como se pinta una
+# factura (render_docx, build_context_emitida) para que se regeneren.
+VERSION_RENDER_PDF = 1
+
+# Contenido y hash de las plantillas ya leidas, por ruta; se relee si cambia la
+# fecha de modificacion o el tamano. Suelen estar en una carpeta compartida.
+_plantillas: Dict[str, Tuple[Tuple[int, int], bytes, str]] = {}
+_plantillas_lock = threading.Lock()
+
+
+def _plantilla_cacheada(template_path: str) -> Tuple[Tuple[int, int], bytes, str]:
+    st = os.stat(template_path)
+    firma = (st.st_mtime_ns, st.st_size)
+    with _plantillas_lock:
+        cacheada = _plantillas.get(template_path)
+        if cacheada is None or cacheada[0] != firma:
+            data = Path(template_path).read_bytes()
+            cacheada = (firma, data, hashlib.sha256(data).hexdigest())
+            _plantillas[template_path] = cacheada
+    return cacheada
+
+
+def _cargar_plantilla(template_path: str) -> DocxTemplate:
+    return DocxTemplate(io.BytesIO(_plantilla_cacheada(template_path)[1]))
+
+
+@lru_cache(maxsize=32)
+def _hash_fichero(path: str, mtime_ns: int, size: int) -> str:
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def huella_pdf(template_path: str, context: Dict[str, Any]) -> str:
+    """Huella de todo lo que determina el PDF: contexto, plantilla y logo.
+
+    Si no cambia, el PDF generado antes sigue siendo valido aunque la factura
+    se haya guardado de nuevo (marcas de envio, suenlace, etc.).
+    """
+    empresa = (context or {}).get("empresa") or {}
+    logo_path = _resolve_logo_path(
+        empresa.get("logo_path") or "", empresa.get("codigo") or empresa.get("codigo_empresa")
+    )
+    logo_hash = ""
+    if logo_path and os.path.exists(logo_path):
+        st = os.stat(logo_path)
+        logo_hash = _hash_fichero(logo_path, st.st_mtime_ns, st.st_size)
+    datos = json.dumps(
+        {
+            "version": VERSION_RENDER_PDF,
+            "contexto": context,
+            "plantilla": _plantilla_cacheada(template_path)[2],
+            "logo": logo_hash,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(datos.encode("utf-8")).hexdigest()
+
+
 def render_docx(template_path: str, context: Dict[str, Any], out_docx_path: str) -> None:
-    doc = DocxTemplate(template_path)
+    doc = _cargar_plantilla(template_path)
     ctx = dict(context or {})
     empresa_ctx = ctx.get("empresa") or {}
     raw_logo_path = empresa_ctx.get("logo_path") or ""
@@ -271,11 +337,16 @@ def render_docx(template_path: str, context: Dict[str, Any], out_docx_path: str)
     logo_inline_error = ""
     if logo_exists:
         try:
-            sanitized_logo_path = _sanitize_logo_path(logo_path)
             empresa = ctx.get("empresa") or {}
-            max_w = empresa.get("logo_max_width_mm") or DEFAULT_LOGO_MAX_WIDTH_MM
-            max_h = empresa.get("logo_max_height_mm") or DEFAULT_LOGO_MAX_HEIGHT_MM
-            ctx["logo"] = _inline_logo(doc, sanitized_logo_path or logo_path, max_w, max_h)
+            max_w = float(empresa.get("logo_max_width_mm") or DEFAULT_LOGO_MAX_WIDTH_MM)
+            max_h = float(empresa.get("logo_max_height_mm") or DEFAULT_LOGO_MAX_HEIGHT_MM)
+            mtime = os.path.getmtime(logo_path)
+            sanitized_logo_path, medidas = _preparar_logo(logo_path, mtime, max_w, max_h)
+            if sanitized_logo_path and not os.path.exists(sanitized_logo_path):
+                # Han borrado la copia saneada de _cache: se vuelve a generar.
+                _preparar_logo.cache_clear()
+                sanitized_logo_path, medidas = _preparar_logo(logo_path, mtime, max_w, max_h)
+            ctx["logo"] = _inline_logo(doc, sanitized_logo_path or logo_path, max_w, max_h, medidas)
             logo_inline_ok = True
         except Exception as exc:
             ctx["logo"] = ""
@@ -383,17 +454,39 @@ def _resolve_logo_path(path: str, codigo: str | None = None) -> str:
     return raw
 
 
-def _inline_logo(doc: DocxTemplate, path: str, max_width_mm: float, max_height_mm: float) -> InlineImage:
+@lru_cache(maxsize=32)
+def _preparar_logo(
+    path: str, mtime: float, max_width_mm: float, max_height_mm: float
+) -> Tuple[str, Tuple[int, int] | None]:
+    """Copia saneada del logo y sus medidas, una vez por logo y fecha de modificacion."""
+    sanitized = _sanitize_logo_path(path)
+    return sanitized, _medidas_logo(sanitized or path, max_width_mm, max_height_mm)
+
+
+def _medidas_logo(path: str, max_width_mm: float, max_height_mm: float) -> Tuple[int, int] | None:
     try:
         image = DocxImage.from_file(path)
         max_w = Mm(float(max_width_mm))
         max_h = Mm(float(max_height_mm))
         scale = min(max_w / image.width, max_h / image.height, 1.0)
-        width = int(image.width * scale)
-        height = int(image.height * scale)
-        return InlineImage(doc, path, width=width, height=height)
+        return int(image.width * scale), int(image.height * scale)
     except Exception:
+        return None
+
+
+def _inline_logo(
+    doc: DocxTemplate,
+    path: str,
+    max_width_mm: float,
+    max_height_mm: float,
+    medidas: Tuple[int, int] | None = None,
+) -> InlineImage:
+    if medidas is None:
+        medidas = _medidas_logo(path, max_width_mm, max_height_mm)
+    if medidas is None:
         return InlineImage(doc, path, width=Mm(float(max_width_mm)))
+    width, height = medidas
+    return InlineImage(doc, path, width=width, height=height)
 
 def _maybe_write_logo_debug(
     out_docx_path: str,
@@ -473,42 +566,11 @@ def _sanitize_logo_path(path: str) -> str:
         return path
 
 def convert_docx_to_pdf(docx_path: str, pdf_path: str) -> None:
-    """Convierte docx a PDF usando Word COM directamente (win32com).
-    Crea una instancia aislada de Word (DispatchEx) con alertas desactivadas
-    y la cierra correctamente al terminar, evitando instancias huerfanas."""
-    import pythoncom
-    import win32com.client as _wc
-
-    abs_docx = os.path.abspath(docx_path)
-    abs_pdf = os.path.abspath(pdf_path)
-    pythoncom.CoInitialize()
-    word = None
-    doc = None
-    try:
-        word = _wc.DispatchEx("Word.Application")
-        word.Visible = False
-        word.DisplayAlerts = 0   # wdAlertsNone
-        word.ScreenUpdating = False
-        doc = word.Documents.Open(abs_docx, ReadOnly=False)
-        try:
-            doc.ExportAsFixedFormat(abs_pdf, ExportFormat=17)  # wdExportFormatPDF
-        except Exception:
-            doc.SaveAs2(abs_pdf, FileFormat=17)               # fallback
-    finally:
-        if doc is not None:
-            try:
-                doc.Close(0)   # wdDoNotSaveChanges
-            except Exception:
-                pass
-        if word is not None:
-            try:
-                word.Quit(0)
-            except Exception:
-                pass
-        try:
-            pythoncom.CoUninitialize()
-        except Exception:
-            pass
+    """Convierte docx a PDF con el conversor compartido de la aplicacion.
+
+    Word (o LibreOffice) sigue abierto entre documentos; ver
+    ``procesos.conversion_pdf``."""
+    pool_conversores().convertir(docx_path, pdf_path)
 
 def generar_pdf_desde_plantilla_word(
     template_path: str,
@@ -539,3 +601,55 @@ def generar_pdf_desde_plantilla_word(
         except Exception:
             pass
     return out_pdf, None
+
+
+def _generar_pdf_con_conversor(
+    template_path: str, context: Dict[str, Any], out_pdf_path: str, conversor
+) -> str:
+    import tempfile
+
+    tmp_fd, tmp_docx = tempfile.mkstemp(suffix=".docx", prefix="gest2a3_")
+    try:
+        os.close(tmp_fd)
+        render_docx(template_path, context, tmp_docx)
+        conversor.convertir(tmp_docx, str(Path(out_pdf_path)))
+    finally:
+        try:
+            Path(tmp_docx).unlink(missing_ok=True)
+        except Exception:
+            pass
+    return str(Path(out_pdf_path))
+
+
+def enviar_pdf_desde_plantilla_word(
+    template_path: str,
+    context: Dict[str, Any],
+    out_pdf_path: str,
+    pool: PoolConversores | None = None,
+) -> Future:
+    """Encarga un PDF al pool sin esperar; el ``Future`` devuelve la ruta."""
+    pool = pool or pool_conversores()
+    return pool.enviar(partial(_generar_pdf_con_conversor, template_path, context, out_pdf_path))
+
+
+def generar_pdfs_desde_plantilla_word(
+    trabajos: Iterable[Tuple[str, Dict[str, Any], str]],
+    pool: PoolConversores | None = None,
+) -> List[Exception | None]:
+    """Genera varios PDF a la vez; ``trabajos`` son (plantilla, contexto, pdf).
+
+    Cada documento se rellena y convierte en un hilo del pool. Devuelve, en
+    el mismo orden, ``None`` o la excepcion de cada documento.
+    """
+    futuros = [
+        enviar_pdf_desde_plantilla_word(plantilla, contexto, pdf, pool)
+        for plantilla, contexto, pdf in trabajos
+    ]
+    errores: List[Exception | None] = []
+    for futuro in futuros:
+        try:
+            futuro.result()
+            errores.append(None)
+        except Exception as exc:
+            errores.append(exc)
+    return errores
@@ -38,9 +38,14 @@ class ResultadoSync:
     notificaciones: list = field(default_factory=list)
     mensaje: str = ""
     error_detalle: str | None = None
+    # Notificaciones vistas en el portal; en una sincronizacion incremental
+    # ``notificaciones`` solo trae las nuevas o cambiadas.
+    detectadas: int | None = None
 
     @property
     def total(self) -> int:
+        if self.detectadas is not None:
+            return self.detectadas
         return len(self.notificaciones)
 
 
@@ -69,6 +74,15 @@ class OpcionesSync:
     datos_ss: dict = field(default_factory=dict)
     # Ruta destino donde el proveedor debe guardar el PDF del certificado.
     ruta_pdf_destino: str | None = None
+    # Sincronizacion incremental (marca de agua del buzon): referencias ya
+    # guardadas -> firma de su ultimo estado, y fecha de puesta a disposicion
+    # mas reciente vista. Las notificaciones anteriores a ``fecha_corte`` ya
+    # no se siguen en las incrementales (las revisa la pasada completa
+    # periodica). incremental=False = sincronizacion completa.
+    incremental: bool = True
+    referencias_conocidas: dict = field(default_factory=dict)
+    desde_fecha: str | None = None
+    fecha_corte: str | None = None
 
     def trace(self, msg: str) -> None:
         if self.log:
@@ -84,7 +98,10 @@ class ConectorOrganismo:
     #: codigo del organismo tal como aparece en notif_organismos.codigo
     codigo_organismo: str = ""
 
-    def sincronizar(self, buzon: dict, cert_material, opciones: OpcionesSync) -> ResultadoSync:
+    def sincronizar(self, buzon: dict, cert_material, opciones: OpcionesSync,
+                    navegador=None) -> ResultadoSync:
+        """``navegador``: navegador ya abierto y reutilizable entre buzones
+        (opcional; cada conector decide si lo aprovecha)."""
         raise NotImplementedError
 
 
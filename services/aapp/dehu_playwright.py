@@ -58,16 +58,36 @@ class ConectorDEHU(ConectorOrganismo):
     def __init__(self, base_url=None):
         self.base_url = (base_url or DEHU_URL_DEFECTO).rstrip("/")
 
-    def sincronizar(self, buzon, cert_material, opciones):
+    def sincronizar(self, buzon, cert_material, opciones, navegador=None):
+        """Sincroniza un buzon.
+
+        Si se recibe ``navegador`` (un Chromium ya lanzado, ver
+        NavegadorCompartido) se abre en el un contexto aislado con el
+        certificado del cliente y el navegador queda abierto para el siguiente
+        buzon. Sin navegador se lanza y cierra uno propio, como siempre.
+        """
+        if navegador is not None:
+            return self._sincronizar_en_navegador(navegador, buzon, cert_material, opciones)
         try:
             from playwright.sync_api import sync_playwright
         except Exception:
+            return _resultado_sin_playwright(self.codigo_organismo)
+        try:
+            with sync_playwright() as p:
+                browser = p.chromium.launch(headless=opciones.headless)
+                try:
+                    return self._sincronizar_en_navegador(browser, buzon, cert_material, opciones)
+                finally:
+                    browser.close()
+        except Exception as exc:
+            import traceback
             return ResultadoSync(
                 ok=False, organismo_codigo=self.codigo_organismo,
-                mensaje="Playwright no esta instalado. Ejecuta: pip install playwright && playwright install chromium",
-                error_detalle="ModuleNotFoundError: playwright",
+                mensaje=f"Error accediendo a DEHu: {exc}",
+                error_detalle=traceback.format_exc(),
             )
 
+    def _sincronizar_en_navegador(self, browser, buzon, cert_material, opciones):
         base = (buzon.get("url_portal") or self.base_url).rstrip("/")
         opciones.trace(f"[DEHU] abriendo {base} con certificado '{cert_material.nombre}'")
 
@@ -81,41 +101,39 @@ class ConectorDEHU(ConectorOrganismo):
         page = None
         capturas = []
         try:
-            with sync_playwright() as p:
-                browser = p.chromium.launch(headless=opciones.headless)
-                try:
-                    context = browser.new_context(
-                        accept_downloads=True,
-                        ignore_https_errors=False,
-                        client_certificates=client_certs,
-                    )
-                except TypeError as exc:
-                    browser.close()
-                    return ResultadoSync(
-                        ok=False, organismo_codigo=self.codigo_organismo,
-                        mensaje=("Tu version de Playwright no soporta 'client_certificates'. "
-                                 "Actualiza:  pip install -U playwright"),
-                        error_detalle=str(exc),
-                    )
-                context.set_default_timeout(opciones.timeout_ms)
+            try:
+                context = browser.new_context(
+                    accept_downloads=True,
+                    ignore_https_errors=False,
+                    client_certificates=client_certs,
+                )
+            except TypeError as exc:
+                return ResultadoSync(
+                    ok=False, organismo_codigo=self.codigo_organismo,
+                    mensaje=("Tu version de Playwright no soporta 'client_certificates'. "
+                             "Actualiza:  pip install -U playwright"),
+                    error_detalle=str(exc),
+                )
+            context.set_default_timeout(opciones.timeout_ms)
+            try:
                 page = context.new_page()
 
                 if opciones.capturar_red:
                     self._instalar_captura_red(page, capturas, opciones)
 
                 try:
-                    notifs = self._flujo(page, base, buzon, cert_material, opciones, capturas)
+                    notifs, detectadas = self._flujo(page, base, buzon, cert_material, opciones, capturas)
                     return ResultadoSync(
                         ok=True, organismo_codigo=self.codigo_organismo,
                         notificaciones=notifs,
-                        mensaje=f"{len(notifs)} notificacion(es) detectada(s).",
+                        detectadas=detectadas,
+                        mensaje=f"{detectadas} notificacion(es) detectada(s).",
                     )
                 except Exception:
                     self._diagnostico(page, opciones, "error", capturas, forzar=True)
                     raise
-                finally:
-                    context.close()
-                    browser.close()
+            finally:
+                context.close()
         except Exception as exc:
             import traceback
             return ResultadoSync(
@@ -147,13 +165,15 @@ class ConectorDEHU(ConectorOrganismo):
         registros = self._fetch_api(page, base, opciones)
         self._diagnostico(page, opciones, "05_listado", capturas, forzar=True)
         if registros:
-            return self._map_registros(registros, cert_material, opciones.nif_filtro)
+            return self._map_registros(registros, cert_material, opciones.nif_filtro,
+                                       conocidas=opciones.referencias_conocidas,
+                                       fecha_corte=opciones.fecha_corte)
         # Respaldo: lo capturado por red o el DOM.
         notifs = self._desde_capturas(capturas, cert_material, opciones.nif_filtro)
         if not notifs:
             self._abrir_notificaciones(page, base, opciones)
             notifs = self._extraer_tabla(page, buzon, cert_material)
-        return notifs
+        return notifs, len(notifs)
 
     # ── API REST ───────────────────────────────────────────────────────
     def _fetch_api(self, page, base, opciones):
@@ -190,11 +210,26 @@ class ConectorDEHU(ConectorOrganismo):
                 opciones.trace(f"[DEHU][api] {endpoint} pagina {page_num}: {len(items)} (total {total})")
                 if page_num * (limit or 100) >= total:
                     break
+                if opciones.incremental and _pagina_ya_vista(
+                    items, opciones.referencias_conocidas, opciones.desde_fecha, opciones.fecha_corte,
+                ):
+                    # El listado llega de lo mas reciente a lo mas antiguo: una
+                    # pagina entera ya sincronizada implica que el resto tambien.
+                    opciones.trace(f"[DEHU][api] {endpoint}: resto ya sincronizado, se corta en pagina {page_num}")
+                    break
                 page_num += 1
         return registros
 
-    def _map_registros(self, registros, cert_material, nif_filtro=None):
+    def _map_registros(self, registros, cert_material, nif_filtro=None, conocidas=None, fecha_corte=None):
+        """Convierte items de la API en NotificacionDTO.
+
+        ``conocidas`` (referencia -> firma de estado) permite omitir las
+        notificaciones ya guardadas cuyo estado no ha cambiado, y
+        ``fecha_corte`` las anteriores a esa fecha. Devuelve las
+        notificaciones y cuantas se han visto en total.
+        """
         objetivo = _norm_nif(nif_filtro) if nif_filtro else None
+        conocidas = conocidas or {}
         notifs = []
         vistos = set()
         for r in registros:
@@ -206,6 +241,9 @@ class ConectorDEHU(ConectorOrganismo):
             if not ref or ref in vistos:
                 continue
             vistos.add(ref)
+            firma = _firma_registro(r)
+            if _ya_sincronizado(r, firma, conocidas, fecha_corte):
+                continue
             realizada = "realized" in (r.get("_endpoint") or "")
             estado = r.get("state") or ("REALIZADA" if realizada else "PENDIENTE")
             notifs.append(NotificacionDTO(
@@ -223,10 +261,11 @@ class ConectorDEHU(ConectorOrganismo):
                     "sentReference": r.get("sentReference"),
                     "endpoint": r.get("_endpoint"),
                     "finalDate": r.get("finalDate"),
+                    "firma_sync": firma,
                     "raw": r,
                 },
             ))
-        return notifs
+        return notifs, len(vistos)
 
     # ── red / captura (respaldo y diagnostico) ─────────────────────────
     def _instalar_captura_red(self, page, capturas, opciones):
@@ -281,7 +320,8 @@ class ConectorDEHU(ConectorOrganismo):
                     if isinstance(it, dict):
                         it.setdefault("_endpoint", cap.get("url", ""))
                 registros.extend(body["items"])
-        return self._map_registros(registros, cert_material, nif_filtro)
+        notifs, _detectadas = self._map_registros(registros, cert_material, nif_filtro)
+        return notifs
 
     # ── clicks tolerantes ──────────────────────────────────────────────
     def _click_acceder(self, page, opciones):
@@ -388,6 +428,62 @@ class ConectorDEHU(ConectorOrganismo):
             opciones.trace(f"[DEHU] no se pudo guardar diagnostico '{etiqueta}': {exc}")
 
 
+class NavegadorCompartido:
+    """Chromium de larga duracion reutilizado entre varios buzones.
+
+    Cada buzon abre su propio contexto (cookies y certificado aislados) sobre
+    el mismo proceso de navegador, evitando lanzar Chromium una vez por
+    cliente. La API sincrona de Playwright esta ligada al hilo que la arranca:
+    una instancia solo debe usarse y cerrarse desde ese hilo.
+    """
+
+    def __init__(self, headless: bool = True):
+        self.headless = headless
+        self._playwright = None
+        self._browser = None
+
+    def obtener(self):
+        """Devuelve el navegador (lo lanza o relanza si hace falta) o None si
+        Playwright no esta disponible."""
+        if self._browser is not None:
+            try:
+                if self._browser.is_connected():
+                    return self._browser
+            except Exception:
+                pass
+            self.cerrar()
+        try:
+            from playwright.sync_api import sync_playwright
+        except Exception:
+            return None
+        try:
+            self._playwright = sync_playwright().start()
+            self._browser = self._playwright.chromium.launch(headless=self.headless)
+        except Exception:
+            self.cerrar()
+            return None
+        return self._browser
+
+    def cerrar(self) -> None:
+        for recurso, metodo in ((self._browser, "close"), (self._playwright, "stop")):
+            if recurso is None:
+                continue
+            try:
+                getattr(recurso, metodo)()
+            except Exception:
+                pass
+        self._browser = None
+        self._playwright = None
+
+
+def _resultado_sin_playwright(codigo_organismo):
+    return ResultadoSync(
+        ok=False, organismo_codigo=codigo_organismo,
+        mensaje="Playwright no esta instalado. Ejecuta: pip install playwright && playwright install chromium",
+        error_detalle="ModuleNotFoundError: playwright",
+    )
+
+
 # ── helpers ────────────────────────────────────────────────────────────────
 _FECHA_RE = re.compile(r"\b(\d{2})[/-](\d{2})[/-](\d{4})\b")
 _ISO_RE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})")
@@ -419,6 +515,40 @@ def _norm_nif(v):
     return re.sub(r"[^0-9A-Z]", "", str(v or "").upper())
 
 
+def _firma_registro(r):
+    """Resume el estado de un item de la API (listado + estado) para detectar
+    cambios sin volver a procesar la notificacion completa."""
+    realizada = "realized" in (r.get("_endpoint") or "")
+    return f"{'R' if realizada else 'P'}:{_map_estado(r.get('state'))}"
+
+
+def _ya_sincronizado(r, firma, conocidas, fecha_corte=None):
+    """True si el item esta guardado sin cambios o es anterior a la fecha de
+    corte de la marca de agua."""
+    ref = r.get("identifier") or r.get("sentReference")
+    if ref and conocidas.get(str(ref)) == firma:
+        return True
+    fecha = _norm_fecha(r.get("availabilityDate"))
+    return bool(fecha_corte and fecha and fecha < fecha_corte)
+
+
+def _pagina_ya_vista(items, conocidas, desde_fecha=None, fecha_corte=None):
+    """True si todos los items de la pagina estan ya sincronizados y no son
+    posteriores a la marca de agua de fecha."""
+    if not conocidas:
+        return False
+    for r in items:
+        if not isinstance(r, dict):
+            continue
+        ref = r.get("identifier") or r.get("sentReference")
+        if not ref or not _ya_sincronizado(r, _firma_registro(r), conocidas, fecha_corte):
+            return False
+        fecha = _norm_fecha(r.get("availabilityDate"))
+        if desde_fecha and fecha and fecha > desde_fecha:
+            return False
+    return True
+
+
 def _map_estado(s):
     s = (s or "").upper()
     if "ACEPTAD" in s:
@@ -6,7 +6,14 @@ Sustituye la "sincronizacion simulada" de la UI por el flujo real:
   2. Ejecuta exclusivamente el conector DEHu.
   3. Ejecuta el conector -> lista de NotificacionDTO.
   4. Persiste en notif_bandeja (idempotente, sin duplicar) y registra el
-     resultado en notif_sync_logs. Actualiza ultima_consulta del buzon.
+     resultado y la duracion en notif_sync_logs. Actualiza ultima_consulta
+     del buzon y su marca de agua (referencias ya guardadas), de modo que la
+     siguiente sincronizacion solo procese notificaciones nuevas o cambiadas.
+     Cada DIAS_SYNC_COMPLETA dias se hace una pasada completa, que recoge los
+     cambios de estado de notificaciones antiguas y rehace la marca.
+
+sincronizar_buzones() reparte los buzones entre varios hilos, cada uno con un
+Chromium reutilizado, y entrega cada resultado en cuanto termina.
 
 La UI solo tiene que llamar a sincronizar_buzon() / sincronizar_buzones().
 """
@@ -14,15 +21,27 @@ from __future__ import annotations
 
 import hashlib
 import json
+import queue
+import threading
+import time
 import traceback
-from dataclasses import dataclass, field
-from datetime import datetime
+from dataclasses import dataclass, field, replace
+from datetime import date, datetime, timedelta
+from typing import Callable
 
 from .base import OpcionesSync, obtener_conector
 from .cert_store import CertStore, CertError
 
 # Importar conectores para que se registren (efecto de import).
 from . import dehu_playwright  # noqa: F401  (registra ConectorDEHU)
+from .dehu_playwright import NavegadorCompartido
+
+# Buzones sincronizados a la vez por defecto (un Chromium por hilo).
+MAX_CONCURRENTES_DEFECTO = 4
+# Dias entre pasadas completas de un buzon con sincronizacion incremental.
+DIAS_SYNC_COMPLETA = 7
+# Dias antes de la marca de fecha que se siguen guardando en la marca de agua.
+DIAS_RETENCION_MARCA = 90
 
 
 def _now() -> str:
@@ -38,6 +57,7 @@ class ResultadoBuzon:
     total_detectadas: int = 0
     mensaje: str = ""
     error_detalle: str | None = None
+    duracion_ms: int = 0
 
 
 @dataclass
@@ -59,9 +79,227 @@ def _bandeja_id(codigo_empresa: str, organismo_codigo: str, referencia: str) ->
 
 
 def sincronizar_buzon(gestor, buzon: dict, opciones: OpcionesSync | None = None,
-                      ejercicio: int | None = None) -> ResultadoBuzon:
+                      ejercicio: int | None = None, navegador=None) -> ResultadoBuzon:
     """Sincroniza un unico buzon y persiste resultados. No lanza excepciones."""
     opciones = opciones or OpcionesSync()
+    inicio = time.perf_counter()
+    res = None
+    error = None
+    completa = False
+    try:
+        material, opciones_buzon = _preparar_buzon(gestor, buzon, opciones)
+        completa = not opciones_buzon.incremental
+        res = obtener_conector("DEHU").sincronizar(buzon, material, opciones_buzon, navegador=navegador)
+    except Exception as exc:
+        error = (str(exc), traceback.format_exc())
+    return _registrar_resultado(gestor, buzon, ejercicio, res, error, _ms_desde(inicio), completa)
+
+
+def sincronizar_buzones(gestor, buzones: list, opciones: OpcionesSync | None = None,
+                        ejercicio: int | None = None, solo_activos: bool = True,
+                        max_concurrentes: int = MAX_CONCURRENTES_DEFECTO,
+                        on_resultado: Callable[[ResultadoBuzon], None] | None = None) -> ResultadoGlobal:
+    """Sincroniza varios buzones en paralelo.
+
+    Se arrancan hasta ``max_concurrentes`` hilos de trabajo; cada uno mantiene
+    un Chromium abierto (NavegadorCompartido) y abre un contexto aislado por
+    buzon con el certificado de su cliente. Los hilos solo hablan con DEHu: la
+    resolucion de certificados y toda la persistencia se hacen en el hilo que
+    llama, de modo que el gestor (una unica conexion) no se comparte.
+
+    ``on_resultado`` se invoca con cada ResultadoBuzon en cuanto termina, para
+    que la UI muestre el progreso sin esperar al ultimo buzon.
+    """
+    opciones = opciones or OpcionesSync()
+    glob = ResultadoGlobal()
+
+    def _emitir(resultado: ResultadoBuzon) -> None:
+        glob.resultados.append(resultado)
+        if on_resultado:
+            try:
+                on_resultado(resultado)
+            except Exception:
+                pass
+
+    tareas: queue.Queue = queue.Queue()
+    pendientes = 0
+    for b in buzones:
+        if solo_activos and not int(b.get("activo", 1)):
+            continue
+        try:
+            material, opciones_buzon = _preparar_buzon(gestor, b, opciones)
+        except Exception as exc:
+            _emitir(_registrar_resultado(
+                gestor, b, ejercicio, None, (str(exc), traceback.format_exc()), 0,
+            ))
+            continue
+        tareas.put((b, material, opciones_buzon))
+        pendientes += 1
+
+    if not pendientes:
+        return glob
+
+    resultados: queue.Queue = queue.Queue()
+    n_hilos = max(1, min(int(max_concurrentes or 1), pendientes))
+    for _ in range(n_hilos):
+        tareas.put(None)
+    hilos = [
+        threading.Thread(
+            target=_trabajador_sync,
+            args=(tareas, resultados, opciones.headless),
+            name=f"dehu-sync-{i + 1}",
+            daemon=True,
+        )
+        for i in range(n_hilos)
+    ]
+    for hilo in hilos:
+        hilo.start()
+    for _ in range(pendientes):
+        buzon, res, error, duracion_ms, completa = resultados.get()
+        _emitir(_registrar_resultado(gestor, buzon, ejercicio, res, error, duracion_ms, completa))
+    for hilo in hilos:
+        hilo.join()
+    return glob
+
+
+def _trabajador_sync(tareas: queue.Queue, resultados: queue.Queue, headless: bool) -> None:
+    """Bucle de un hilo de sincronizacion: un navegador, muchos buzones."""
+    conector = obtener_conector("DEHU")
+    navegador = NavegadorCompartido(headless=headless)
+    try:
+        while True:
+            tarea = tareas.get()
+            if tarea is None:
+                return
+            buzon, material, opciones_buzon = tarea
+            inicio = time.perf_counter()
+            res = None
+            error = None
+            try:
+                res = conector.sincronizar(
+                    buzon, material, opciones_buzon, navegador=navegador.obtener(),
+                )
+            except Exception as exc:
+                error = (str(exc), traceback.format_exc())
+            resultados.put((buzon, res, error, _ms_desde(inicio), not opciones_buzon.incremental))
+    finally:
+        navegador.cerrar()
+
+
+def _preparar_buzon(gestor, buzon: dict, opciones: OpcionesSync):
+    """Resuelve certificado y opciones propias del buzon. Lanza CertError."""
+    org_codigo = (buzon.get("organismo_codigo") or "").upper()
+
+    # 1) Certificado (unico del cliente)
+    material = CertStore(gestor).material_para_buzon(buzon)
+
+    # 2) DEHu es el unico buzon soportado. No se redirigen silenciosamente
+    # otros portales al conector DEHu.
+    if org_codigo != "DEHU":
+        raise CertError(
+            f"El buzon '{org_codigo or '(sin codigo)'} ya no esta soportado. "
+            "Configura el cliente con el buzon unico DEHu."
+        )
+    if obtener_conector("DEHU") is None:
+        raise CertError(
+            f"No hay conector disponible para el organismo '{org_codigo or '(desconocido)'}'."
+        )
+
+    # Filtrar al NIF/CIF del cliente: evita mezclar y duplicar cuando el
+    # certificado ve notificaciones de varios titulares (p.ej. RED de la SS).
+    # Copia por buzon: las opciones se comparten entre hilos.
+    try:
+        _emp = gestor.get_empresa(buzon.get("codigo_empresa"))
+        nif_filtro = (_emp or {}).get("cif") or None
+    except Exception:
+        nif_filtro = None
+    if opciones.incremental and not _toca_sync_completa(buzon):
+        desde_fecha, conocidas, _fechas = _marca_sync(buzon)
+        return material, replace(
+            opciones, nif_filtro=nif_filtro, referencias_conocidas=conocidas,
+            desde_fecha=desde_fecha, fecha_corte=_fecha_corte(desde_fecha),
+        )
+    return material, replace(
+        opciones, nif_filtro=nif_filtro, incremental=False,
+        referencias_conocidas={}, desde_fecha=None, fecha_corte=None,
+    )
+
+
+def _toca_sync_completa(buzon: dict) -> bool:
+    """True si el buzon nunca ha hecho una pasada completa o hace mas de
+    DIAS_SYNC_COMPLETA dias de la ultima."""
+    try:
+        ultima = datetime.fromisoformat(str(buzon.get("hwm_sync_completa") or ""))
+    except ValueError:
+        return True
+    return datetime.now() - ultima >= timedelta(days=DIAS_SYNC_COMPLETA)
+
+
+def _fecha_corte(desde_fecha: str | None) -> str | None:
+    try:
+        return (date.fromisoformat(str(desde_fecha)[:10]) - timedelta(days=DIAS_RETENCION_MARCA)).isoformat()
+    except ValueError:
+        return None
+
+
+def _marca_sync(buzon: dict) -> tuple[str | None, dict, dict]:
+    """Lee la marca de agua guardada en el buzon: fecha, referencia -> firma y
+    referencia -> fecha de puesta a disposicion."""
+    try:
+        guardadas = json.loads(buzon.get("hwm_referencias_json") or "{}")
+    except (TypeError, ValueError):
+        guardadas = {}
+    if not isinstance(guardadas, dict):
+        guardadas = {}
+    conocidas, fechas = {}, {}
+    for ref, valor in guardadas.items():
+        # Formato anterior: solo la firma, sin fecha.
+        firma, fecha = (valor[0], valor[1]) if isinstance(valor, list) and len(valor) == 2 else (valor, None)
+        conocidas[ref] = firma
+        fechas[ref] = fecha
+    return buzon.get("hwm_fecha_disposicion") or None, conocidas, fechas
+
+
+def _actualizar_marca_sync(gestor, buzon: dict, notificaciones: list, completa: bool = False) -> None:
+    """Amplia la marca de agua con lo recien guardado (solo items de la API).
+
+    Una pasada completa la rehace desde cero. En ambos casos se descartan las
+    referencias anteriores a la fecha de corte.
+    """
+    if completa:
+        desde_fecha, conocidas, fechas = None, {}, {}
+    else:
+        desde_fecha, conocidas, fechas = _marca_sync(buzon)
+    cambios = False
+    for dto in notificaciones:
+        firma = (dto.metadatos or {}).get("firma_sync")
+        if not firma:
+            continue
+        ref = str(dto.referencia)
+        conocidas[ref] = firma
+        fechas[ref] = dto.fecha_puesta_disposicion
+        cambios = True
+        fecha = dto.fecha_puesta_disposicion
+        if fecha and (not desde_fecha or fecha > desde_fecha):
+            desde_fecha = fecha
+    if not cambios:
+        return
+    corte = _fecha_corte(desde_fecha)
+    referencias = {
+        ref: [firma, fechas.get(ref)]
+        for ref, firma in conocidas.items()
+        if not (corte and fechas.get(ref) and fechas[ref] < corte)
+    }
+    gestor.actualizar_marca_sync_notif_buzon(
+        buzon.get("codigo_empresa"), buzon.get("id"), desde_fecha, referencias,
+        _now() if completa else None,
+    )
+
+
+def _registrar_resultado(gestor, buzon: dict, ejercicio: int | None, res,
+                         error: tuple[str, str] | None, duracion_ms: int,
+                         completa: bool = False) -> ResultadoBuzon:
+    """Persiste en bandeja el resultado del conector y registra el log."""
     ejercicio = ejercicio or datetime.now().year
     nombre = buzon.get("nombre", buzon.get("id", "?"))
     org_codigo = (buzon.get("organismo_codigo") or "").upper()
@@ -76,63 +314,39 @@ def sincronizar_buzon(gestor, buzon: dict, opciones: OpcionesSync | None = None,
     ok = True
 
     try:
-        # 1) Certificado (unico del cliente)
-        material = CertStore(gestor).material_para_buzon(buzon)
-
-        # 2) DEHu es el unico buzon soportado. No se redirigen silenciosamente
-        # otros portales al conector DEHu.
-        if org_codigo != "DEHU":
-            raise CertError(
-                f"El buzon '{org_codigo or '(sin codigo)'} ya no esta soportado. "
-                "Configura el cliente con el buzon unico DEHu."
-            )
-        conector = obtener_conector("DEHU")
-        if conector is None:
-            raise CertError(
-                f"No hay conector disponible para el organismo '{org_codigo or '(desconocido)'}'."
-            )
-
-        # Filtrar al NIF/CIF del cliente: evita mezclar y duplicar cuando el
-        # certificado ve notificaciones de varios titulares (p.ej. RED de la SS).
-        try:
-            _emp = gestor.get_empresa(codigo_empresa)
-            opciones.nif_filtro = (_emp or {}).get("cif") or None
-        except Exception:
-            opciones.nif_filtro = None
-
-        # 3) Ejecutar
-        res = conector.sincronizar(buzon, material, opciones)
-        total = res.total
-        if not res.ok:
+        if error is not None:
+            ok = False
+            log_resultado = "ERROR"
+            mensaje, error_detalle = error
+        elif not res.ok:
+            total = res.total
             ok = False
             log_resultado = "ERROR"
             mensaje = res.mensaje
             error_detalle = res.error_detalle
         else:
-            # 4) Persistir en bandeja (idempotente)
-            for dto in res.notificaciones:
-                item_id = _bandeja_id(codigo_empresa, org_codigo, dto.dedup_key())
-                existe = _existe_bandeja(gestor, codigo_empresa, item_id)
-                gestor.upsert_notif_bandeja_item({
-                    "id": item_id,
-                    "codigo_empresa": codigo_empresa,
-                    "ejercicio": ejercicio,
-                    "buzon_id": buzon.get("id"),
-                    "organismo_id": org_id,
-                    "asunto": dto.asunto,
-                    "descripcion": dto.descripcion,
-                    "tipo_acto": dto.tipo_acto,
-                    "referencia": dto.referencia,
-                    "nif_interesado": dto.nif_interesado,
-                    "nombre_interesado": dto.nombre_interesado,
-                    "fecha_puesta_disposicion": dto.fecha_puesta_disposicion,
-                    "fecha_vencimiento": dto.fecha_vencimiento,
-                    "estado": dto.estado,
-                    "pdf_path": dto.pdf_path,
-                    "metadatos_json": json.dumps(dto.metadatos, ensure_ascii=False),
-                })
-                if not existe:
-                    nuevas += 1
+            total = res.total
+            # 4) Persistir en bandeja (idempotente, una sola sentencia)
+            items = [{
+                "id": _bandeja_id(codigo_empresa, org_codigo, dto.dedup_key()),
+                "codigo_empresa": codigo_empresa,
+                "ejercicio": ejercicio,
+                "buzon_id": buzon.get("id"),
+                "organismo_id": org_id,
+                "asunto": dto.asunto,
+                "descripcion": dto.descripcion,
+                "tipo_acto": dto.tipo_acto,
+                "referencia": dto.referencia,
+                "nif_interesado": dto.nif_interesado,
+                "nombre_interesado": dto.nombre_interesado,
+                "fecha_puesta_disposicion": dto.fecha_puesta_disposicion,
+                "fecha_vencimiento": dto.fecha_vencimiento,
+                "estado": dto.estado,
+                "pdf_path": dto.pdf_path,
+                "metadatos_json": json.dumps(dto.metadatos, ensure_ascii=False),
+            } for dto in res.notificaciones]
+            nuevas = len(gestor.upsert_notif_bandeja_items(items))
+            _actualizar_marca_sync(gestor, buzon, res.notificaciones, completa)
             mensaje = f"{total} detectada(s), {nuevas} nueva(s)."
     except Exception as exc:
         ok = False
@@ -151,6 +365,8 @@ def sincronizar_buzon(gestor, buzon: dict, opciones: OpcionesSync | None = None,
             "resultado": log_resultado,
             "error_detalle": (error_detalle or "")[:4000] if error_detalle else None,
             "notificaciones_detectadas": total,
+            "notificaciones_nuevas": nuevas,
+            "duracion_ms": duracion_ms,
         })
         buzon_upd = dict(buzon)
         buzon_upd["ultima_consulta"] = ahora
@@ -166,25 +382,9 @@ def sincronizar_buzon(gestor, buzon: dict, opciones: OpcionesSync | None = None,
         total_detectadas=total,
         mensaje=mensaje,
         error_detalle=error_detalle,
+        duracion_ms=duracion_ms,
     )
 
 
-def sincronizar_buzones(gestor, buzones: list, opciones: OpcionesSync | None = None,
-                        ejercicio: int | None = None, solo_activos: bool = True) -> ResultadoGlobal:
-    glob = ResultadoGlobal()
-    for b in buzones:
-        if solo_activos and not int(b.get("activo", 1)):
-            continue
-        glob.resultados.append(sincronizar_buzon(gestor, b, opciones, ejercicio))
-    return glob
-
-
-def _existe_bandeja(gestor, codigo_empresa: str, item_id: str) -> bool:
-    try:
-        cur = gestor.conn.execute(
-            "SELECT 1 FROM notif_bandeja WHERE id=? AND codigo_empresa=?",
-            (item_id, codigo_empresa),
-        )
-        return cur.fetchone() is not None
-    except Exception:
-        return False
+def _ms_desde(inicio: float) -> int:
+    return int((time.perf_counter() - inicio) * 1000)
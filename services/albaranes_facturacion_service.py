@@ -0,0 +1,202 @@
+"""Facturacion en bloque de albaranes emitidos.
+
+``FacturadorAlbaranes`` agrupa los albaranes seleccionados por cliente en una
+sola pasada, prepara una factura por cliente y la graba junto con la marca de
+facturado de sus albaranes en una unica transaccion.
+
+Un grupo de un solo albaran hereda su serie y numero (el albaran ya consumio
+el contador); los grupos de varios albaranes toman los numeros reservados de
+la serie de facturas, que se piden de una vez para todo el lote.
+"""
+from __future__ import annotations
+
+import uuid
+from datetime import datetime
+from typing import Callable, Iterable
+
+from utils.ui_facturas_emitidas_helpers import to_float
+from utils.validaciones import normalizar_nif_cif
+
+
+def formatear_fecha_descripcion(fecha_txt: str) -> str:
+    value = str(fecha_txt or "").strip()
+    if not value:
+        return ""
+    for fmt_in in ("%d/%m/%Y", "%Y-%m-%d", "%Y/%m/%d", "%d-%m-%Y"):
+        try:
+            return datetime.strptime(value, fmt_in).strftime("%d/%m/%Y")
+        except Exception:
+            continue
+    return value
+
+
+def clave_cliente(albaran: dict) -> str:
+    """NIF normalizado del albaran; sin NIF, su tercero o su nombre."""
+    nif = normalizar_nif_cif(albaran.get("nif") or "")
+    if nif:
+        return f"nif:{nif}"
+    tercero = str(albaran.get("tercero_id") or "").strip()
+    if tercero:
+        return f"tercero:{tercero}"
+    return f"nombre:{str(albaran.get('nombre') or '').strip().upper()}"
+
+
+def agrupar_por_cliente(albaranes: Iterable[dict]) -> list[list[dict]]:
+    """Albaranes pendientes agrupados por cliente, en el orden de llegada."""
+    grupos: dict[str, list[dict]] = {}
+    for alb in albaranes:
+        if not alb or alb.get("facturado"):
+            continue
+        grupos.setdefault(clave_cliente(alb), []).append(alb)
+    return list(grupos.values())
+
+
+def descripcion_factura(albaranes: list[dict]) -> str:
+    albaranes = [a for a in (albaranes or []) if a]
+    if not albaranes:
+        return "Factura correspondiente al albaran."
+    if len(albaranes) == 1:
+        alb = albaranes[0]
+        numero = str(alb.get("numero") or "").strip()
+        fecha = formatear_fecha_descripcion(alb.get("fecha_asiento") or alb.get("fecha_expedicion"))
+        return f"Factura correspondiente al albaran {numero} de fecha {fecha}."
+    refs = []
+    for alb in albaranes:
+        numero = str(alb.get("numero") or "").strip()
+        fecha = formatear_fecha_descripcion(alb.get("fecha_asiento") or alb.get("fecha_expedicion"))
+        refs.append(f"{numero} de fecha {fecha}".strip())
+    return f"Factura correspondiente a los albaranes: {'; '.join(refs)}."
+
+
+def lineas_factura(albaranes: list[dict], descripcion: str | None = None) -> list[dict]:
+    """Una linea por combinacion de tipos de IVA, recargo e IRPF."""
+    if descripcion is None:
+        descripcion = descripcion_factura(albaranes)
+    grouped = {}
+    for alb in albaranes or []:
+        for ln in alb.get("lineas", []) or []:
+            if str(ln.get("tipo") or "").strip().lower() == "obs":
+                continue
+            pct_iva = round(to_float(ln.get("pct_iva")), 4)
+            pct_re = round(to_float(ln.get("pct_re")), 4)
+            pct_irpf = round(to_float(ln.get("pct_irpf")), 4)
+            item = grouped.setdefault(
+                (pct_iva, pct_re, pct_irpf),
+                {
+                    "concepto": descripcion,
+                    "tipo": "",
+                    "unidades": 1.0,
+                    "precio": 0.0,
+                    "base": 0.0,
+                    "pct_iva": pct_iva,
+                    "cuota_iva": 0.0,
+                    "pct_re": pct_re,
+                    "cuota_re": 0.0,
+                    "pct_irpf": pct_irpf,
+                    "cuota_irpf": 0.0,
+                },
+            )
+            item["base"] += to_float(ln.get("base"))
+            item["cuota_iva"] += to_float(ln.get("cuota_iva"))
+            item["cuota_re"] += to_float(ln.get("cuota_re"))
+            item["cuota_irpf"] += to_float(ln.get("cuota_irpf"))
+    out = []
+    for item in grouped.values():
+        for campo in ("base", "cuota_iva", "cuota_re", "cuota_irpf"):
+            item[campo] = round(item[campo], 2)
+        item["precio"] = item["base"]
+        out.append(item)
+    return out
+
+
+class FacturadorAlbaranes:
+    """Convierte albaranes en facturas por cliente contra un gestor."""
+
+    def __init__(self, gestor):
+        self.gestor = gestor
+
+    def cargar(self, codigo_empresa: str, ids: list, ejercicio: int | None = None) -> list[dict]:
+        """Albaranes seleccionados con una consulta, en el orden de ``ids``."""
+        por_id = {
+            str(a.get("id")): a
+            for a in self.gestor.listar_albaranes_emitidas_por_ids(codigo_empresa, ids, ejercicio)
+        }
+        return [por_id[str(i)] for i in ids if str(i) in por_id]
+
+    def preparar(
+        self,
+        codigo_empresa: str,
+        grupos: list[list[dict]],
+        fecha: str,
+        ejercicio: int,
+        serie: str = "",
+        numeros: Iterable[str] = (),
+        moneda: tuple[str, str] = ("", ""),
+        plantilla_por_defecto: Callable[[int], str] | None = None,
+    ) -> list[tuple[dict, list[str]]]:
+        """Factura de cada grupo con los ids de sus albaranes.
+
+        ``numeros`` debe traer un numero por cada grupo de varios albaranes.
+        Cada factura lleva su propio id: sin el, el gestor usaria la marca de
+        tiempo en milisegundos y dos facturas del mismo lote podrian pisarse.
+        """
+        numeros = iter(numeros)
+        out = []
+        for albaranes in grupos:
+            base = albaranes[0]
+            if len(albaranes) == 1:
+                numero_fac = str(base.get("numero") or "").strip()
+                serie_fac = str(base.get("serie") or "").strip()
+                eje_fac = base.get("ejercicio") or ejercicio
+            else:
+                try:
+                    numero_fac = next(numeros)
+                except StopIteration:
+                    raise ValueError("Faltan numeros reservados para las facturas agrupadas.") from None
+                serie_fac = serie
+                eje_fac = ejercicio
+            moneda_codigo = base.get("moneda_codigo", "") or moneda[0]
+            moneda_simbolo = base.get("moneda_simbolo", "") if base.get("moneda_codigo") else moneda[1]
+            descripcion = descripcion_factura(albaranes)
+            plantilla = base.get("plantilla_emitidas") or (plantilla_por_defecto(eje_fac) if plantilla_por_defecto else "")
+            factura = {
+                "id": str(uuid.uuid4()),
+                "codigo_empresa": codigo_empresa,
+                "ejercicio": eje_fac,
+                "tercero_id": base.get("tercero_id"),
+                "serie": serie_fac,
+                "numero": numero_fac,
+                "numero_largo_sii": "",
+                "fecha_asiento": fecha,
+                "fecha_expedicion": fecha,
+                "fecha_operacion": fecha,
+                "tipo_operacion": base.get("tipo_operacion") or "01",
+                "modelo_fiscal": base.get("modelo_fiscal") or "",
+                "nif": normalizar_nif_cif(base.get("nif", "")),
+                "nombre": base.get("nombre", ""),
+                "descripcion": descripcion,
+                "subcuenta_cliente": base.get("subcuenta_cliente", ""),
+                "forma_pago": base.get("forma_pago", ""),
+                "cuenta_bancaria": base.get("cuenta_bancaria", ""),
+                "moneda_codigo": moneda_codigo,
+                "moneda_simbolo": moneda_simbolo,
+                "plantilla_word": base.get("plantilla_word") or "",
+                "plantilla_emitidas": plantilla,
+                "retencion_aplica": bool(base.get("retencion_aplica")),
+                "retencion_pct": base.get("retencion_pct"),
+                "retencion_base": base.get("retencion_base"),
+                "retencion_importe": base.get("retencion_importe"),
+                "lineas": lineas_factura(albaranes, descripcion),
+                "generada": False,
+                "fecha_generacion": "",
+            }
+            out.append((factura, [a.get("id") for a in albaranes]))
+        return out
+
+    def facturar(self, codigo_empresa: str, ejercicio: int, facturas: list[tuple[dict, list[str]]],
+                 fecha_facturacion: str | None = None) -> list[str]:
+        """Graba las facturas y marca los albaranes; devuelve los ids creados."""
+        if not facturas:
+            return []
+        fecha_facturacion = fecha_facturacion or datetime.now().strftime("%Y-%m-%d %H:%M")
+        return self.gestor.facturar_albaranes_en_bloque(codigo_empresa, ejercicio, facturas, fecha_facturacion)
@@ -0,0 +1,136 @@
+"""Almacen por contenido del repositorio documental compartido.
+
+Cada fichero se guarda una sola vez bajo ``_contenido/<ab>/<sha256>`` y las
+rutas legibles de empresa/ejercicio/categoria son enlaces duros a ese objeto.
+Asi el mismo PDF recibido por correo, mensajeria y OCR ocupa una sola copia
+en el NAS. El recuento de referencias vive en ``documentos_contenido``.
+
+Los documentos archivados se tratan como inmutables: modificar en sitio una
+ruta enlazada cambiaria todas sus copias logicas.
+
+Quien escribe un objeto toma antes una referencia provisional
+(``referencia_provisional``) y quien libera la ultima borra el objeto dentro
+de la misma transaccion que la fila. Asi una escritura y un borrado
+concurrentes del mismo hash nunca dejan la BD apuntando a un objeto borrado.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from utils.utilidades import get_document_repository_dir
+
+logger = logging.getLogger(__name__)
+
+CARPETA_CONTENIDO = "_contenido"
+_TAMANO_BLOQUE = 1024 * 1024
+
+
+def sha256_archivo(path: str | Path) -> str:
+    h = hashlib.sha256()
+    with open(str(path), "rb") as f:
+        for chunk in iter(lambda: f.read(_TAMANO_BLOQUE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class AlmacenDocumental:
+    """Objetos inmutables por SHA-256 con escrituras atomicas."""
+
+    def __init__(self, raiz: str | Path | None = None):
+        self._raiz = Path(raiz) if raiz else get_document_repository_dir() / CARPETA_CONTENIDO
+
+    def ruta_objeto(self, digest: str) -> Path:
+        digest = str(digest or "").strip().lower()
+        if len(digest) != 64 or any(ch not in "0123456789abcdef" for ch in digest):
+            raise ValueError(f"Hash de contenido no valido: {digest!r}")
+        return self._raiz / digest[:2] / digest
+
+    def guardar_bytes(self, contenido: bytes, digest: str | None = None) -> Path:
+        """Devuelve el objeto del contenido, escribiendolo solo si no existe."""
+        digest = digest or hashlib.sha256(contenido).hexdigest()
+        objeto = self.ruta_objeto(digest)
+        if objeto.is_file():
+            return objeto
+        objeto.parent.mkdir(parents=True, exist_ok=True)
+        temporal = self._temporal(objeto)
+        try:
+            with open(temporal, "wb") as f:
+                f.write(contenido)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporal, objeto)
+        finally:
+            temporal.unlink(missing_ok=True)
+        return objeto
+
+    def guardar_archivo(self, origen: str | Path, digest: str | None = None) -> Path:
+        origen = Path(origen)
+        digest = digest or sha256_archivo(origen)
+        objeto = self.ruta_objeto(digest)
+        if objeto.is_file():
+            return objeto
+        objeto.parent.mkdir(parents=True, exist_ok=True)
+        temporal = self._temporal(objeto)
+        try:
+            shutil.copyfile(origen, temporal)
+            os.replace(temporal, objeto)
+        finally:
+            temporal.unlink(missing_ok=True)
+        return objeto
+
+    def materializar(self, objeto: Path, destino: str | Path) -> Path:
+        """Publica ``objeto`` en ``destino`` como enlace duro o, si el volumen
+        no los admite, como copia. En ambos casos se renombra al final para
+        que ningun puesto vea un fichero a medio escribir."""
+        destino = Path(destino)
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        temporal = self._temporal(destino)
+        try:
+            try:
+                os.link(objeto, temporal)
+            except OSError as exc:
+                logger.debug("[Almacen] Sin enlace duro para %s: %s", destino, exc)
+                shutil.copyfile(objeto, temporal)
+            os.replace(temporal, destino)
+        finally:
+            temporal.unlink(missing_ok=True)
+        return destino
+
+    def eliminar_objeto(self, digest: str) -> None:
+        """Borra el objeto cuando la BD indica que ya no tiene referencias."""
+        try:
+            eliminar_ruta_objeto(self.ruta_objeto(digest))
+        except ValueError as exc:
+            logger.warning("[Almacen] No se pudo eliminar el contenido %s: %s", digest, exc)
+
+    @staticmethod
+    def _temporal(destino: Path) -> Path:
+        return destino.with_name(f".{destino.name}.{uuid.uuid4().hex}.tmp")
+
+
+def eliminar_ruta_objeto(ruta: str | Path) -> None:
+    """Borra un objeto del almacen por su ruta; se pasa como
+    ``al_eliminar_objeto`` a los metodos del gestor que liberan referencias."""
+    try:
+        Path(ruta).unlink(missing_ok=True)
+    except OSError as exc:
+        logger.warning("[Almacen] No se pudo eliminar el contenido %s: %s", ruta, exc)
+
+
+@contextmanager
+def referencia_provisional(gestor, almacen: AlmacenDocumental, digest: str, tamano: int | None = None):
+    """Mantiene vivo el objeto de ``digest`` mientras se escribe, se publica y
+    se registra el documento que lo referenciara. Al salir se suelta la
+    referencia provisional y, si nadie mas lo usa, se borra el objeto."""
+    objeto = almacen.ruta_objeto(digest)
+    gestor.referenciar_contenido_documental(digest, str(objeto), tamano)
+    try:
+        yield objeto
+    finally:
+        gestor.liberar_contenido_documental(digest, al_eliminar_objeto=eliminar_ruta_objeto)
@@ -0,0 +1,108 @@
+"""Sesion HTTP compartida por los clientes del escritorio.
+
+Todos los clientes del backend (OCR, correo, mensajeria, firma, tramites)
+usan la misma ``requests.Session``: las conexiones TLS quedan abiertas en el
+pool y las llamadas sucesivas al mismo host no repiten el handshake.
+
+- Reintentos con espera exponencial y dispersion aleatoria ante fallos de
+  conexion y respuestas 429/502/503/504. Los errores de estado solo se
+  reintentan en metodos idempotentes; un POST nunca se repite una vez enviado.
+- Respuestas comprimidas (gzip/deflate), que requests descomprime solo.
+- Sin cookies: las credenciales van en cabeceras por peticion, asi ningun
+  cliente hereda estado de otro.
+- ``registrar_observador`` permite medir cada peticion (metodo, URL, estado
+  y segundos).
+"""
+from __future__ import annotations
+
+import logging
+import random
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from typing import Callable
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+POOL_CONEXIONES = 16
+MAX_REINTENTOS = 3
+ESPERA_BASE_S = 0.5
+ESPERA_MAX_S = 8.0
+
+_lock = threading.Lock()
+_sesion: requests.Session | None = None
+_observadores: list[Callable[[str, str, int, float], None]] = []
+
+
+class _ReintentoDisperso(Retry):
+    """Retry con +-50 % de dispersion para que los puestos no reintenten a la vez."""
+
+    def get_backoff_time(self) -> float:
+        espera = super().get_backoff_time()
+        return min(ESPERA_MAX_S, espera * random.uniform(0.5, 1.5)) if espera else 0.0
+
+
+def _politica_reintentos() -> Retry:
+    return _ReintentoDisperso(
+        total=MAX_REINTENTOS,
+        connect=MAX_REINTENTOS,
+        read=MAX_REINTENTOS,
+        status=MAX_REINTENTOS,
+        backoff_factor=ESPERA_BASE_S,
+        status_forcelist=(429, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+
+def _medir(response, *_args, **_kwargs):
+    segundos = response.elapsed.total_seconds()
+    metodo = getattr(response.request, "method", "") or ""
+    logger.debug("[HTTP] %s %s -> %s en %.3f s", metodo, response.url, response.status_code, segundos)
+    for observador in list(_observadores):
+        try:
+            observador(metodo, response.url, response.status_code, segundos)
+        except Exception as exc:
+            logger.debug("[HTTP] Observador fallido: %s", exc)
+    return response
+
+
+def crear_sesion() -> requests.Session:
+    """Sesion nueva con pool, reintentos, compresion y medicion."""
+    sesion = requests.Session()
+    adaptador = HTTPAdapter(
+        pool_connections=4, pool_maxsize=POOL_CONEXIONES,
+        max_retries=_politica_reintentos(),
+    )
+    sesion.mount("https://", adaptador)
+    sesion.mount("http://", adaptador)
+    sesion.headers["Accept-Encoding"] = "gzip, deflate"
+    sesion.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    sesion.hooks["response"].append(_medir)
+    return sesion
+
+
+def sesion_backend() -> requests.Session:
+    """Sesion unica del proceso; la conexion de cada host se reutiliza
+    entre clientes e hilos."""
+    global _sesion
+    with _lock:
+        if _sesion is None:
+            _sesion = crear_sesion()
+        return _sesion
+
+
+def registrar_observador(observador: Callable[[str, str, int, float], None]) -> None:
+    """``observador(metodo, url, estado, segundos)`` tras cada respuesta."""
+    with _lock:
+        _observadores.append(observador)
+
+
+def quitar_observador(observador) -> None:
+    with _lock:
+        if observador in _observadores:
+            _observadores.remove(observador)
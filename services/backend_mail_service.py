@@ -5,8 +5,7 @@ import os
 from dataclasses import dataclass
 from pathlib import Path
 
-import requests
-
+from services.backend_http import sesion_backend
 from utils.utilidades import load_app_config
 
 
@@ -27,7 +26,7 @@ class BackendMailService:
         ).rstrip("/")
         from utils.credential_store import get_workstation_token
         self.token = get_workstation_token() or os.getenv("GEST2A3ECO_WORKSTATION_TOKEN", "")
-        self.http = session or requests.Session()
+        self.http = session or sesion_backend()
 
     @property
     def configured(self) -> bool:
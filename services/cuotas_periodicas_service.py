@@ -0,0 +1,324 @@
+"""Generacion en bloque de las facturas de cuotas periodicas.
+
+``GeneradorCuotas`` calcula los periodos pendientes de todas las cuotas de una
+empresa (o de todas) con una sola consulta, prepara un plan con la factura
+borrador de cada periodo para revisarlo antes de grabar y lo graba entero en
+una transaccion.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import dataclass, field
+from datetime import date, datetime
+
+from utils.validaciones import normalizar_nif_cif
+
+_PASOS_PERIODICIDAD = {"mensual": 1, "bimestral": 2, "trimestral": 3, "semestral": 6, "anual": 12}
+
+
+def parse_fecha_ddmmyyyy(txt: str) -> date | None:
+    """Convierte dd/mm/yyyy a date. Devuelve None si no es valido."""
+    try:
+        return datetime.strptime(str(txt).strip(), "%d/%m/%Y").date()
+    except Exception:
+        return None
+
+
+def calcular_periodos(periodicidad: str, inicio: date, fin: date) -> list[str]:
+    """Genera lista de strings YYYY-MM desde inicio hasta fin (inclusive) segun periodicidad."""
+    step = _PASOS_PERIODICIDAD.get(periodicidad, 1)
+    periodos = []
+    y, m = inicio.year, inicio.month
+    fin_ym = (fin.year, fin.month)
+    while (y, m) <= fin_ym:
+        periodos.append(f"{y:04d}-{m:02d}")
+        m += step
+        while m > 12:
+            m -= 12
+            y += 1
+    return periodos
+
+
+def periodos_pendientes(cuota: dict, hasta: date, generados) -> list[str]:
+    inicio = parse_fecha_ddmmyyyy(cuota.get("fecha_inicio") or "")
+    if not inicio:
+        return []
+    fin = hasta
+    if cuota.get("fecha_fin"):
+        fin_cuota = parse_fecha_ddmmyyyy(cuota["fecha_fin"])
+        if fin_cuota is not None:
+            fin = min(fin_cuota, hasta)
+    if inicio > fin:
+        return []
+    generados = set(generados or ())
+    return [p for p in calcular_periodos(cuota.get("periodicidad", "mensual"), inicio, fin) if p not in generados]
+
+
+def id_factura_cuota(cuota_id, periodo: str) -> str:
+    # ID deterministico: el mismo (cuota, periodo) siempre produce el mismo fid.
+    # Asi, si un intento anterior creo un borrador pero fallo al registrar el
+    # periodo, el siguiente intento actualiza ese borrador en vez de duplicarlo.
+    clave = f"cuota:{cuota_id}:{periodo}"
+    return str(int(hashlib.md5(clave.encode()).hexdigest()[:15], 16))
+
+
+def lineas_cuota(cuota: dict) -> list[dict]:
+    lineas_raw = cuota.get("lineas_json") or "[]"
+    if isinstance(lineas_raw, list):
+        lineas = lineas_raw
+    else:
+        try:
+            lineas = json.loads(lineas_raw)
+        except Exception:
+            lineas = []
+    # Normalizar nombres de campo: la vista de facturas usa "unidades" y
+    # "precio"; cuotas antiguas pueden haber guardado "cantidad" y
+    # "precio_unitario". Se asegura la presencia de los campos canónicos.
+    lineas_norm = []
+    for ln in lineas:
+        if not isinstance(ln, dict):
+            continue
+        nl = dict(ln)
+        if "unidades" not in nl:
+            nl["unidades"] = nl.get("cantidad", 1.0)
+        if "precio" not in nl:
+            nl["precio"] = nl.get("precio_unitario", 0.0)
+        lineas_norm.append(nl)
+    return lineas_norm
+
+
+def _importe(lineas: list[dict]) -> float:
+    total = 0.0
+    for ln in lineas:
+        for campo in ("base", "cuota_iva"):
+            try:
+                total += float(str(ln.get(campo) or 0).replace(",", "."))
+            except ValueError:
+                pass
+    return round(total, 2)
+
+
+@dataclass(slots=True)
+class CuotaPlanificada:
+    """Una factura del plan: ``accion`` es ``nueva``, ``actualizar`` o ``error``."""
+
+    cuota: dict
+    periodo: str
+    accion: str
+    factura: dict | None = None
+    error: str = ""
+    importe: float = 0.0
+
+
+@dataclass(slots=True)
+class PlanCuotas:
+    fecha_factura: str
+    items: list[CuotaPlanificada] = field(default_factory=list)
+
+    def por_accion(self, accion: str) -> list[CuotaPlanificada]:
+        return [i for i in self.items if i.accion == accion]
+
+    @property
+    def grabables(self) -> list[CuotaPlanificada]:
+        return [i for i in self.items if i.factura is not None]
+
+    def resumen(self, max_lineas: int = 10) -> str:
+        nuevas = self.por_accion("nueva")
+        actualizar = self.por_accion("actualizar")
+        errores = self.por_accion("error")
+        importe = sum(i.importe for i in self.grabables)
+        texto = [
+            f"Fecha de factura: {self.fecha_factura}",
+            f"Facturas borrador nuevas: {len(nuevas)}",
+        ]
+        if actualizar:
+            texto.append(f"Borradores existentes que se actualizan: {len(actualizar)}")
+        texto.append(f"Importe total: {importe:,.2f}")
+        if errores:
+            texto.append(f"\nNo se generaran ({len(errores)}):")
+            texto.extend(
+                f"  - {_nombre_cuota(i.cuota)} / {i.periodo}: {i.error}" for i in errores[:max_lineas]
+            )
+            if len(errores) > max_lineas:
+                texto.append(f"  ... y {len(errores) - max_lineas} mas")
+        return "\n".join(texto)
+
+
+def _nombre_cuota(cuota: dict) -> str:
+    return str(cuota.get("nombre") or cuota.get("nif") or cuota.get("id") or "?")
+
+
+class GeneradorCuotas:
+    def __init__(self, gestor):
+        self._gestor = gestor
+
+    def pendientes(
+        self,
+        codigo_empresa: str | None = None,
+        ejercicio: int | None = None,
+        hasta: date | None = None,
+    ) -> list[dict]:
+        """Lista de dicts {cuota, periodos} de las cuotas activas con periodos por generar."""
+        hasta = hasta or date.today()
+        resultado = []
+        for cuota in self._gestor.listar_cuotas_con_periodos(codigo_empresa, ejercicio, solo_activas=True):
+            periodos = periodos_pendientes(cuota, hasta, cuota.get("periodos_generados"))
+            if periodos:
+                resultado.append({"cuota": cuota, "periodos": periodos})
+        return resultado
+
+    def previsualizar(self, cuotas: list[dict], seleccionados, fecha_factura: str) -> PlanCuotas:
+        """Prepara sin grabar nada las facturas de los ``(cuota_id, periodo)`` elegidos."""
+        por_id = {str(c["id"]): c for c in cuotas}
+        plan = PlanCuotas(fecha_factura)
+        pares = sorted(
+            {(str(cid), periodo) for cid, periodo in seleccionados if str(cid) in por_id},
+            key=lambda par: (_nombre_cuota(por_id[par[0]]).lower(), par[0], par[1]),
+        )
+        grupos: dict[tuple, list[tuple[dict, str]]] = {}
+        for cid, periodo in pares:
+            cuota = por_id[cid]
+            grupos.setdefault((cuota["codigo_empresa"], cuota["ejercicio"]), []).append((cuota, periodo))
+        for (codigo, ejercicio), items in grupos.items():
+            plan.items.extend(self._planificar_empresa(codigo, ejercicio, items, fecha_factura))
+        return plan
+
+    def aplicar(self, plan: PlanCuotas) -> list[str]:
+        """Graba las facturas y los periodos del plan en una transaccion."""
+        grabables = plan.grabables
+        if not grabables:
+            return []
+        return self._gestor.registrar_facturas_cuotas(
+            [(i.factura, i.cuota["id"], i.periodo) for i in grabables],
+            datetime.now().strftime("%d/%m/%Y"),
+        )
+
+    # ── Preparacion por empresa ──────────────────────────────────────────────
+
+    def _planificar_empresa(self, codigo, ejercicio, items, fecha_factura) -> list[CuotaPlanificada]:
+        cuotas = {str(c["id"]): c for c, _ in items}
+        terceros = self._resolver_terceros(codigo, ejercicio, cuotas.values())
+        cuenta_bancaria, plantilla_emitidas = self._defaults_empresa(codigo, ejercicio)
+        fids = [id_factura_cuota(c["id"], periodo) for c, periodo in items]
+        existentes = {
+            str(f["id"]): f for f in self._gestor.listar_facturas_emitidas_por_ids(codigo, fids)
+        }
+
+        plan = []
+        for (cuota, periodo), fid in zip(items, fids):
+            tercero = terceros[str(cuota["id"])]
+            if isinstance(tercero, Exception):
+                plan.append(CuotaPlanificada(cuota, periodo, "error", error=str(tercero)))
+                continue
+            previa = existentes.get(fid)
+            if previa is not None and not previa.get("borrador"):
+                plan.append(CuotaPlanificada(
+                    cuota, periodo, "error",
+                    error="ya existe una factura emitida para este periodo; no se sobrescribe",
+                ))
+                continue
+            tercero_id, subcuenta_cliente = tercero
+            lineas = lineas_cuota(cuota)
+            factura = self._factura_borrador(
+                cuota, fid, fecha_factura, lineas, tercero_id,
+                str(cuota.get("subcuenta_cliente") or "").strip() or subcuenta_cliente,
+                str(cuota.get("cuenta_bancaria") or "").strip() or cuenta_bancaria,
+                str(cuota.get("plantilla_emitidas") or "").strip() or plantilla_emitidas,
+            )
+            plan.append(CuotaPlanificada(
+                cuota, periodo, "actualizar" if previa is not None else "nueva",
+                factura=factura, importe=_importe(lineas),
+            ))
+        return plan
+
+    def _resolver_terceros(self, codigo, ejercicio, cuotas) -> dict[str, tuple[str, str] | Exception]:
+        """(tercero_id, subcuenta_cliente) de cada cuota, o el error que impide facturarla.
+
+        Usa el tercero de la cuota si sigue existiendo y, si no, el de su NIF.
+        """
+        cuotas = list(cuotas)
+        por_id = self._gestor.subcuentas_cliente_por_tercero(
+            codigo, [c.get("tercero_id") for c in cuotas]
+        )
+        sin_tercero = [
+            c for c in cuotas if str(c.get("tercero_id") or "").strip() not in por_id
+        ]
+        por_nif = self._gestor.get_terceros_by_nifs(
+            codigo, ejercicio, [c.get("nif") for c in sin_tercero]
+        ) if sin_tercero else {}
+
+        out: dict[str, tuple[str, str] | Exception] = {}
+        for cuota in cuotas:
+            tid = str(cuota.get("tercero_id") or "").strip()
+            if tid in por_id:
+                out[str(cuota["id"])] = (tid, por_id[tid])
+                continue
+            nif = str(cuota.get("nif") or "").strip()
+            if not nif:
+                out[str(cuota["id"])] = ValueError(
+                    "La cuota no tiene tercero ni NIF asignado. "
+                    "Edita la cuota y asigna un cliente antes de generar."
+                )
+                continue
+            tercero = por_nif.get(normalizar_nif_cif(nif))
+            if not tercero:
+                out[str(cuota["id"])] = ValueError(
+                    f"No existe un tercero global con NIF {nif}. "
+                    "Crealo primero en el maestro de terceros antes de generar esta factura."
+                )
+                continue
+            out[str(cuota["id"])] = (str(tercero["id"]), str(tercero.get("subcuenta_cliente") or "").strip())
+        return out
+
+    def _defaults_empresa(self, codigo, ejercicio) -> tuple[str, str]:
+        cuenta_bancaria = plantilla_emitidas = ""
+        try:
+            emp = self._gestor.get_empresa(codigo, ejercicio) or {}
+            cuenta_bancaria = str(emp.get("cuenta_bancaria") or "").strip()
+        except Exception:
+            pass
+        try:
+            pls = self._gestor.listar_emitidas(codigo, ejercicio)
+            if pls:
+                plantilla_emitidas = str(pls[0].get("nombre") or "").strip()
+        except Exception:
+            pass
+        return cuenta_bancaria, plantilla_emitidas
+
+    @staticmethod
+    def _factura_borrador(cuota, fid, fecha_factura, lineas, tercero_id,
+                          subcuenta_cliente, cuenta_bancaria, plantilla_emitidas) -> dict:
+        return {
+            "id": fid,
+            "codigo_empresa": cuota["codigo_empresa"],
+            "ejercicio": cuota["ejercicio"],
+            "tercero_id": tercero_id or None,
+            "serie": cuota.get("serie") or "",
+            "numero": "",
+            "fecha_asiento": fecha_factura,
+            "fecha_expedicion": fecha_factura,
+            "fecha_operacion": fecha_factura,
+            "tipo_operacion": cuota.get("tipo_operacion") or "01",
+            "modelo_fiscal": cuota.get("modelo_fiscal") or "",
+            "nif": cuota.get("nif") or "",
+            "nombre": cuota.get("nombre") or "",
+            "descripcion": cuota.get("descripcion") or "",
+            "observaciones": cuota.get("observaciones") or "",
+            "subcuenta_cliente": subcuenta_cliente,
+            "forma_pago": cuota.get("forma_pago") or "",
+            "cuenta_bancaria": cuenta_bancaria,
+            "plantilla_word": str(cuota.get("plantilla_word") or "").strip(),
+            "plantilla_emitidas": plantilla_emitidas,
+            "retencion_aplica": cuota.get("retencion_aplica") or 0,
+            "retencion_pct": cuota.get("retencion_pct"),
+            "descuento_total_tipo": cuota.get("descuento_total_tipo"),
+            "descuento_total_valor": cuota.get("descuento_total_valor"),
+            "moneda_codigo": cuota.get("moneda_codigo"),
+            "moneda_simbolo": cuota.get("moneda_simbolo"),
+            "lineas": lineas,
+            "borrador": 1,
+            "generada": 0,
+            "fecha_generacion": "",
+            "enviado": 0,
+        }
@@ -8,7 +8,7 @@ from __future__ import annotations
 import warnings
 from pathlib import Path
 
-import requests
+from services.backend_http import sesion_backend
 
 warnings.warn(
     "dataprius_service.DatapriusClient esta obsoleto. "
@@ -39,7 +39,7 @@ class DatapriusClient:
         self.client_secret = str(client_secret or "").strip()
         self.base_url = str(base_url or "").rstrip("/")
         self.timeout = int(timeout)
-        self._http = session or requests.Session()
+        self._http = session or sesion_backend()
         self._access_token = ""
         if not self.client_id or not self.client_secret:
             raise ValueError("Configura dataprius_api_key y dataprius_api_secret.")
@@ -4,7 +4,7 @@ import hashlib
 import json
 from pathlib import Path
 
-import requests
+from services.backend_http import sesion_backend
 
 
 class _BackendClient:
@@ -14,7 +14,7 @@ class _BackendClient:
         # Preferir workstation_token si esta disponible; si no, usar api_key
         self.api_key = str(workstation_token or api_key or "")
         self.timeout = timeout
-        self.http = session or requests.Session()
+        self.http = session or sesion_backend()
 
     def request(self, method: str, path: str, **kwargs):
         headers = dict(kwargs.pop("headers", {}))
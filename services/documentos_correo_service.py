@@ -10,6 +10,7 @@ import zipfile
 from dataclasses import dataclass, field
 from pathlib import Path
 
+from services.almacen_documental import CARPETA_CONTENIDO, AlmacenDocumental, referencia_provisional
 from services.graph_mail_service import GraphMailService
 from services.ocr.ocr_service import OcrService
 from utils.utilidades import get_default_received_documents_dir
@@ -131,6 +132,9 @@ class DocumentosCorreoService:
     ) -> ImportSummary:
         summary = ImportSummary()
         ocr = OcrService(self._gestor, codigo_empresa, ejercicio, usuario=usuario)
+        almacen = AlmacenDocumental(
+            get_default_received_documents_dir().parent / CARPETA_CONTENIDO
+        )
         for attachment_id in dict.fromkeys(attachment_ids):
             try:
                 item = self._graph.download_attachment(
@@ -148,8 +152,13 @@ class DocumentosCorreoService:
                     summary.duplicates.append(name)
                     continue
                 destination = self._destination(codigo_empresa, ejercicio, name)
-                destination.write_bytes(content)
-                result = ocr.procesar_archivo(str(destination))
+                # La referencia del contenido la toma el documento OCR; la
+                # provisional solo cubre la escritura. Si el OCR lo descarta
+                # como duplicado, al soltarla se borra el objeto sin usar.
+                with referencia_provisional(self._gestor, almacen, digest, len(content)):
+                    stored = almacen.guardar_bytes(content, digest)
+                    almacen.materializar(stored, destination)
+                    result = ocr.procesar_archivo(str(destination))
                 if result.get("estado") == "duplicado":
                     destination.unlink(missing_ok=True)
                     summary.duplicates.append(name)
@@ -0,0 +1,118 @@
+"""Exportacion de facturas y albaranes emitidos a Excel o CSV.
+
+Las filas llegan de un iterable (normalmente los ``iterar_*`` del gestor) y se
+escriben segun llegan: en Excel con un libro ``write_only`` de openpyxl y en
+CSV con el modulo estandar, que es la via rapida para volumenes grandes. En
+ningun caso se acumula el listado completo en memoria.
+"""
+from __future__ import annotations
+
+import csv
+from pathlib import Path
+from typing import Callable, Iterable
+
+CABECERAS_FACTURAS = ["Ejercicio", "Serie", "Numero", "Fecha", "Cliente", "NIF", "Base", "IVA", "RE", "Total", "Generada"]
+ANCHOS_FACTURAS = [10, 8, 14, 12, 35, 16, 12, 12, 10, 12, 10]
+
+CABECERAS_ALBARANES = ["Numero", "Fecha", "Cliente", "NIF", "Base", "IVA", "RE", "Total", "Facturado", "Factura"]
+ANCHOS_ALBARANES = [18, 12, 35, 16, 12, 12, 10, 12, 10, 14]
+
+
+def fila_factura(fac: dict, totales: dict) -> list:
+    return [
+        fac.get("ejercicio", ""),
+        str(fac.get("serie") or "").strip(),
+        str(fac.get("numero") or "").strip(),
+        fac.get("fecha_asiento", ""),
+        fac.get("nombre", ""),
+        fac.get("nif", ""),
+        totales["base"],
+        totales["iva"],
+        totales["re"],
+        totales["total"],
+        "Si" if fac.get("generada") else "No",
+    ]
+
+
+def fila_albaran(alb: dict, totales: dict) -> list:
+    return [
+        str(alb.get("numero") or "").strip(),
+        alb.get("fecha_asiento", ""),
+        alb.get("nombre", ""),
+        alb.get("nif", ""),
+        totales["base"],
+        totales["iva"],
+        totales["re"],
+        totales["total"],
+        "Si" if alb.get("facturado") else "No",
+        str(alb.get("factura_numero") or "").strip(),
+    ]
+
+
+def es_ruta_csv(ruta: str | Path) -> bool:
+    return Path(ruta).suffix.lower() == ".csv"
+
+
+def _escribir_csv(ruta: str | Path, cabeceras: list[str], filas: Iterable[list]) -> int:
+    # Separador ';' y coma decimal: lo que espera Excel con configuracion regional espanola.
+    n = 0
+    with open(ruta, "w", newline="", encoding="utf-8-sig") as fh:
+        writer = csv.writer(fh, delimiter=";")
+        writer.writerow(cabeceras)
+        for fila in filas:
+            writer.writerow([f"{v:.2f}".replace(".", ",") if isinstance(v, float) else v for v in fila])
+            n += 1
+    return n
+
+
+def _escribir_xlsx(ruta: str | Path, titulo: str, cabeceras: list[str], anchos: list[int], filas: Iterable[list]) -> int:
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, Font, PatternFill
+    from openpyxl.utils import get_column_letter
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(titulo)
+    for ci, w in enumerate(anchos, 1):
+        ws.column_dimensions[get_column_letter(ci)].width = w
+    ws.freeze_panes = "A2"
+    hdr_font = Font(bold=True, color="FFFFFF")
+    hdr_fill = PatternFill("solid", fgColor="2563EB")
+    hdr_align = Alignment(horizontal="center")
+    cabecera = []
+    for h in cabeceras:
+        cell = WriteOnlyCell(ws, value=h)
+        cell.font = hdr_font
+        cell.fill = hdr_fill
+        cell.alignment = hdr_align
+        cabecera.append(cell)
+    ws.append(cabecera)
+    n = 0
+    for fila in filas:
+        ws.append(fila)
+        n += 1
+    wb.save(ruta)
+    return n
+
+
+def exportar_tabla(
+    ruta: str | Path,
+    titulo: str,
+    cabeceras: list[str],
+    anchos: list[int],
+    filas: Iterable[list],
+) -> int:
+    """Escribe ``filas`` en ``ruta`` (``.csv`` o Excel) y devuelve cuantas se han escrito."""
+    if es_ruta_csv(ruta):
+        return _escribir_csv(ruta, cabeceras, filas)
+    return _escribir_xlsx(ruta, titulo, cabeceras, anchos, filas)
+
+
+def exportar_facturas(ruta: str | Path, facturas: Iterable[dict], totales: Callable[[dict], dict]) -> int:
+    filas = (fila_factura(fac, totales(fac)) for fac in facturas)
+    return exportar_tabla(ruta, "Facturas", CABECERAS_FACTURAS, ANCHOS_FACTURAS, filas)
+
+
+def exportar_albaranes(ruta: str | Path, albaranes: Iterable[dict], totales: Callable[[dict], dict]) -> int:
+    filas = (fila_albaran(alb, totales(alb)) for alb in albaranes)
+    return exportar_tabla(ruta, "Albaranes", CABECERAS_ALBARANES, ANCHOS_ALBARANES, filas)
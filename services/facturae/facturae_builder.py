@@ -43,7 +43,10 @@ def _sub(parent: ET.Element, tag: str) -> ET.Element:
     # por lo que los elementos locales van sin namespace (solo la raiz <fe:Facturae>
     # se cualifica). Verificado con el XSD oficial y con una factura real aceptada
     # por FACe: ver services/facturae/schemas/README.md.
-    return ET.SubElement(parent, tag)
+    # makeelement + append sirve igual para nodos de ElementTree y de lxml.
+    node = parent.makeelement(tag, {})
+    parent.append(node)
+    return node
 
 
 def q6(value: Decimal) -> Decimal:
@@ -316,19 +319,33 @@ def _append_taxes(parent: ET.Element, tag: str, taxes: list[FacturaeTaxBreakdown
         _amount(tnode, "TaxAmount", tax.tax_amount)
 
 
-def build_facturae_xml(document: FacturaeDocument) -> str:
-    # Estructura de namespaces verificada contra el XSD oficial 3.2.1 y contra
-    # una factura real aceptada por FACe: solo la raiz se cualifica con el
-    # prefijo "fe"; el resto de elementos van sin namespace (elementFormDefault
-    # no cualificado en el XSD). No se declara xsi:schemaLocation porque la
-    # factura de referencia tampoco lo hace y no es necesario para validar.
+def _root_etree() -> ET.Element:
     ET.register_namespace("fe", FACTURAE_NS)
     ET.register_namespace("ds", DS_NS)
-
     root = ET.Element(f"{{{FACTURAE_NS}}}Facturae")
     # xmlns:ds se declara igualmente sin usarse todavia: es el punto de
     # extension reservado para la firma XAdES-EPES (sign_facturae_xml).
     root.set("xmlns:ds", DS_NS)
+    return root
+
+
+def _root_lxml():
+    from lxml import etree as lxml_etree
+
+    return lxml_etree.Element(f"{{{FACTURAE_NS}}}Facturae", nsmap={"fe": FACTURAE_NS, "ds": DS_NS})
+
+
+def build_facturae_tree(document: FacturaeDocument, use_lxml: bool = False):
+    """Arbol del XML Facturae, con ElementTree o (``use_lxml``) con lxml.
+
+    El arbol lxml se puede validar contra el XSD sin serializarlo antes.
+    """
+    # Estructura de namespaces verificada contra el XSD oficial 3.2.1 y contra
+    # una factura real aceptada por FACe: solo la raiz se cualifica con el
+    # prefijo "fe"; el resto de elementos van sin namespace (elementFormDefault
+    # no cualificado en el XSD). No se declara xsi:schemaLocation porque la
+    # factura de referencia tampoco lo hace y no es necesario para validar.
+    root = _root_lxml() if use_lxml else _root_etree()
 
     header = _sub(root, "FileHeader")
     _txt(header, "SchemaVersion", SCHEMA_VERSION)
@@ -414,4 +431,16 @@ def build_facturae_xml(document: FacturaeDocument) -> str:
             _append_taxes(line_node, "TaxesWithheld", line.taxes_withheld)
         _append_taxes(line_node, "TaxesOutputs", line.tax_outputs)
 
-    return ET.tostring(root, encoding="utf-8", xml_declaration=True).decode("utf-8")
+    return root
+
+
+def serialize_facturae_tree(root) -> bytes:
+    if isinstance(root, ET.Element):
+        return ET.tostring(root, encoding="utf-8", xml_declaration=True)
+    from lxml import etree as lxml_etree
+
+    return lxml_etree.tostring(root, encoding="utf-8", xml_declaration=True)
+
+
+def build_facturae_xml(document: FacturaeDocument) -> str:
+    return serialize_facturae_tree(build_facturae_tree(document)).decode("utf-8")
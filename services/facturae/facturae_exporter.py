@@ -1,10 +1,17 @@
 from __future__ import annotations
 
+import os
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
+from typing import Iterable
 
-from services.facturae.facturae_builder import build_facturae_document, build_facturae_xml
+from services.facturae.facturae_builder import (
+    build_facturae_document,
+    build_facturae_tree,
+    serialize_facturae_tree,
+)
 from services.facturae.facturae_codes import (
     FACTURAE_STATUS_GENERADO,
     FACTURAE_STATUS_NO_GENERADO,
@@ -15,9 +22,15 @@ from utils.utilidades import aplicar_descuento_total_lineas
 from services.facturae.facturae_validator import (
     build_facturae_error_payload,
     validate_facturae_payload,
+    validate_facturae_tree,
     validate_facturae_xml_content,
+    xsd_validation_available,
 )
 
+# Por debajo de este numero de facturas el lote se genera en el propio proceso:
+# arrancar los procesos de trabajo cuesta mas de lo que se gana.
+LOTE_MINIMO_PROCESOS = 24
+
 
 @dataclass(slots=True)
 class FacturaeExportResult:
@@ -79,14 +92,19 @@ class FacturaeExporter:
             return FacturaeExportResult(ok=False, errors=errors, facturae_status=build_facturae_error_payload(errors)["facturae_status"])
 
         document = build_facturae_document(payload)
-        xml_content = build_facturae_xml(document)
-        xml_errors = validate_facturae_xml_content(xml_content)
+        # Con lxml el arbol se valida contra el XSD tal cual se construye y se
+        # serializa una sola vez, para escribirlo.
+        use_lxml = xsd_validation_available()
+        root = build_facturae_tree(document, use_lxml=use_lxml)
+        xml_bytes = serialize_facturae_tree(root)
+        xml_content = xml_bytes.decode("utf-8")
+        xml_errors = validate_facturae_tree(root) if use_lxml else validate_facturae_xml_content(xml_content)
         if xml_errors:
             return FacturaeExportResult(ok=False, errors=xml_errors, facturae_status=build_facturae_error_payload(xml_errors)["facturae_status"])
 
         target = Path(output_path)
         target.parent.mkdir(parents=True, exist_ok=True)
-        target.write_text(xml_content, encoding="utf-8")
+        target.write_bytes(xml_bytes)
         return FacturaeExportResult(
             ok=True,
             errors=[],
@@ -96,6 +114,24 @@ class FacturaeExporter:
             facturae_status=FACTURAE_STATUS_GENERADO,
         )
 
+    def export_lote(self, trabajos: Iterable[tuple], procesos: int | None = None) -> list[FacturaeExportResult]:
+        """Genera varias facturas Facturae y devuelve un resultado por factura.
+
+        Cada trabajo es ``(factura, emisor, receptor, output_path, relacion_tercero)``.
+        Los resultados van en el mismo orden que los trabajos y sin ``xml_content``
+        (el XML queda en ``output_path``). Los lotes grandes se reparten entre
+        ``procesos`` procesos; cada uno compila el XSD una sola vez.
+        """
+        trabajos = list(trabajos)
+        if procesos is None:
+            procesos = procesos_facturae_por_defecto()
+        procesos = max(1, min(int(procesos), len(trabajos) or 1))
+        if procesos == 1 or len(trabajos) < LOTE_MINIMO_PROCESOS:
+            return [_exportar_trabajo(trabajo, self) for trabajo in trabajos]
+        chunksize = max(1, len(trabajos) // (procesos * 4))
+        with ProcessPoolExecutor(max_workers=procesos) as pool:
+            return list(pool.map(_exportar_trabajo, trabajos, chunksize=chunksize))
+
     def build_factura_persistence_update(self, factura: dict, result: FacturaeExportResult) -> dict:
         updated = dict(factura)
         updated["facturae_status"] = result.facturae_status
@@ -120,6 +156,30 @@ class FacturaeExporter:
         }
 
 
+def procesos_facturae_por_defecto() -> int:
+    return max(1, min(8, os.cpu_count() or 1))
+
+
+_exporter_proceso: FacturaeExporter | None = None
+
+
+def _exportar_trabajo(trabajo: tuple, exporter: FacturaeExporter | None = None) -> FacturaeExportResult:
+    global _exporter_proceso
+    if exporter is None:
+        if _exporter_proceso is None:
+            _exporter_proceso = FacturaeExporter()
+        exporter = _exporter_proceso
+    factura, emisor, receptor, output_path, *resto = trabajo
+    relacion_tercero = resto[0] if resto else None
+    try:
+        result = exporter.export(factura, emisor, receptor, output_path, relacion_tercero)
+    except Exception as exc:
+        errors = [f"Error al generar el XML Facturae: {exc}"]
+        return FacturaeExportResult(ok=False, errors=errors, facturae_status=build_facturae_error_payload(errors)["facturae_status"])
+    result.xml_content = ""
+    return result
+
+
 def sign_facturae_xml(xml_path: str, certificate_path: str, certificate_password: str) -> str:
     raise NotImplementedError(
         "La firma XAdES-EPES no esta implementada en esta fase. Punto de extension reservado."
@@ -128,16 +128,36 @@ def validate_facturae_payload(payload: dict) -> list[str]:
     return errors
 
 
-def validate_facturae_xml_content(xml_content: str) -> list[str]:
+def xsd_validation_available() -> bool:
+    return _load_xsd_schema() is not _XSD_UNAVAILABLE
+
+
+def _root_errors(tag: str) -> list[str]:
     errors: list[str] = []
+    if not tag.endswith("Facturae"):
+        errors.append("La raiz del XML no es Facturae.")
+    if FACTURAE_NS not in tag:
+        errors.append(f"El namespace principal de Facturae no coincide con {SCHEMA_VERSION}.")
+    return errors
+
+
+def validate_facturae_tree(root) -> list[str]:
+    """Valida un arbol lxml ya construido contra el XSD cacheado, sin serializarlo."""
+    errors = _root_errors(root.tag)
+    if errors:
+        return errors
+    schema = _load_xsd_schema()
+    if schema is not _XSD_UNAVAILABLE and not schema.validate(root):
+        errors.extend(f"XSD Facturae {SCHEMA_VERSION}: {e.message}" for e in schema.error_log)
+    return errors
+
+
+def validate_facturae_xml_content(xml_content: str) -> list[str]:
     try:
         root = ET.fromstring(xml_content)
     except ET.ParseError as exc:
         return [f"El XML Facturae generado no es valido: {exc}"]
-    if not root.tag.endswith("Facturae"):
-        errors.append("La raiz del XML no es Facturae.")
-    if FACTURAE_NS not in root.tag:
-        errors.append(f"El namespace principal de Facturae no coincide con {SCHEMA_VERSION}.")
+    errors = _root_errors(root.tag)
     if errors:
         return errors
 
@@ -5,11 +5,16 @@ import base64
 import hashlib
 import mimetypes
 import re
-import shutil
 import uuid
 from dataclasses import dataclass, field
 from pathlib import Path
 
+from services.almacen_documental import (
+    CARPETA_CONTENIDO,
+    AlmacenDocumental,
+    eliminar_ruta_objeto,
+    referencia_provisional,
+)
 from services.graph_mail_service import GraphMailService
 from services.ocr.ocr_service import OcrService
 from utils.utilidades import get_document_repository_dir
@@ -43,9 +48,13 @@ class ArchiveSummary:
 
 
 class GestionDocumentalService:
-    def __init__(self, gestor, graph: GraphMailService | None = None):
+    def __init__(
+        self, gestor, graph: GraphMailService | None = None,
+        almacen: AlmacenDocumental | None = None,
+    ):
         self._gestor = gestor
         self._graph = graph or GraphMailService()
+        self._almacen = almacen
 
     def categorias(self) -> list[dict]:
         return self._gestor.listar_categorias_documentales()
@@ -98,23 +107,25 @@ class GestionDocumentalService:
                 )
                 filename = self._available_filename(folder, name)
                 destination = folder / filename
-                destination.write_bytes(content)
-                try:
-                    document_id = self._gestor.registrar_documento_archivo({
-                        "id": str(uuid.uuid4()), "codigo_empresa": codigo_empresa,
-                        "ejercicio": ejercicio, "categoria_id": category_id,
-                        "nombre_original": name, "nombre_archivo": filename,
-                        "ruta": str(destination), "hash_archivo": digest,
-                        "tamano": len(content),
-                        "mime_type": item.get("contentType") or mimetypes.guess_type(name)[0],
-                        "origen": "correo", "graph_message_id": graph_message_id,
-                        "graph_attachment_id": attachment_id,
-                        "correo_remitente": remitente, "correo_asunto": asunto,
-                        "creado_por": usuario,
-                    })
-                except Exception:
-                    destination.unlink(missing_ok=True)
-                    raise
+                with referencia_provisional(self._gestor, self.almacen, digest, len(content)):
+                    stored = self.almacen.guardar_bytes(content, digest)
+                    self.almacen.materializar(stored, destination)
+                    try:
+                        document_id = self._gestor.registrar_documento_archivo({
+                            "id": str(uuid.uuid4()), "codigo_empresa": codigo_empresa,
+                            "ejercicio": ejercicio, "categoria_id": category_id,
+                            "nombre_original": name, "nombre_archivo": filename,
+                            "ruta": str(destination), "hash_archivo": digest,
+                            "ruta_objeto": str(stored), "tamano": len(content),
+                            "mime_type": item.get("contentType") or mimetypes.guess_type(name)[0],
+                            "origen": "correo", "graph_message_id": graph_message_id,
+                            "graph_attachment_id": attachment_id,
+                            "correo_remitente": remitente, "correo_asunto": asunto,
+                            "creado_por": usuario,
+                        })
+                    except Exception:
+                        destination.unlink(missing_ok=True)
+                        raise
                 self._gestor.registrar_decision_adjunto({
                     "graph_message_id": graph_message_id,
                     "graph_attachment_id": attachment_id, "nombre": name,
@@ -149,19 +160,22 @@ class GestionDocumentalService:
         folder = self._category_directory(codigo_empresa, ejercicio, category["carpeta"])
         filename = self._available_filename(folder, source.name)
         destination = folder / filename
-        shutil.copy2(source, destination)
-        try:
-            return self._gestor.registrar_documento_archivo({
-                "codigo_empresa": codigo_empresa, "ejercicio": ejercicio,
-                "categoria_id": categoria_id, "nombre_original": source.name,
-                "nombre_archivo": filename, "ruta": str(destination),
-                "hash_archivo": digest, "tamano": len(content),
-                "mime_type": mimetypes.guess_type(source.name)[0],
-                "origen": "manual", "creado_por": usuario,
-            })
-        except Exception:
-            destination.unlink(missing_ok=True)
-            raise
+        with referencia_provisional(self._gestor, self.almacen, digest, len(content)):
+            stored = self.almacen.guardar_bytes(content, digest)
+            self.almacen.materializar(stored, destination)
+            try:
+                return self._gestor.registrar_documento_archivo({
+                    "codigo_empresa": codigo_empresa, "ejercicio": ejercicio,
+                    "categoria_id": categoria_id, "nombre_original": source.name,
+                    "nombre_archivo": filename, "ruta": str(destination),
+                    "hash_archivo": digest, "ruta_objeto": str(stored),
+                    "tamano": len(content),
+                    "mime_type": mimetypes.guess_type(source.name)[0],
+                    "origen": "manual", "creado_por": usuario,
+                })
+            except Exception:
+                destination.unlink(missing_ok=True)
+                raise
 
     def archivar_adjunto_mensajeria(
         self, adjunto: dict, *, ejercicio: int, categoria_id: str,
@@ -190,24 +204,28 @@ class GestionDocumentalService:
         )
         filename = self._available_filename(folder, adjunto["nombre_original"])
         destination = folder / filename
-        shutil.copy2(source, destination)
-        try:
-            document_id = self._gestor.registrar_documento_archivo({
-                "codigo_empresa": adjunto["codigo_empresa"], "ejercicio": int(ejercicio),
-                "categoria_id": categoria_id, "nombre_original": adjunto["nombre_original"],
-                "nombre_archivo": filename, "ruta": str(destination), "hash_archivo": digest,
-                "tamano": len(content), "mime_type": adjunto.get("mime_type"), "origen": "chat",
-                "mensaje_id": adjunto.get("mensaje_remoto_id"),
-                "correo_remitente": adjunto.get("remitente"), "correo_asunto": "Mensajeria cliente",
-                "creado_por": usuario,
-            })
-        except Exception:
-            destination.unlink(missing_ok=True)
-            raise
+        with referencia_provisional(self._gestor, self.almacen, digest, len(content)):
+            stored = self.almacen.guardar_bytes(content, digest)
+            self.almacen.materializar(stored, destination)
+            try:
+                document_id = self._gestor.registrar_documento_archivo({
+                    "codigo_empresa": adjunto["codigo_empresa"], "ejercicio": int(ejercicio),
+                    "categoria_id": categoria_id, "nombre_original": adjunto["nombre_original"],
+                    "nombre_archivo": filename, "ruta": str(destination), "hash_archivo": digest,
+                    "ruta_objeto": str(stored), "tamano": len(content), "mime_type": adjunto.get("mime_type"), "origen": "chat",
+                    "mensaje_id": adjunto.get("mensaje_remoto_id"),
+                    "correo_remitente": adjunto.get("remitente"), "correo_asunto": "Mensajeria cliente",
+                    "creado_por": usuario,
+                })
+            except Exception:
+                destination.unlink(missing_ok=True)
+                raise
         source.unlink(missing_ok=True)
         return document_id
 
-    def enviar_a_ocr(self, documento_id: str, usuario: str = "") -> dict:
+    def enviar_a_ocr(self, documento_id: str, usuario: str = "", en_cola: bool = False) -> dict:
+        """Envia el documento a OCR. Con ``en_cola`` solo lo registra y el
+        analisis queda para los trabajadores de ``ColaOcr``."""
         document = self._gestor.get_documento_archivo(documento_id)
         if not document:
             raise ValueError("Documento no encontrado.")
@@ -215,10 +233,14 @@ class GestionDocumentalService:
             raise ValueError("La categoria del documento no permite enviarlo a OCR.")
         if document.get("ocr_documento_id"):
             raise ValueError("El documento ya fue enviado a OCR.")
-        result = OcrService(
+        service = OcrService(
             self._gestor, document["codigo_empresa"], int(document["ejercicio"]),
             usuario=usuario,
-        ).procesar_archivo(document["ruta"])
+        )
+        result = (
+            service.encolar_archivo(document["ruta"]) if en_cola
+            else service.procesar_archivo(document["ruta"])
+        )
         ocr_id = str(result.get("documento_id") or "")
         if ocr_id:
             self._gestor.vincular_documento_archivo_ocr(documento_id, ocr_id)
@@ -242,7 +264,11 @@ class GestionDocumentalService:
             temporary = path.with_name(f".eliminando-{uuid.uuid4().hex}-{path.name}")
             path.replace(temporary)
         try:
-            deleted = self._gestor.eliminar_documento_archivo(documento_id)
+            # El objeto del almacen, si era la ultima copia logica, se borra
+            # dentro de la transaccion que libera su referencia.
+            deleted = self._gestor.eliminar_documento_archivo(
+                documento_id, al_eliminar_objeto=eliminar_ruta_objeto,
+            )
             if not deleted:
                 raise ValueError("Documento no encontrado.")
         except Exception:
@@ -252,6 +278,16 @@ class GestionDocumentalService:
         if temporary:
             temporary.unlink(missing_ok=True)
 
+    @property
+    def almacen(self) -> AlmacenDocumental:
+        if self._almacen is None:
+            # Mismo volumen que las carpetas de categoria: los enlaces duros
+            # no pueden cruzar unidades.
+            self._almacen = AlmacenDocumental(
+                get_document_repository_dir() / CARPETA_CONTENIDO
+            )
+        return self._almacen
+
     @staticmethod
     def _safe_name(value: str) -> str:
         return re.sub(r'[<>:"/\\|?*\x00-\x1f]', "_", Path(value).name).strip(". ") or "Documento"
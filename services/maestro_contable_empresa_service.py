@@ -12,7 +12,7 @@ Clasificacion automatica por prefijo de 3 digitos (PGC espanol):
   resto → otra
 
 Reglas de uso:
-  - proponer_siguiente_subcuenta: solo calcula, nunca persiste.
+  - proponer_siguiente_subcuenta: calcula y reserva al puesto, nunca crea la subcuenta.
   - crear_subcuenta_empresa: persiste con pendiente_alta_a3=1 si creado_en_gest2a3eco=1.
   - importar_subcuentas_desde_dataframe: no marca pendiente_alta_a3 (ya viene de A3).
   - marcar_subcuenta_alta_a3_realizada: llama siempre con la confirmacion del usuario.
@@ -56,6 +56,12 @@ _PREFIJOS_TERCERO: dict[str, str] = {
     "deudor":    "440",
 }
 
+# Filas por carga masiva del maestro en la importacion desde A3
+TAMANO_BLOQUE_CARGA = 2000
+
+# Longitud maxima de un codigo de subcuenta importado
+MAX_DIGITOS_SUBCUENTA = 12
+
 # Tipos de subcuenta validos
 TIPOS_SUBCUENTA = (
     "cliente", "proveedor", "acreedor", "deudor",
@@ -233,9 +239,10 @@ class MaestroContableEmpresaService:
     ) -> str:
         """Calcula la siguiente subcuenta libre para el tipo dado.
 
-        Fuentes consultadas (sin modificar ninguna):
+        Fuentes consultadas en una sola sentencia:
           1. maestro_subcuentas_empresa (fuente de verdad nueva)
           2. plan_cuentas (cuentas importadas de A3, todos los ejercicios)
+        La subcuenta queda reservada unos minutos para este puesto.
         """
         prefijo = _PREFIJOS_TERCERO.get(tipo) or {
             "gasto":           "600",
@@ -249,27 +256,9 @@ class MaestroContableEmpresaService:
             "caja":            "570",
         }.get(tipo, "400")
 
-        usadas: set[int] = set()
-
-        for sub in gestor.listar_maestro_subcuentas_empresa(codigo_empresa, activo=None):
-            val = str(sub.get("subcuenta") or "").strip()
-            if _es_del_prefijo(val, prefijo, digitos_plan):
-                usadas.add(int(val))
-
-        cuentas_plan = gestor.conn.execute(
-            "SELECT DISTINCT cuenta FROM plan_cuentas WHERE codigo_empresa=?",
-            (codigo_empresa,),
-        ).fetchall()
-        for row in cuentas_plan:
-            val = str(row[0] or "").strip()
-            if _es_del_prefijo(val, prefijo, digitos_plan):
-                usadas.add(int(val))
-
-        primera = int(prefijo) * (10 ** (digitos_plan - len(prefijo))) + 1
-        candidato = primera
-        while candidato in usadas:
-            candidato += 1
-        return str(candidato).zfill(digitos_plan)
+        return gestor.proponer_subcuenta_libre(
+            codigo_empresa, prefijo, digitos_plan, reservar=True,
+        )
 
     # ── Creacion ──────────────────────────────────────────────────────────────
 
@@ -367,42 +356,64 @@ class MaestroContableEmpresaService:
                 }
             )
 
-        gestor.upsert_plan_cuentas(codigo, int(ejercicio or 0), normalizadas)
-        total = len(normalizadas)
-        for indice, item in enumerate(normalizadas, 1):
-            tercero_id = None
-            if item["nif"]:
-                tercero = gestor.get_tercero_by_nif_normalizado(item["nif"])
-                if tercero:
-                    tercero_id = str(tercero.get("id") or "").strip() or None
-            if not tercero_id:
-                coincidencias = [
-                    t for t in (gestor.listar_terceros() or [])
-                    if _normalizar_nombre_vinculo(t.get("nombre") or t.get("nombre_legal"))
-                    and _normalizar_nombre_vinculo(t.get("nombre") or t.get("nombre_legal"))
-                    == _normalizar_nombre_vinculo(item["descripcion"])
-                ]
-                if len(coincidencias) == 1:
-                    tercero_id = str(coincidencias[0].get("id") or "").strip() or None
-            registro = {
-                    "codigo_empresa": codigo,
-                    "subcuenta": item["cuenta"],
-                    "nombre_subcuenta": item["descripcion"],
-                    "tipo_subcuenta": clasificar_tipo_subcuenta(item["cuenta"]),
-                    "nif_snapshot": item["nif"],
-                    "tercero_id": tercero_id,
-                    "activo": 1,
-                    "origen": "a3",
-                    "creado_en_gest2a3eco": 0,
-                    "pendiente_alta_a3": 0,
-                }
-            gestor.upsert_maestro_subcuenta(registro)
-            if tercero_id:
-                self._asignar_subcuenta_a_relacion(gestor, codigo, tercero_id, registro)
-            if progress_callback and (indice == total or indice % 10 == 0):
-                progress_callback(indice, total)
+        gestor.cargar_plan_cuentas(codigo, int(ejercicio or 0), normalizadas)
+        self.cargar_subcuentas_a3(gestor, codigo, normalizadas, progress_callback=progress_callback)
         return len(normalizadas)
 
+    def cargar_subcuentas_a3(
+        self,
+        gestor,
+        codigo_empresa: str,
+        cuentas: list[dict],
+        progress_callback=None,
+        tamano_bloque: int = TAMANO_BLOQUE_CARGA,
+    ) -> dict:
+        """Vuelca en el maestro las cuentas leidas de A3 por bloques.
+
+        Cada cuenta se vincula al tercero con su NIF o, si no lo tiene, al
+        unico tercero con el mismo nombre. ``progress_callback(hechas, total)``
+        se llama tras cada bloque. Devuelve los recuentos acumulados de
+        ``cargar_maestro_subcuentas``.
+        """
+        por_nif, por_nombre = _indices_terceros(gestor)
+        registros: list[dict] = []
+        for item in cuentas or []:
+            subcuenta = str(item.get("cuenta") or "").strip()
+            if not subcuenta:
+                continue
+            descripcion = str(item.get("descripcion") or "").strip()
+            nif = normalizar_nif_cif(item.get("nif") or "") or None
+            tercero_id = por_nif.get(nif) if nif else None
+            if not tercero_id:
+                tercero_id = por_nombre.get(_normalizar_nombre_vinculo(descripcion))
+            registros.append({
+                "subcuenta": subcuenta,
+                "nombre_subcuenta": descripcion,
+                "tipo_subcuenta": clasificar_tipo_subcuenta(subcuenta),
+                "nif_snapshot": nif,
+                "tercero_id": tercero_id,
+                "activo": 1,
+                "origen": "a3",
+                "creado_en_gest2a3eco": 0,
+                "pendiente_alta_a3": 0,
+            })
+        recuento = {"insertadas": 0, "actualizadas": 0, "sin_cambios": 0}
+        total = len(registros)
+        paso = max(1, int(tamano_bloque or TAMANO_BLOQUE_CARGA))
+        for inicio in range(0, total, paso):
+            bloque = registros[inicio:inicio + paso]
+            parcial = gestor.cargar_maestro_subcuentas(codigo_empresa, bloque)
+            for clave in recuento:
+                recuento[clave] += int(parcial.get(clave) or 0)
+            for registro in bloque:
+                if registro["tercero_id"]:
+                    self._asignar_subcuenta_a_relacion(
+                        gestor, codigo_empresa, registro["tercero_id"], registro,
+                    )
+            if progress_callback:
+                progress_callback(inicio + len(bloque), total)
+        return recuento
+
     # ── Importacion desde DataFrame ───────────────────────────────────────────
 
     def importar_subcuentas_desde_dataframe(
@@ -425,6 +436,10 @@ class MaestroContableEmpresaService:
           actualizar_duplicados — True: sobreescribe existentes; False: las omite.
           progress_callback     — callable(idx, total) para actualizar progreso.
 
+        Las filas no validas se descartan antes de la carga y se informan una
+        a una en ``detalles_error``. ``actualizadas`` cuenta solo las
+        existentes que cambian; las que ya estaban igual van a ``omitidas``.
+
         Devuelve dict con: importadas, actualizadas, omitidas, errores, detalles_error.
         """
         col_map = {_normalize_colname(c): c for c in df.columns}
@@ -439,58 +454,55 @@ class MaestroContableEmpresaService:
         detalles_error: list[str] = []
         filas = list(df.iterrows())
         total = len(filas)
+        por_nif, _por_nombre = _indices_terceros(gestor)
 
+        payloads: dict[str, dict] = {}
         for idx, (_, row) in enumerate(filas):
-            if progress_callback:
+            if progress_callback and idx % 500 == 0:
                 try:
                     progress_callback(idx, total)
                 except Exception:
                     pass
-            subcuenta = _normalizar_codigo_subcuenta(row.get(col_sub))
-            if not subcuenta:
-                continue
+            raw_sub = row.get(col_sub)
+            subcuenta = _normalizar_codigo_subcuenta(raw_sub)
             descripcion = str(row.get(col_desc, "") or "") if col_desc else ""
             nif_raw     = str(row.get(col_nif, "") or "") if col_nif else ""
             if nif_raw.strip().lower() in ("nan", "none", "null"):
                 nif_raw = ""
+            motivo = _motivo_fila_no_valida(raw_sub, subcuenta, descripcion, nif_raw)
+            if motivo:
+                errores += 1
+                detalles_error.append(f"Fila {idx + 1} ({str(raw_sub).strip()}): {motivo}")
+                continue
+            if not subcuenta:
+                continue
+            nif_snapshot = normalizar_nif_cif(nif_raw) or None
+            # La ultima fila de una subcuenta repetida es la que se guarda
+            payloads[subcuenta] = {
+                "subcuenta":            subcuenta,
+                "nombre_subcuenta":     descripcion,
+                "tipo_subcuenta":       clasificar_tipo_subcuenta(subcuenta),
+                "nif_snapshot":         nif_snapshot,
+                "tercero_id":           por_nif.get(nif_snapshot) if nif_snapshot else None,
+                "origen":               origen,
+                "creado_en_gest2a3eco": 0,
+                "pendiente_alta_a3":    0,
+            }
+
+        if payloads:
             try:
-                existente = gestor.get_maestro_subcuenta_por_subcuenta(
-                    codigo_empresa, subcuenta
+                recuento = gestor.cargar_maestro_subcuentas(
+                    codigo_empresa, list(payloads.values()),
+                    actualizar=actualizar_duplicados,
                 )
-                if existente and not actualizar_duplicados:
-                    omitidas += 1
-                    continue
-                nif_snapshot = normalizar_nif_cif(nif_raw) or None
-                # Buscar tercero vinculado por NIF normalizado
-                tercero_id = None
-                if nif_snapshot:
-                    try:
-                        ter = gestor.get_tercero_by_nif_normalizado(nif_snapshot)
-                        if ter:
-                            tercero_id = str(ter.get("id") or "").strip() or None
-                    except Exception:
-                        pass
-                payload = {
-                    "codigo_empresa":       codigo_empresa,
-                    "subcuenta":            subcuenta,
-                    "nombre_subcuenta":     descripcion,
-                    "tipo_subcuenta":       clasificar_tipo_subcuenta(subcuenta),
-                    "nif_snapshot":         nif_snapshot,
-                    "tercero_id":           tercero_id,
-                    "origen":               origen,
-                    "creado_en_gest2a3eco": 0,
-                    "pendiente_alta_a3":    0,
-                }
-                gestor.upsert_maestro_subcuenta(payload)
-                if tercero_id:
-                    vinculadas += 1
-                if existente:
-                    actualizadas += 1
-                else:
-                    importadas += 1
             except Exception as exc:
-                errores += 1
-                detalles_error.append(f"{subcuenta}: {exc}")
+                errores += len(payloads)
+                detalles_error.append(f"Carga de {len(payloads)} subcuentas: {exc}")
+            else:
+                importadas = recuento["insertadas"]
+                actualizadas = recuento["actualizadas"]
+                omitidas = len(payloads) - importadas - actualizadas
+                vinculadas = sum(1 for p in payloads.values() if p["tercero_id"])
 
         # Notificar progreso final
         if progress_callback:
@@ -530,6 +542,26 @@ def _normalize_colname(s: str) -> str:
     return ascii_s.lower().strip().replace(".", "")
 
 
+def _indices_terceros(gestor) -> tuple[dict[str, str], dict[str, str]]:
+    """Terceros por NIF normalizado y por nombre, leidos en una sola consulta.
+
+    Un nombre compartido por varios terceros no se usa para vincular.
+    """
+    por_nif: dict[str, str] = {}
+    por_nombre: dict[str, str | None] = {}
+    for tercero in gestor.listar_terceros() or []:
+        tercero_id = str(tercero.get("id") or "").strip()
+        if not tercero_id:
+            continue
+        nif = str(tercero.get("nif_normalizado") or "").strip().upper()
+        if nif:
+            por_nif.setdefault(nif, tercero_id)
+        nombre = _normalizar_nombre_vinculo(tercero.get("nombre") or tercero.get("nombre_legal"))
+        if nombre:
+            por_nombre[nombre] = tercero_id if nombre not in por_nombre else None
+    return por_nif, {k: v for k, v in por_nombre.items() if v}
+
+
 def _normalizar_nombre_vinculo(valor) -> str:
     """Clave conservadora para cruzar descripciones A3 con el maestro global."""
     nfkd = unicodedata.normalize("NFKD", str(valor or ""))
@@ -537,8 +569,23 @@ def _normalizar_nombre_vinculo(valor) -> str:
     return "".join(ch for ch in ascii_s if ch.isalnum())
 
 
-def _es_del_prefijo(val: str, prefijo: str, ndig: int) -> bool:
-    return val.startswith(prefijo) and val.isdigit() and len(val) == ndig
+def _motivo_fila_no_valida(raw_sub, subcuenta: str, descripcion: str, nif: str) -> str:
+    """Motivo por el que una fila importada no puede cargarse, o "" si es valida.
+
+    Una fila sin codigo no es un error: se ignora como hasta ahora.
+    """
+    texto = "" if raw_sub is None else str(raw_sub).strip()
+    if texto.lower() in ("", "nan", "none", "null"):
+        return ""
+    if any(ch.isalpha() for ch in texto):
+        return "el codigo de subcuenta no es numerico"
+    if not subcuenta:
+        return "el codigo de subcuenta no tiene digitos"
+    if len(subcuenta) > MAX_DIGITOS_SUBCUENTA:
+        return f"el codigo de subcuenta supera {MAX_DIGITOS_SUBCUENTA} digitos"
+    if "\x00" in descripcion or "\x00" in nif:
+        return "contiene caracteres no validos"
+    return ""
 
 
 def _normalizar_codigo_subcuenta(raw) -> str:
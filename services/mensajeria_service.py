@@ -9,8 +9,7 @@ import uuid
 from dataclasses import dataclass, field
 from pathlib import Path
 
-import requests
-
+from services.backend_http import sesion_backend
 from utils.utilidades import get_document_repository_dir, load_app_config, save_app_config
 
 
@@ -44,7 +43,7 @@ class MensajeriaRemoteClient:
         )
         self.user_id = str(user_id)
         self.user_name = str(user_name or user_id)
-        self.http = session or requests.Session()
+        self.http = session or sesion_backend()
 
     @property
     def configured(self) -> bool:
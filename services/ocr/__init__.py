@@ -6,6 +6,8 @@ Jerarquia:
   services/ocr/base.py             — interfaz abstracta de motor OCR
   services/ocr/invoice_interpreter.py — extraccion de campos desde texto libre
   services/ocr/ocr_service.py      — orquestador con gestion de BD
+  services/ocr/cola_ocr.py         — cola persistente y trabajadores en segundo plano
+  services/ocr/cache_ocr.py        — cache de resultados de motores por hash de fichero
   services/ocr/engines/            — implementaciones concretas de motores
 
 Este paquete es el unico nucleo OCR activo.  La proyeccion hacia
@@ -19,7 +21,9 @@ from services.ocr.types import (
     OcrDocumentState,
 )
 from services.ocr.base import OcrEngineBase
+from services.ocr.cache_ocr import CacheOcr
 from services.ocr.ocr_service import OcrService
+from services.ocr.cola_ocr import ColaOcr
 from services.ocr.aprendizaje_service import AprendizajeOcrService
 
 __all__ = [
@@ -29,6 +33,8 @@ __all__ = [
     "OcrField",
     "OcrDocumentState",
     "OcrEngineBase",
+    "CacheOcr",
     "OcrService",
+    "ColaOcr",
     "AprendizajeOcrService",
 ]
@@ -47,8 +47,27 @@ class OcrEngineBase(ABC):
           la lista errores rellena.  Nunca lanza excepcion.
         """
 
+    # ── Cache de resultados ───────────────────────────────────────────────────
+
+    @property
+    def version(self) -> str:
+        """Version de la salida del motor; cambiarla invalida la cache OCR."""
+        return "1"
+
+    def desde_cache(self, datos: dict) -> OcrInvoiceResult:
+        """Reconstruye un resultado guardado en la cache OCR."""
+        return OcrInvoiceResult.from_dict(datos)
+
     # ── Utilidades para subclases ─────────────────────────────────────────────
 
+    def _interpretar(self, texto: str, confianza: float) -> OcrInvoiceResult:
+        """Interpreta el texto extraido con las reglas actuales de facturas."""
+        from services.ocr.invoice_interpreter import InvoiceInterpreter
+        result = InvoiceInterpreter().interpretar(texto)
+        result.motor = self.nombre
+        result.confianza = confianza
+        return result
+
     def _error_result(self, mensaje: str) -> OcrInvoiceResult:
         """Crea un OcrInvoiceResult de error con el motor identificado."""
         logger.warning("[%s] %s", self.nombre, mensaje)
@@ -0,0 +1,111 @@
+"""
+CacheOcr — salida de los motores OCR guardada por contenido del fichero.
+
+La clave es (sha256 del fichero, motor, version del motor). Reprocesar un
+documento o reclasificarlo entre emitidas y recibidas reutiliza la lectura
+anterior en vez de repetir la llamada al backend (Azure) o a Tesseract. Los
+motores de texto reinterpretan el texto guardado, asi que una correccion de
+InvoiceInterpreter se aplica sin volver a leer el fichero.
+
+La tabla ocr_cache_resultados es comun a todos los puestos y se poda por
+tamaño: se descarta primero lo que lleva mas tiempo sin usarse. Un fallo de
+la cache nunca impide el OCR; solo se pierde el atajo.
+"""
+from __future__ import annotations
+
+import contextlib
+import json
+import logging
+import threading
+
+from services.ocr.types import OcrInvoiceResult
+
+logger = logging.getLogger(__name__)
+
+MAX_BYTES_DEFECTO = 256 * 1024 * 1024
+# Cada cuantas escrituras del proceso se comprueba el tamaño de la cache.
+_PODA_CADA = 50
+
+
+class CacheOcr:
+    """
+    Cache persistente de resultados por motor.
+
+    Parametros:
+      gestor    — gestor principal de datos
+      max_bytes — tamaño maximo de la cache antes de podar
+      lock      — cerrojo de la conexion si el gestor se comparte entre hilos
+    """
+
+    _lock_contadores = threading.Lock()
+    _contadores = {"aciertos": 0, "fallos": 0, "guardados": 0, "podados": 0}
+
+    def __init__(self, gestor, max_bytes: int = MAX_BYTES_DEFECTO, lock=None):
+        self._gestor = gestor
+        self._max_bytes = max(0, int(max_bytes))
+        self._lock = lock or contextlib.nullcontext()
+
+    def obtener(self, hash_archivo: str, motor) -> OcrInvoiceResult | None:
+        """Resultado guardado de ``motor`` para el fichero, o None."""
+        try:
+            with self._lock:
+                guardado = self._gestor.get_cache_ocr(hash_archivo, motor.nombre, motor.version)
+            resultado = motor.desde_cache(json.loads(guardado)) if guardado else None
+        except Exception as exc:
+            logger.debug("[CacheOcr] No se pudo leer la cache: %s", exc)
+            resultado = None
+        self._contar("aciertos" if resultado is not None else "fallos")
+        return resultado
+
+    def guardar(self, hash_archivo: str, motor, resultado: OcrInvoiceResult) -> None:
+        """Guarda la salida del motor salvo que sea un fallo sin texto
+        (backend caido, PDF sin capa de texto...), que debe reintentarse."""
+        if not (resultado.texto or "").strip() and resultado.errores:
+            return
+        try:
+            with self._lock:
+                self._gestor.guardar_cache_ocr(
+                    hash_archivo, motor.nombre, motor.version,
+                    json.dumps(resultado.to_dict(), ensure_ascii=False),
+                )
+        except Exception as exc:
+            logger.debug("[CacheOcr] No se pudo guardar en la cache: %s", exc)
+            return
+        if self._contar("guardados") % _PODA_CADA == 0:
+            self.podar()
+
+    def podar(self) -> int:
+        try:
+            with self._lock:
+                borrados = self._gestor.podar_cache_ocr(self._max_bytes)
+        except Exception as exc:
+            logger.warning("[CacheOcr] No se pudo podar la cache: %s", exc)
+            return 0
+        if borrados:
+            logger.info("[CacheOcr] %s resultado(s) descartados por tamaño.", borrados)
+            with self._lock_contadores:
+                self._contadores["podados"] += borrados
+        return borrados
+
+    def estadisticas(self) -> dict:
+        """Aciertos y fallos de este proceso mas el estado de la tabla."""
+        with self._lock_contadores:
+            datos = dict(self._contadores)
+        consultas = datos["aciertos"] + datos["fallos"]
+        datos["tasa_aciertos"] = round(datos["aciertos"] / consultas, 3) if consultas else 0.0
+        try:
+            with self._lock:
+                tabla = self._gestor.estadisticas_cache_ocr()
+        except Exception as exc:
+            logger.debug("[CacheOcr] Sin estadisticas de la tabla: %s", exc)
+            tabla = {}
+        datos["entradas"] = tabla.get("entradas", 0)
+        datos["bytes"] = tabla.get("bytes", 0)
+        datos["aciertos_totales"] = tabla.get("aciertos", 0)
+        return datos
+
+    @classmethod
+    def _contar(cls, clave: str) -> int:
+        with cls._lock_contadores:
+            cls._contadores[clave] += 1
+            return cls._contadores[clave]
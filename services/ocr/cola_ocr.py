@@ -0,0 +1,244 @@
+"""
+ColaOcr — trabajadores OCR en segundo plano sobre documentos_ocr.
+
+Cada trabajo es una fila de documentos_ocr en estado ``en_cola``. Los
+trabajadores la reclaman con ``FOR UPDATE SKIP LOCKED``, analizan el fichero
+en paralelo y guardan el resultado. La cola sobrevive a reinicios: lo que un
+puesto dejo en ``procesando`` vuelve a la cola pasado ``bloqueo_max_s``, salvo
+que ya haya agotado sus intentos.
+
+Una cola creada con ``empresa_id`` solo atiende los documentos de esa empresa,
+que es lo que hace cada pantalla con la empresa abierta.
+
+Con el backend OCR disponible cada trabajador reclama varios documentos y
+los envia en una sola peticion de lote (``OcrService.analizar_lote``); lo que
+el lote no resuelve se pide documento a documento.
+
+Un fallo inesperado (backend caido, red, BD) se reintenta con espera
+exponencial; un documento ilegible no es un fallo, queda en ``error`` como
+en el procesamiento directo.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import uuid
+from pathlib import Path
+from typing import Callable, Optional
+
+from services.ocr.cache_ocr import CacheOcr
+from services.ocr.ocr_service import OcrService
+from services.ocr.types import OcrInvoiceResult
+
+logger = logging.getLogger(__name__)
+
+MAX_TRABAJADORES_DEFECTO = 4
+MAX_INTENTOS_DEFECTO = 3
+TAMANO_LOTE_DEFECTO = 10
+ESPERA_BASE_S = 30.0
+BLOQUEO_MAX_S = 15 * 60
+
+
+def espera_reintento(intento: int, base: float = ESPERA_BASE_S) -> float:
+    """Espera exponencial con +-20 % de dispersion para no sincronizar puestos."""
+    return base * (2 ** max(0, int(intento) - 1)) * random.uniform(0.8, 1.2)
+
+
+class ColaOcr:
+    """
+    Grupo de trabajadores que vacia la cola OCR de la base de datos.
+
+    El analisis (motores OCR) corre en paralelo; los accesos al gestor se
+    serializan con un cerrojo porque la conexion es compartida.
+
+    Parametros:
+      gestor           — gestor principal de datos
+      empresa_id       — empresa cuyos documentos se atienden (None: todas)
+      max_trabajadores — hilos que analizan documentos a la vez
+      max_intentos     — fallos tolerados antes de marcar ``error``
+      tamano_lote      — documentos por reclamacion cuando el backend admite
+                         lotes (sin backend se reclaman de uno en uno para
+                         repartirlos entre los hilos)
+      on_resultado     — callback(dict) con la respuesta de cada documento,
+                         invocado desde el hilo trabajador
+    """
+
+    def __init__(
+        self,
+        gestor,
+        empresa_id: str | None = None,
+        max_trabajadores: int = MAX_TRABAJADORES_DEFECTO,
+        max_intentos: int = MAX_INTENTOS_DEFECTO,
+        on_resultado: Optional[Callable[[dict], None]] = None,
+        bloqueo_max_s: float = BLOQUEO_MAX_S,
+        espera_base_s: float = ESPERA_BASE_S,
+        tamano_lote: int = TAMANO_LOTE_DEFECTO,
+    ):
+        self._gestor = gestor
+        self._empresa_id = str(empresa_id) if empresa_id else None
+        self._max_trabajadores = max(1, int(max_trabajadores))
+        self._max_intentos = max(1, int(max_intentos))
+        self._on_resultado = on_resultado
+        self._bloqueo_max_s = bloqueo_max_s
+        self._espera_base_s = espera_base_s
+        self._tamano_lote = max(1, int(tamano_lote))
+        self._con_lotes = False
+        self._id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock_bd = threading.Lock()
+        self._cache = CacheOcr(gestor, lock=self._lock_bd)
+        self._local = threading.local()
+
+    # ── Ejecucion ─────────────────────────────────────────────────────────────
+
+    def procesar_pendientes(self) -> int:
+        """Vacia la cola con el grupo de trabajadores y vuelve al terminar.
+
+        Los documentos que esperan un reintento se dejan para la siguiente
+        pasada. Devuelve el numero de documentos atendidos.
+        """
+        self.recuperar_bloqueados()
+        contador = [0]
+        lock = threading.Lock()
+
+        def _trabajador():
+            while True:
+                try:
+                    docs = self._reclamar()
+                except Exception as exc:
+                    # Lo reclamado antes del fallo lo recupera la siguiente
+                    # pasada cuando caduque su bloqueo.
+                    logger.warning("[ColaOcr] No se pudo leer la cola: %s", exc)
+                    return
+                if not docs:
+                    return
+                self._procesar_lote(docs)
+                with lock:
+                    contador[0] += len(docs)
+
+        hilos = [
+            threading.Thread(target=_trabajador, name=f"ocr-cola-{i + 1}", daemon=True)
+            for i in range(self._max_trabajadores)
+        ]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        return contador[0]
+
+    def recuperar_bloqueados(self) -> int:
+        with self._lock_bd:
+            recuperados = self._gestor.recuperar_documentos_ocr_bloqueados(
+                self._bloqueo_max_s, self._max_intentos, self._empresa_id,
+            )
+        if recuperados:
+            logger.info("[ColaOcr] %s documento(s) devueltos a la cola.", recuperados)
+        return recuperados
+
+    # ── Trabajadores ──────────────────────────────────────────────────────────
+
+    def _reclamar(self) -> list[dict]:
+        limite = self._tamano_lote if self._con_lotes else 1
+        with self._lock_bd:
+            return list(self._gestor.reclamar_documentos_ocr_en_cola(self._id, limite, self._empresa_id))
+
+    def _procesar_lote(self, docs: list[dict]) -> None:
+        """Analiza juntos los documentos de un mismo servicio y guarda cada
+        uno por separado. Si el lote falla, cada documento se analiza solo."""
+        grupos: dict[int, tuple[OcrService, list[dict]]] = {}
+        for doc in docs:
+            try:
+                svc = self._servicio_para(doc)
+            except Exception:
+                # _procesar lo reintenta y, si vuelve a fallar, lo reprograma.
+                self._procesar(doc)
+                continue
+            grupos.setdefault(id(svc), (svc, []))[1].append(doc)
+        for svc, grupo in grupos.values():
+            lecturas = {}
+            if len(grupo) > 1:
+                existentes = [d for d in grupo if Path(str(d.get("ruta_original") or "")).is_file()]
+                try:
+                    resultados = svc.analizar_lote(
+                        [Path(str(d["ruta_original"])) for d in existentes],
+                        [d.get("hash_archivo") for d in existentes],
+                    )
+                    lecturas = {str(d["id"]): r for d, r in zip(existentes, resultados)}
+                except Exception as exc:
+                    logger.warning("[ColaOcr] Lote fallido, se analiza documento a documento: %s", exc)
+            for doc in grupo:
+                self._procesar(doc, lecturas.get(str(doc["id"])))
+
+    def _procesar(self, doc: dict, result: OcrInvoiceResult | None = None) -> None:
+        doc_id = str(doc["id"])
+        try:
+            svc = self._servicio_para(doc)
+            if result is None:
+                path = Path(str(doc.get("ruta_original") or ""))
+                if not path.is_file():
+                    raise FileNotFoundError(f"Fichero original no encontrado: {path}")
+                result = svc.analizar_archivo(path)
+            with self._lock_bd:
+                respuesta = svc.guardar_resultado(doc, result)
+                self._gestor.liberar_documento_ocr_en_cola(doc_id)
+        except Exception as exc:
+            intento = int(doc.get("cola_intentos") or 1)
+            logger.warning("[ColaOcr] Intento %s de %s fallido: %s", intento, doc_id, exc)
+            try:
+                with self._lock_bd:
+                    estado = self._gestor.reprogramar_documento_ocr(
+                        doc_id, str(exc), self._max_intentos,
+                        espera_reintento(intento, self._espera_base_s),
+                    )
+            except Exception as exc_bd:
+                # Si ni siquiera se puede reprogramar, la recuperacion por
+                # bloqueo caducado lo devolvera a la cola.
+                logger.warning("[ColaOcr] No se pudo reprogramar %s: %s", doc_id, exc_bd)
+                estado = "procesando"
+            respuesta = {
+                "documento_id": doc_id,
+                "factura_id":   None,
+                "estado":       estado,
+                "resultado":    {},
+                "errores":      [str(exc)],
+            }
+        if self._on_resultado:
+            try:
+                self._on_resultado(respuesta)
+            except Exception as exc:
+                logger.warning("[ColaOcr] No se pudo notificar el resultado: %s", exc)
+
+    def _servicio_para(self, doc: dict) -> OcrService:
+        """OcrService por hilo y combinacion de opciones.
+
+        Construir la cadena de motores consulta el backend y Tesseract, asi
+        que cada trabajador reutiliza sus servicios entre documentos.
+        """
+        try:
+            opciones = json.loads(doc.get("cola_opciones_json") or "{}")
+        except (TypeError, ValueError):
+            opciones = {}
+        clave = (
+            str(doc.get("empresa_id") or ""),
+            int(opciones.get("ejercicio") or 0),
+            str(opciones.get("usuario") or ""),
+            str(doc.get("tipo_documento") or "factura_recibida"),
+            str(opciones.get("fecha_contable") or ""),
+        )
+        cache = getattr(self._local, "servicios", None)
+        if cache is None:
+            cache = self._local.servicios = {}
+        svc = cache.get(clave)
+        if svc is None:
+            svc = OcrService(
+                self._gestor, clave[0], clave[1], usuario=clave[2],
+                tipo_documento=clave[3], fecha_contable=clave[4],
+                cache_ocr=self._cache,
+            )
+            cache[clave] = svc
+            if getattr(svc, "admite_lotes", False):
+                self._con_lotes = True
+        return svc
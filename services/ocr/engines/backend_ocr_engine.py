@@ -4,15 +4,29 @@ Motor OCR: proxy hacia el backend Gest2A3Eco (Azure Document Intelligence).
 Cuando el backend esta configurado (integrations_api_url), el escritorio
 delega el OCR al backend en lugar de llamar a Azure directamente.
 Las credenciales Azure residen exclusivamente en el backend.
+
+Las llamadas usan la sesion HTTP compartida (services.backend_http), de modo
+que los documentos sucesivos reutilizan la conexion TLS. ``extraer_lote``
+envia muchos ficheros en una peticion y recibe cada resultado en cuanto
+Azure lo termina.
 """
 from __future__ import annotations
+import json
 import logging
+import time
+from contextlib import ExitStack
 from pathlib import Path
+from typing import Callable, Optional
+from services.backend_http import sesion_backend
 from services.ocr.base import OcrEngineBase
 from services.ocr.types import OcrInvoiceResult
 
 logger = logging.getLogger(__name__)
 
+# Debe coincidir con MAX_FICHEROS_LOTE del backend.
+MAX_FICHEROS_LOTE = 50
+INTERVALO_SONDEO_S = 1.5
+
 
 class BackendOcrEngine(OcrEngineBase):
     """Motor OCR que delega en el backend FastAPI."""
@@ -33,10 +47,9 @@ class BackendOcrEngine(OcrEngineBase):
         if self._disponible is not None:
             return self._disponible
         try:
-            import requests
-            resp = requests.get(
+            resp = sesion_backend().get(
                 f"{self._base_url}/api/v1/integrations/status",
-                headers={"X-API-Key": self._api_key},
+                headers=self._cabeceras(),
                 timeout=10,
             )
             data = resp.json() if resp.status_code == 200 else {}
@@ -49,20 +62,148 @@ class BackendOcrEngine(OcrEngineBase):
         if not path.exists():
             return self._error_result(f"Fichero no encontrado: {path}")
         try:
-            import requests
             with path.open("rb") as fh:
-                resp = requests.post(
+                resp = sesion_backend().post(
                     f"{self._base_url}/api/v1/ocr/invoices/analyze",
-                    headers={"X-API-Key": self._api_key},
+                    headers=self._cabeceras(),
                     files={"file": (path.name, fh)},
                     timeout=self._timeout,
                 )
             if resp.status_code >= 400:
-                try:
-                    detail = resp.json().get("detail", resp.text)
-                except Exception:
-                    detail = resp.text
-                return self._error_result(f"Backend OCR error {resp.status_code}: {detail}")
+                return self._error_result(
+                    f"Backend OCR error {resp.status_code}: {self._detalle(resp)}"
+                )
             return OcrInvoiceResult.from_dict(resp.json())
         except Exception as exc:
             return self._error_result(f"Error llamando al backend OCR: {exc}")
+
+    def extraer_lote(
+        self,
+        paths: list[Path],
+        on_resultado: Optional[Callable[[Path, OcrInvoiceResult], None]] = None,
+        flujo: bool = True,
+    ) -> list[OcrInvoiceResult]:
+        """
+        Analiza varios ficheros con los lotes del backend.
+
+        Los resultados se devuelven en el orden de ``paths``; ``on_resultado``
+        se invoca en cuanto cada uno termina. Con ``flujo`` los resultados se
+        reciben por NDJSON; si no, o si el flujo se corta, se consulta el
+        estado del lote. Un backend sin lotes se atiende fichero a fichero.
+        Nunca lanza excepcion.
+        """
+        paths = [Path(p) for p in paths]
+        resultados: list[OcrInvoiceResult | None] = [None] * len(paths)
+
+        def _entregar(indice: int, resultado: OcrInvoiceResult) -> None:
+            resultados[indice] = resultado
+            if on_resultado:
+                try:
+                    on_resultado(paths[indice], resultado)
+                except Exception as exc:
+                    logger.warning("[%s] No se pudo notificar el resultado: %s", self.nombre, exc)
+
+        pendientes = []
+        for indice, path in enumerate(paths):
+            if path.exists():
+                pendientes.append(indice)
+            else:
+                _entregar(indice, self._error_result(f"Fichero no encontrado: {path}"))
+
+        for inicio in range(0, len(pendientes), MAX_FICHEROS_LOTE):
+            grupo = pendientes[inicio:inicio + MAX_FICHEROS_LOTE]
+            try:
+                self._procesar_lote([paths[i] for i in grupo], grupo, _entregar, flujo)
+            except _LoteNoSoportado:
+                for indice in grupo:
+                    if resultados[indice] is None:
+                        _entregar(indice, self.extraer(paths[indice]))
+            except Exception as exc:
+                for indice in grupo:
+                    if resultados[indice] is None:
+                        _entregar(indice, self._error_result(
+                            f"Error llamando al backend OCR: {exc}"
+                        ))
+        return resultados  # type: ignore[return-value]
+
+    # ── Lotes ─────────────────────────────────────────────────────────────────
+
+    def _procesar_lote(self, paths, indices, entregar, flujo: bool) -> None:
+        url = f"{self._base_url}/api/v1/ocr/invoices/batch"
+        with ExitStack() as pila:
+            ficheros = [
+                ("files", (path.name, pila.enter_context(path.open("rb"))))
+                for path in paths
+            ]
+            resp = sesion_backend().post(url, headers=self._cabeceras(), files=ficheros, timeout=self._timeout)
+        if resp.status_code in (404, 405):
+            raise _LoteNoSoportado()
+        if resp.status_code >= 400:
+            raise RuntimeError(f"Backend OCR error {resp.status_code}: {self._detalle(resp)}")
+        job_id = resp.json()["job_id"]
+        recibidos: set[int] = set()
+
+        def _recibir(item: dict) -> None:
+            posicion = int(item["indice"])
+            if posicion in recibidos or not 0 <= posicion < len(indices):
+                return
+            recibidos.add(posicion)
+            if item.get("estado") == "ok":
+                resultado = OcrInvoiceResult.from_dict(item.get("resultado") or {})
+            else:
+                resultado = self._error_result(
+                    f"Backend OCR: {item.get('error') or 'analisis fallido'}"
+                )
+            entregar(indices[posicion], resultado)
+
+        if flujo:
+            try:
+                self._leer_flujo(f"{url}/{job_id}/stream", _recibir)
+            except Exception as exc:
+                logger.info("[%s] Flujo del lote interrumpido, se consulta: %s", self.nombre, exc)
+        if len(recibidos) < len(indices):
+            self._sondear(f"{url}/{job_id}", _recibir, len(recibidos))
+
+    def _leer_flujo(self, url: str, recibir) -> None:
+        with sesion_backend().get(url, headers=self._cabeceras(), stream=True,
+                           timeout=(10, self._timeout)) as resp:
+            resp.raise_for_status()
+            for linea in resp.iter_lines():
+                if not linea:
+                    continue
+                item = json.loads(linea)
+                if "indice" in item:
+                    recibir(item)
+
+    def _sondear(self, url: str, recibir, desde: int) -> None:
+        limite = time.monotonic() + self._timeout * 5
+        while True:
+            resp = sesion_backend().get(url, headers=self._cabeceras(),
+                                 params={"desde": desde}, timeout=self._timeout)
+            if resp.status_code >= 400:
+                raise RuntimeError(f"Backend OCR error {resp.status_code}: {self._detalle(resp)}")
+            estado = resp.json()
+            for item in estado.get("resultados") or []:
+                recibir(item)
+            desde = int(estado.get("completados") or desde)
+            if estado.get("terminado"):
+                return
+            if time.monotonic() >= limite:
+                raise TimeoutError("el lote OCR no termino a tiempo")
+            time.sleep(INTERVALO_SONDEO_S)
+
+    # ── Utilidades ────────────────────────────────────────────────────────────
+
+    def _cabeceras(self) -> dict:
+        return {"X-API-Key": self._api_key}
+
+    @staticmethod
+    def _detalle(resp) -> str:
+        try:
+            return resp.json().get("detail", resp.text)
+        except Exception:
+            return resp.text
+
+
+class _LoteNoSoportado(Exception):
+    """El backend es anterior a los lotes OCR."""
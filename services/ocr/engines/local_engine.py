@@ -7,10 +7,19 @@ Requisitos:
 
 Si Tesseract no esta disponible, disponible() devuelve False sin error.
 Activacion: instalar tesseract y pip install pytesseract.
+
+Las paginas de un PDF se reconocen en paralelo. pytesseract lanza un proceso
+tesseract por llamada, asi que basta un pool de hilos para ocupar todos los
+nucleos; el renderizado con pymupdf (que no admite hilos) se hace en el hilo
+que llama y se solapa con el OCR de las paginas anteriores.
 """
 from __future__ import annotations
 
 import logging
+import os
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from services.ocr.base import OcrEngineBase
@@ -22,6 +31,8 @@ logger = logging.getLogger(__name__)
 _LANG = "spa+eng"
 # Resolucion de renderizado PDF → imagen (DPI)
 _PDF_DPI_SCALE = 2.0
+# Paginas reconocidas a la vez (un proceso tesseract por pagina)
+_MAX_PAGINAS_PARALELO = max(1, min(8, os.cpu_count() or 1))
 
 
 class LocalOcrEngine(OcrEngineBase):
@@ -32,8 +43,9 @@ class LocalOcrEngine(OcrEngineBase):
     (PNG, JPG, TIFF).
     """
 
-    def __init__(self, lang: str = _LANG):
+    def __init__(self, lang: str = _LANG, max_paginas_paralelo: int = _MAX_PAGINAS_PARALELO):
         self._lang = lang
+        self._max_paginas_paralelo = max(1, int(max_paginas_paralelo))
 
     @property
     def nombre(self) -> str:
@@ -52,63 +64,152 @@ class LocalOcrEngine(OcrEngineBase):
             return self._error_result(f"Fichero no encontrado: {path}")
 
         if self._es_pdf(path):
-            texto = self._pdf_to_text(path)
+            texto, confianza = self._pdf_to_text(path)
         elif self._es_imagen(path):
-            texto = self._imagen_to_text(path)
+            texto, confianza = self._imagen_to_text(path)
         else:
             return self._error_result(f"Tipo de fichero no soportado: {path.suffix}")
 
         if not texto:
             return self._error_result("Tesseract no extrajo texto del documento.")
 
-        from services.ocr.invoice_interpreter import InvoiceInterpreter
-        result = InvoiceInterpreter().interpretar(texto)
-        result.motor = self.nombre
-        result.confianza = self._calcular_confianza(path)
-        return result
+        return self._interpretar(texto, confianza)
+
+    @property
+    def version(self) -> str:
+        return f"2:{self._lang}:{_PDF_DPI_SCALE}"
+
+    def desde_cache(self, datos: dict) -> OcrInvoiceResult:
+        """Reinterpreta el texto guardado sin volver a ejecutar Tesseract."""
+        if not str(datos.get("texto") or "").strip():
+            return super().desde_cache(datos)
+        return self._interpretar(str(datos["texto"]), float(datos.get("confianza") or 0.0))
 
     # ── Backends de extraccion ────────────────────────────────────────────────
 
-    def _pdf_to_text(self, path: Path) -> str:
+    def _pdf_to_text(self, path: Path) -> tuple[str, float]:
         try:
             import fitz
-            import io
-            import pytesseract
             from PIL import Image as PilImage
 
             doc = fitz.open(str(path))
-            paginas = []
-            mat = fitz.Matrix(_PDF_DPI_SCALE, _PDF_DPI_SCALE)
-            for page in doc:
-                pix = page.get_pixmap(matrix=mat)
-                img = PilImage.open(io.BytesIO(pix.tobytes("png")))
-                paginas.append(pytesseract.image_to_string(img, lang=self._lang))
-            doc.close()
-            return "\n".join(paginas).strip()
+            try:
+                mat = fitz.Matrix(_PDF_DPI_SCALE, _PDF_DPI_SCALE)
+                imagenes = (
+                    _pixmap_a_imagen(PilImage, page.get_pixmap(
+                        matrix=mat, colorspace=fitz.csGRAY, alpha=False,
+                    ))
+                    for page in doc
+                )
+                if len(doc) == 1 or self._max_paginas_paralelo == 1:
+                    paginas = [self._ocr_imagen(img) for img in imagenes]
+                else:
+                    # tesseract usa OpenMP: con varias paginas a la vez, un
+                    # hilo por proceso evita sobresuscribir los nucleos. El
+                    # limite va solo en el entorno de esos procesos.
+                    entorno = dict(os.environ, OMP_THREAD_LIMIT="1")
+                    with ThreadPoolExecutor(
+                        max_workers=min(self._max_paginas_paralelo, len(doc)),
+                        thread_name_prefix="tesseract",
+                    ) as pool:
+                        futuros = [pool.submit(self._ocr_imagen, img, entorno) for img in imagenes]
+                        paginas = [f.result() for f in futuros]
+            finally:
+                doc.close()
+            texto = "\n".join(t for t, _ in paginas).strip()
+            return texto, _confianza_media([c for _, confs in paginas for c in confs])
         except Exception as exc:
             logger.warning("[tesseract] Error al renderizar PDF: %s", exc)
-            return ""
+            return "", 0.0
 
-    def _imagen_to_text(self, path: Path) -> str:
+    def _imagen_to_text(self, path: Path) -> tuple[str, float]:
         try:
-            import pytesseract
             from PIL import Image as PilImage
-            img = PilImage.open(str(path))
-            return pytesseract.image_to_string(img, lang=self._lang).strip()
+            with PilImage.open(str(path)) as img:
+                texto, confs = self._ocr_imagen(img)
+            return texto.strip(), _confianza_media(confs)
         except Exception as exc:
             logger.warning("[tesseract] Error al procesar imagen: %s", exc)
-            return ""
+            return "", 0.0
 
-    def _calcular_confianza(self, path: Path) -> float:
-        """Confianza promedio de Tesseract (solo para imagenes; PDFs = 0.75)."""
-        if self._es_pdf(path):
-            return 0.75
-        try:
-            import pytesseract
-            from PIL import Image as PilImage
-            img = PilImage.open(str(path))
+    def _ocr_imagen(self, img, entorno: dict | None = None) -> tuple[str, list[float]]:
+        """Texto y confianzas por palabra con una sola ejecucion de tesseract.
+
+        pytesseract no deja indicar el entorno del proceso: con ``entorno``
+        se lanza tesseract directamente.
+        """
+        import pytesseract
+        if entorno is None:
             data = pytesseract.image_to_data(img, lang=self._lang, output_type=pytesseract.Output.DICT)
-            confs = [c for c in data.get("conf", []) if c != -1]
-            return round(sum(confs) / len(confs) / 100, 3) if confs else 0.0
-        except Exception:
-            return 0.0
+        else:
+            data = _tesseract_tsv(pytesseract.pytesseract.tesseract_cmd, img, self._lang, entorno)
+        return _texto_y_confianzas(data)
+
+
+def _pixmap_a_imagen(pil_image, pix):
+    """Pasa las muestras del pixmap a PIL sin codificar un PNG intermedio."""
+    modo = {1: "L", 3: "RGB", 4: "RGBA"}[pix.n]
+    return pil_image.frombytes(modo, (pix.width, pix.height), pix.samples)
+
+
+def _tesseract_tsv(comando: str, img, lang: str, entorno: dict) -> dict:
+    """Ejecuta tesseract con salida TSV y el entorno indicado.
+
+    Devuelve el mismo diccionario por columnas que ``image_to_data``.
+    """
+    with tempfile.TemporaryDirectory(prefix="tesseract_") as tmp:
+        entrada = os.path.join(tmp, "pagina.png")
+        img.save(entrada)
+        salida = subprocess.run(
+            [comando, entrada, "stdout", "-l", lang, "tsv"],
+            env=entorno,
+            capture_output=True,
+            check=True,
+            creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0),
+        ).stdout.decode("utf-8", "replace")
+    filas = [linea.split("\t") for linea in salida.splitlines() if linea]
+    if not filas:
+        return {}
+    cabecera = filas[0]
+    data: dict[str, list] = {col: [] for col in cabecera}
+    for fila in filas[1:]:
+        fila += [""] * (len(cabecera) - len(fila))
+        for col, valor in zip(cabecera, fila):
+            data[col].append(valor if col in ("text", "conf") else int(valor or 0))
+    return data
+
+
+def _texto_y_confianzas(data: dict) -> tuple[str, list[float]]:
+    """Reconstruye el texto de ``image_to_data`` con los saltos de linea y
+    parrafo que produciria ``image_to_string``."""
+    lineas: list[str] = []
+    confs: list[float] = []
+    actual: list[str] = []
+    clave_linea = clave_parrafo = None
+    for i, palabra in enumerate(data.get("text", [])):
+        palabra = str(palabra or "").strip()
+        if not palabra:
+            continue
+        parrafo = (data["block_num"][i], data["par_num"][i])
+        linea = parrafo + (data["line_num"][i],)
+        if linea != clave_linea:
+            if actual:
+                lineas.append(" ".join(actual))
+                actual = []
+            if clave_parrafo is not None and parrafo != clave_parrafo:
+                lineas.append("")
+            clave_linea, clave_parrafo = linea, parrafo
+        actual.append(palabra)
+        try:
+            conf = float(data["conf"][i])
+        except (TypeError, ValueError):
+            continue
+        if conf >= 0:
+            confs.append(conf)
+    if actual:
+        lineas.append(" ".join(actual))
+    return "\n".join(lineas), confs
+
+
+def _confianza_media(confs: list[float]) -> float:
+    return round(sum(confs) / len(confs) / 100, 3) if confs else 0.0
@@ -66,11 +66,14 @@ class PdfTextEngine(OcrEngineBase):
             )
 
         # Texto extraido: interpretar campos
-        from services.ocr.invoice_interpreter import InvoiceInterpreter
-        result = InvoiceInterpreter().interpretar(texto)
-        result.motor = self.nombre
-        result.confianza = 0.92
-        return result
+        return self._interpretar(texto, 0.92)
+
+    def desde_cache(self, datos: dict) -> OcrInvoiceResult:
+        """Reinterpreta el texto guardado: una mejora del interprete se
+        aplica sin volver a leer el PDF."""
+        if not str(datos.get("texto") or "").strip():
+            return super().desde_cache(datos)
+        return self._interpretar(str(datos["texto"]), float(datos.get("confianza") or 0.92))
 
     # ── Backends de extraccion ────────────────────────────────────────────────
 
@@ -12,10 +12,18 @@ Principios:
   - Sin dependencias de UI ni de base de datos.
   - Funciones puras testables de forma aislada.
   - Compatible con el contrato OcrInvoiceResult.
+
+Rendimiento:
+  Los patrones se compilan una vez al importar el modulo. Cada texto se
+  prepara una sola vez (_contexto): lineas normalizadas, version en
+  minusculas para descartar patrones cuya palabra clave no aparece e importes
+  compartidos entre detectores. Los detectores siguen recibiendo el texto, asi
+  que pueden llamarse sueltos.
 """
 from __future__ import annotations
 
 import re
+from functools import lru_cache
 from typing import Optional
 
 from services.ocr.types import OcrInvoiceResult, OcrVatLine, OcrRetentionLine
@@ -104,6 +112,148 @@ class InvoiceInterpreter:
         return errores
 
 
+# ── Patrones precompilados ────────────────────────────────────────────────────
+#
+# Cada patron de busqueda va acompañado de las palabras clave (en minusculas)
+# de las que necesita al menos una para poder coincidir. Si ninguna aparece en
+# el texto, el patron no se ejecuta. Una tupla vacia lo ejecuta siempre.
+
+_I = re.IGNORECASE
+
+_RE_NIF_ETIQUETA_FLEXIBLE = re.compile(
+    r"\b(?:CIF|NIF|N\.I\.F\.?|C\.I\.F\.?)\s*[:#\.]?\s*([A-Z0-9][A-Z0-9 ./-]{5,24})", _I,
+)
+_RE_NO_ALFANUM = re.compile(r"[^A-Z0-9]")
+_RE_CIF = re.compile(r"[A-Z]\d{7}[A-Z0-9]")
+_RE_NIF_PERSONA = re.compile(r"\d{8}[A-Z]")
+_RE_NIE = re.compile(r"[XYZ]\d{7}[A-Z]")
+_CLAVES_NIF = ("cif", "nif", "vat", "n.i.f", "c.i.f")
+_ETIQ = r"\b(?:CIF|NIF|VAT(?:[ \t]+(?:no\.?|number))?|N\.I\.F\.?|C\.I\.F\.)[ \t]*[:#\.]?[ \t]*"
+_PATRONES_NIF = (
+    (re.compile(_ETIQ + r"([A-Z]\d{7}[A-Z0-9])", _I), _CLAVES_NIF),    # CIF espanol con etiqueta
+    (re.compile(_ETIQ + r"(\d{8}[A-Z])", _I), _CLAVES_NIF),              # NIF persona fisica con etiqueta
+    (re.compile(_ETIQ + r"([XYZ]\d{7}[A-Z])", _I), _CLAVES_NIF),         # NIE con etiqueta
+    (re.compile(_ETIQ + r"([A-Z]{2}[A-Z0-9]{2,13})", _I), _CLAVES_NIF),  # VAT comunitario con etiqueta
+    (re.compile(r"\b([A-Z]\d{7}[A-Z0-9])\b", _I), ()),                   # CIF sin etiqueta
+    (re.compile(r"\b(\d{8}[A-Z])\b", _I), ()),                            # NIF persona fisica sin etiqueta
+    (re.compile(r"\b([XYZ]\d{7}[A-Z])\b", _I), ()),                       # NIE sin etiqueta
+)
+
+_SKIP_NOMBRE = frozenset({
+    "FACTURA", "INVOICE", "CIF", "NIF", "FECHA", "TOTAL", "BASE",
+    "IVA", "ALBARAN", "PRESUPUESTO", "PEDIDO", "NOTA", "RECIBO", "ABONO",
+    "ALBARÁN", "NÚMERO", "NUMERO", "PROVEEDOR", "CLIENTE", "PAGINA",
+    "PÁGINA", "REFER", "DESCRIPCION", "DESCRIPCIÓN", "CANTIDAD", "LOTE",
+    "PRECIO", "DTOS", "IMPORTE", "MERCANCIA", "MERCANCÍA",
+})
+_RE_CONTIENE_FECHA = re.compile(r"\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4}")
+_RE_SOLO_CIFRAS = re.compile(r"[\d\s\.,€$%\-/]+")
+
+_RE_CABECERA_FACTURA = re.compile(r"(?:Factura|Fra\.?|Invoice)\s*:", _I)
+_RE_CABECERA_FECHA = re.compile(r"(?:Fecha|Date)\s*:?", _I)
+_RE_FECHA_SUELTA = re.compile(r"\d{1,2}[/-]\d{1,2}[/-]\d{2,4}")
+_RE_VALOR_NUMERO = re.compile(r"[A-Z0-9][A-Z0-9 /.-]{1,39}", _I)
+_PATRONES_NUMERO_FACTURA = (
+    (re.compile(
+        r"\b(?:Factura|Fra\.?|Invoice)\s*(?:N[ºo°]?\.?|No\.?|Num\.?|#)?\s*[:#\-]?\s*([A-Z0-9][A-Z0-9\/\.\-]{1,39})", _I,
+    ), ("factura", "fra", "invoice")),
+    (re.compile(
+        r"\bN[ºo°]\s*(?:de\s+)?factura\s*[:#\-]?\s*([A-Z0-9][A-Z0-9\/\.\-]{1,39})", _I,
+    ), ("factura",)),
+    (re.compile(
+        r"\b(?:Numero\s+de\s+documento|Ref(?:erencia)?\.?)\s*[:#]?\s*([A-Z0-9][A-Z0-9\/\.\-]{1,39})", _I,
+    ), ("numero", "ref")),
+    (re.compile(
+        r"\b(?:Serie|REF\.?)\s*[:#]?\s*([A-Z0-9][A-Z0-9\/\.\-]{1,39})", _I,
+    ), ("serie", "ref")),
+)
+
+_FECHA = r"(\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4}|\d{4}[\/\-\.]\d{1,2}[\/\-\.]\d{1,2})"
+_PATRONES_FECHA = ((re.compile(
+    r"(?:Fecha\s+(?:de\s+)?(?:factura|emision|expedicion|emisi[oó]n)|"
+    r"Invoice\s+date|Date)\s*[:#\-]?\s*" + _FECHA, _I,
+), ("fecha", "date")),)
+_RE_FECHA_MES = re.compile(
+    r"(\d{1,2})\s+(?:de\s+)?(" + "|".join(MESES_ES.keys()) + r")\s+(?:de\s+)?(\d{4})", _I,
+)
+_RE_FECHA_NUMERICA = re.compile(r"\b(\d{1,2}[\/\-]\d{1,2}[\/\-]\d{4}|\d{4}[\/\-]\d{2}[\/\-]\d{2})\b")
+_PATRONES_VENCIMIENTO = ((re.compile(
+    r"(?:Vencimiento|Fecha\s+vencimiento|Due\s+date|Vto\.?)\s*[:#\-]?\s*" + _FECHA, _I,
+), ("vencimiento", "due", "vto")),)
+
+_PATRONES_TOTAL = (
+    (re.compile(r"\bTotal\s+(?:factura|importe|a\s+pagar)\b[^0-9]{0,80}([0-9][0-9\.,]*)", _I), ("total",)),
+    (re.compile(
+        r"\b(?:Total\s+(?:factura|importe|a\s+pagar)|Importe\s+total|TOTAL\s+FACTURA|TOTAL)\s*[:#\-]?\s*(?:EUR|€)?\s*([0-9][0-9\.,]*)", _I,
+    ), ("total",)),
+    (re.compile(
+        r"\b(?:Total\s+(?:factura|importe|a\s+pagar)|Importe\s+total|TOTAL\s+FACTURA|TOTAL)\s*[:#\-]?\s*([0-9][0-9\.,]*)\s*(?:EUR|€)?", _I,
+    ), ("total",)),
+)
+
+_RE_IVA_VERTICAL = re.compile(
+    r"I\.?V\.?A\.?\s*(\d{1,2}(?:[,\.]\d+)?)\s*%\s*(?:s/)?\s*"
+    r"([0-9][0-9\.,]*)\s*[^0-9]{0,40}\s*([0-9][0-9\.,]*)", _I,
+)
+_RE_TABLA_IVA = re.compile(r"(\d{1,2}(?:[,\.]\d+)?)\s*%\s+([0-9][0-9\.,]*)\s+([0-9][0-9\.,]*)", _I)
+_RE_BASE_CON_TIPO = re.compile(
+    r"(?:Base\s+(?:imponible\s+)?(?:al\s+)?|Base\s*)(\d{1,2}(?:[,\.]\d+)?)\s*%\s*[:#]?\s*([0-9][0-9\.,]*)", _I,
+)
+_RE_CUOTA_CON_TIPO = re.compile(
+    r"(?:Cuota\s+IVA?|IVA?)\s+(?:al\s+)?(\d{1,2}(?:[,\.]\d+)?)\s*%\s*[:#]?\s*([0-9][0-9\.,]*)", _I,
+)
+_RE_IVA_PARENTESIS = re.compile(r"IVA\s*\((\d{1,2})\s*%\)\s*[:#]?\s*([0-9][0-9\.,]*)", _I)
+_PATRONES_BASE = ((re.compile(r"\b(?:Base\s+imponible|Base)\s*[:#]?\s*([0-9][0-9\.,]*)", _I), ("base",)),)
+_PATRONES_CUOTA = ((re.compile(r"\b(?:Cuota\s+IVA?|IVA?)\s*[:#]?\s*([0-9][0-9\.,]*)", _I), ("iv",)),)
+
+_RE_RETENCION_CON_TIPO = re.compile(
+    r"(?:Retenci[oó]n\s+IRPF|IRPF)\s*\(?\s*(\d{1,2}(?:[,\.]\d+)?)\s*%\)?\s*[:#\-]?\s*-?\s*([0-9][0-9\.,]*)", _I,
+)
+_RE_RETENCION_SIN_TIPO = re.compile(r"\b(?:Retenci[oó]n|R\.\s*IRPF)\s*[:#]?\s*-?\s*([0-9][0-9\.,]*)", _I)
+
+_RE_FECHA_ISO = re.compile(r"\d{4}-\d{2}-\d{2}")
+_RE_FECHA_DMA = re.compile(r"(\d{1,2})[/\-\.](\d{1,2})[/\-\.](\d{4})")
+_RE_FECHA_AMD = re.compile(r"(\d{4})[/\-\.](\d{1,2})[/\-\.](\d{1,2})")
+
+
+# ── Texto preparado ───────────────────────────────────────────────────────────
+
+class _TextoFactura:
+    """Lo que varios detectores necesitan del mismo texto, calculado una vez."""
+
+    __slots__ = ("texto", "plegado", "_lineas", "_importes")
+
+    def __init__(self, texto: str):
+        self.texto = texto
+        # casefold cubre todas las equivalencias de re.IGNORECASE: si una
+        # palabra clave no esta aqui, el patron no puede coincidir.
+        self.plegado = texto.casefold()
+        self._lineas: list[str] | None = None
+        self._importes: dict = {}
+
+    @property
+    def lineas(self) -> list[str]:
+        """Lineas con los espacios normalizados."""
+        if self._lineas is None:
+            self._lineas = [" ".join(line.split()) for line in self.texto.splitlines()]
+        return self._lineas
+
+    def contiene(self, claves: tuple[str, ...]) -> bool:
+        return not claves or any(clave in self.plegado for clave in claves)
+
+    def importe(self, patrones) -> float:
+        """Importe de la primera coincidencia, compartido entre detectores."""
+        clave = id(patrones)
+        if clave not in self._importes:
+            self._importes[clave] = _parse_amount(_search(self.texto, patrones))
+        return self._importes[clave]
+
+
+@lru_cache(maxsize=8)
+def _contexto(text: str) -> _TextoFactura:
+    return _TextoFactura(text)
+
+
 # ── Deteccion de campos (funciones puras) ─────────────────────────────────────
 
 def _detectar_nif(text: str) -> str:
@@ -112,49 +262,29 @@ def _detectar_nif(text: str) -> str:
     # formatos como ``NIF: A-28/647451``. Normalizamos ese primer identificador
     # etiquetado antes de evaluar los patrones estrictos: mas abajo aparece con
     # frecuencia el NIF del cliente, que no debe usarse como proveedor.
-    etiqueta_flexible = re.compile(
-        r"\b(?:CIF|NIF|N\.I\.F\.?|C\.I\.F\.?)\s*[:#\.]?\s*([A-Z0-9][A-Z0-9 ./-]{5,24})",
-        re.IGNORECASE,
-    )
-    for match in etiqueta_flexible.finditer(text):
-        candidato = re.sub(r"[^A-Z0-9]", "", match.group(1).upper())
-        if re.fullmatch(r"[A-Z]\d{7}[A-Z0-9]", candidato):
-            return candidato
-        if re.fullmatch(r"\d{8}[A-Z]", candidato):
-            return candidato
-        if re.fullmatch(r"[XYZ]\d{7}[A-Z]", candidato):
-            return candidato
-    _ETIQ = r"\b(?:CIF|NIF|VAT(?:[ \t]+(?:no\.?|number))?|N\.I\.F\.?|C\.I\.F\.)[ \t]*[:#\.]?[ \t]*"
-    return _search(text, [
-        _ETIQ + r"([A-Z]\d{7}[A-Z0-9])",    # CIF espanol con etiqueta
-        _ETIQ + r"(\d{8}[A-Z])",              # NIF persona fisica con etiqueta
-        _ETIQ + r"([XYZ]\d{7}[A-Z])",         # NIE con etiqueta
-        _ETIQ + r"([A-Z]{2}[A-Z0-9]{2,13})",  # VAT comunitario con etiqueta
-        r"\b([A-Z]\d{7}[A-Z0-9])\b",          # CIF sin etiqueta
-        r"\b(\d{8}[A-Z])\b",                   # NIF persona fisica sin etiqueta
-        r"\b([XYZ]\d{7}[A-Z])\b",              # NIE sin etiqueta
-    ])
+    if _contexto(text).contiene(_CLAVES_NIF):
+        for match in _RE_NIF_ETIQUETA_FLEXIBLE.finditer(text):
+            candidato = _RE_NO_ALFANUM.sub("", match.group(1).upper())
+            if _RE_CIF.fullmatch(candidato):
+                return candidato
+            if _RE_NIF_PERSONA.fullmatch(candidato):
+                return candidato
+            if _RE_NIE.fullmatch(candidato):
+                return candidato
+    return _search(text, _PATRONES_NIF)
 
 
 def _detectar_nombre_proveedor(text: str) -> str:
     """Heuristica: primera linea no vacia que no sea una etiqueta conocida."""
-    skip = {
-        "FACTURA", "INVOICE", "CIF", "NIF", "FECHA", "TOTAL", "BASE",
-        "IVA", "ALBARAN", "PRESUPUESTO", "PEDIDO", "NOTA", "RECIBO", "ABONO",
-        "ALBARÁN", "NÚMERO", "NUMERO", "PROVEEDOR", "CLIENTE", "PAGINA",
-        "PÁGINA", "REFER", "DESCRIPCION", "DESCRIPCIÓN", "CANTIDAD", "LOTE",
-        "PRECIO", "DTOS", "IMPORTE", "MERCANCIA", "MERCANCÍA",
-    }
-    for line in text.splitlines():
-        clean = " ".join(line.split()).strip()
+    for clean in _contexto(text).lineas:
         if not clean or len(clean) < 3 or len(clean) > 80:
             continue
         upper = clean.upper()
-        if any(tag in upper for tag in skip):
+        if any(tag in upper for tag in _SKIP_NOMBRE):
             continue
-        if re.search(r"\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4}", clean):
+        if _RE_CONTIENE_FECHA.search(clean):
             continue
-        if re.fullmatch(r"[\d\s\.,€$%\-/]+", clean):
+        if _RE_SOLO_CIFRAS.fullmatch(clean):
             continue
         return clean
     return ""
@@ -166,42 +296,29 @@ def _detectar_numero_factura(text: str) -> str:
     # siguiente. En el texto extraido queda ``Factura:\nfecha\nnumero``; la
     # expresion regular general confunde entonces el nombre del proveedor con
     # el numero de factura.
-    lines = [" ".join(line.split()).strip() for line in text.splitlines()]
+    lines = _contexto(text).lineas
     for index, line in enumerate(lines):
-        if not re.fullmatch(r"(?:Factura|Fra\.?|Invoice)\s*:", line, re.IGNORECASE):
+        if not _RE_CABECERA_FACTURA.fullmatch(line):
             continue
         for candidate in lines[index + 1:index + 6]:
-            if not candidate or re.fullmatch(r"(?:Fecha|Date)\s*:?", candidate, re.IGNORECASE):
+            if not candidate or _RE_CABECERA_FECHA.fullmatch(candidate):
                 continue
-            if re.fullmatch(r"\d{1,2}[/-]\d{1,2}[/-]\d{2,4}", candidate):
+            if _RE_FECHA_SUELTA.fullmatch(candidate):
                 continue
-            if re.fullmatch(r"[A-Z0-9][A-Z0-9 /.-]{1,39}", candidate, re.IGNORECASE):
+            if _RE_VALOR_NUMERO.fullmatch(candidate):
                 return candidate
-    return _search(text, [
-        r"\b(?:Factura|Fra\.?|Invoice)\s*(?:N[ºo°]?\.?|No\.?|Num\.?|#)?\s*[:#\-]?\s*([A-Z0-9][A-Z0-9\/\.\-]{1,39})",
-        r"\bN[ºo°]\s*(?:de\s+)?factura\s*[:#\-]?\s*([A-Z0-9][A-Z0-9\/\.\-]{1,39})",
-        r"\b(?:Numero\s+de\s+documento|Ref(?:erencia)?\.?)\s*[:#]?\s*([A-Z0-9][A-Z0-9\/\.\-]{1,39})",
-        r"\b(?:Serie|REF\.?)\s*[:#]?\s*([A-Z0-9][A-Z0-9\/\.\-]{1,39})",
-    ])
+    return _search(text, _PATRONES_NUMERO_FACTURA)
 
 
 def _detectar_fecha(text: str) -> str:
     """Extrae la fecha de factura, priorizando etiquetas explicitas."""
     # Con etiqueta explicita
-    found = _search(text, [
-        r"(?:Fecha\s+(?:de\s+)?(?:factura|emision|expedicion|emisi[oó]n)|"
-        r"Invoice\s+date|Date)\s*[:#\-]?\s*"
-        r"(\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4}|\d{4}[\/\-\.]\d{1,2}[\/\-\.]\d{1,2})",
-    ])
+    found = _search(text, _PATRONES_FECHA)
     if found:
         return _normalizar_fecha(found)
 
     # Con nombre de mes
-    pat_mes = re.compile(
-        r"(\d{1,2})\s+(?:de\s+)?(" + "|".join(MESES_ES.keys()) + r")\s+(?:de\s+)?(\d{4})",
-        re.IGNORECASE,
-    )
-    m = pat_mes.search(text)
+    m = _RE_FECHA_MES.search(text)
     if m:
         dia  = m.group(1).zfill(2)
         mes  = str(MESES_ES.get(m.group(2).lower(), 0)).zfill(2)
@@ -209,33 +326,26 @@ def _detectar_fecha(text: str) -> str:
         return f"{ano}-{mes}-{dia}"
 
     # Fallback: primera fecha numerica
-    m2 = re.search(
-        r"\b(\d{1,2}[\/\-]\d{1,2}[\/\-]\d{4}|\d{4}[\/\-]\d{2}[\/\-]\d{2})\b",
-        text,
-    )
+    m2 = _RE_FECHA_NUMERICA.search(text)
     return _normalizar_fecha(m2.group(1)) if m2 else ""
 
 
 def _detectar_fecha_vencimiento(text: str) -> str:
-    found = _search(text, [
-        r"(?:Vencimiento|Fecha\s+vencimiento|Due\s+date|Vto\.?)\s*[:#\-]?\s*"
-        r"(\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4}|\d{4}[\/\-\.]\d{1,2}[\/\-\.]\d{1,2})",
-    ])
+    found = _search(text, _PATRONES_VENCIMIENTO)
     return _normalizar_fecha(found) if found else ""
 
 
 def _detectar_total(text: str) -> float:
-    return _buscar_importe(text, [
-        r"\bTotal\s+(?:factura|importe|a\s+pagar)\b[^0-9]{0,80}([0-9][0-9\.,]*)",
-        r"\b(?:Total\s+(?:factura|importe|a\s+pagar)|Importe\s+total|TOTAL\s+FACTURA|TOTAL)\s*[:#\-]?\s*(?:EUR|€)?\s*([0-9][0-9\.,]*)",
-        r"\b(?:Total\s+(?:factura|importe|a\s+pagar)|Importe\s+total|TOTAL\s+FACTURA|TOTAL)\s*[:#\-]?\s*([0-9][0-9\.,]*)\s*(?:EUR|€)?",
-    ])
+    return _contexto(text).importe(_PATRONES_TOTAL)
 
 
 # ── Deteccion de lineas de IVA ────────────────────────────────────────────────
 
 def _detectar_lineas_iva(text: str) -> list[OcrVatLine]:
     """Intenta varios patrones para detectar tramos de IVA multiples."""
+    # Todos los formatos de desglose llevan el signo de porcentaje.
+    if "%" not in text:
+        return []
     lineas = _detectar_tabla_iva(text)
     if not lineas:
         lineas = _detectar_iva_desglose_vertical(text)
@@ -251,13 +361,8 @@ def _detectar_iva_desglose_vertical(text: str) -> list[OcrVatLine]:
 
     Ejemplo: ``I.V.A. 10,00% s/\n253,10 ...:\n25,31``.
     """
-    patron = re.compile(
-        r"I\.?V\.?A\.?\s*(\d{1,2}(?:[,\.]\d+)?)\s*%\s*(?:s/)?\s*"
-        r"([0-9][0-9\.,]*)\s*[^0-9]{0,40}\s*([0-9][0-9\.,]*)",
-        re.IGNORECASE,
-    )
     lineas = []
-    for match in patron.finditer(text):
+    for match in _RE_IVA_VERTICAL.finditer(text):
         tipo = _parse_amount(match.group(1))
         base = _parse_amount(match.group(2))
         cuota = _parse_amount(match.group(3))
@@ -271,12 +376,8 @@ def _detectar_tabla_iva(text: str) -> list[OcrVatLine]:
     Detecta filas de tabla con patron: TIPO%  BASE  CUOTA_IVA
     Ejemplo: 21%  1.000,00  210,00
     """
-    patron = re.compile(
-        r"(\d{1,2}(?:[,\.]\d+)?)\s*%\s+([0-9][0-9\.,]*)\s+([0-9][0-9\.,]*)",
-        re.IGNORECASE,
-    )
     lineas: list[OcrVatLine] = []
-    for m in patron.finditer(text):
+    for m in _RE_TABLA_IVA.finditer(text):
         tipo  = _parse_amount(m.group(1))
         base  = _parse_amount(m.group(2))
         cuota = _parse_amount(m.group(3))
@@ -290,22 +391,14 @@ def _detectar_pares_tipo_iva(text: str) -> list[OcrVatLine]:
     Detecta pares explicitos:
       'Base al 21%: 1.000,00'  +  'Cuota IVA 21%: 210,00'
     """
-    pat_base  = re.compile(
-        r"(?:Base\s+(?:imponible\s+)?(?:al\s+)?|Base\s*)(\d{1,2}(?:[,\.]\d+)?)\s*%\s*[:#]?\s*([0-9][0-9\.,]*)",
-        re.IGNORECASE,
-    )
-    pat_cuota = re.compile(
-        r"(?:Cuota\s+IVA?|IVA?)\s+(?:al\s+)?(\d{1,2}(?:[,\.]\d+)?)\s*%\s*[:#]?\s*([0-9][0-9\.,]*)",
-        re.IGNORECASE,
-    )
     bases:  dict[float, float] = {}
     cuotas: dict[float, float] = {}
-    for m in pat_base.finditer(text):
+    for m in _RE_BASE_CON_TIPO.finditer(text):
         tipo  = _parse_amount(m.group(1))
         valor = _parse_amount(m.group(2))
         if 0.0 <= tipo <= 100.0 and valor > 0:
             bases[tipo] = valor
-    for m in pat_cuota.finditer(text):
+    for m in _RE_CUOTA_CON_TIPO.finditer(text):
         tipo  = _parse_amount(m.group(1))
         valor = _parse_amount(m.group(2))
         if 0.0 <= tipo <= 100.0 and valor > 0:
@@ -324,18 +417,12 @@ def _detectar_iva_junto_a_base(text: str) -> list[OcrVatLine]:
     """
     Detecta patron 'IVA (21%): 210,00' junto a 'Base imponible: 1.000,00'.
     """
-    pat = re.compile(
-        r"IVA\s*\((\d{1,2})\s*%\)\s*[:#]?\s*([0-9][0-9\.,]*)",
-        re.IGNORECASE,
-    )
     lineas = []
-    for m in pat.finditer(text):
+    for m in _RE_IVA_PARENTESIS.finditer(text):
         tipo  = _parse_amount(m.group(1))
         cuota = _parse_amount(m.group(2))
-        # Intentar encontrar base correspondiente
-        base = _buscar_importe(text, [
-            r"\b(?:Base\s+imponible|Base)\s*[:#]?\s*([0-9][0-9\.,]*)",
-        ])
+        # Base correspondiente (la misma para todas las coincidencias)
+        base = _contexto(text).importe(_PATRONES_BASE)
         if cuota > 0:
             lineas.append(OcrVatLine(tipo_iva=tipo, base=base, cuota_iva=cuota))
     return lineas
@@ -343,12 +430,9 @@ def _detectar_iva_junto_a_base(text: str) -> list[OcrVatLine]:
 
 def _linea_iva_fallback(text: str) -> Optional[OcrVatLine]:
     """Linea unica con importes globales (sin tipo de IVA explicito)."""
-    base  = _buscar_importe(text, [
-        r"\b(?:Base\s+imponible|Base)\s*[:#]?\s*([0-9][0-9\.,]*)",
-    ])
-    cuota = _buscar_importe(text, [
-        r"\b(?:Cuota\s+IVA?|IVA?)\s*[:#]?\s*([0-9][0-9\.,]*)",
-    ])
+    ctx = _contexto(text)
+    base  = ctx.importe(_PATRONES_BASE)
+    cuota = ctx.importe(_PATRONES_CUOTA)
     if base or cuota:
         tipo = round(cuota / base * 100, 1) if base else 0.0
         # Ajustar a tipo standard si es aproximado
@@ -369,29 +453,24 @@ def _detectar_retenciones(text: str) -> list[OcrRetentionLine]:
       'IRPF (15%): 150,00'
       'Retencion: 150,00'
     """
-    pat_con_tipo = re.compile(
-        r"(?:Retenci[oó]n\s+IRPF|IRPF)\s*\(?\s*(\d{1,2}(?:[,\.]\d+)?)\s*%\)?\s*[:#\-]?\s*-?\s*([0-9][0-9\.,]*)",
-        re.IGNORECASE,
-    )
-    pat_sin_tipo = re.compile(
-        r"\b(?:Retenci[oó]n|R\.\s*IRPF)\s*[:#]?\s*-?\s*([0-9][0-9\.,]*)",
-        re.IGNORECASE,
-    )
-
+    ctx = _contexto(text)
     retenciones: list[OcrRetentionLine] = []
-    for m in pat_con_tipo.finditer(text):
-        tipo    = _parse_amount(m.group(1))
-        importe = _parse_amount(m.group(2))
-        if importe > 0:
-            base = round(importe / tipo * 100, 2) if tipo else 0.0
-            retenciones.append(OcrRetentionLine(
-                tipo_retencion=tipo,
-                importe_retencion=importe,
-                base_retencion=base,
-            ))
+    if not ctx.contiene(("retenci", "irpf")):
+        return retenciones
+    if "%" in text and ctx.contiene(("irpf",)):
+        for m in _RE_RETENCION_CON_TIPO.finditer(text):
+            tipo    = _parse_amount(m.group(1))
+            importe = _parse_amount(m.group(2))
+            if importe > 0:
+                base = round(importe / tipo * 100, 2) if tipo else 0.0
+                retenciones.append(OcrRetentionLine(
+                    tipo_retencion=tipo,
+                    importe_retencion=importe,
+                    base_retencion=base,
+                ))
 
     if not retenciones:
-        for m in pat_sin_tipo.finditer(text):
+        for m in _RE_RETENCION_SIN_TIPO.finditer(text):
             importe = _parse_amount(m.group(1))
             if importe > 0:
                 retenciones.append(OcrRetentionLine(importe_retencion=importe))
@@ -401,9 +480,14 @@ def _detectar_retenciones(text: str) -> list[OcrRetentionLine]:
 
 # ── Utilidades de parsing ─────────────────────────────────────────────────────
 
-def _search(text: str, patterns: list[str]) -> str:
-    for pat in patterns:
-        m = re.search(pat, text, flags=re.IGNORECASE)
+def _search(text: str, patterns) -> str:
+    """Primer grupo capturado por el primer patron ``(regex, claves)`` que
+    coincide. Se saltan los patrones cuyas palabras clave no estan en el texto."""
+    ctx = _contexto(text)
+    for pat, claves in patterns:
+        if not ctx.contiene(claves):
+            continue
+        m = pat.search(text)
         if m:
             return str(m.group(1)).strip()
     return ""
@@ -444,24 +528,20 @@ def _parse_amount(raw: str) -> float:
         return 0.0
 
 
-def _buscar_importe(text: str, patterns: list[str]) -> float:
-    return _parse_amount(_search(text, patterns))
-
-
 def _normalizar_fecha(raw: str) -> str:
     """Intenta convertir varios formatos a YYYY-MM-DD."""
     if not raw:
         return ""
     raw = raw.strip()
     # YYYY-MM-DD ya correcto
-    if re.fullmatch(r"\d{4}-\d{2}-\d{2}", raw):
+    if _RE_FECHA_ISO.fullmatch(raw):
         return raw
     # DD/MM/YYYY o DD-MM-YYYY o DD.MM.YYYY
-    m = re.fullmatch(r"(\d{1,2})[/\-\.](\d{1,2})[/\-\.](\d{4})", raw)
+    m = _RE_FECHA_DMA.fullmatch(raw)
     if m:
         return f"{m.group(3)}-{m.group(2).zfill(2)}-{m.group(1).zfill(2)}"
     # YYYY/MM/DD
-    m = re.fullmatch(r"(\d{4})[/\-\.](\d{1,2})[/\-\.](\d{1,2})", raw)
+    m = _RE_FECHA_AMD.fullmatch(raw)
     if m:
         return f"{m.group(1)}-{m.group(2).zfill(2)}-{m.group(3).zfill(2)}"
     return raw
@@ -14,16 +14,21 @@ Compatible con el contrato OcrInvoiceResult de services/ocr/types.py.
 """
 from __future__ import annotations
 
-import hashlib
 import json
 import logging
 import re
-import shutil
 import uuid
 from datetime import datetime
 from pathlib import Path
 from typing import Optional
 
+from services.almacen_documental import (
+    CARPETA_CONTENIDO,
+    AlmacenDocumental,
+    referencia_provisional,
+    sha256_archivo,
+)
+from services.ocr.cache_ocr import CacheOcr
 from services.ocr.types import OcrInvoiceResult, OcrDocumentState
 from utils.utilidades import get_default_received_documents_dir
 
@@ -43,8 +48,11 @@ class OcrService:
       empresa_id — codigo de empresa (ej: 'E00001')
       ejercicio  — ejercicio fiscal (ej: 2024)
       usuario    — nombre de usuario (para auditoría)
+      cache_ocr  — cache de resultados de motores (por defecto, una propia)
     """
 
+    _cache: CacheOcr | None = None
+
     def __init__(
         self,
         gestor,
@@ -53,6 +61,7 @@ class OcrService:
         usuario: str = "",
         tipo_documento: str = "factura_recibida",
         fecha_contable: str | None = None,
+        cache_ocr: CacheOcr | None = None,
     ):
         self._gestor    = gestor
         self._empresa   = empresa_id
@@ -63,6 +72,7 @@ class OcrService:
         self._tipo_documento = tipo_documento
         self._fecha_contable = str(fecha_contable or "").strip()
         self._motores   = self._construir_cadena_motores()
+        self._cache     = cache_ocr if cache_ocr is not None else CacheOcr(gestor)
 
     # ── Punto de entrada publico ──────────────────────────────────────────────
 
@@ -77,6 +87,30 @@ class OcrService:
           resultado       — OcrInvoiceResult serializado como dict
           errores         — lista de errores
         """
+        return self._registrar_archivo(file_path, progress_callback)
+
+    def encolar_archivo(
+        self, file_path: str, prioridad: int = 0, progress_callback=None,
+    ) -> dict:
+        """
+        Registra y archiva el fichero igual que ``procesar_archivo`` pero deja
+        el analisis a los trabajadores de ``ColaOcr``. Devuelve el mismo dict
+        con estado ``en_cola``.
+        """
+        return self._registrar_archivo(file_path, progress_callback, prioridad_cola=prioridad)
+
+    def opciones_cola(self) -> dict:
+        """Parametros del servicio que un trabajador necesita para recrearlo."""
+        return {
+            "ejercicio": self._ejercicio,
+            "usuario": self._usuario,
+            "fecha_contable": self._fecha_contable,
+        }
+
+    def _registrar_archivo(
+        self, file_path: str, progress_callback=None, prioridad_cola: int | None = None,
+    ) -> dict:
+        encolar = prioridad_cola is not None
         source_path = Path(file_path)
         if not source_path.exists():
             return self._respuesta_error(None, f"Fichero no encontrado: {file_path}")
@@ -110,10 +144,15 @@ class OcrService:
                 self._gestor.conn.commit()
                 payload_dup = dict(doc_dup)
                 payload_dup["tipo_documento"] = self._tipo_documento
-                payload_dup["estado"] = OcrDocumentState.PROCESANDO.value
+                payload_dup["estado"] = (
+                    OcrDocumentState.EN_COLA.value if encolar
+                    else OcrDocumentState.PROCESANDO.value
+                )
                 payload_dup["error_ocr"] = ""
                 self._gestor.upsert_documento_ocr(payload_dup)
                 self._notificar_progreso(progress_callback, payload_dup)
+                if encolar:
+                    return self._respuesta_en_cola(str(doc_dup["id"]), prioridad_cola)
                 return self.reprocesar_documento(
                     str(doc_dup["id"]), progress_callback=progress_callback,
                 )
@@ -122,11 +161,14 @@ class OcrService:
             ruta_existente = Path(str(doc_dup.get("ruta_original") or ""))
             if not ruta_existente.is_file():
                 try:
-                    payload_dup = dict(doc_dup)
-                    payload_dup["ruta_original"] = str(
-                        self._archivar_en_repositorio_compartido(source_path)
-                    )
-                    self._gestor.upsert_documento_ocr(payload_dup)
+                    almacen = self._almacen()
+                    with referencia_provisional(self._gestor, almacen, hash_archivo):
+                        payload_dup = dict(doc_dup)
+                        payload_dup["ruta_original"] = str(
+                            self._archivar_en_repositorio_compartido(source_path, hash_archivo)
+                        )
+                        payload_dup["ruta_objeto"] = self._objeto_en_almacen(almacen, hash_archivo)
+                        self._gestor.upsert_documento_ocr(payload_dup)
                 except Exception as exc:
                     logger.warning("[OcrService] No se pudo recuperar la copia compartida: %s", exc)
             logger.info("[OcrService] Duplicado detectado: %s", source_path.name)
@@ -140,36 +182,46 @@ class OcrService:
 
         # 3. Copiar antes de OCR al repositorio comun. El procesamiento y la
         # ruta persistida no deben depender del ordenador que importo el PDF.
-        try:
-            path = self._archivar_en_repositorio_compartido(source_path)
-        except Exception as exc:
-            return self._respuesta_error(
-                None, f"No se pudo archivar el documento en la ruta compartida: {exc}"
-            )
-
-        # 4. Crear registro inicial en documentos_ocr
-        doc_id = str(uuid.uuid4())
-        doc_payload = {
-            "id":              doc_id,
-            "empresa_id":      self._empresa,
-            "ruta_original":   str(path),
-            "nombre_archivo":  path.name,
-            "hash_archivo":    hash_archivo,
-            "tipo_documento":  self._tipo_documento,
-            "estado":          OcrDocumentState.PROCESANDO.value,
-            "fecha_alta":      _now(),
-            "fecha_procesado": None,
-            "motor_ocr":       "",
-            "confianza_global": 0.0,
-            "error_ocr":       "",
-            "texto_extraido":  "",
-            "json_ocr":        "",
-        }
-        self._gestor.upsert_documento_ocr(doc_payload)
+        # La referencia provisional protege el objeto del almacen hasta que
+        # el documento registrado tiene la suya.
+        almacen = self._almacen()
+        with referencia_provisional(self._gestor, almacen, hash_archivo, source_path.stat().st_size):
+            try:
+                path = self._archivar_en_repositorio_compartido(source_path, hash_archivo)
+            except Exception as exc:
+                return self._respuesta_error(
+                    None, f"No se pudo archivar el documento en la ruta compartida: {exc}"
+                )
+
+            # 4. Crear registro inicial en documentos_ocr
+            doc_id = str(uuid.uuid4())
+            doc_payload = {
+                "id":              doc_id,
+                "empresa_id":      self._empresa,
+                "ruta_original":   str(path),
+                "nombre_archivo":  path.name,
+                "hash_archivo":    hash_archivo,
+                "tipo_documento":  self._tipo_documento,
+                "estado":          (
+                    OcrDocumentState.EN_COLA.value if encolar
+                    else OcrDocumentState.PROCESANDO.value
+                ),
+                "fecha_alta":      _now(),
+                "fecha_procesado": None,
+                "motor_ocr":       "",
+                "confianza_global": 0.0,
+                "error_ocr":       "",
+                "texto_extraido":  "",
+                "json_ocr":        "",
+                "ruta_objeto":     self._objeto_en_almacen(almacen, hash_archivo),
+            }
+            self._gestor.upsert_documento_ocr(doc_payload)
         self._notificar_progreso(progress_callback, doc_payload)
+        if encolar:
+            return self._respuesta_en_cola(doc_id, prioridad_cola)
 
         # 5. Intentar extraccion con cadena de motores
-        result = self._ejecutar_motores(path)
+        result = self._ejecutar_motores(path, hash_archivo)
 
         # 6. Actualizar documento con resultado
         doc_payload.update({
@@ -203,8 +255,14 @@ class OcrService:
             "errores":      result.errores,
         }
 
-    def reprocesar_documento(self, documento_id: str, progress_callback=None) -> dict:
-        """Vuelve a analizar un documento existente sin tratarlo como duplicado."""
+    def reprocesar_documento(
+        self, documento_id: str, progress_callback=None, forzar_ocr: bool = False,
+    ) -> dict:
+        """Vuelve a analizar un documento existente sin tratarlo como duplicado.
+
+        Reutiliza la lectura guardada en la cache OCR salvo con ``forzar_ocr``,
+        que repite los motores y sustituye lo guardado.
+        """
         doc = self._gestor.get_documento_ocr(documento_id)
         if not doc:
             return self._respuesta_error(documento_id, "Documento OCR no encontrado.")
@@ -216,7 +274,72 @@ class OcrService:
         doc_payload.update({"estado": OcrDocumentState.PROCESANDO.value, "error_ocr": ""})
         self._gestor.upsert_documento_ocr(doc_payload)
         self._notificar_progreso(progress_callback, doc_payload)
-        result = self._ejecutar_motores(path)
+        result = self._ejecutar_motores(
+            path, str(doc.get("hash_archivo") or "") or None, usar_cache=not forzar_ocr,
+        )
+        return self.guardar_resultado(doc_payload, result)
+
+    def analizar_archivo(self, path: Path) -> OcrInvoiceResult:
+        """Ejecuta la cadena de motores sin tocar la base de datos."""
+        return self._ejecutar_motores(Path(path))
+
+    @property
+    def admite_lotes(self) -> bool:
+        """Hay un motor (el backend) que analiza varios ficheros por peticion."""
+        return self._motor_lotes() is not None
+
+    def analizar_lote(
+        self, paths: list[Path], hashes: list[str | None] | None = None,
+    ) -> list[OcrInvoiceResult]:
+        """Como ``analizar_archivo`` para varios ficheros, en el mismo orden.
+
+        Los que el motor de lotes no tiene en la cache se le envian en una
+        sola peticion. Una lectura del lote fallida no se usa: ese fichero
+        vuelve a pedirse por separado en la cadena normal de motores.
+        """
+        paths = [Path(p) for p in paths]
+        hashes = list(hashes or [None] * len(paths))
+        precalculados: list[dict] = [{} for _ in paths]
+        motor = self._motor_lotes()
+        if motor is not None and len(paths) > 1:
+            pendientes = []
+            for i, path in enumerate(paths):
+                if self._cache is not None:
+                    if not hashes[i]:
+                        try:
+                            hashes[i] = _sha256(path)
+                        except OSError:
+                            pass
+                    guardado = self._cache.obtener(hashes[i], motor) if hashes[i] else None
+                    if guardado is not None:
+                        precalculados[i][motor.nombre] = guardado
+                        continue
+                pendientes.append(i)
+            lecturas = []
+            if len(pendientes) > 1:
+                try:
+                    lecturas = motor.extraer_lote([paths[i] for i in pendientes])
+                except Exception as exc:
+                    logger.warning("[OcrService] Lote OCR fallido, se analiza fichero a fichero: %s", exc)
+            for i, resultado in zip(pendientes, lecturas):
+                if resultado is None or (not (resultado.texto or "").strip() and resultado.errores):
+                    continue
+                if self._cache is not None and hashes[i]:
+                    self._cache.guardar(hashes[i], motor, resultado)
+                precalculados[i][motor.nombre] = resultado
+        return [
+            self._ejecutar_motores(path, hashes[i], precalculados=precalculados[i])
+            for i, path in enumerate(paths)
+        ]
+
+    def _motor_lotes(self):
+        return next((m for m in self._motores if hasattr(m, "extraer_lote")), None)
+
+    def guardar_resultado(self, doc: dict, result: OcrInvoiceResult) -> dict:
+        """Persiste el analisis de un documento ya registrado y sustituye
+        la propuesta de factura anterior."""
+        documento_id = str(doc["id"])
+        doc_payload = dict(doc)
         doc_payload.update({
             "estado": result.estado_sugerido.value,
             "fecha_procesado": _now(),
@@ -230,7 +353,7 @@ class OcrService:
 
         # La propuesta anterior y sus lineas se eliminan por cascada antes de
         # guardar la nueva. Asi nunca se acumulan IVAs de intentos previos.
-        tipo = doc.get("tipo_documento") or "factura_recibida"
+        tipo = doc_payload.get("tipo_documento") or "factura_recibida"
         tabla_ocr = (
             "facturas_emitidas_ocr"
             if tipo == "factura_emitida"
@@ -245,13 +368,23 @@ class OcrService:
             result.proveedor_nif or result.numero_factura
         ) else None
         return {
-            "documento_id": str(documento_id),
+            "documento_id": documento_id,
             "factura_id": factura_id,
             "estado": result.estado_sugerido.value,
             "resultado": result.to_dict(),
             "errores": result.errores,
         }
 
+    def _respuesta_en_cola(self, documento_id: str, prioridad: int) -> dict:
+        self._gestor.encolar_documento_ocr(documento_id, prioridad, self.opciones_cola())
+        return {
+            "documento_id": documento_id,
+            "factura_id":   None,
+            "estado":       OcrDocumentState.EN_COLA.value,
+            "resultado":    {},
+            "errores":      [],
+        }
+
     @staticmethod
     def _notificar_progreso(callback, documento: dict) -> None:
         if not callback:
@@ -261,8 +394,26 @@ class OcrService:
         except Exception as exc:
             logger.warning("[OcrService] No se pudo notificar el progreso: %s", exc)
 
-    def _archivar_en_repositorio_compartido(self, source: Path) -> Path:
-        """Devuelve la copia definitiva del OCR en el repositorio compartido."""
+    @staticmethod
+    def _almacen() -> AlmacenDocumental:
+        return AlmacenDocumental(get_default_received_documents_dir().parent / CARPETA_CONTENIDO)
+
+    @staticmethod
+    def _objeto_en_almacen(almacen: AlmacenDocumental, digest: str) -> str | None:
+        """Ruta del objeto si el contenido esta en el almacen (los documentos
+        archivados antes del almacen no tienen objeto ni referencia)."""
+        objeto = almacen.ruta_objeto(digest)
+        return str(objeto) if objeto.is_file() else None
+
+    def _archivar_en_repositorio_compartido(
+        self, source: Path, hash_archivo: str | None = None,
+    ) -> Path:
+        """Devuelve la copia definitiva del OCR en el repositorio compartido.
+
+        La copia es un enlace al almacen por contenido, de modo que el mismo
+        PDF ya archivado desde correo o mensajeria no ocupa espacio otra vez.
+        La referencia al objeto la toma el documento OCR al registrarse.
+        """
         root = get_default_received_documents_dir()
         try:
             # Un documento que ya procede del archivo compartido no se copia
@@ -283,12 +434,15 @@ class OcrService:
         destination_dir.mkdir(parents=True, exist_ok=True)
         safe_name = re.sub(r'[<>:"/\\|?*\x00-\x1f]', "_", source.name).strip(". ") or "Documento"
         destination = destination_dir / safe_name
+        digest = hash_archivo or _sha256(source)
         index = 2
-        while destination.exists() and _sha256(destination) != _sha256(source):
+        while destination.exists() and _sha256(destination) != digest:
             destination = destination_dir / f"{Path(safe_name).stem}_{index}{Path(safe_name).suffix}"
             index += 1
         if not destination.exists():
-            shutil.copy2(source, destination)
+            almacen = AlmacenDocumental(root.parent / CARPETA_CONTENIDO)
+            stored = almacen.guardar_archivo(source, digest)
+            almacen.materializar(stored, destination)
         return destination
 
     # ── Cadena de motores ─────────────────────────────────────────────────────
@@ -332,10 +486,18 @@ class OcrService:
 
         return motores
 
-    def _ejecutar_motores(self, path: Path) -> OcrInvoiceResult:
+    def _ejecutar_motores(
+        self, path: Path, hash_archivo: str | None = None, usar_cache: bool = True,
+        precalculados: dict[str, OcrInvoiceResult] | None = None,
+    ) -> OcrInvoiceResult:
         """
         Ejecuta la cadena de motores en orden.
         Devuelve el primer resultado con texto suficiente o el ultimo error.
+
+        La salida de cada motor se guarda en la cache OCR y, con
+        ``usar_cache``, se reutiliza en vez de volver a ejecutarlo.
+        ``precalculados`` trae por nombre de motor lecturas ya obtenidas
+        (p. ej. de un lote) que no se vuelven a pedir.
         """
         ultimo_resultado = OcrInvoiceResult(
             motor="none",
@@ -344,13 +506,27 @@ class OcrService:
 
         diagnosticos = []
         azure_prioritario = any(motor.nombre == "azure_backend" for motor in self._motores)
-        for motor in self._motores:
+        cache = self._cache
+        if cache is not None and not hash_archivo:
             try:
-                resultado = motor.extraer(path)
-            except Exception as exc:
-                logger.warning("[OcrService] Motor %s lanzo excepcion: %s", motor.nombre, exc)
-                diagnosticos.append(f"{motor.nombre}: {exc}")
-                continue
+                hash_archivo = _sha256(path)
+            except OSError:
+                cache = None
+        for motor in self._motores:
+            resultado = (precalculados or {}).get(motor.nombre)
+            if resultado is None and cache and usar_cache:
+                resultado = cache.obtener(hash_archivo, motor)
+                if resultado is not None:
+                    logger.info("[OcrService] %s: resultado de %s desde la cache.", path.name, motor.nombre)
+            if resultado is None:
+                try:
+                    resultado = motor.extraer(path)
+                except Exception as exc:
+                    logger.warning("[OcrService] Motor %s lanzo excepcion: %s", motor.nombre, exc)
+                    diagnosticos.append(f"{motor.nombre}: {exc}")
+                    continue
+                if cache is not None:
+                    cache.guardar(hash_archivo, motor, resultado)
 
             if resultado.errores:
                 diagnosticos.extend(f"{motor.nombre}: {error}" for error in resultado.errores)
@@ -549,11 +725,7 @@ class OcrService:
 # ── Utilidades ────────────────────────────────────────────────────────────────
 
 def _sha256(path: Path) -> str:
-    h = hashlib.sha256()
-    with open(str(path), "rb") as f:
-        for chunk in iter(lambda: f.read(65536), b""):
-            h.update(chunk)
-    return h.hexdigest()
+    return sha256_archivo(path)
 
 
 def _now() -> str:
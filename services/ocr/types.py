@@ -16,6 +16,7 @@ from typing import Any
 # ── Estados del documento ────────────────────────────────────────────────────
 
 class OcrDocumentState(str, Enum):
+    EN_COLA             = "en_cola"
     PROCESANDO          = "procesando"
     ERROR               = "error"
     PENDIENTE_REVISION  = "pendiente_revision"
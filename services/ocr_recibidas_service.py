@@ -19,17 +19,11 @@ def resolve_recibidas_template(gestor, codigo: str, ejercicio: int) -> dict:
     }
 
 
-def build_terceros_by_nif(gestor, codigo: str, ejercicio: int) -> dict[str, dict[str, Any]]:
-    terceros_by_nif: dict[str, dict[str, Any]] = {}
-    for tercero in gestor.listar_terceros():
-        nif = _norm_nif(tercero.get("nif"))
-        if nif:
-            terceros_by_nif[nif] = tercero
-    for tercero in gestor.listar_terceros_por_empresa(codigo, ejercicio):
-        nif = _norm_nif(tercero.get("nif"))
-        if nif:
-            terceros_by_nif[nif] = tercero
-    return terceros_by_nif
+def build_terceros_by_nif(gestor, codigo: str, ejercicio: int, rows: list[dict]) -> dict[str, dict[str, Any]]:
+    """Terceros por NIF normalizado de los proveedores que aparecen en ``rows``."""
+    return gestor.get_terceros_by_nifs(
+        codigo, ejercicio, [r.get("NIF Cliente Proveedor") or r.get("NIF") for r in rows]
+    )
 
 
 def doc_to_row(doc: dict) -> dict:
@@ -123,7 +117,6 @@ def generate_suenlace_for_docs(gestor, codigo: str, ejercicio: int, docs: list[d
     plantilla = resolve_recibidas_template(gestor, codigo, ejercicio)
     empresa = gestor.get_empresa(codigo, ejercicio) or {}
     ndig = int(empresa.get("digitos_plan") or 8)
-    terceros_by_nif = build_terceros_by_nif(gestor, codigo, ejercicio)
 
     rows: list[dict] = []
     for doc in docs:
@@ -135,6 +128,7 @@ def generate_suenlace_for_docs(gestor, codigo: str, ejercicio: int, docs: list[d
                 lineas = gestor.listar_ocr_lineas_doc(str(doc_id)) or []
         rows.extend(doc_to_rows(doc, lineas))
 
+    terceros_by_nif = build_terceros_by_nif(gestor, codigo, ejercicio, rows)
     return generar_recibidas_suenlace(
         rows,
         plantilla,
@@ -171,7 +165,3 @@ def mark_docs_as_generated(gestor, docs: list[dict], *, estado_contable: str = "
             asiento["numero_asiento"] = payload.get("numero_asiento")
             asiento["fecha_asiento"] = payload.get("fecha_asiento")
             gestor.upsert_asiento_contable(asiento)
-
-
-def _norm_nif(value: Any) -> str:
-    return str(value or "").strip().upper()
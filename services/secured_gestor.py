@@ -165,19 +165,19 @@ class SecuredGestor:
         self.security.ensure_company_write(row["codigo_empresa"])
         return self._base.vincular_documento_archivo_ocr(documento_id, ocr_documento_id)
 
-    def eliminar_documento_archivo(self, documento_id: str):
+    def eliminar_documento_archivo(self, documento_id: str, al_eliminar_objeto=None):
         row = self._base.get_documento_archivo(documento_id)
         if not row:
             return None
         self.security.ensure_company_write(row["codigo_empresa"])
-        return self._base.eliminar_documento_archivo(documento_id)
+        return self._base.eliminar_documento_archivo(documento_id, al_eliminar_objeto)
 
-    def eliminar_documento_ocr(self, documento_id: str):
+    def eliminar_documento_ocr(self, documento_id: str, al_eliminar_objeto=None):
         row = self._base.get_documento_ocr(documento_id)
         if not row:
             return False
         self.security.ensure_company_write(row["empresa_id"])
-        return self._base.eliminar_documento_ocr(documento_id)
+        return self._base.eliminar_documento_ocr(documento_id, al_eliminar_objeto)
 
     def vincular_documentos_graph_comunicacion(self, graph_message_id: str):
         return self._base.vincular_documentos_graph_comunicacion(graph_message_id)
@@ -371,6 +371,10 @@ class SecuredGestor:
         self.security.ensure_company_read(codigo_empresa)
         return self._base.listar_facturas_emitidas(codigo_empresa, ejercicio)
 
+    def listar_facturas_emitidas_por_ids(self, codigo_empresa: str, ids: list):
+        self.security.ensure_company_read(codigo_empresa)
+        return self._base.listar_facturas_emitidas_por_ids(codigo_empresa, ids)
+
     def listar_facturas_recibidas_docs(self, codigo_empresa: str, ejercicio: int):
         self.security.ensure_company_read(codigo_empresa)
         return self._base.listar_facturas_recibidas_docs(codigo_empresa, ejercicio)
@@ -416,6 +420,10 @@ class SecuredGestor:
         self.security.ensure_company_read(codigo_empresa)
         return self._base.listar_albaranes_emitidas(codigo_empresa, ejercicio)
 
+    def listar_albaranes_emitidas_por_ids(self, codigo_empresa: str, ids: list, ejercicio: int | None = None):
+        self.security.ensure_company_read(codigo_empresa)
+        return self._base.listar_albaranes_emitidas_por_ids(codigo_empresa, ids, ejercicio)
+
     def listar_terceros_empresa(self, codigo_empresa: str, ejercicio: int):
         self.security.ensure_company_read(codigo_empresa)
         return self._base.listar_terceros_empresa(codigo_empresa, ejercicio)
@@ -424,6 +432,14 @@ class SecuredGestor:
         self.security.ensure_company_read(codigo_empresa)
         return self._base.listar_terceros_por_empresa(codigo_empresa, ejercicio)
 
+    def get_terceros_by_nifs(self, codigo_empresa: str, ejercicio: int, nifs):
+        self.security.ensure_company_read(codigo_empresa)
+        return self._base.get_terceros_by_nifs(codigo_empresa, ejercicio, nifs)
+
+    def subcuentas_cliente_por_tercero(self, codigo_empresa: str, tercero_ids):
+        self.security.ensure_company_read(codigo_empresa)
+        return self._base.subcuentas_cliente_por_tercero(codigo_empresa, tercero_ids)
+
     def get_tercero_empresa(self, codigo_empresa: str, tercero_id: str, ejercicio: int):
         self.security.ensure_company_read(codigo_empresa)
         return self._base.get_tercero_empresa(codigo_empresa, tercero_id, ejercicio)
@@ -489,6 +505,34 @@ class SecuredGestor:
         self.security.ensure_company_write(factura.get("codigo_empresa"))
         return self._base.upsert_factura_emitida(factura)
 
+    def upsert_facturas_emitidas(self, facturas: list[dict]) -> list[str]:
+        for codigo in {factura.get("codigo_empresa") for factura in facturas}:
+            self.security.ensure_company_write(codigo)
+        return self._base.upsert_facturas_emitidas(facturas)
+
+    def listar_cuotas_con_periodos(self, codigo_empresa: str | None = None, ejercicio: int | None = None,
+                                   solo_activas: bool = False):
+        if codigo_empresa is not None:
+            self.security.ensure_company_read(codigo_empresa)
+            return self._base.listar_cuotas_con_periodos(codigo_empresa, ejercicio, solo_activas)
+        rows = self._base.listar_cuotas_con_periodos(None, ejercicio, solo_activas)
+        if self.security.session.is_admin():
+            return rows
+        return [row for row in rows if self.security.can_read_company(str(row.get("codigo_empresa") or ""))]
+
+    def registrar_facturas_cuotas(self, generaciones, fecha: str):
+        for codigo in {factura.get("codigo_empresa") for factura, _cuota_id, _periodo in generaciones}:
+            self.security.ensure_company_write(codigo)
+        return self._base.registrar_facturas_cuotas(generaciones, fecha)
+
+    def reservar_numeros_serie(self, codigo: str, ejercicio: int, serie: str, n: int = 1):
+        self.security.ensure_company_write(codigo)
+        return self._base.reservar_numeros_serie(codigo, ejercicio, serie, n)
+
+    def devolver_numeros_serie(self, codigo: str, ejercicio: int, serie: str, reservados: range) -> bool:
+        self.security.ensure_company_write(codigo)
+        return self._base.devolver_numeros_serie(codigo, ejercicio, serie, reservados)
+
     def upsert_factura_recibida_doc(self, doc: dict):
         self.security.ensure_company_write(doc.get("codigo_empresa"))
         return self._base.upsert_factura_recibida_doc(doc)
@@ -540,6 +584,19 @@ class SecuredGestor:
         self.security.ensure_company_write(codigo_empresa)
         return self._base.desmarcar_facturas_emitidas_generadas(codigo_empresa, ids, ejercicio)
 
+    def marcar_pdf_factura_emitida(
+        self,
+        codigo_empresa: str,
+        factura_id: str,
+        pdf_path: str,
+        pdf_generated_at: str | None,
+        pdf_huella: str | None,
+    ) -> bool:
+        self.security.ensure_company_write(codigo_empresa)
+        return self._base.marcar_pdf_factura_emitida(
+            codigo_empresa, factura_id, pdf_path, pdf_generated_at, pdf_huella
+        )
+
     def marcar_factura_emitida_enviada(self, codigo_empresa: str, factura_id: str, fecha: str, canal: str | None, ejercicio: int):
         self.security.ensure_company_write(codigo_empresa)
         return self._base.marcar_factura_emitida_enviada(codigo_empresa, factura_id, fecha, canal, ejercicio)
@@ -556,6 +613,26 @@ class SecuredGestor:
         self.security.ensure_company_write(codigo_empresa)
         return self._base.marcar_albaranes_facturados(codigo_empresa, ids, factura_id, fecha, ejercicio)
 
+    def facturar_albaranes_en_bloque(self, codigo_empresa: str, ejercicio: int, grupos, fecha: str):
+        self.security.ensure_company_write(codigo_empresa)
+        for codigo in {factura.get("codigo_empresa") for factura, _ids in grupos}:
+            self.security.ensure_company_write(codigo)
+        return self._base.facturar_albaranes_en_bloque(codigo_empresa, ejercicio, grupos, fecha)
+
+    def iterar_facturas_emitidas(self, codigo_empresa: str, ejercicio: int | None = None, cliente: str = "",
+                                 desde=None, hasta=None, excluir_ocr: bool = False, lote: int = 500):
+        self.security.ensure_company_read(codigo_empresa)
+        return self._base.iterar_facturas_emitidas(
+            codigo_empresa, ejercicio, cliente=cliente, desde=desde, hasta=hasta, excluir_ocr=excluir_ocr, lote=lote,
+        )
+
+    def iterar_albaranes_emitidas(self, codigo_empresa: str, ejercicio: int | None = None, cliente: str = "",
+                                  desde=None, hasta=None, lote: int = 500):
+        self.security.ensure_company_read(codigo_empresa)
+        return self._base.iterar_albaranes_emitidas(
+            codigo_empresa, ejercicio, cliente=cliente, desde=desde, hasta=hasta, lote=lote,
+        )
+
     def upsert_tercero_empresa(self, rel: dict):
         self.security.ensure_company_write(rel.get("codigo_empresa"))
         return self._base.upsert_tercero_empresa(rel)
@@ -692,6 +769,15 @@ class SecuredGestor:
         self.security.ensure_company_write(buzon.get("codigo_empresa"))
         return self._base.upsert_notif_buzon(buzon)
 
+    def actualizar_marca_sync_notif_buzon(
+        self, codigo_empresa: str, buzon_id: str, fecha_disposicion: str | None,
+        referencias: dict, sync_completa: str | None = None,
+    ) -> None:
+        self.security.ensure_company_write(codigo_empresa)
+        return self._base.actualizar_marca_sync_notif_buzon(
+            codigo_empresa, buzon_id, fecha_disposicion, referencias, sync_completa,
+        )
+
     def eliminar_notif_buzon(self, codigo_empresa: str, buzon_id: str) -> None:
         self.security.ensure_company_write(codigo_empresa)
         return self._base.eliminar_notif_buzon(codigo_empresa, buzon_id)
@@ -702,6 +788,11 @@ class SecuredGestor:
         self.security.ensure_company_write(item.get("codigo_empresa"))
         return self._base.upsert_notif_bandeja_item(item)
 
+    def upsert_notif_bandeja_items(self, items: list[dict]) -> list[str]:
+        for codigo in {item.get("codigo_empresa") for item in items}:
+            self.security.ensure_company_write(codigo)
+        return self._base.upsert_notif_bandeja_items(items)
+
     def cambiar_estado_notif_bandeja(
         self, codigo_empresa: str, item_id: str, estado: str, fecha: str
     ) -> None:
@@ -10,7 +10,7 @@ import hashlib
 import warnings
 from pathlib import Path
 
-import requests
+from services.backend_http import sesion_backend
 
 warnings.warn(
     "signrequest_service.SignRequestClient esta obsoleto. "
@@ -41,7 +41,7 @@ class SignRequestClient:
         self.from_email = str(from_email or "").strip()
         self.base_url = str(base_url or "").rstrip("/")
         self.timeout = int(timeout)
-        self._http = session or requests.Session()
+        self._http = session or sesion_backend()
         if not self.token or not self.from_email:
             raise ValueError("Configura signrequest_token y signrequest_from_email.")
 
@@ -3,7 +3,7 @@ Busqueda, propuesta de subcuenta y creacion de terceros para el flujo OCR.
 
 Reglas de uso:
   - resolver_tercero: SOLO busca, nunca crea. Llamar desde main thread.
-  - proponer_subcuenta: calcula la siguiente libre, no la persiste.
+  - proponer_subcuenta: calcula la siguiente libre y la reserva al puesto, no la crea.
   - crear_tercero: crea tercero + relacion empresa. Llamar solo con accion explicita del usuario.
 
 Jerarquia de busqueda:
@@ -15,11 +15,14 @@ Jerarquia de busqueda:
 Propuesta de subcuenta:
   Prefijos por tipo: proveedor=400, acreedor=410, cliente=430.
   Busca la primera posicion libre tanto en terceros_empresas como en plan_cuentas.
+  La busqueda se resuelve en la base de datos (GestorBase.proponer_subcuenta_libre).
 """
 from __future__ import annotations
 
 import re
+import time
 import unicodedata
+from collections import defaultdict
 
 from utils.validaciones import normalizar_nif_cif
 from services.terceros_empresa_fiscal_service import DEFAULT_REL_CONFIG
@@ -43,6 +46,22 @@ CAMPO_SUBCUENTA = {
 # ── Servicio principal ────────────────────────────────────────────────────────
 
 class TercerosOcrService:
+    """Resolucion de terceros para OCR.
+
+    Los candidatos de cada (empresa, ejercicio) y el maestro global se
+    indexan en memoria una sola vez. El indice se reconstruye cuando cambia
+    ``gestor.generacion_terceros()`` (altas/bajas de terceros o subcuentas en
+    este puesto) o pasados ``INDICE_TTL_S`` segundos, por los cambios hechos
+    desde otros puestos.
+    """
+
+    def __init__(self):
+        self._indices: dict[tuple[str, int], IndiceTerceros] = {}
+        self._indice_global: IndiceTerceros | None = None
+
+    def invalidar(self) -> None:
+        self._indices.clear()
+        self._indice_global = None
 
     # ── Busqueda ──────────────────────────────────────────────────────────────
 
@@ -61,7 +80,47 @@ class TercerosOcrService:
         """
         nif_norm = _norm_nif(nif)
         nombre_norm = _norm_nombre(nombre)
+        indice = self._indice_empresa(gestor, codigo, ejercicio)
+
+        # 1. NIF exacto en terceros de la empresa
+        if nif_norm:
+            t = indice.por_nif(nif_norm)
+            if t is not None:
+                return t
+
+        # 2+3. Nombre normalizado en terceros de la empresa
+        if nombre_norm:
+            t = indice.por_nombre(nombre_norm)
+            if t is not None:
+                return t
+            # Parcial (uno contiene al otro, minimo 5 chars para evitar falsos)
+            if len(nombre_norm) >= 5:
+                t = indice.por_nombre_parcial(nombre_norm)
+                if t is not None:
+                    return t
+
+        # 4. NIF exacto en maestro global
+        if nif_norm:
+            return self._indice_maestro(gestor).por_nif(nif_norm)
 
+        return None
+
+    def _indice_empresa(self, gestor, codigo: str, ejercicio: int) -> "IndiceTerceros":
+        clave = (str(codigo), int(ejercicio or 0))
+        indice = self._indices.get(clave)
+        if indice is None or not indice.vigente(gestor):
+            indice = IndiceTerceros(gestor, self._candidatos_empresa(gestor, codigo, ejercicio))
+            self._indices[clave] = indice
+        return indice
+
+    def _indice_maestro(self, gestor) -> "IndiceTerceros":
+        indice = self._indice_global
+        if indice is None or not indice.vigente(gestor):
+            indice = IndiceTerceros(gestor, list(gestor.listar_terceros() or []))
+            self._indice_global = indice
+        return indice
+
+    def _candidatos_empresa(self, gestor, codigo: str, ejercicio: int) -> list[dict]:
         empresa_terceros = [
             self._normalizar_candidato_facturacion(t)
             for t in gestor.listar_subcuentas_facturacion(
@@ -89,34 +148,7 @@ class TercerosOcrService:
                 if key not in seen:
                     empresa_terceros.append(t)
                     seen.add(key)
-
-        # 1. NIF exacto en terceros de la empresa
-        if nif_norm:
-            for t in empresa_terceros:
-                if _norm_nif(t.get("nif")) == nif_norm:
-                    return t
-
-        # 2+3. Nombre normalizado en terceros de la empresa
-        if nombre_norm:
-            # Exacto
-            for t in empresa_terceros:
-                if _norm_nombre(t.get("nombre") or "") == nombre_norm:
-                    return t
-            # Parcial (uno contiene al otro, minimo 5 chars para evitar falsos)
-            if len(nombre_norm) >= 5:
-                for t in empresa_terceros:
-                    t_norm = _norm_nombre(t.get("nombre") or "")
-                    if t_norm and len(t_norm) >= 5:
-                        if nombre_norm in t_norm or t_norm in nombre_norm:
-                            return t
-
-        # 4. NIF exacto en maestro global
-        if nif_norm:
-            for t in gestor.listar_terceros():
-                if _norm_nif(t.get("nif")) == nif_norm:
-                    return t
-
-        return None
+        return empresa_terceros
 
     def _normalizar_candidato_facturacion(self, item: dict) -> dict:
         out = dict(item or {})
@@ -156,43 +188,20 @@ class TercerosOcrService:
     ) -> str:
         """Calcula la siguiente subcuenta libre para el tipo de tercero.
 
-        Consulta (sin modificar):
+        Consulta en una sola sentencia:
           1. maestro_subcuentas_empresa (fuente de verdad nueva)
           2. terceros_empresas (legacy, backward compat)
           3. plan_cuentas (cuentas importadas de A3)
-        No persiste nada.
+        No crea la subcuenta; solo la reserva unos minutos para este puesto.
         """
         empresa = gestor.get_empresa(codigo, ejercicio) or {}
         ndig = int(empresa.get("digitos_plan") or 8)
         prefijo = PREFIJOS.get(tipo_tercero, "400")
         campo = CAMPO_SUBCUENTA.get(tipo_tercero, "subcuenta_proveedor")
-
-        usadas: set[int] = set()
-
-        # 1. maestro_subcuentas_empresa (nuevo)
-        for sub in gestor.listar_maestro_subcuentas_empresa(codigo, activo=None):
-            val = str(sub.get("subcuenta") or "").strip()
-            if _es_subcuenta_valida(val, prefijo, ndig):
-                usadas.add(int(val))
-
-        # 2. terceros_empresas (legacy)
-        for t in gestor.listar_terceros_por_empresa(codigo, ejercicio):
-            sub = str(t.get(campo) or "").strip()
-            if _es_subcuenta_valida(sub, prefijo, ndig):
-                usadas.add(int(sub))
-
-        # 3. plan_cuentas importado de A3 para el ejercicio activo
-        for cuenta in gestor.get_plan_cuentas(codigo, ejercicio):
-            val = str(cuenta.get("cuenta") or "").strip()
-            if _es_subcuenta_valida(val, prefijo, ndig):
-                usadas.add(int(val))
-
-        primera = int(prefijo) * (10 ** (ndig - len(prefijo))) + 1
-        candidato = primera
-        while candidato in usadas:
-            candidato += 1
-
-        return str(candidato).zfill(ndig)
+        return gestor.proponer_subcuenta_libre(
+            codigo, prefijo, ndig,
+            ejercicio=ejercicio, campo_terceros=campo, reservar=True,
+        )
 
     # ── Creacion de tercero ───────────────────────────────────────────────────
 
@@ -220,10 +229,9 @@ class TercerosOcrService:
         # Anti-duplicado: si ya existe por NIF, reusar su id
         tercero_id: str | None = None
         if nif:
-            for t in gestor.listar_terceros():
-                if _norm_nif(t.get("nif")) == _norm_nif(nif):
-                    tercero_id = str(t["id"])
-                    break
+            existente = self._indice_maestro(gestor).por_nif(_norm_nif(nif))
+            if existente is not None:
+                tercero_id = str(existente["id"])
 
         tercero = {
             "id":        tercero_id,
@@ -286,7 +294,92 @@ class TercerosOcrService:
         nif_norm = _norm_nif(nif)
         if not nif_norm:
             return False
-        return any(_norm_nif(t.get("nif")) == nif_norm for t in gestor.listar_terceros())
+        return self._indice_maestro(gestor).por_nif(nif_norm) is not None
+
+
+# ── Indice de busqueda ────────────────────────────────────────────────────────
+
+INDICE_TTL_S = 300.0
+
+
+class IndiceTerceros:
+    """Indice en memoria de una lista de candidatos.
+
+    Conserva la semantica de la busqueda lineal: ante varios candidatos
+    validos gana el primero de la lista original.
+    """
+
+    def __init__(self, gestor, candidatos: list[dict]):
+        self._gestor = gestor
+        self._generacion = _generacion(gestor)
+        self._creado = time.monotonic()
+        self._candidatos = candidatos
+        self._nifs: dict[str, int] = {}
+        self._nombres: dict[str, int] = {}
+        self._nombres_norm: list[str] = []
+        self._trigramas: dict[str, list[int]] = defaultdict(list)
+        self._n_trigramas: list[int] = []
+        for pos, t in enumerate(candidatos):
+            nif = _norm_nif(t.get("nif"))
+            if nif:
+                self._nifs.setdefault(nif, pos)
+            nombre = _norm_nombre(t.get("nombre") or "")
+            self._nombres_norm.append(nombre)
+            if nombre:
+                self._nombres.setdefault(nombre, pos)
+            gramas = _trigramas(nombre) if len(nombre) >= 5 else set()
+            self._n_trigramas.append(len(gramas))
+            for grama in gramas:
+                self._trigramas[grama].append(pos)
+
+    def vigente(self, gestor) -> bool:
+        return (
+            gestor is self._gestor
+            and _generacion(gestor) == self._generacion
+            and time.monotonic() - self._creado < INDICE_TTL_S
+        )
+
+    def por_nif(self, nif_norm: str) -> dict | None:
+        pos = self._nifs.get(nif_norm)
+        return self._candidatos[pos] if pos is not None else None
+
+    def por_nombre(self, nombre_norm: str) -> dict | None:
+        pos = self._nombres.get(nombre_norm)
+        return self._candidatos[pos] if pos is not None else None
+
+    def por_nombre_parcial(self, nombre_norm: str) -> dict | None:
+        """Primer candidato cuyo nombre contiene o esta contenido en el buscado.
+
+        Si A contiene a B, todos los trigramas de B estan en A: basta contar
+        coincidencias por candidato y verificar solo los que cubren todos los
+        trigramas del buscado o todos los suyos.
+        """
+        gramas = _trigramas(nombre_norm)
+        if not gramas:
+            return None
+        aciertos: dict[int, int] = defaultdict(int)
+        for grama in gramas:
+            for pos in self._trigramas.get(grama, ()):
+                aciertos[pos] += 1
+        for pos in sorted(aciertos):
+            n = aciertos[pos]
+            if n != len(gramas) and n != self._n_trigramas[pos]:
+                continue
+            t_norm = self._nombres_norm[pos]
+            if nombre_norm in t_norm or t_norm in nombre_norm:
+                return self._candidatos[pos]
+        return None
+
+
+def _generacion(gestor) -> int:
+    try:
+        return int(gestor.generacion_terceros())
+    except Exception:
+        return 0
+
+
+def _trigramas(texto: str) -> set[str]:
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
 
 
 # ── Utilidades de normalizacion (nivel modulo, testables) ─────────────────────
@@ -326,11 +419,3 @@ def _norm_nombre(nombre: str | None) -> str:
     # Eliminar sufijos juridicos
     palabras = [p for p in s.split() if p not in _SUFIJOS_LEGALES]
     return " ".join(palabras).strip()
-
-
-def _es_subcuenta_valida(sub: str, prefijo: str, ndig: int) -> bool:
-    return (
-        sub.startswith(prefijo)
-        and sub.isdigit()
-        and len(sub) == ndig
-    )
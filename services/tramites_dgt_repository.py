@@ -4,6 +4,8 @@ from typing import Protocol
 
 import requests
 
+from services.backend_http import sesion_backend
+
 
 class DgtRepository(Protocol):
     def listar_expedientes(self) -> list[dict]:
@@ -47,7 +49,7 @@ class ApiDgtRepository:
         if not self.base_url or not self.api_key:
             raise ValueError("Configura integrations_api_url y workstation_token para usar Tramites DGT online.")
         self.timeout = timeout
-        self._http = session or requests.Session()
+        self._http = session or sesion_backend()
 
     def _request(self, method: str, path: str, **kwargs):
         headers = dict(kwargs.pop("headers", {}))
@@ -0,0 +1,304 @@
+import threading
+import time
+
+import pytest
+
+from models.auth import CompanyPermission, UserRecord, UserRole, UserSession
+from services.aapp import sync_service
+from services.auth_service import AuthorizationService
+from services.secured_gestor import SecuredGestor
+from services.aapp.base import NotificacionDTO, OpcionesSync, ResultadoSync
+
+
+class _GestorFalso:
+    def __init__(self):
+        self.logs = []
+        self.bandeja = {}
+        self.buzones = []
+        self.hilos = set()
+
+    def get_empresa(self, codigo):
+        self.hilos.add(threading.get_ident())
+        return {"cif": f"B{codigo}"}
+
+    def upsert_notif_bandeja_items(self, items):
+        self.hilos.add(threading.get_ident())
+        nuevos = [item["id"] for item in items if item["id"] not in self.bandeja]
+        self.bandeja.update({item["id"]: item for item in items})
+        return nuevos
+
+    def upsert_notif_sync_log(self, log):
+        self.hilos.add(threading.get_ident())
+        self.logs.append(log)
+
+    def upsert_notif_buzon(self, buzon):
+        self.buzones.append(buzon)
+
+
+class _CertStoreFalso:
+    def __init__(self, gestor):
+        self.gestor = gestor
+
+    def material_para_buzon(self, buzon):
+        if buzon.get("sin_cert"):
+            raise sync_service.CertError("sin certificado")
+        return object()
+
+
+class _NavegadorFalso:
+    creados = []
+
+    def __init__(self, headless=True):
+        self.cerrado = False
+        _NavegadorFalso.creados.append(self)
+
+    def obtener(self):
+        return self
+
+    def cerrar(self):
+        self.cerrado = True
+
+
+class _ConectorFalso:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.activos = 0
+        self.max_activos = 0
+        self.navegadores = []
+        self.nif_filtros = []
+
+    def sincronizar(self, buzon, material, opciones, navegador=None):
+        with self.lock:
+            self.activos += 1
+            self.max_activos = max(self.max_activos, self.activos)
+            self.navegadores.append(navegador)
+            self.nif_filtros.append(opciones.nif_filtro)
+        time.sleep(0.05)
+        with self.lock:
+            self.activos -= 1
+        return ResultadoSync(
+            ok=True, organismo_codigo="DEHU",
+            notificaciones=[NotificacionDTO(referencia=f"ref-{buzon['id']}", asunto="Aviso")],
+        )
+
+
+def _preparar(monkeypatch):
+    conector = _ConectorFalso()
+    _NavegadorFalso.creados = []
+    monkeypatch.setattr(sync_service, "CertStore", _CertStoreFalso)
+    monkeypatch.setattr(sync_service, "NavegadorCompartido", _NavegadorFalso)
+    monkeypatch.setattr(sync_service, "obtener_conector", lambda _codigo: conector)
+    return conector
+
+
+def _buzon(n, **extra):
+    datos = {"id": f"bz{n}", "nombre": f"Buzon {n}", "codigo_empresa": f"{n:05d}",
+             "organismo_codigo": "DEHU", "organismo_id": 1, "activo": 1}
+    datos.update(extra)
+    return datos
+
+
+def test_sincronizar_buzones_en_paralelo_con_navegador_por_hilo(monkeypatch):
+    conector = _preparar(monkeypatch)
+    gestor = _GestorFalso()
+    opciones = OpcionesSync()
+    recibidos = []
+
+    glob = sync_service.sincronizar_buzones(
+        gestor, [_buzon(i) for i in range(6)], opciones,
+        ejercicio=2026, max_concurrentes=3, on_resultado=recibidos.append,
+    )
+
+    assert len(glob.resultados) == 6
+    assert [r.buzon_id for r in recibidos] == [r.buzon_id for r in glob.resultados]
+    assert glob.total_nuevas == 6
+    assert conector.max_activos > 1
+    assert len(_NavegadorFalso.creados) == 3
+    assert all(nav.cerrado for nav in _NavegadorFalso.creados)
+    assert set(conector.navegadores) <= set(_NavegadorFalso.creados)
+    # La persistencia se hace siempre en el hilo que llama.
+    assert gestor.hilos == {threading.get_ident()}
+    # Cada buzon filtra por su propio NIF sin tocar las opciones compartidas.
+    assert sorted(conector.nif_filtros) == sorted(f"B{i:05d}" for i in range(6))
+    assert opciones.nif_filtro is None
+
+
+def test_sincronizar_buzones_registra_tiempos_y_errores_de_certificado(monkeypatch):
+    _preparar(monkeypatch)
+    gestor = _GestorFalso()
+
+    glob = sync_service.sincronizar_buzones(
+        gestor, [_buzon(1), _buzon(2, sin_cert=True), _buzon(3, activo=0)],
+        ejercicio=2026, max_concurrentes=2,
+    )
+
+    assert len(glob.resultados) == 2
+    assert [r.buzon_id for r in glob.con_error] == ["bz2"]
+    logs = {log["buzon_id"]: log for log in gestor.logs}
+    assert logs["bz1"]["resultado"] == "OK"
+    assert logs["bz1"]["notificaciones_nuevas"] == 1
+    assert logs["bz1"]["duracion_ms"] >= 50
+    assert logs["bz2"]["resultado"] == "ERROR"
+    assert "sin certificado" in logs["bz2"]["error_detalle"]
+
+
+class _CursorBandeja:
+    def __init__(self, filas):
+        self._filas = filas
+
+    def fetchall(self):
+        return self._filas
+
+
+class _ConexionBandeja:
+    def __init__(self, existentes):
+        self.existentes = set(existentes)
+        self.sentencias = []
+        self.commits = 0
+
+    def execute(self, sql, params):
+        self.sentencias.append((sql, params))
+        ids = params[::20]
+        filas = [(item_id, item_id not in self.existentes) for item_id in ids]
+        self.existentes.update(ids)
+        return _CursorBandeja(filas)
+
+    def commit(self):
+        self.commits += 1
+
+
+def test_upsert_notif_bandeja_items_usa_una_sentencia_y_devuelve_nuevos():
+    from models.gestor_base import GestorBase
+
+    gestor = GestorBase.__new__(GestorBase)
+    gestor.conn = _ConexionBandeja(existentes={"nb_1"})
+    items = [
+        {"id": "nb_1", "codigo_empresa": "00001", "ejercicio": 2026, "asunto": "A"},
+        {"id": "nb_2", "codigo_empresa": "00001", "ejercicio": 2026, "asunto": "B"},
+        {"id": "nb_2", "codigo_empresa": "00001", "ejercicio": 2026, "asunto": "B2"},
+    ]
+
+    nuevos = gestor.upsert_notif_bandeja_items(items)
+
+    assert nuevos == ["nb_2"]
+    assert len(gestor.conn.sentencias) == 1
+    sql, params = gestor.conn.sentencias[0]
+    assert "ON CONFLICT(id) DO UPDATE" in sql
+    assert "RETURNING id, (xmax = 0) AS nuevo" in sql
+    assert len(params) == 40
+    assert params[25] == "B2"
+    assert gestor.conn.commits == 1
+    assert gestor.upsert_notif_bandeja_items([]) == []
+
+
+class _CertMaterialFalso:
+    nif_titular = "B00001"
+    nombre = "Cliente"
+
+
+def test_map_registros_omite_referencias_conocidas_sin_cambios():
+    from services.aapp.dehu_playwright import ConectorDEHU, _pagina_ya_vista
+
+    registros = [
+        {"identifier": "N1", "state": "PENDIENTE", "_endpoint": "/api/v1/notifications",
+         "availabilityDate": "2026-03-01"},
+        {"identifier": "N2", "state": "ACEPTADA", "_endpoint": "/api/v1/realized_notifications",
+         "availabilityDate": "2026-02-01"},
+        {"identifier": "N3", "state": "PENDIENTE", "_endpoint": "/api/v1/notifications",
+         "availabilityDate": "2026-03-05"},
+    ]
+    conocidas = {"N1": "P:PENDIENTE", "N2": "P:PENDIENTE"}
+
+    notifs, detectadas = ConectorDEHU()._map_registros(registros, _CertMaterialFalso(), conocidas=conocidas)
+
+    # N1 sin cambios se omite; N2 paso a realizada; N3 es nueva.
+    assert [n.referencia for n in notifs] == ["N2", "N3"]
+    assert detectadas == 3
+    assert notifs[0].metadatos["firma_sync"] == "R:ACEPTADA"
+    assert _pagina_ya_vista(registros[:1], conocidas, "2026-03-01") is True
+    assert _pagina_ya_vista(registros, conocidas, "2026-03-01") is False
+    assert _pagina_ya_vista(registros[:1], {}, None) is False
+    # Lo anterior a la fecha de corte ya no se sigue en las incrementales.
+    notifs, detectadas = ConectorDEHU()._map_registros(
+        registros, _CertMaterialFalso(), conocidas=conocidas, fecha_corte="2026-02-15",
+    )
+    assert [n.referencia for n in notifs] == ["N3"] and detectadas == 3
+
+
+def test_sincronizar_buzon_usa_y_amplia_la_marca_de_agua(monkeypatch):
+    conector = _preparar(monkeypatch)
+    recibidas = []
+    original = conector.sincronizar
+
+    def _sincronizar(buzon, material, opciones, navegador=None):
+        recibidas.append((opciones.desde_fecha, dict(opciones.referencias_conocidas)))
+        res = original(buzon, material, opciones, navegador)
+        res.notificaciones[0].fecha_puesta_disposicion = "2026-04-02"
+        res.notificaciones[0].metadatos["firma_sync"] = "P:PENDIENTE"
+        return res
+
+    conector.sincronizar = _sincronizar
+    gestor = _GestorFalso()
+    marcas = []
+    gestor.actualizar_marca_sync_notif_buzon = lambda *args: marcas.append(args)
+    buzon = _buzon(1, hwm_fecha_disposicion="2026-04-01", hwm_sync_completa=sync_service._now(),
+                   hwm_referencias_json='{"ref-antigua": "R:ACEPTADA", "ref-caducada": ["R:ACEPTADA", "2025-12-01"]}')
+
+    res = sync_service.sincronizar_buzon(gestor, buzon, OpcionesSync(), ejercicio=2026)
+
+    assert res.ok
+    assert recibidas == [("2026-04-01", {"ref-antigua": "R:ACEPTADA", "ref-caducada": "R:ACEPTADA"})]
+    # Se amplia la marca y se descarta lo anterior a la fecha de corte (90 dias).
+    assert marcas == [(
+        "00001", "bz1", "2026-04-02",
+        {"ref-antigua": ["R:ACEPTADA", None], "ref-bz1": ["P:PENDIENTE", "2026-04-02"]},
+        None,
+    )]
+
+
+def test_sincronizar_buzon_hace_pasada_completa_periodica(monkeypatch):
+    conector = _preparar(monkeypatch)
+    recibidas = []
+    original = conector.sincronizar
+
+    def _sincronizar(buzon, material, opciones, navegador=None):
+        recibidas.append((opciones.incremental, opciones.referencias_conocidas))
+        res = original(buzon, material, opciones, navegador)
+        res.detectadas = 40
+        res.notificaciones[0].metadatos["firma_sync"] = "P:PENDIENTE"
+        return res
+
+    conector.sincronizar = _sincronizar
+    gestor = _GestorFalso()
+    marcas = []
+    gestor.actualizar_marca_sync_notif_buzon = lambda *args: marcas.append(args)
+    hace_un_mes = "2026-01-01T00:00:00"
+    buzon = _buzon(1, hwm_fecha_disposicion="2026-04-01", hwm_sync_completa=hace_un_mes,
+                   hwm_referencias_json='{"ref-retirada": ["R:ACEPTADA", "2026-03-30"]}')
+
+    res = sync_service.sincronizar_buzon(gestor, buzon, OpcionesSync(), ejercicio=2026)
+
+    assert recibidas == [(False, {})]
+    # La pasada completa rehace la marca con lo visto y guarda su fecha.
+    (codigo, buzon_id, fecha, referencias, completa), = marcas
+    assert referencias == {"ref-bz1": ["P:PENDIENTE", None]} and completa
+    # El total sigue siendo lo visto en el portal, no solo lo guardado.
+    assert res.total_detectadas == 40
+    assert res.mensaje == "40 detectada(s), 1 nueva(s)."
+
+
+def test_secured_gestor_exige_escritura_en_cada_empresa_del_lote():
+    sesion = UserSession(
+        user=UserRecord(7, "empleado", "Ana", UserRole.EMPLEADO, True),
+        company_permissions={"E00001": CompanyPermission.WRITE, "E00002": CompanyPermission.READ},
+    )
+    base = _GestorFalso()
+    gestor = SecuredGestor(base, AuthorizationService(sesion))
+
+    assert gestor.upsert_notif_bandeja_items([{"id": "n1", "codigo_empresa": "E00001"}]) == ["n1"]
+    with pytest.raises(PermissionError):
+        gestor.upsert_notif_bandeja_items([
+            {"id": "n2", "codigo_empresa": "E00001"},
+            {"id": "n3", "codigo_empresa": "E00002"},
+        ])
+    assert set(base.bandeja) == {"n1"}
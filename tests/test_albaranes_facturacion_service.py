@@ -0,0 +1,190 @@
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+
+from models import gestor_base
+from models.auth import CompanyPermission, UserRecord, UserRole, UserSession
+from models.gestor_base import SCHEMA, GestorBase
+from services.albaranes_facturacion_service import FacturadorAlbaranes, agrupar_por_cliente
+from services.auth_service import AuthorizationService
+from services.secured_gestor import SecuredGestor
+
+
+def _albaran(aid, nif, base=100, pct_iva=21, **overrides):
+    alb = {
+        "id": aid,
+        "codigo_empresa": "E00001",
+        "ejercicio": 2026,
+        "serie": "ALB",
+        "numero": f"Alb-2026-{aid}",
+        "fecha_asiento": "10/03/2026",
+        "nif": nif,
+        "nombre": f"Cliente {nif}",
+        "tercero_id": f"T-{nif}",
+        "facturado": False,
+        "lineas": [{"base": base, "pct_iva": pct_iva, "cuota_iva": round(base * pct_iva / 100, 2)}],
+    }
+    alb.update(overrides)
+    return alb
+
+
+def test_agrupar_por_cliente_en_una_pasada_normaliza_nif_y_omite_facturados():
+    albaranes = [
+        _albaran("1", "B-1234"),
+        _albaran("2", "X999"),
+        _albaran("3", "b1234"),
+        _albaran("4", "X999", facturado=True),
+        _albaran("5", "", tercero_id="T9"),
+    ]
+
+    grupos = agrupar_por_cliente(albaranes)
+
+    assert [[a["id"] for a in g] for g in grupos] == [["1", "3"], ["2"], ["5"]]
+
+
+def test_preparar_numera_solo_las_facturas_agrupadas():
+    albaranes = [
+        _albaran("1", "B1234", 100),
+        _albaran("2", "X999", 50, pct_iva=10),
+        _albaran("3", "B1234", 20),
+        _albaran("4", "B1234", 30, pct_iva=10),
+    ]
+    facturador = FacturadorAlbaranes(gestor=None)
+
+    facturas = facturador.preparar(
+        "E00001",
+        agrupar_por_cliente(albaranes),
+        "15/03/2026",
+        2026,
+        serie="A",
+        numeros=["000007"],
+        moneda=("EUR", "€"),
+        plantilla_por_defecto=lambda eje: f"General {eje}",
+    )
+
+    (agrupada, ids_agrupada), (simple, ids_simple) = facturas
+    assert ids_agrupada == ["1", "3", "4"] and ids_simple == ["2"]
+    assert (agrupada["serie"], agrupada["numero"]) == ("A", "000007")
+    assert (simple["serie"], simple["numero"]) == ("ALB", "Alb-2026-2")
+    assert [(ln["pct_iva"], ln["base"], ln["cuota_iva"]) for ln in agrupada["lineas"]] == [
+        (21.0, 120.0, 25.2),
+        (10.0, 30.0, 3.0),
+    ]
+    assert agrupada["descripcion"].startswith("Factura correspondiente a los albaranes: Alb-2026-1 de fecha 10/03/2026")
+    assert (agrupada["moneda_codigo"], agrupada["plantilla_emitidas"]) == ("EUR", "General 2026")
+
+    with pytest.raises(ValueError):
+        facturador.preparar("E00001", agrupar_por_cliente(albaranes), "15/03/2026", 2026, serie="A")
+
+
+def _gestor_sqlite():
+    gestor = GestorBase.__new__(GestorBase)
+    gestor.conn = sqlite3.connect(":memory:")
+    gestor.conn.row_factory = sqlite3.Row
+    gestor.conn.executescript("""
+        CREATE TABLE albaranes_emitidas_docs (id TEXT PRIMARY KEY, codigo_empresa TEXT, ejercicio INTEGER,
+                                              numero TEXT, fecha_asiento TEXT, lineas_json TEXT,
+                                              facturado INTEGER, retencion_aplica INTEGER,
+                                              factura_id TEXT, fecha_facturacion TEXT);
+        INSERT INTO albaranes_emitidas_docs (id, codigo_empresa, ejercicio, numero, fecha_asiento, lineas_json, facturado)
+        VALUES ('1', 'E00001', 2026, 'A1', '01/03/2026', '[{"base": 10}]', 0),
+               ('2', 'E00001', 2026, 'A2', '02/03/2026', '[]', 0),
+               ('3', 'E00001', 2026, 'A3', '03/03/2026', '[]', 0),
+               ('4', 'E00002', 2026, 'A4', '04/03/2026', '[]', 0);
+    """)
+    return gestor
+
+
+def test_cargar_albaranes_por_ids_con_una_consulta_y_en_el_orden_pedido():
+    gestor = _gestor_sqlite()
+
+    albaranes = FacturadorAlbaranes(gestor).cargar("E00001", ["3", "1", "4", "X"], 2026)
+
+    assert [a["id"] for a in albaranes] == ["3", "1"]
+    assert albaranes[1]["lineas"] == [{"base": 10}] and albaranes[1]["facturado"] is False
+
+
+def test_facturar_albaranes_en_bloque_deshace_todo_si_falla_una():
+    gestor = _gestor_sqlite()
+
+    def upsert(factura, commit=True):
+        assert commit is False
+        if factura["id"] == "F2":
+            raise RuntimeError("fallo")
+        return factura["id"]
+
+    gestor.upsert_factura_emitida = upsert
+    with pytest.raises(RuntimeError):
+        gestor.facturar_albaranes_en_bloque("E00001", 2026, [({"id": "F1"}, ["1", "2"]), ({"id": "F2"}, ["3"])], "x")
+    assert not any(a["facturado"] for a in gestor.listar_albaranes_emitidas("E00001", 2026))
+
+    gestor.upsert_factura_emitida = lambda factura, commit=True: factura["id"]
+    ids = FacturadorAlbaranes(gestor).facturar(
+        "E00001", 2026, [({"id": "F1"}, ["1", "2"]), ({"id": "F3"}, ["3"])], "2026-03-15 10:00"
+    )
+
+    assert ids == ["F1", "F3"]
+    assert [(a["id"], a["facturado"], a["factura_id"]) for a in gestor.listar_albaranes_emitidas("E00001", 2026)] == [
+        ("1", True, "F1"),
+        ("2", True, "F1"),
+        ("3", True, "F3"),
+    ]
+
+
+def test_facturar_albaranes_en_bloque_marca_todos_con_un_solo_update():
+    gestor = _gestor_sqlite()
+    gestor.upsert_factura_emitida = lambda factura, commit=True: factura["id"]
+    sentencias = []
+    gestor.conn.set_trace_callback(sentencias.append)
+
+    gestor.facturar_albaranes_en_bloque("E00001", 2026, [({"id": "F1"}, ["1", "2"]), ({"id": "F3"}, ["3"])], "x")
+
+    gestor.conn.set_trace_callback(None)
+    assert sum(sql.lstrip().upper().startswith("UPDATE") for sql in sentencias) == 1
+    assert [a["factura_id"] for a in gestor.listar_albaranes_emitidas("E00001", 2026)] == ["F1", "F1", "F3"]
+
+
+def test_facturas_del_mismo_lote_no_se_pisan_en_el_gestor(monkeypatch):
+    gestor = GestorBase.__new__(GestorBase)
+    gestor.conn = sqlite3.connect(":memory:")
+    gestor.conn.row_factory = sqlite3.Row
+    gestor.conn.executescript(SCHEMA)
+    for columna in ("borrador", "subcuenta_ingreso", "subcuenta_iva", "subcuenta_retencion"):
+        gestor._ensure_column("facturas_emitidas_docs", columna, "TEXT")
+    gestor._indexar_referencias_subcuenta = lambda *_args: None
+    albaranes = [_albaran("1", "B1234"), _albaran("2", "B1234"), _albaran("3", "X999")]
+    gestor.conn.executemany(
+        "INSERT INTO albaranes_emitidas_docs (id, codigo_empresa, ejercicio, numero, facturado) VALUES (?,?,?,?,0)",
+        [(a["id"], a["codigo_empresa"], a["ejercicio"], a["numero"]) for a in albaranes],
+    )
+    # Mismo milisegundo para todo el lote: sin id propio las facturas colisionarian.
+    monkeypatch.setattr(gestor_base.time, "time", lambda: 1773568800.0)
+    facturador = FacturadorAlbaranes(gestor)
+    facturas = facturador.preparar(
+        "E00001", agrupar_por_cliente(albaranes), "15/03/2026", 2026, serie="A", numeros=["000007"],
+    )
+
+    ids = facturador.facturar("E00001", 2026, facturas, "2026-03-15 10:00")
+
+    assert len(set(ids)) == 2
+    guardadas = gestor.listar_facturas_emitidas("E00001", 2026)
+    assert sorted(f["numero"] for f in guardadas) == ["000007", "Alb-2026-3"]
+    assert [(a["id"], a["factura_id"]) for a in gestor.listar_albaranes_emitidas("E00001", 2026)] == [
+        ("1", ids[0]),
+        ("2", ids[0]),
+        ("3", ids[1]),
+    ]
+
+
+def test_secured_gestor_exige_lectura_para_cargar_albaranes_por_id():
+    sesion = UserSession(
+        user=UserRecord(7, "empleado", "Ana", UserRole.EMPLEADO, True),
+        company_permissions={"E00702": CompanyPermission.READ},
+    )
+    base = SimpleNamespace(listar_albaranes_emitidas_por_ids=lambda codigo, ids, ejercicio=None: [{"id": i} for i in ids])
+    gestor = SecuredGestor(base, AuthorizationService(sesion))
+
+    assert FacturadorAlbaranes(gestor).cargar("E00702", ["1"], 2026) == [{"id": "1"}]
+    with pytest.raises(PermissionError):
+        FacturadorAlbaranes(gestor).cargar("E00999", ["1"], 2026)
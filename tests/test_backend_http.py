@@ -0,0 +1,47 @@
+from datetime import timedelta
+from types import SimpleNamespace
+
+from services import backend_http
+from services.dgt_remote_integrations import _BackendClient
+
+
+def test_clientes_comparten_la_sesion_con_pool_y_reintentos():
+    sesion = backend_http.sesion_backend()
+
+    assert backend_http.sesion_backend() is sesion
+    assert _BackendClient("https://api.example.test", "token").http is sesion
+    adaptador = sesion.get_adapter("https://api.example.test")
+    assert adaptador._pool_maxsize == backend_http.POOL_CONEXIONES
+    reintentos = adaptador.max_retries
+    assert reintentos.is_retry("GET", 503) and not reintentos.is_retry("POST", 503)
+    assert "gzip" in sesion.headers["Accept-Encoding"]
+    assert not sesion.cookies.get_policy().allowed_domains()
+
+
+def test_espera_entre_reintentos_con_dispersion(monkeypatch):
+    reintentos = backend_http._politica_reintentos()
+    for _ in range(3):
+        reintentos = reintentos.increment("GET", "/x")
+    monkeypatch.setattr(backend_http.random, "uniform", lambda a, b: b)
+    maxima = reintentos.get_backoff_time()
+    monkeypatch.setattr(backend_http.random, "uniform", lambda a, b: a)
+
+    assert maxima == 3 * reintentos.get_backoff_time()
+    assert maxima <= backend_http.ESPERA_MAX_S
+
+
+def test_observadores_reciben_la_duracion():
+    medidas = []
+    observador = lambda *datos: medidas.append(datos)
+    backend_http.registrar_observador(observador)
+    respuesta = SimpleNamespace(
+        elapsed=timedelta(milliseconds=250), request=SimpleNamespace(method="GET"),
+        url="https://api.example.test/x", status_code=200,
+    )
+    try:
+        assert backend_http._medir(respuesta) is respuesta
+    finally:
+        backend_http.quitar_observador(observador)
+    backend_http._medir(respuesta)
+
+    assert medidas == [("GET", "https://api.example.test/x", 200, 0.25)]
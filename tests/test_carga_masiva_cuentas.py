@@ -0,0 +1,261 @@
+import os
+import uuid
+
+import pandas as pd
+import pytest
+
+from models.gestor_base import GestorBase
+from models.gestor_postgres import ConexionPostgres, GestorPostgres
+from services.maestro_contable_empresa_service import MaestroContableEmpresaService
+
+
+class _Cursor:
+    def __init__(self, fila=None, rowcount=0):
+        self._fila = fila
+        self.rowcount = rowcount
+
+    def fetchone(self):
+        return self._fila
+
+
+class _ConexionCopy:
+    def __init__(self, fallo=False):
+        self.sentencias = []
+        self.copias = []
+        self.fallo = fallo
+        self.commits = self.rollbacks = 0
+
+    def execute(self, sql, params=()):
+        self.sentencias.append(sql)
+        if sql.startswith("DELETE"):
+            return _Cursor(rowcount=3)
+        if sql.startswith("WITH fusion AS"):
+            if self.fallo:
+                raise RuntimeError("conflicto")
+            return _Cursor({"insertadas": 1, "actualizadas": 1})
+        return _Cursor()
+
+    def copiar_filas(self, sql, filas):
+        self.copias.append((sql, list(filas)))
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def _gestor(conn):
+    gestor = GestorBase.__new__(GestorBase)
+    gestor.conn = conn
+    return gestor
+
+
+def test_plan_se_vuelca_con_copy_y_una_fusion():
+    conn = _ConexionCopy()
+    recuento = _gestor(conn).cargar_plan_cuentas("00001", 2026, [
+        {"cuenta": "4300", "descripcion": "Clientes "},
+        {"cuenta": "4300", "descripcion": "Repetida"},
+        {"cuenta": "4000", "descripcion": "Proveedores"},
+        {"cuenta": "5720", "descripcion": "Bancos"},
+    ])
+
+    assert recuento == {"insertadas": 1, "actualizadas": 1, "sin_cambios": 1, "eliminadas": 3}
+    assert conn.copias == [(
+        "COPY _carga_plan_cuentas (cuenta, descripcion) FROM STDIN",
+        [("4300", "Clientes"), ("4000", "Proveedores"), ("5720", "Bancos")],
+    )]
+    assert conn.sentencias[0].startswith("CREATE TEMP TABLE _carga_plan_cuentas")
+    assert conn.commits == 1
+
+
+def test_maestro_sin_actualizar_no_toca_existentes_y_deshace_si_falla():
+    conn = _ConexionCopy()
+    _gestor(conn).cargar_maestro_subcuentas(
+        "00001", [{"subcuenta": "43000001", "nombre_subcuenta": "Cliente"}], actualizar=False,
+    )
+    assert "DO NOTHING" in conn.sentencias[-1]
+    assert conn.copias[0][1][0][:2] == ("43000001", "Cliente")
+
+    conn = _ConexionCopy(fallo=True)
+    with pytest.raises(RuntimeError):
+        _gestor(conn).cargar_maestro_subcuentas("00001", [{"subcuenta": "43000001"}])
+    assert "COALESCE(excluded.tercero_id, m.tercero_id)" in conn.sentencias[-1]
+    assert (conn.commits, conn.rollbacks) == (0, 1)
+
+
+class _GestorFalso:
+    def __init__(self):
+        self.llamadas = []
+        self.relaciones = {}
+        self.recuento = None
+
+    def listar_terceros(self):
+        self.llamadas.append("listar_terceros")
+        return [
+            {"id": "T1", "nif_normalizado": "B12345678", "nombre": "Alfa SL"},
+            {"id": "T2", "nif_normalizado": "", "nombre": "Beta SA"},
+            {"id": "T3", "nif_normalizado": "", "nombre": "Gamma"},
+            {"id": "T4", "nif_normalizado": "", "nombre": "Gamma"},
+        ]
+
+    def cargar_plan_cuentas(self, codigo, ejercicio, cuentas):
+        self.llamadas.append("plan")
+        self.plan = cuentas
+
+    def cargar_maestro_subcuentas(self, codigo, subcuentas, actualizar=True):
+        self.llamadas.append("maestro")
+        self.subcuentas = subcuentas
+        return self.recuento or {"insertadas": len(subcuentas), "actualizadas": 0, "sin_cambios": 0}
+
+    def get_tercero_empresa(self, codigo, tercero_id, ejercicio):
+        return None
+
+    def upsert_tercero_empresa(self, relacion):
+        self.relaciones[relacion["tercero_id"]] = relacion
+
+
+def test_importar_plan_a3_vincula_terceros_sin_consultas_por_fila():
+    gestor = _GestorFalso()
+    avisos = []
+    total = MaestroContableEmpresaService().importar_plan_desde_a3(
+        gestor, "00001", 2026,
+        [
+            {"cuenta": "43000001", "descripcion": "Cliente", "nif": "B12345678"},
+            {"cuenta": "40000001", "descripcion": "Beta, S.A."},
+            {"cuenta": "40000002", "descripcion": "Gamma"},
+            {"cuenta": "43000001", "descripcion": "Repetida"},
+        ],
+        progress_callback=lambda i, n: avisos.append((i, n)),
+    )
+
+    assert total == 3
+    assert gestor.llamadas == ["plan", "listar_terceros", "maestro"]
+    assert [s["tercero_id"] for s in gestor.subcuentas] == ["T1", "T2", None]
+    assert gestor.relaciones["T1"]["subcuenta_cliente"] == "43000001"
+    assert gestor.relaciones["T2"]["subcuenta_proveedor"] == "40000001"
+    assert avisos == [(3, 3)]
+
+
+def test_importar_plan_a3_avisa_del_progreso_por_bloques():
+    gestor = _GestorFalso()
+    avisos = []
+    cuentas = [{"cuenta": f"5720000{i}", "descripcion": f"Banco {i}"} for i in range(5)]
+
+    recuento = MaestroContableEmpresaService().cargar_subcuentas_a3(
+        gestor, "00001", cuentas,
+        progress_callback=lambda i, n: avisos.append((i, n)), tamano_bloque=2,
+    )
+
+    assert gestor.llamadas == ["listar_terceros", "maestro", "maestro", "maestro"]
+    assert avisos == [(2, 5), (4, 5), (5, 5)]
+    assert recuento == {"insertadas": 5, "actualizadas": 0, "sin_cambios": 0}
+
+
+def test_importar_dataframe_informa_filas_no_validas_y_solo_cuenta_cambios():
+    gestor = _GestorFalso()
+    gestor.recuento = {"insertadas": 1, "actualizadas": 1, "sin_cambios": 1}
+    df = pd.DataFrame({
+        "Subcuenta": ["43000001", "4300A001", "40000001", "1234567890123", "57200001.0", None],
+        "Descripcion": ["Cliente", "Mal", "Proveedor", "Larga", "Banco", "Vacia"],
+    })
+
+    resultado = MaestroContableEmpresaService().importar_subcuentas_desde_dataframe(gestor, "00001", df)
+
+    assert [s["subcuenta"] for s in gestor.subcuentas] == ["43000001", "40000001", "57200001"]
+    assert (resultado["importadas"], resultado["actualizadas"], resultado["omitidas"]) == (1, 1, 1)
+    assert resultado["errores"] == 2
+    assert resultado["detalles_error"][0].startswith("Fila 2 (4300A001):")
+    assert resultado["detalles_error"][1].startswith("Fila 4 (1234567890123):")
+
+
+@pytest.fixture
+def gestor_postgres():
+    dsn = os.getenv("GEST2A3ECO_TEST_DATABASE_URL", "").strip()
+    if not dsn:
+        pytest.skip("GEST2A3ECO_TEST_DATABASE_URL no configurado para tests PostgreSQL.")
+    psycopg = pytest.importorskip("psycopg")
+    from psycopg.rows import dict_row
+
+    esquema = f"test_carga_{uuid.uuid4().hex[:8]}"
+    gestor = GestorPostgres.__new__(GestorPostgres)
+    gestor.conn = ConexionPostgres(psycopg.connect(dsn, row_factory=dict_row))
+    gestor.conn.execute(f"CREATE SCHEMA {esquema}")
+    gestor.conn.execute(f"SET search_path TO {esquema}")
+    gestor.conn.execute(
+        "CREATE TABLE plan_cuentas (codigo_empresa TEXT NOT NULL, ejercicio INTEGER NOT NULL,"
+        " cuenta TEXT NOT NULL, descripcion TEXT, PRIMARY KEY (codigo_empresa, ejercicio, cuenta))"
+    )
+    gestor.conn.execute(
+        """CREATE TABLE maestro_subcuentas_empresa (
+               id SERIAL PRIMARY KEY, codigo_empresa TEXT NOT NULL, tercero_id TEXT,
+               subcuenta TEXT NOT NULL, nombre_subcuenta TEXT, tipo_subcuenta TEXT,
+               nif_snapshot TEXT, activo INTEGER NOT NULL DEFAULT 1, origen TEXT,
+               fecha_importacion TEXT, creado_en_gest2a3eco INTEGER NOT NULL DEFAULT 0,
+               pendiente_alta_a3 INTEGER NOT NULL DEFAULT 0, observaciones TEXT,
+               created_at TEXT, updated_at TEXT, UNIQUE (codigo_empresa, subcuenta))"""
+    )
+    gestor.conn.commit()
+    try:
+        yield gestor
+    finally:
+        gestor.conn.rollback()
+        gestor.conn.execute(f"DROP SCHEMA {esquema} CASCADE")
+        gestor.conn.commit()
+        gestor.conn.close()
+
+
+def test_plan_en_postgres_solo_reescribe_las_cuentas_que_cambian(gestor_postgres):
+    plan = [
+        {"cuenta": "4300", "descripcion": "Clientes"},
+        {"cuenta": "4000", "descripcion": "Proveedores"},
+        {"cuenta": "5720", "descripcion": "Bancos"},
+    ]
+    assert gestor_postgres.cargar_plan_cuentas("00001", 2026, plan) == {
+        "insertadas": 3, "actualizadas": 0, "sin_cambios": 0, "eliminadas": 0,
+    }
+
+    plan[1]["descripcion"] = "Proveedores varios"
+    plan[2] = {"cuenta": "5700", "descripcion": "Caja"}
+    assert gestor_postgres.cargar_plan_cuentas("00001", 2026, plan) == {
+        "insertadas": 1, "actualizadas": 1, "sin_cambios": 1, "eliminadas": 1,
+    }
+    assert gestor_postgres.get_plan_cuentas("00001", 2026) == [
+        {"cuenta": "4000", "descripcion": "Proveedores varios"},
+        {"cuenta": "4300", "descripcion": "Clientes"},
+        {"cuenta": "5700", "descripcion": "Caja"},
+    ]
+
+
+def test_maestro_en_postgres_cuenta_cambios_y_conserva_el_tercero(gestor_postgres):
+    def subcuenta(codigo, nombre, tercero_id=None):
+        return {"subcuenta": codigo, "nombre_subcuenta": nombre, "tipo_subcuenta": "cliente",
+                "tercero_id": tercero_id, "origen": "a3"}
+
+    primera = [subcuenta("43000001", "Alfa", "T1"), subcuenta("43000002", "Beta"), subcuenta("43000003", "Gamma")]
+    assert gestor_postgres.cargar_maestro_subcuentas("00001", primera) == {
+        "insertadas": 3, "actualizadas": 0, "sin_cambios": 0,
+    }
+
+    # Sin tercero en la importacion, la vinculacion existente se conserva y
+    # la fila no cuenta como cambiada.
+    segunda = [subcuenta("43000001", "Alfa"), subcuenta("43000002", "Beta SL"),
+               subcuenta("43000003", "Gamma"), subcuenta("43000004", "Delta")]
+    assert gestor_postgres.cargar_maestro_subcuentas("00001", segunda) == {
+        "insertadas": 1, "actualizadas": 1, "sin_cambios": 2,
+    }
+    assert gestor_postgres.cargar_maestro_subcuentas("00001", [subcuenta("43000002", "Otro")], actualizar=False) == {
+        "insertadas": 0, "actualizadas": 0, "sin_cambios": 1,
+    }
+    filas = {
+        r["subcuenta"]: (r["nombre_subcuenta"], r["tercero_id"])
+        for r in gestor_postgres.conn.execute(
+            "SELECT subcuenta, nombre_subcuenta, tercero_id FROM maestro_subcuentas_empresa"
+        ).fetchall()
+    }
+    assert filas == {
+        "43000001": ("Alfa", "T1"),
+        "43000002": ("Beta SL", None),
+        "43000003": ("Gamma", None),
+        "43000004": ("Delta", None),
+    }
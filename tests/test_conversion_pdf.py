@@ -0,0 +1,88 @@
+import threading
+
+import pytest
+from docx import Document
+
+import procesos.facturas_word as facturas_word
+from procesos.conversion_pdf import PoolConversores
+
+
+class _Conversor:
+    creados = []
+
+    def __init__(self):
+        self.hilo = threading.current_thread().name
+        self.convertidos = []
+        self.cerrado = False
+        _Conversor.creados.append(self)
+
+    def convertir(self, docx_path, pdf_path):
+        if "falla" in str(pdf_path):
+            raise RuntimeError("Word no responde")
+        with open(docx_path, "rb") as src, open(pdf_path, "wb") as dst:
+            dst.write(src.read())
+        self.convertidos.append(pdf_path)
+
+    def cerrar(self):
+        self.cerrado = True
+
+
+@pytest.fixture
+def conversores():
+    _Conversor.creados = []
+    return _Conversor.creados
+
+
+def test_pool_reutiliza_un_conversor_por_hilo_y_lo_cierra(conversores, tmp_path):
+    docx = tmp_path / "a.docx"
+    docx.write_bytes(b"docx")
+
+    with PoolConversores(hilos=2, fabrica=_Conversor) as pool:
+        for i in range(6):
+            pool.convertir(str(docx), str(tmp_path / f"{i}.pdf"))
+
+    assert 1 <= len(conversores) <= 2
+    assert sum(len(c.convertidos) for c in conversores) == 6
+    assert all(c.cerrado for c in conversores)
+    with pytest.raises(RuntimeError):
+        pool.convertir(str(docx), str(tmp_path / "x.pdf"))
+
+
+def test_lote_rellena_plantillas_en_paralelo_y_devuelve_errores_por_documento(conversores, tmp_path, monkeypatch):
+    plantilla = tmp_path / "plantilla.docx"
+    doc = Document()
+    doc.add_paragraph("Factura {{ factura.numero }}")
+    doc.save(plantilla)
+    lecturas = []
+    leer = facturas_word.Path.read_bytes
+    monkeypatch.setattr(
+        facturas_word.Path, "read_bytes",
+        lambda self: lecturas.append(self.name) or leer(self),
+    )
+
+    trabajos = [
+        (str(plantilla), {"factura": {"numero": str(i)}}, str(tmp_path / nombre))
+        for i, nombre in enumerate(["1.pdf", "falla.pdf", "3.pdf", "4.pdf"])
+    ]
+    with PoolConversores(hilos=3, fabrica=_Conversor) as pool:
+        errores = facturas_word.generar_pdfs_desde_plantilla_word(trabajos, pool=pool)
+
+    assert [type(e).__name__ if e else None for e in errores] == [None, "RuntimeError", None, None]
+    assert Document(str(tmp_path / "3.pdf")).paragraphs[0].text == "Factura 2"
+    assert lecturas == ["plantilla.docx"]
+
+
+def test_huella_cambia_con_el_contexto_y_la_plantilla(tmp_path):
+    plantilla = tmp_path / "plantilla.docx"
+    doc = Document()
+    doc.add_paragraph("{{ factura.numero }}")
+    doc.save(plantilla)
+    contexto = {"empresa": {"nombre": "Empresa"}, "factura": {"numero": "1"}}
+
+    huella = facturas_word.huella_pdf(str(plantilla), contexto)
+
+    assert facturas_word.huella_pdf(str(plantilla), dict(contexto)) == huella
+    assert facturas_word.huella_pdf(str(plantilla), {**contexto, "factura": {"numero": "2"}}) != huella
+    doc.add_paragraph("Pie")
+    doc.save(plantilla)
+    assert facturas_word.huella_pdf(str(plantilla), contexto) != huella
@@ -0,0 +1,223 @@
+import sqlite3
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+
+from models.auth import CompanyPermission, UserRecord, UserRole, UserSession
+from models.gestor_base import GestorBase
+from services.auth_service import AuthorizationService
+from services.cuotas_periodicas_service import GeneradorCuotas, id_factura_cuota
+from services.secured_gestor import SecuredGestor
+
+
+def _cuota(cid, **overrides):
+    cuota = {
+        "id": cid,
+        "codigo_empresa": "E00001",
+        "ejercicio": 2026,
+        "activa": 1,
+        "tercero_id": f"T{cid}",
+        "nif": "",
+        "nombre": f"Cliente {cid}",
+        "serie": "A",
+        "periodicidad": "mensual",
+        "fecha_inicio": "01/01/2026",
+        "fecha_fin": "",
+        "lineas_json": '[{"concepto": "Cuota", "cantidad": 1, "precio_unitario": 50, "base": 50, "cuota_iva": 10.5}]',
+    }
+    cuota.update(overrides)
+    return cuota
+
+
+class _Gestor:
+    def __init__(self, cuotas, terceros=None, por_nif=None, existentes=()):
+        self.cuotas = cuotas
+        self.terceros = terceros or {}
+        self.por_nif = por_nif or {}
+        self.existentes = list(existentes)
+        self.llamadas = []
+        self.registradas = None
+
+    def listar_cuotas_con_periodos(self, codigo, ejercicio, solo_activas=False):
+        self.llamadas.append(("cuotas", codigo, ejercicio, solo_activas))
+        return self.cuotas
+
+    def subcuentas_cliente_por_tercero(self, codigo, ids):
+        self.llamadas.append(("terceros", codigo, sorted(i for i in ids if i)))
+        return {tid: sub for tid, sub in self.terceros.items() if tid in ids}
+
+    def get_terceros_by_nifs(self, codigo, ejercicio, nifs):
+        self.llamadas.append(("nifs", codigo, list(nifs)))
+        return self.por_nif
+
+    def get_empresa(self, codigo, ejercicio):
+        return {"cuenta_bancaria": "ES00 0000"}
+
+    def listar_emitidas(self, codigo, ejercicio):
+        return [{"nombre": "General"}]
+
+    def listar_facturas_emitidas_por_ids(self, codigo, ids):
+        self.llamadas.append(("existentes", codigo, len(ids)))
+        return [f for f in self.existentes if f["id"] in ids]
+
+    def registrar_facturas_cuotas(self, generaciones, fecha):
+        self.registradas = generaciones
+        return [f["id"] for f, _cid, _periodo in generaciones]
+
+
+def test_pendientes_usa_los_periodos_de_la_consulta_unica():
+    gestor = _Gestor([
+        _cuota("1", periodos_generados=["2026-01", "2026-02"]),
+        _cuota("2", periodicidad="trimestral", periodos_generados=[]),
+        _cuota("3", fecha_inicio="01/06/2026", periodos_generados=[]),
+    ])
+
+    pendientes = GeneradorCuotas(gestor).pendientes("E00001", 2026, hasta=date(2026, 4, 30))
+
+    assert [(p["cuota"]["id"], p["periodos"]) for p in pendientes] == [
+        ("1", ["2026-03", "2026-04"]),
+        ("2", ["2026-01", "2026-04"]),
+    ]
+    assert gestor.llamadas == [("cuotas", "E00001", 2026, True)]
+
+
+def test_previsualizar_resuelve_terceros_en_bloque_y_no_graba():
+    cuotas = [
+        _cuota("1"),
+        _cuota("2", tercero_id="", nif="B-1234"),
+        _cuota("3", tercero_id="", nif=""),
+        _cuota("4", tercero_id="BORRADO", nif="X999"),
+    ]
+    previa = {"id": id_factura_cuota("1", "2026-01"), "borrador": 1}
+    gestor = _Gestor(
+        cuotas,
+        terceros={"T1": "43000001"},
+        por_nif={"B1234": {"id": "T2", "subcuenta_cliente": "43000002"}},
+        existentes=[previa],
+    )
+    seleccion = [("1", "2026-01"), ("1", "2026-02"), ("2", "2026-01"), ("3", "2026-01"), ("4", "2026-01")]
+
+    plan = GeneradorCuotas(gestor).previsualizar(cuotas, seleccion, "31/01/2026")
+
+    acciones = {(i.cuota["id"], i.periodo): i.accion for i in plan.items}
+    assert acciones == {
+        ("1", "2026-01"): "actualizar",
+        ("1", "2026-02"): "nueva",
+        ("2", "2026-01"): "nueva",
+        ("3", "2026-01"): "error",
+        ("4", "2026-01"): "error",
+    }
+    factura = next(i.factura for i in plan.items if i.cuota["id"] == "2")
+    assert (factura["tercero_id"], factura["subcuenta_cliente"]) == ("T2", "43000002")
+    assert factura["cuenta_bancaria"] == "ES00 0000"
+    assert factura["plantilla_emitidas"] == "General"
+    assert factura["lineas"][0]["unidades"] == 1
+    assert factura["numero"] == "" and factura["borrador"] == 1
+    assert [c[0] for c in gestor.llamadas] == ["terceros", "nifs", "existentes"]
+    assert gestor.registradas is None
+    resumen = plan.resumen()
+    assert "Facturas borrador nuevas: 2" in resumen
+    assert "Borradores existentes que se actualizan: 1" in resumen
+    assert "Importe total: 181.50" in resumen
+    assert "No se generaran (2)" in resumen
+
+    ids = GeneradorCuotas(gestor).aplicar(plan)
+
+    assert len(ids) == 3
+    assert [(cid, periodo) for _f, cid, periodo in gestor.registradas] == [
+        ("1", "2026-01"), ("1", "2026-02"), ("2", "2026-01"),
+    ]
+
+
+def test_previsualizar_no_sobrescribe_facturas_ya_emitidas():
+    cuotas = [_cuota("1")]
+    emitida = {"id": id_factura_cuota("1", "2026-01"), "borrador": 0}
+    gestor = _Gestor(cuotas, terceros={"T1": ""}, existentes=[emitida])
+
+    plan = GeneradorCuotas(gestor).previsualizar(cuotas, [("1", "2026-01")], "31/01/2026")
+
+    assert [i.accion for i in plan.items] == ["error"]
+    assert plan.grabables == []
+
+
+def _gestor_sqlite():
+    gestor = GestorBase.__new__(GestorBase)
+    gestor.conn = sqlite3.connect(":memory:")
+    gestor.conn.row_factory = sqlite3.Row
+    gestor.conn.executescript("""
+        CREATE TABLE cuotas_periodicas (id TEXT PRIMARY KEY, codigo_empresa TEXT, ejercicio INTEGER,
+                                        nombre TEXT, activa INTEGER);
+        CREATE TABLE cuotas_periodicas_generadas (id INTEGER PRIMARY KEY AUTOINCREMENT, cuota_id TEXT NOT NULL,
+                                                  periodo TEXT NOT NULL, factura_id TEXT, fecha_registro TEXT,
+                                                  UNIQUE(cuota_id, periodo));
+        INSERT INTO cuotas_periodicas VALUES ('1', 'E00001', 2026, 'Ana', 1), ('2', 'E00001', 2026, 'Bea', 0),
+                                             ('3', 'E00002', 2026, 'Carla', 1);
+        INSERT INTO cuotas_periodicas_generadas (cuota_id, periodo) VALUES ('1', '2026-02'), ('1', '2026-01');
+    """)
+    return gestor
+
+
+def test_listar_cuotas_con_periodos_agrupa_una_sola_consulta():
+    gestor = _gestor_sqlite()
+
+    cuotas = gestor.listar_cuotas_con_periodos("E00001", 2026)
+    assert [(c["id"], c["periodos_generados"]) for c in cuotas] == [("1", ["2026-01", "2026-02"]), ("2", [])]
+    assert [c["id"] for c in gestor.listar_cuotas_con_periodos(solo_activas=True)] == ["1", "3"]
+
+
+def test_registrar_facturas_cuotas_deshace_todo_si_falla_una():
+    gestor = _gestor_sqlite()
+    grabadas = []
+
+    def upsert(factura, commit=True):
+        assert commit is False
+        if factura["id"] == "F2":
+            raise RuntimeError("fallo")
+        grabadas.append(factura["id"])
+        return factura["id"]
+
+    gestor.upsert_factura_emitida = upsert
+    with pytest.raises(RuntimeError):
+        gestor.registrar_facturas_cuotas([({"id": "F1"}, "3", "2026-01"), ({"id": "F2"}, "3", "2026-02")], "01/02/2026")
+    assert grabadas == ["F1"]
+    assert gestor.listar_cuotas_con_periodos("E00002")[0]["periodos_generados"] == []
+
+    gestor.upsert_factura_emitida = lambda factura, commit=True: factura["id"]
+    ids = gestor.registrar_facturas_cuotas([({"id": "F1"}, "3", "2026-01"), ({"id": "F3"}, "3", "2026-03")], "01/04/2026")
+    assert ids == ["F1", "F3"]
+    fila = gestor.conn.execute(
+        "SELECT factura_id, fecha_registro FROM cuotas_periodicas_generadas WHERE cuota_id='3' AND periodo='2026-03'"
+    ).fetchone()
+    assert tuple(fila) == ("F3", "01/04/2026")
+
+
+def test_subcuentas_cliente_por_tercero_prima_el_ejercicio_cero():
+    gestor = _gestor_sqlite()
+    gestor.conn.executescript("""
+        CREATE TABLE terceros (id TEXT PRIMARY KEY);
+        CREATE TABLE terceros_empresas (codigo_empresa TEXT, ejercicio INTEGER, tercero_id TEXT, subcuenta_cliente TEXT);
+        INSERT INTO terceros VALUES ('T1'), ('T2'), ('T3');
+        INSERT INTO terceros_empresas VALUES ('E00001', 2025, 'T1', '43000009'), ('E00001', 0, 'T1', '43000001'),
+                                             ('E00001', 2024, 'T2', '43000024'), ('E00001', 2025, 'T2', '43000025'),
+                                             ('E00002', 0, 'T3', '43000003');
+    """)
+
+    assert gestor.subcuentas_cliente_por_tercero("E00001", ["T1", "T2", "T3", "NO", None]) == {
+        "T1": "43000001",
+        "T2": "43000025",
+        "T3": "",
+    }
+
+
+def test_secured_gestor_exige_lectura_para_las_subcuentas_de_cliente():
+    sesion = UserSession(
+        user=UserRecord(7, "empleado", "Ana", UserRole.EMPLEADO, True),
+        company_permissions={"E00702": CompanyPermission.READ},
+    )
+    base = SimpleNamespace(subcuentas_cliente_por_tercero=lambda codigo, ids: {"T1": "43000001"})
+    gestor = SecuredGestor(base, AuthorizationService(sesion))
+
+    assert gestor.subcuentas_cliente_por_tercero("E00702", ["T1"]) == {"T1": "43000001"}
+    with pytest.raises(PermissionError):
+        gestor.subcuentas_cliente_por_tercero("E00999", ["T1"])
@@ -28,7 +28,7 @@ def test_eliminar_factura_libera_primero_sus_albaranes():
 
     gestor.eliminar_factura_emitida("E00701", "fac-58", 2026)
 
-    assert gestor.conn.operaciones == [
+    assert gestor.conn.operaciones[:2] == [
         (
             "UPDATE albaranes_emitidas_docs SET facturado=0, factura_id=NULL, "
             "fecha_facturacion=NULL WHERE codigo_empresa=? AND ejercicio=? AND factura_id=?",
@@ -39,6 +39,10 @@ def test_eliminar_factura_libera_primero_sus_albaranes():
             ("E00701", 2026, "fac-58"),
         ),
     ]
+    assert gestor.conn.operaciones[2] == (
+        "DELETE FROM referencias_subcuentas WHERE tipo_doc=? AND doc_id=?",
+        ("factura_emitida", "fac-58"),
+    )
     assert gestor.conn.commits == 1
     assert gestor.conn.rollbacks == 0
 
@@ -0,0 +1,92 @@
+import sqlite3
+from datetime import date
+
+import openpyxl
+
+from models.gestor_base import GestorBase
+from services.exportacion_documentos_service import exportar_albaranes, exportar_facturas
+
+
+def _totales(doc):
+    base = sum(ln["base"] for ln in doc["lineas"])
+    return {"base": base, "iva": round(base * 0.21, 2), "re": 0.0, "total": round(base * 1.21, 2)}
+
+
+def _gestor_sqlite():
+    gestor = GestorBase.__new__(GestorBase)
+    gestor.conn = sqlite3.connect(":memory:")
+    gestor.conn.row_factory = sqlite3.Row
+    gestor.conn.executescript("""
+        CREATE TABLE facturas_emitidas_docs (id TEXT PRIMARY KEY, codigo_empresa TEXT, ejercicio INTEGER, serie TEXT,
+                                             numero TEXT, fecha_asiento TEXT, nombre TEXT, nif TEXT, lineas_json TEXT,
+                                             generada INTEGER, retencion_aplica INTEGER, origen_factura TEXT);
+        CREATE TABLE albaranes_emitidas_docs (id TEXT PRIMARY KEY, codigo_empresa TEXT, ejercicio INTEGER,
+                                              numero TEXT, fecha_asiento TEXT, nombre TEXT, nif TEXT, lineas_json TEXT,
+                                              facturado INTEGER, retencion_aplica INTEGER, factura_id TEXT);
+        INSERT INTO facturas_emitidas_docs VALUES
+            ('F1', 'E00001', 2025, 'A', '000001', '20/12/2025', 'Ana 100%', 'B1', '[{"base": 100}]', 1, 0, 'facturacion'),
+            ('F2', 'E00001', 2026, 'A', '000002', '2026-01-15', 'Bea', 'B2', '[{"base": 50}]', 0, 0, 'facturacion'),
+            ('F3', 'E00001', 2026, 'A', '000003', '03-02-2026', 'Ana Sur', 'B3', '[{"base": 10}]', 0, 0, 'ocr'),
+            ('F4', 'E00002', 2026, 'A', '000001', '10/01/2026', 'Ana', 'B1', '[]', 0, 0, 'facturacion');
+        INSERT INTO albaranes_emitidas_docs VALUES
+            ('A1', 'E00001', 2026, 'Alb-1', '10/01/2026', 'Bea', 'B2', '[{"base": 50}]', 1, 0, 'F2'),
+            ('A2', 'E00001', 2026, 'Alb-2', '11/02/2026', 'Carla', 'X_9', '[{"base": 5}]', 0, 0, NULL);
+    """)
+    return gestor
+
+
+def test_iterar_facturas_filtra_en_la_base_de_datos():
+    gestor = _gestor_sqlite()
+
+    def ids(**filtros):
+        return [f["id"] for f in gestor.iterar_facturas_emitidas("E00001", lote=1, **filtros)]
+
+    assert ids() == ["F1", "F2", "F3"]
+    assert ids(ejercicio=2026, excluir_ocr=True) == ["F2"]
+    assert ids(cliente="ANA") == ["F1", "F3"]
+    assert ids(cliente="b2") == ["F2"]
+    assert ids(cliente="100%") == ["F1"]
+    assert ids(desde=date(2026, 1, 1)) == ["F2", "F3"]
+    assert ids(desde=date(2026, 1, 1), hasta=date(2026, 1, 31)) == ["F2"]
+    assert ids(hasta=date(2025, 12, 31)) == ["F1"]
+
+
+def test_iterar_albaranes_trae_el_numero_de_factura_y_escapa_comodines():
+    gestor = _gestor_sqlite()
+
+    albaranes = list(gestor.iterar_albaranes_emitidas("E00001", 2026))
+
+    assert [(a["id"], a["factura_numero"], a["facturado"]) for a in albaranes] == [
+        ("A1", "000002", True),
+        ("A2", None, False),
+    ]
+    assert [a["id"] for a in gestor.iterar_albaranes_emitidas("E00001", cliente="x_")] == ["A2"]
+    assert [a["id"] for a in gestor.iterar_albaranes_emitidas("E00001", cliente="_")] == ["A2"]
+
+
+def test_exportar_facturas_xlsx_en_modo_streaming(tmp_path):
+    gestor = _gestor_sqlite()
+    ruta = tmp_path / "facturas.xlsx"
+
+    n = exportar_facturas(ruta, gestor.iterar_facturas_emitidas("E00001", 2026), _totales)
+
+    assert n == 2
+    ws = openpyxl.load_workbook(ruta).active
+    assert ws.title == "Facturas"
+    filas = list(ws.values)
+    assert filas[0][:3] == ("Ejercicio", "Serie", "Numero")
+    assert filas[1] == (2026, "A", "000002", "2026-01-15", "Bea", "B2", 50, 10.5, 0, 60.5, "No")
+    assert ws["A1"].font.bold and ws.freeze_panes == "A2"
+
+
+def test_exportar_albaranes_csv_con_separador_y_decimales_espanoles(tmp_path):
+    gestor = _gestor_sqlite()
+    ruta = tmp_path / "albaranes.csv"
+
+    n = exportar_albaranes(ruta, gestor.iterar_albaranes_emitidas("E00001", 2026), _totales)
+
+    assert n == 2
+    lineas = ruta.read_text(encoding="utf-8-sig").splitlines()
+    assert lineas[0] == "Numero;Fecha;Cliente;NIF;Base;IVA;RE;Total;Facturado;Factura"
+    assert lineas[1] == "Alb-1;10/01/2026;Bea;B2;50;10,50;0,00;60,50;Si;000002"
+    assert lineas[2].endswith(";No;")
@@ -1,3 +1,5 @@
+import pytest
+
 from services.facturae import FacturaeExporter
 
 
@@ -161,3 +163,50 @@ def test_facturae_export_persistence_update_contains_path(tmp_path):
 
     assert updated["facturae_status"] == "generado"
     assert updated["facturae_xml_path"].endswith("facturae_ok.xml")
+
+
+def test_facturae_export_lote_reports_each_invoice(tmp_path):
+    exporter = FacturaeExporter()
+    trabajos = [
+        (_factura([_linea(100, 21, 21)], numero="1"), _emisor(), _receptor(), str(tmp_path / "f1.xml")),
+        (_factura([]), _emisor(), _receptor(), str(tmp_path / "f2.xml")),
+        (_factura([_linea(200, 10, 20)], numero="3"), _emisor(), _receptor(), str(tmp_path / "f3.xml"), None),
+    ]
+
+    results = exporter.export_lote(trabajos, procesos=1)
+
+    assert [r.ok for r in results] == [True, False, True]
+    assert any("al menos una linea" in error for error in results[1].errors)
+    assert results[0].xml_content == ""
+    assert "<InvoiceNumber>3</InvoiceNumber>" in (tmp_path / "f3.xml").read_text(encoding="utf-8")
+    assert not (tmp_path / "f2.xml").exists()
+
+
+def test_facturae_export_lote_with_processes_matches_single_export(tmp_path):
+    from services.facturae.facturae_exporter import LOTE_MINIMO_PROCESOS
+
+    exporter = FacturaeExporter()
+    trabajos = [
+        (_factura([_linea(100 + i, 21, round((100 + i) * 0.21, 2))], numero=str(i)), _emisor(), _receptor(), str(tmp_path / f"lote_{i}.xml"))
+        for i in range(LOTE_MINIMO_PROCESOS)
+    ]
+
+    results = exporter.export_lote(trabajos, procesos=2)
+
+    assert all(r.ok for r in results), [r.errors for r in results if not r.ok]
+    single = exporter.export(*trabajos[5][:3], str(tmp_path / "single.xml"))
+    assert (tmp_path / "lote_5.xml").read_text(encoding="utf-8") == single.xml_content
+
+
+def test_facturae_tree_is_validated_against_xsd_without_serializing():
+    pytest.importorskip("lxml.etree")
+    from services.facturae.facturae_builder import build_facturae_document, build_facturae_tree
+    from services.facturae.facturae_validator import validate_facturae_tree
+
+    exporter = FacturaeExporter()
+    payload = exporter.build_payload(_factura([_linea(100, 21, 21)]), _emisor(), _receptor())
+    root = build_facturae_tree(build_facturae_document(payload), use_lxml=True)
+    assert validate_facturae_tree(root) == []
+
+    root.find("FileHeader").remove(root.find("FileHeader/Modality"))
+    assert any("XSD Facturae" in error for error in validate_facturae_tree(root))
@@ -1,7 +1,13 @@
+import pytest
+
 from controllers.ui_facturas_emitidas_controller import FacturasEmitidasController
 from controllers import ui_facturas_emitidas_controller as module
 from types import SimpleNamespace
 
+from models.auth import CompanyPermission, UserRecord, UserRole, UserSession
+from services.auth_service import AuthorizationService
+from services.secured_gestor import SecuredGestor
+
 
 def test_numero_factura_contable_concatena_serie_y_numero():
     controller = FacturasEmitidasController.__new__(FacturasEmitidasController)
@@ -261,14 +267,14 @@ def test_eliminar_factura_refresca_albaranes_para_que_queden_editables():
     controller._get_factura_by_id = lambda _id: {
         "id": "fac-58", "ejercicio": 2026, "generada": False,
     }
-    controller.refresh_facturas = lambda: llamadas.append(("refresh_facturas",))
+    controller._recargar_facturas = lambda ids: llamadas.append(("recargar_facturas", ids))
     controller.refresh_albaranes = lambda: llamadas.append(("refresh_albaranes",))
 
     controller.eliminar()
 
     assert llamadas == [
         ("eliminar", ("E00701", "fac-58", 2026)),
-        ("refresh_facturas",),
+        ("recargar_facturas", ["fac-58"]),
         ("refresh_albaranes",),
     ]
 
@@ -290,3 +296,297 @@ def test_resolver_pdf_albaran_regenera_si_fue_modificado(tmp_path):
 
     assert result == str(pdf)
     assert pdf.read_bytes() == b"PDF nuevo"
+
+
+def test_resolver_pdf_factura_solo_regenera_si_cambia_la_huella(tmp_path, monkeypatch):
+    pdf = tmp_path / "factura.pdf"
+    pdf.write_bytes(b"PDF vigente")
+    generados, marcados = [], []
+    controller = FacturasEmitidasController.__new__(FacturasEmitidasController)
+    controller._codigo = "E00701"
+    controller._app_pdf_path = lambda _fac: str(pdf)
+    controller._can_write = lambda: True
+    controller._log_pdf_error = lambda *args: None
+    controller._plantilla_y_contexto_word = lambda fac: ("plantilla.docx", {"total": fac["total"]})
+    controller._gestor = SimpleNamespace(
+        marcar_pdf_factura_emitida=lambda *args: marcados.append(args),
+    )
+    monkeypatch.setattr(module, "huella_pdf", lambda _tpl, ctx: f"h{ctx['total']}")
+    monkeypatch.setattr(
+        module, "generar_pdf_desde_plantilla_word",
+        lambda **kw: generados.append(kw["context"]) or pdf.write_bytes(b"PDF nuevo"),
+    )
+    # Guardada despues de generar el PDF (p. ej. al marcarla enviada).
+    factura = {
+        "id": "fac-1", "total": 100, "pdf_huella": "h100",
+        "updated_at": "2026-08-10T13:30:00", "pdf_generated_at": "2026-08-10T13:20:00",
+    }
+
+    assert controller._resolve_app_pdf(factura) == str(pdf)
+    assert generados == [] and marcados == []
+
+    factura["total"] = 120
+    assert controller._resolve_app_pdf(factura) == str(pdf)
+    assert generados == [{"total": 120}]
+    assert pdf.read_bytes() == b"PDF nuevo"
+    assert marcados[0][:3] == ("E00701", "fac-1", str(pdf))
+    assert marcados[0][4] == factura["pdf_huella"] == "h120"
+
+
+def test_confirmar_borradores_reserva_los_numeros_de_cada_serie_de_una_vez():
+    reservas, grabadas, empresas = [], [], []
+    facturas = {
+        "b1": {"id": "b1", "borrador": 1, "serie": "A", "fecha_asiento": "03/02/2026"},
+        "b2": {"id": "b2", "borrador": 1, "serie": "A", "fecha_asiento": "04/02/2026"},
+        "b3": {"id": "b3", "borrador": 1, "serie": "B", "fecha_asiento": "05/02/2026"},
+        "f4": {"id": "f4", "borrador": 0, "serie": "A", "numero": "000001"},
+    }
+
+    def reservar(codigo, ejercicio, serie, n):
+        reservas.append((codigo, ejercicio, serie, n))
+        return range(40, 40 + n)
+
+    controller = FacturasEmitidasController.__new__(FacturasEmitidasController)
+    controller._codigo = "E00001"
+    controller._ejercicio = 2026
+    controller._empresa_conf = {"siguiente_num_emitidas": 40}
+    controller._gestor = SimpleNamespace(
+        reservar_numeros_serie=reservar,
+        upsert_facturas_emitidas=lambda facs: grabadas.extend(
+            (fac["id"], fac["serie"], fac["numero"], fac["borrador"]) for fac in facs
+        ),
+        upsert_empresa=lambda emp: empresas.append(dict(emp)),
+    )
+    controller._ensure_write = lambda: True
+    controller._get_factura_by_id = facturas.get
+    controller._serie_for_year = lambda year, rectificativa=False, nombre_serie=None: nombre_serie
+    controller._empresa_for_year = lambda year: dict(controller._empresa_conf)
+    controller._recargar_facturas = lambda ids: None
+    controller._view = SimpleNamespace(
+        get_selected_ids=lambda: ["b1", "f4", "b2", "b3"],
+        show_info=lambda *_args: None,
+    )
+
+    controller.confirmar_borrador()
+
+    assert reservas == [("E00001", 2026, "A", 2), ("E00001", 2026, "B", 1)]
+    assert grabadas == [("b1", "A", "000040", 0), ("b2", "A", "000041", 0), ("b3", "B", "000040", 0)]
+    assert [e["siguiente_num_emitidas"] for e in empresas] == [42, 43]
+
+
+def _controller_numeracion(gestor, errores):
+    controller = FacturasEmitidasController.__new__(FacturasEmitidasController)
+    controller._codigo = "E00001"
+    controller._ejercicio = 2026
+    controller._empresa_conf = {"siguiente_num_emitidas": 40}
+    controller._gestor = gestor
+    controller._ensure_write = lambda: True
+    controller._serie_for_year = lambda year, rectificativa=False, nombre_serie=None: nombre_serie or "A"
+    controller._empresa_for_year = lambda year: dict(controller._empresa_conf)
+    controller._recargar_facturas = lambda ids: None
+    controller._view = SimpleNamespace(
+        show_info=lambda *_args: None,
+        show_error=lambda _t, msg: errores.append(msg),
+    )
+    return controller
+
+
+def test_confirmar_borradores_devuelve_los_numeros_si_falla_la_grabacion():
+    devueltos, empresas, errores = [], [], []
+    borrador = {"id": "b1", "borrador": 1, "serie": "A", "fecha_asiento": "03/02/2026"}
+
+    def grabar(_facs):
+        raise RuntimeError("sin conexion")
+
+    gestor = SimpleNamespace(
+        reservar_numeros_serie=lambda codigo, eje, serie, n: range(40, 40 + n),
+        devolver_numeros_serie=lambda *args: devueltos.append(args) or True,
+        upsert_facturas_emitidas=grabar,
+        upsert_empresa=lambda emp: empresas.append(dict(emp)),
+    )
+    controller = _controller_numeracion(gestor, errores)
+    controller._get_factura_by_id = {"b1": borrador}.get
+    controller._view.get_selected_ids = lambda: ["b1"]
+
+    controller.confirmar_borrador()
+
+    assert devueltos == [("E00001", 2026, "A", range(40, 41))]
+    assert empresas == [] and len(errores) == 1
+    assert borrador["borrador"] == 1 and "numero" not in borrador
+
+
+def test_reservar_numeros_no_oculta_errores_de_la_base_de_datos():
+    empresas = []
+
+    def reservar(*_args):
+        raise RuntimeError("bloqueo")
+
+    gestor = SimpleNamespace(reservar_numeros_serie=reservar, upsert_empresa=empresas.append)
+    controller = _controller_numeracion(gestor, [])
+
+    with pytest.raises(RuntimeError):
+        controller._reservar_numeros(2026, "A", 2)
+    assert empresas == []
+
+    gestor.reservar_numeros_serie = lambda *_args: None
+    assert controller._reservar_numeros(2026, "A", 2) == ["000040", "000041"]
+    assert empresas[-1]["siguiente_num_emitidas"] == 42
+
+
+def test_facturar_albaranes_devuelve_los_numeros_si_falla_el_bloque(monkeypatch):
+    devueltos, errores = [], []
+    albaranes = [
+        {"id": "1", "nif": "B1", "numero": "Alb-1", "lineas": []},
+        {"id": "2", "nif": "B1", "numero": "Alb-2", "lineas": []},
+    ]
+
+    def facturar(*_args):
+        raise RuntimeError("conflicto")
+
+    gestor = SimpleNamespace(
+        listar_albaranes_emitidas_por_ids=lambda *_args: albaranes,
+        reservar_numeros_serie=lambda codigo, eje, serie, n: range(7, 7 + n),
+        devolver_numeros_serie=lambda *args: devueltos.append(args) or True,
+        facturar_albaranes_en_bloque=facturar,
+        upsert_empresa=lambda emp: None,
+    )
+    controller = _controller_numeracion(gestor, errores)
+    controller._view.get_selected_albaran_ids = lambda: ["1", "2"]
+    controller._year_from_fecha_txt = lambda _fecha: 2026
+    controller._default_plantilla_emitidas_name = lambda eje: ""
+    monkeypatch.setattr(module, "load_monedas", lambda: [])
+    # Solo se factura dentro del ejercicio en curso.
+    controller._ejercicio = module.datetime.now().year
+
+    controller.facturar_albaranes()
+
+    assert devueltos == [("E00001", 2026, "A", range(7, 8))]
+    assert errores and "conflicto" in errores[0]
+
+
+def test_exportar_facturas_filtra_en_el_gestor_y_escribe_en_segundo_plano(monkeypatch, tmp_path):
+    llamadas = []
+    mensajes = []
+
+    class HiloInmediato:
+        def __init__(self, target, **_kwargs):
+            self._target = target
+
+        def start(self):
+            llamadas.append("hilo")
+            self._target()
+
+    def iterar(codigo, ejercicio, **filtros):
+        llamadas.append((codigo, ejercicio, filtros))
+        yield {"ejercicio": 2026, "serie": "A", "numero": "1", "lineas": [{"base": 10, "cuota_iva": 2.1}]}
+
+    monkeypatch.setattr(module.threading, "Thread", HiloInmediato)
+    controller = FacturasEmitidasController.__new__(FacturasEmitidasController)
+    controller._codigo = "E00001"
+    controller._ejercicio = 2026
+    controller._allow_all_years = True
+    controller._incluir_origen_ocr = False
+    controller._gestor = SimpleNamespace(iterar_facturas_emitidas=iterar)
+    controller._view = SimpleNamespace(
+        after=lambda _ms, fn, *args: fn(*args),
+        show_info=lambda _t, msg: mensajes.append(msg),
+        show_error=lambda _t, msg: mensajes.append(msg),
+    )
+    ruta = tmp_path / "facturas.csv"
+    controller._ruta_exportacion = lambda _nombre: str(ruta)
+
+    controller.exportar_facturas_excel("01/01/2026", "", "ana")
+
+    # La consulta se hace en la ventana; el hilo solo escribe el fichero.
+    (codigo, ejercicio, filtros), hilo = llamadas
+    assert hilo == "hilo" and (codigo, ejercicio) == ("E00001", None)
+    assert filtros["cliente"] == "ana" and filtros["excluir_ocr"] is True
+    assert str(filtros["desde"]) == "2026-01-01" and filtros["hasta"] is None
+    assert mensajes == ["Exportadas 1 facturas."]
+    assert ruta.read_text(encoding="utf-8-sig").splitlines()[1].startswith("2026;A;1;")
+
+
+def test_exportar_albaranes_avisa_si_falla_la_consulta_sin_lanzar_el_hilo(monkeypatch, tmp_path):
+    hilos, mensajes = [], []
+
+    def iterar(*_args, **_kwargs):
+        raise RuntimeError("sin conexion")
+        yield
+
+    monkeypatch.setattr(module.threading, "Thread", lambda **kwargs: hilos.append(kwargs))
+    controller = FacturasEmitidasController.__new__(FacturasEmitidasController)
+    controller._codigo = "E00001"
+    controller._ejercicio = 2026
+    controller._gestor = SimpleNamespace(iterar_albaranes_emitidas=iterar)
+    controller._view = SimpleNamespace(show_error=lambda _t, msg: mensajes.append(msg))
+    controller._ruta_exportacion = lambda _nombre: str(tmp_path / "albaranes.csv")
+
+    controller.exportar_albaranes_excel("", "", "")
+
+    assert hilos == []
+    assert mensajes == ["No se pudo exportar:\nsin conexion"]
+    assert not (tmp_path / "albaranes.csv").exists()
+
+
+def test_precalentar_pdfs_solo_lee_la_base_de_datos_en_la_ventana(tmp_path, monkeypatch):
+    pdf = tmp_path / "factura.pdf"
+    pdf.write_bytes(b"PDF antiguo")
+    plantilla = tmp_path / "plantilla.docx"
+    plantilla.write_bytes(b"docx")
+    hilos, encargados = [], []
+    controller = FacturasEmitidasController.__new__(FacturasEmitidasController)
+    controller._empresa_conf_for_word = lambda: {"codigo": "E00701"}
+    controller._cliente_factura = lambda fac: {"nombre": fac["nombre"]}
+    controller._totales_factura = lambda fac: {"total": fac["total"]}
+    controller._app_pdf_path = lambda _fac: str(pdf)
+    controller._docx_template_path = lambda _fac: str(plantilla)
+    monkeypatch.setattr(
+        module, "threading",
+        SimpleNamespace(Thread=lambda target, args, **kw: SimpleNamespace(start=lambda: hilos.append((target, args)))),
+    )
+    monkeypatch.setattr(module, "build_context_emitida", lambda emp, fac, cli, tot: {"total": tot["total"]})
+    monkeypatch.setattr(module, "huella_pdf", lambda _tpl, ctx: f"h{ctx['total']}")
+    monkeypatch.setattr(
+        module, "enviar_pdf_desde_plantilla_word",
+        lambda tpl, ctx, out: encargados.append(ctx) or SimpleNamespace(add_done_callback=lambda cb: None),
+    )
+    facturas = [
+        {"id": "f1", "nombre": "Ana", "total": 100, "pdf_path": str(pdf), "pdf_huella": "h100"},
+        {"id": "f2", "nombre": "Bea", "total": 120, "pdf_path": str(pdf), "pdf_huella": "h100"},
+        {"id": "f3", "nombre": "Sin PDF", "total": 1},
+    ]
+
+    assert controller.precalentar_pdfs(facturas) == 2
+    assert encargados == []
+
+    (target, args), = hilos
+    target(*args)
+    assert encargados == [{"total": 120}]
+
+
+def test_secured_gestor_exige_escritura_para_registrar_el_pdf():
+    sesion = UserSession(
+        user=UserRecord(7, "empleado", "Ana", UserRole.EMPLEADO, True),
+        company_permissions={"E00701": CompanyPermission.WRITE, "E00702": CompanyPermission.READ},
+    )
+    marcados = []
+    base = SimpleNamespace(marcar_pdf_factura_emitida=lambda *args: marcados.append(args) or True)
+    gestor = SecuredGestor(base, AuthorizationService(sesion))
+
+    assert gestor.marcar_pdf_factura_emitida("E00701", "f1", "f1.pdf", "2026-10-19T10:00:00", "h1") is True
+    with pytest.raises(PermissionError):
+        gestor.marcar_pdf_factura_emitida("E00702", "f2", "f2.pdf", None, "h2")
+    assert marcados == [("E00701", "f1", "f1.pdf", "2026-10-19T10:00:00", "h1")]
+
+
+def test_secured_gestor_exige_lectura_para_recargar_facturas_por_id():
+    sesion = UserSession(
+        user=UserRecord(7, "empleado", "Ana", UserRole.EMPLEADO, True),
+        company_permissions={"E00702": CompanyPermission.READ},
+    )
+    base = SimpleNamespace(listar_facturas_emitidas_por_ids=lambda codigo, ids: [{"id": i} for i in ids])
+    gestor = SecuredGestor(base, AuthorizationService(sesion))
+
+    assert gestor.listar_facturas_emitidas_por_ids("E00702", ["f1"]) == [{"id": "f1"}]
+    with pytest.raises(PermissionError):
+        gestor.listar_facturas_emitidas_por_ids("E00999", ["f1"])
@@ -0,0 +1,48 @@
+from io import BytesIO
+
+from PIL import Image
+from pypdf import PdfReader
+
+from procesos.facturas_pdf_basico import generar_pdf_basico, generar_pdf_multiple
+
+
+def _logo(path, color):
+    Image.new("RGB", (8, 4), color).save(path, format="JPEG")
+    return str(path)
+
+
+def _factura(numero):
+    return {
+        "serie": "A", "numero": numero, "fecha_expedicion": "2026-05-08",
+        "lineas": [{"concepto": "Servicio", "unidades": 1, "precio": 100, "base": 100, "pct_iva": 21, "cuota_iva": 21}],
+    }
+
+
+def test_pdf_multiple_se_escribe_por_paginas_con_un_logo_por_empresa(tmp_path):
+    uno = {"nombre": "Uno", "codigo": "E1", "logo_path": _logo(tmp_path / "uno.jpg", "red")}
+    dos = {"nombre": "Dos", "codigo": "E2", "logo_path": _logo(tmp_path / "dos.jpg", "blue")}
+    totales = {"base": 100, "iva": 21, "total": 121}
+    out = tmp_path / "lote.pdf"
+
+    generar_pdf_multiple(
+        ((emp, _factura(str(i)), {"nombre": "Cliente"}, totales) for i, emp in enumerate([uno, dos, uno, dos])),
+        str(out),
+    )
+
+    data = out.read_bytes()
+    assert data.count(b"/Subtype /Image") == 2
+    reader = PdfReader(BytesIO(data), strict=True)
+    assert len(reader.pages) == 4
+    logos = [page["/Resources"]["/XObject"].raw_get("/Im1").idnum for page in reader.pages]
+    assert logos[0] == logos[2] != logos[1] == logos[3]
+    assert "Factura emitida" in reader.pages[3].extract_text()
+
+
+def test_pdf_basico_y_lote_vacio(tmp_path):
+    out = tmp_path / "una.pdf"
+    generar_pdf_basico({"nombre": "Sin logo"}, _factura("9"), {}, {"total": 0}, str(out))
+    assert len(PdfReader(str(out), strict=True).pages) == 1
+
+    vacio = tmp_path / "vacio.pdf"
+    generar_pdf_multiple(iter(()), str(vacio))
+    assert not vacio.exists()
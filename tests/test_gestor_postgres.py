@@ -406,10 +406,18 @@ _COLUMNAS_ESENCIALES = {
     ("ocr_aprendizaje_ejemplos", "marcas_json"),
     ("facturas_emitidas_docs", "updated_at"),
     ("facturas_emitidas_docs", "pdf_generated_at"),
+    ("facturas_emitidas_docs", "pdf_huella"),
     ("facturas_emitidas_docs", "origen_factura"),
     ("facturas_emitidas_docs", "ocr_documento_id"),
     ("albaranes_emitidas_docs", "updated_at"),
     ("albaranes_emitidas_docs", "pdf_generated_at"),
+    ("notif_sync_logs", "duracion_ms"),
+    ("notif_sync_logs", "notificaciones_nuevas"),
+    ("notif_buzones", "hwm_fecha_disposicion"),
+    ("notif_buzones", "hwm_referencias_json"),
+    ("notif_buzones", "hwm_sync_completa"),
+    ("documentos_ocr", "ruta_objeto"),
+    ("documentos_archivo", "ruta_objeto"),
 }
 
 
@@ -0,0 +1,78 @@
+from models.gestor_base import GestorBase
+from models.indice_cuentas import EN_MAESTRO, EN_PLAN, IndiceCuentas
+
+
+def test_indice_busca_por_prefijo_y_descripcion():
+    indice = IndiceCuentas([
+        ("43000002", "Cliente Dos", EN_MAESTRO),
+        ("4300", "Clientes", EN_PLAN),
+        ("43000001", "Cliente Uno", EN_PLAN | EN_MAESTRO),
+        ("40000001", "Proveedor", EN_PLAN),
+        ("4301", "Clientes, efectos", EN_PLAN),
+    ])
+
+    assert [c for c, _ in indice.por_prefijo("4300")] == ["4300", "43000001", "43000002"]
+    assert [c for c, _ in indice.por_prefijo("430", EN_PLAN)] == ["4300", "43000001", "4301"]
+    assert indice.por_prefijo("430", limite=1) == [("4300", "Clientes")]
+    assert indice.por_prefijo("5") == []
+    assert indice.descripcion("43000002") == "Cliente Dos"
+    assert indice.descripcion("4302") is None
+    assert [c for c, _ in indice.buscar("EFECTOS")] == ["4301"]
+    assert len(indice.por_prefijo("")) == len(indice) == 5
+
+
+class _Cursor:
+    rowcount = 0
+
+    def __init__(self, filas):
+        self._filas = filas
+
+    def fetchone(self):
+        return self._filas[0]
+
+    def fetchall(self):
+        return self._filas
+
+
+class _Conexion:
+    def __init__(self):
+        self.plan = {2026: [("4300", "Clientes"), ("43000001", "Cliente plan")]}
+        self.maestro = [("43000001", "Cliente Uno SL"), ("43000009", "")]
+        self.consultas = 0
+
+    def execute(self, sql, params=()):
+        if sql.startswith("SELECT cuenta, descripcion FROM plan_cuentas"):
+            self.consultas += 1
+            ejercicios = [params[1]] if len(params) > 1 else list(self.plan)
+            filas = [f for e in ejercicios for f in self.plan.get(e, [])]
+            return _Cursor([{"cuenta": c, "descripcion": d} for c, d in filas])
+        if sql.startswith("SELECT subcuenta, nombre_subcuenta"):
+            return _Cursor([{"subcuenta": c, "nombre_subcuenta": n} for c, n in self.maestro])
+        if sql.startswith("DELETE FROM plan_cuentas"):
+            self.plan[params[1]] = []
+        if sql.startswith("WITH fusion AS"):
+            self.plan[params[1]] += self.carga
+            return _Cursor([{"insertadas": len(self.carga), "actualizadas": 0}])
+        return _Cursor([])
+
+    def executemany(self, _sql, filas):
+        self.carga = list(filas)
+
+    def commit(self):
+        pass
+
+
+def test_gestor_reutiliza_el_indice_hasta_que_cambia_el_plan():
+    gestor = GestorBase.__new__(GestorBase)
+    gestor.conn = _Conexion()
+
+    assert gestor.buscar_cuentas_en_plan("00001", 2026, "4300") == ["4300", "43000001"]
+    indice = gestor.indice_cuentas("00001", 2026)
+    assert indice.descripcion("43000001") == "Cliente Uno SL"
+    assert indice.descripcion("43000009") == ""
+    assert gestor.conn.consultas == 1
+
+    gestor.upsert_plan_cuentas("00001", 2026, [{"cuenta": "4309", "descripcion": "Dudoso"}])
+
+    assert gestor.buscar_cuentas_en_plan("00001", 2026, "430") == ["4309"]
+    assert gestor.conn.consultas == 2
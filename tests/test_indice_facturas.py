@@ -0,0 +1,78 @@
+from types import SimpleNamespace
+
+from controllers.ui_facturas_emitidas_controller import FacturasEmitidasController
+from models.indice_facturas import IndiceFacturas
+
+
+def test_indice_filtra_por_anio_y_serie_y_se_actualiza_por_id():
+    fac = {"id": 1, "ejercicio": 2026, "serie": "A"}
+    indice = IndiceFacturas([
+        fac,
+        {"id": 2, "ejercicio": 2025, "serie": "A"},
+        {"id": 3, "ejercicio": 2026, "serie": "R"},
+    ])
+
+    assert indice.anios() == [2025, 2026]
+    assert indice.series() == ["A", "R"]
+    assert [f["id"] for f in indice.filtrar(2026, "A")] == [1]
+    assert [f["id"] for f in indice.filtrar(serie="A")] == [1, 2]
+
+    # El dict cacheado cambia en sitio: quitar usa las claves con que se indexo.
+    fac["serie"] = "B"
+    indice.actualizar(dict(fac))
+    assert indice.series() == ["A", "B", "R"]
+    assert [f["id"] for f in indice.filtrar(2026, "A")] == []
+    assert indice.get("1")["serie"] == "B"
+
+    indice.quitar(3)
+    assert indice.series() == ["A", "B"]
+    assert len(indice) == 2
+
+
+class _Vista:
+    def __init__(self):
+        self.pintadas = []
+
+    def clear_facturas(self):
+        self.pintadas = []
+
+    def insert_factura_row(self, fac, total):
+        self.pintadas.append(fac["id"])
+
+    def __getattr__(self, nombre):
+        return lambda *args, **kwargs: None
+
+
+def test_recargar_facturas_relee_solo_las_modificadas():
+    controller = FacturasEmitidasController.__new__(FacturasEmitidasController)
+    controller._codigo = "E00701"
+    controller._ejercicio = 2026
+    controller._allow_all_years = False
+    controller._incluir_origen_ocr = False
+    controller._empresa_conf = {}
+    controller._view = _Vista()
+    controller._facturas_cache = IndiceFacturas([
+        {"id": "F1", "ejercicio": 2026, "serie": "A", "numero": "1"},
+        {"id": "F2", "ejercicio": 2026, "serie": "A", "numero": "2"},
+    ])
+    leidas = []
+
+    def _por_ids(codigo, ids):
+        leidas.append(list(ids))
+        return [
+            {"id": "F1", "ejercicio": 2026, "serie": "A", "numero": "1b"},
+            {"id": "F3", "ejercicio": 2026, "origen_factura": "ocr"},
+        ]
+
+    controller._gestor = SimpleNamespace(
+        listar_facturas_emitidas_por_ids=_por_ids,
+        get_empresa=lambda codigo, ejercicio: None,
+    )
+
+    controller._recargar_facturas(["F1", "F2", "F3"])
+
+    assert leidas == [["F1", "F2", "F3"]]
+    assert controller._facturas_cache.get("F1")["numero"] == "1b"
+    assert controller._facturas_cache.get("F2") is None
+    assert controller._facturas_cache.get("F3") is None
+    assert controller._view.pintadas == ["F1"]
@@ -0,0 +1,165 @@
+from services.ocr.base import OcrEngineBase
+from services.ocr.cache_ocr import CacheOcr
+from services.ocr.ocr_service import OcrService
+from services.ocr.types import OcrInvoiceResult
+
+_TEXTO = "FACTURA F-2026-7\nNIF: B12345678\nTotal 121,00\n" + "detalle " * 10
+
+
+class _GestorCache:
+    def __init__(self):
+        self.filas = {}
+        self.podas = []
+
+    def get_cache_ocr(self, hash_archivo, motor, version):
+        fila = self.filas.get((hash_archivo, motor, version))
+        if fila is None:
+            return None
+        fila["aciertos"] += 1
+        return fila["json"]
+
+    def guardar_cache_ocr(self, hash_archivo, motor, version, resultado_json):
+        fila = self.filas.setdefault((hash_archivo, motor, version), {"aciertos": 0})
+        fila["json"] = resultado_json
+
+    def podar_cache_ocr(self, max_bytes):
+        self.podas.append(max_bytes)
+        return 0
+
+    def estadisticas_cache_ocr(self):
+        return {"entradas": len(self.filas), "bytes": 0,
+                "aciertos": sum(f["aciertos"] for f in self.filas.values())}
+
+
+class _MotorTexto(OcrEngineBase):
+    def __init__(self, version="1", texto=_TEXTO, errores=None):
+        self._version = version
+        self._texto = texto
+        self._errores = errores or []
+        self.llamadas = 0
+
+    @property
+    def nombre(self):
+        return "tesseract"
+
+    @property
+    def version(self):
+        return self._version
+
+    def disponible(self):
+        return True
+
+    def extraer(self, path):
+        self.llamadas += 1
+        if self._errores:
+            return OcrInvoiceResult(motor=self.nombre, errores=list(self._errores))
+        return self._interpretar(self._texto, 0.8)
+
+    def desde_cache(self, datos):
+        return self._interpretar(datos["texto"], datos["confianza"])
+
+
+def _servicio(gestor, motor):
+    svc = OcrService.__new__(OcrService)
+    svc._gestor = gestor
+    svc._motores = [motor]
+    svc._cache = CacheOcr(gestor, max_bytes=1000)
+    return svc
+
+
+def test_reprocesar_reutiliza_la_salida_del_motor(tmp_path, monkeypatch):
+    ruta = tmp_path / "f.pdf"
+    ruta.write_bytes(b"%PDF-1")
+    gestor = _GestorCache()
+    motor = _MotorTexto()
+    svc = _servicio(gestor, motor)
+
+    primero = svc._ejecutar_motores(ruta)
+    # Una mejora del interprete se aplica al texto guardado sin repetir OCR.
+    from services.ocr import invoice_interpreter
+    original = invoice_interpreter.InvoiceInterpreter.interpretar
+
+    def _interpretar_mejorado(self, texto):
+        result = original(self, texto)
+        result.numero_factura = "MEJORADO"
+        return result
+
+    monkeypatch.setattr(invoice_interpreter.InvoiceInterpreter, "interpretar", _interpretar_mejorado)
+    segundo = svc._ejecutar_motores(ruta)
+
+    assert motor.llamadas == 1
+    assert primero.numero_factura != "MEJORADO"
+    assert segundo.numero_factura == "MEJORADO" and segundo.texto == primero.texto
+    assert list(gestor.filas)[0][1:] == ("tesseract", "1")
+
+    svc._ejecutar_motores(ruta, usar_cache=False)
+    assert motor.llamadas == 2
+    estadisticas = svc._cache.estadisticas()
+    assert estadisticas["aciertos_totales"] == 1 and estadisticas["entradas"] == 1
+
+
+def test_cache_distingue_version_y_no_guarda_fallos(tmp_path):
+    ruta = tmp_path / "f.pdf"
+    ruta.write_bytes(b"%PDF-2")
+    gestor = _GestorCache()
+
+    caido = _MotorTexto(errores=["Backend OCR error 503"])
+    _servicio(gestor, caido)._ejecutar_motores(ruta)
+    assert gestor.filas == {}
+
+    _servicio(gestor, _MotorTexto(version="1"))._ejecutar_motores(ruta)
+    nuevo = _MotorTexto(version="2")
+    _servicio(gestor, nuevo)._ejecutar_motores(ruta)
+    assert nuevo.llamadas == 1
+    assert sorted(clave[2] for clave in gestor.filas) == ["1", "2"]
+
+
+def test_cache_se_poda_periodicamente(monkeypatch):
+    from services.ocr import cache_ocr
+
+    gestor = _GestorCache()
+    cache = CacheOcr(gestor, max_bytes=500)
+    monkeypatch.setattr(cache_ocr, "_PODA_CADA", 1)
+    cache.guardar("h" * 64, _MotorTexto(), OcrInvoiceResult(texto="hola"))
+    assert gestor.podas == [500]
+    assert CacheOcr(object()).obtener("h", _MotorTexto()) is None
+
+
+class _MotorLote(_MotorTexto):
+    def __init__(self, fallan=()):
+        super().__init__()
+        self.fallan = set(fallan)
+        self.lotes = []
+
+    @property
+    def nombre(self):
+        return "azure_backend"
+
+    def extraer_lote(self, paths):
+        self.lotes.append([p.name for p in paths])
+        return [
+            OcrInvoiceResult(motor=self.nombre, errores=["lote caido"]) if p.name in self.fallan
+            else self._interpretar(_TEXTO, 0.9)
+            for p in paths
+        ]
+
+
+def test_analizar_lote_pide_al_backend_lo_que_no_esta_en_cache(tmp_path):
+    rutas = []
+    for i in range(3):
+        ruta = tmp_path / f"f{i}.pdf"
+        ruta.write_bytes(f"%PDF-{i}".encode())
+        rutas.append(ruta)
+    gestor = _GestorCache()
+    motor = _MotorLote(fallan={"f2.pdf"})
+    svc = _servicio(gestor, motor)
+    svc._ejecutar_motores(rutas[0])
+    assert motor.llamadas == 1
+
+    resultados = svc.analizar_lote(rutas)
+
+    assert motor.lotes == [["f1.pdf", "f2.pdf"]]
+    # La lectura fallida del lote se repite con una peticion individual.
+    assert motor.llamadas == 2
+    assert [r.numero_factura for r in resultados] == ["F-2026-7"] * 3
+    assert len(gestor.filas) == 3
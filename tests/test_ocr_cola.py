@@ -0,0 +1,264 @@
+import json
+import sqlite3
+import threading
+import time
+
+from models.gestor_base import GestorBase
+from services.ocr import cola_ocr
+from services.ocr.cola_ocr import ColaOcr, espera_reintento
+from services.ocr.ocr_service import OcrService
+from services.ocr.types import OcrInvoiceResult
+
+
+class _GestorCola:
+    def __init__(self, docs):
+        self.docs = {doc["id"]: dict(doc) for doc in docs}
+        self.reprogramados = []
+        self.liberados = []
+        self.recuperaciones = 0
+        self.reclamados = []
+
+    def recuperar_documentos_ocr_bloqueados(self, _bloqueo_max_s, _max_intentos=None, _empresa_id=None):
+        self.recuperaciones += 1
+        return 0
+
+    def reclamar_documentos_ocr_en_cola(self, trabajador, limite=1, empresa_id=None):
+        en_cola = sorted(
+            (d for d in self.docs.values()
+             if d["estado"] == "en_cola" and empresa_id in (None, d.get("empresa_id"))),
+            key=lambda d: (-d.get("cola_prioridad", 0), d["fecha_alta"]),
+        )[:limite]
+        for doc in en_cola:
+            doc.update(estado="procesando", cola_trabajador=trabajador,
+                       cola_intentos=doc.get("cola_intentos", 0) + 1)
+            self.reclamados.append(doc["id"])
+        return [dict(doc) for doc in en_cola]
+
+    def reprogramar_documento_ocr(self, doc_id, error, max_intentos, espera_s):
+        doc = self.docs[doc_id]
+        self.reprogramados.append((doc_id, doc["cola_intentos"], espera_s))
+        # El reintento inmediato simplifica el test; la espera se comprueba aparte.
+        doc["estado"] = "error" if doc["cola_intentos"] >= max_intentos else "en_cola"
+        doc["error_ocr"] = error
+        return doc["estado"]
+
+    def liberar_documento_ocr_en_cola(self, doc_id):
+        self.liberados.append(doc_id)
+
+
+class _ServicioFalso:
+    def __init__(self, gestor, fallos=None):
+        self.gestor = gestor
+        self.fallos = fallos or {}
+        self.lock = threading.Lock()
+        self.activos = 0
+        self.max_activos = 0
+
+    def analizar_archivo(self, path):
+        with self.lock:
+            self.activos += 1
+            self.max_activos = max(self.max_activos, self.activos)
+        time.sleep(0.03)
+        with self.lock:
+            self.activos -= 1
+        if self.fallos.get(path.name, 0) > 0:
+            self.fallos[path.name] -= 1
+            raise ConnectionError("backend caido")
+        return OcrInvoiceResult(motor="falso", texto="x" * 60)
+
+    def guardar_resultado(self, doc, _result):
+        self.gestor.docs[doc["id"]]["estado"] = "pendiente_revision"
+        return {"documento_id": doc["id"], "estado": "pendiente_revision", "errores": []}
+
+
+def _docs(tmp_path, n, extra=None):
+    docs = []
+    for i in range(n):
+        ruta = tmp_path / f"f{i}.pdf"
+        ruta.write_bytes(b"%PDF")
+        doc = {"id": f"d{i}", "ruta_original": str(ruta), "estado": "en_cola",
+               "fecha_alta": f"2026-01-01 00:00:{i:02d}", "cola_prioridad": 0,
+               "cola_opciones_json": json.dumps({"ejercicio": 2026})}
+        doc.update((extra or {}).get(i, {}))
+        docs.append(doc)
+    return docs
+
+
+def test_procesar_pendientes_en_paralelo_por_prioridad(tmp_path):
+    gestor = _GestorCola(_docs(tmp_path, 6, {5: {"cola_prioridad": 9}}))
+    servicio = _ServicioFalso(gestor)
+    resultados = []
+    cola = ColaOcr(gestor, max_trabajadores=3, on_resultado=resultados.append)
+    cola._servicio_para = lambda _doc: servicio
+
+    atendidos = cola.procesar_pendientes()
+
+    assert atendidos == 6
+    assert gestor.recuperaciones == 1
+    assert gestor.reclamados[0] == "d5"
+    assert servicio.max_activos > 1
+    assert sorted(gestor.liberados) == [f"d{i}" for i in range(6)]
+    assert {r["estado"] for r in resultados} == {"pendiente_revision"}
+
+
+def test_fallos_se_reintentan_y_agotan_en_error(tmp_path):
+    gestor = _GestorCola(_docs(tmp_path, 2))
+    servicio = _ServicioFalso(gestor, fallos={"f0.pdf": 1, "f1.pdf": 5})
+    cola = ColaOcr(gestor, max_trabajadores=1, max_intentos=3, espera_base_s=10)
+    cola._servicio_para = lambda _doc: servicio
+
+    cola.procesar_pendientes()
+
+    assert gestor.docs["d0"]["estado"] == "pendiente_revision"
+    assert gestor.docs["d1"]["estado"] == "error"
+    assert "backend caido" in gestor.docs["d1"]["error_ocr"]
+    intentos_d1 = [(n, espera) for doc, n, espera in gestor.reprogramados if doc == "d1"]
+    assert [n for n, _ in intentos_d1] == [1, 2, 3]
+    assert 8 <= intentos_d1[0][1] <= 12 and 16 <= intentos_d1[1][1] <= 24
+
+
+def test_cola_de_una_empresa_no_atiende_documentos_de_otra(tmp_path):
+    gestor = _GestorCola(_docs(tmp_path, 3, {0: {"empresa_id": "E1"}, 1: {"empresa_id": "E2"},
+                                             2: {"empresa_id": "E1"}}))
+    servicio = _ServicioFalso(gestor)
+    cola = ColaOcr(gestor, empresa_id="E1", max_trabajadores=2)
+    cola._servicio_para = lambda _doc: servicio
+
+    assert cola.procesar_pendientes() == 2
+    assert sorted(gestor.reclamados) == ["d0", "d2"]
+    assert gestor.docs["d1"]["estado"] == "en_cola"
+
+
+def test_un_fallo_al_reclamar_no_tumba_la_pasada(tmp_path):
+    gestor = _GestorCola(_docs(tmp_path, 2))
+    servicio = _ServicioFalso(gestor)
+    cola = ColaOcr(gestor, max_trabajadores=1)
+    cola._servicio_para = lambda _doc: servicio
+    reclamar = gestor.reclamar_documentos_ocr_en_cola
+    llamadas = []
+
+    def _reclamar_con_fallo(*args):
+        llamadas.append(args)
+        if len(llamadas) == 2:
+            raise ConnectionError("bd caida")
+        return reclamar(*args)
+
+    gestor.reclamar_documentos_ocr_en_cola = _reclamar_con_fallo
+
+    assert cola.procesar_pendientes() == 1
+    assert gestor.docs["d1"]["estado"] == "en_cola"
+
+
+class _ServicioLotes(_ServicioFalso):
+    admite_lotes = True
+
+    def __init__(self, gestor, lote_falla=False):
+        super().__init__(gestor)
+        self.lote_falla = lote_falla
+        self.lotes = []
+        self.individuales = []
+
+    def analizar_lote(self, paths, hashes=None):
+        self.lotes.append([p.name for p in paths])
+        if self.lote_falla:
+            raise ConnectionError("lote caido")
+        return [OcrInvoiceResult(motor="falso", texto="x" * 60) for _ in paths]
+
+    def analizar_archivo(self, path):
+        self.individuales.append(path.name)
+        return super().analizar_archivo(path)
+
+
+def test_con_backend_reclama_en_lotes_y_recurre_a_peticiones_sueltas(tmp_path, monkeypatch):
+    for lote_falla in (False, True):
+        gestor = _GestorCola(_docs(tmp_path, 5))
+        servicio = _ServicioLotes(gestor, lote_falla=lote_falla)
+        monkeypatch.setattr(cola_ocr, "OcrService", lambda *_a, **_k: servicio)
+        cola = ColaOcr(gestor, max_trabajadores=1, tamano_lote=3)
+
+        assert cola.procesar_pendientes() == 5
+
+        # La primera reclamacion es suelta: aun no se sabe si hay backend.
+        assert servicio.lotes == [["f1.pdf", "f2.pdf", "f3.pdf"]]
+        esperados = ["f0.pdf", "f4.pdf"] if not lote_falla else ["f0.pdf", "f1.pdf", "f2.pdf", "f3.pdf", "f4.pdf"]
+        assert servicio.individuales == esperados
+        assert {d["estado"] for d in gestor.docs.values()} == {"pendiente_revision"}
+
+
+def test_recuperar_bloqueados_marca_error_al_agotar_intentos():
+    gestor = GestorBase.__new__(GestorBase)
+    gestor.conn = sqlite3.connect(":memory:")
+    gestor.conn.row_factory = sqlite3.Row
+    gestor.conn.executescript("""
+        CREATE TABLE documentos_ocr (id TEXT PRIMARY KEY, empresa_id TEXT, estado TEXT, error_ocr TEXT,
+                                     cola_intentos INTEGER, cola_trabajador TEXT, cola_bloqueado_en TEXT);
+        INSERT INTO documentos_ocr VALUES
+            ('d1', 'E1', 'procesando', '', 1, 'w', '2000-01-01T00:00:00'),
+            ('d2', 'E1', 'procesando', '', 3, 'w', '2000-01-01T00:00:00'),
+            ('d3', 'E2', 'procesando', '', 1, 'w', '2000-01-01T00:00:00'),
+            ('d4', 'E1', 'procesando', '', 1, 'w', '2999-01-01T00:00:00');
+    """)
+
+    assert gestor.recuperar_documentos_ocr_bloqueados(60, max_intentos=3, empresa_id="E1") == 1
+
+    estados = {r["id"]: (r["estado"], r["cola_trabajador"]) for r in gestor.conn.execute(
+        "SELECT id, estado, cola_trabajador FROM documentos_ocr")}
+    assert estados == {
+        "d1": ("en_cola", None),
+        "d2": ("error", None),
+        "d3": ("procesando", "w"),
+        "d4": ("procesando", "w"),
+    }
+
+
+def test_espera_reintento_crece_exponencialmente(monkeypatch):
+    monkeypatch.setattr(cola_ocr.random, "uniform", lambda _a, _b: 1.0)
+    assert [espera_reintento(n, 30) for n in (1, 2, 3)] == [30, 60, 120]
+
+
+class _GestorEncolar:
+    def __init__(self):
+        self.documentos = []
+        self.encolados = []
+
+    def buscar_documento_ocr_por_hash(self, _empresa, _hash):
+        return None
+
+    def upsert_documento_ocr(self, doc):
+        self.documentos.append(dict(doc))
+
+    def encolar_documento_ocr(self, doc_id, prioridad, opciones):
+        self.encolados.append((doc_id, prioridad, opciones))
+
+    def referenciar_contenido_documental(self, *_args, **_kwargs):
+        return 1
+
+    def liberar_contenido_documental(self, *_args, **_kwargs):
+        return 0
+
+
+def test_encolar_archivo_registra_sin_analizar(tmp_path, monkeypatch):
+    source = tmp_path / "factura.pdf"
+    source.write_bytes(b"%PDF-cola")
+    monkeypatch.setattr(
+        "services.ocr.ocr_service.get_default_received_documents_dir", lambda: tmp_path / "Empresas",
+    )
+    gestor = _GestorEncolar()
+    servicio = object.__new__(OcrService)
+    servicio._gestor = gestor
+    servicio._empresa = "E00001"
+    servicio._ejercicio = 2026
+    servicio._usuario = "ana"
+    servicio._tipo_documento = "factura_recibida"
+    servicio._fecha_contable = ""
+    servicio._archivar_en_repositorio_compartido = lambda path, _hash=None: path
+    servicio._ejecutar_motores = lambda _path: (_ for _ in ()).throw(AssertionError("no"))
+
+    resultado = servicio.encolar_archivo(str(source), prioridad=5)
+
+    assert resultado["estado"] == "en_cola"
+    assert gestor.documentos[0]["estado"] == "en_cola"
+    assert gestor.encolados == [(
+        resultado["documento_id"], 5,
+        {"ejercicio": 2026, "usuario": "ana", "fecha_contable": ""},
+    )]
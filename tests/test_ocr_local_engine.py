@@ -0,0 +1,95 @@
+import threading
+import time
+
+import pytest
+
+from services.ocr.engines import local_engine
+from services.ocr.engines.local_engine import LocalOcrEngine
+
+
+def _pdf(tmp_path, paginas):
+    fitz = pytest.importorskip("fitz")
+    doc = fitz.open()
+    for i in range(paginas):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Pagina {i + 1}")
+    ruta = tmp_path / "escaneo.pdf"
+    doc.save(str(ruta))
+    doc.close()
+    return ruta
+
+
+def test_pdf_paginas_en_paralelo_con_imagen_directa(tmp_path):
+    ruta = _pdf(tmp_path, 4)
+    engine = LocalOcrEngine(max_paginas_paralelo=4)
+    lock = threading.Lock()
+    estado = {"activos": 0, "max": 0, "modos": set(), "n": 0, "omp": set()}
+
+    def _ocr(img, entorno=None):
+        with lock:
+            estado["omp"].add((entorno or {}).get("OMP_THREAD_LIMIT"))
+            estado["activos"] += 1
+            estado["max"] = max(estado["max"], estado["activos"])
+            estado["modos"].add(img.mode)
+            estado["n"] += 1
+            n = estado["n"]
+        time.sleep(0.05)
+        with lock:
+            estado["activos"] -= 1
+        return f"texto {n}", [80.0, 90.0]
+
+    engine._ocr_imagen = _ocr
+    omp_antes = local_engine.os.environ.get("OMP_THREAD_LIMIT")
+
+    texto, confianza = engine._pdf_to_text(ruta)
+
+    assert texto.splitlines() == ["texto 1", "texto 2", "texto 3", "texto 4"]
+    assert confianza == 0.85
+    assert estado["max"] > 1
+    assert estado["modos"] == {"L"}
+    # El limite de OpenMP va solo a los procesos tesseract, no al nuestro.
+    assert estado["omp"] == {"1"}
+    assert local_engine.os.environ.get("OMP_THREAD_LIMIT") == omp_antes
+
+
+def test_texto_y_confianzas_de_una_sola_llamada():
+    data = {
+        "text":      ["", "Factura", "F-1", "Total", "", "121,00"],
+        "conf":      ["-1", "96", "90", "88", "-1", 70],
+        "block_num": [1, 1, 1, 1, 2, 2],
+        "par_num":   [1, 1, 1, 1, 1, 1],
+        "line_num":  [0, 1, 1, 2, 0, 1],
+    }
+
+    texto, confs = local_engine._texto_y_confianzas(data)
+
+    assert texto == "Factura F-1\nTotal\n\n121,00"
+    assert confs == [96.0, 90.0, 88.0, 70.0]
+    assert local_engine._confianza_media(confs) == 0.86
+
+
+def test_tesseract_tsv_con_entorno_propio(monkeypatch):
+    llamadas = []
+    tsv = (
+        "level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\tconf\ttext\n"
+        "5\t1\t1\t1\t1\t1\t0\t0\t10\t10\t96.5\tFactura\n"
+        "5\t1\t1\t1\t1\t2\t0\t0\t10\t10\t90\tF-1\n"
+        "4\t1\t1\t1\t2\t0\t0\t0\t10\t10\t-1\n"
+    )
+
+    class _Imagen:
+        def save(self, ruta):
+            open(ruta, "wb").close()
+
+    def _run(cmd, **kw):
+        llamadas.append((cmd, kw["env"]))
+        return local_engine.subprocess.CompletedProcess(cmd, 0, tsv.encode("utf-8"), b"")
+
+    monkeypatch.setattr(local_engine.subprocess, "run", _run)
+
+    data = local_engine._tesseract_tsv("tesseract", _Imagen(), "spa", {"OMP_THREAD_LIMIT": "1"})
+
+    (cmd, env), = llamadas
+    assert cmd[0] == "tesseract" and cmd[2:] == ["stdout", "-l", "spa", "tsv"]
+    assert env == {"OMP_THREAD_LIMIT": "1"}
+    assert local_engine._texto_y_confianzas(data) == ("Factura F-1", [96.5, 90.0])
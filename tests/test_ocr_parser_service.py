@@ -211,3 +211,22 @@ def test_to_dict_contrato_tipado():
     ):
         assert campo in d, f"Campo '{campo}' ausente en to_dict()"
     assert isinstance(d["bases_iva"], list)
+
+
+def test_filtro_por_palabras_clave_no_cambia_el_resultado(monkeypatch):
+    from pathlib import Path
+
+    from services.ocr import invoice_interpreter
+
+    corpus = sorted((Path(__file__).parent / "fixtures" / "ocr_textos").glob("*.txt"))
+    textos = [p.read_text(encoding="utf-8") for p in corpus]
+    textos += [t.upper() for t in textos] + [t.lower() for t in textos]
+    con_filtro = [InvoiceInterpreter().interpretar(t).to_dict() for t in textos]
+
+    invoice_interpreter._contexto.cache_clear()
+    monkeypatch.setattr(invoice_interpreter._TextoFactura, "contiene", lambda _self, _claves: True)
+    sin_filtro = [InvoiceInterpreter().interpretar(t).to_dict() for t in textos]
+    invoice_interpreter._contexto.cache_clear()
+
+    assert len(corpus) >= 10
+    assert con_filtro == sin_filtro
@@ -1,12 +1,46 @@
+import hashlib
+import sqlite3
 from pathlib import Path
 
+import pytest
+
+from models.gestor_base import GestorBase
+from services.almacen_documental import AlmacenDocumental, eliminar_ruta_objeto, referencia_provisional
 from services.ocr.ocr_service import OcrService
 
 
+def _gestor_sqlite():
+    gestor = GestorBase.__new__(GestorBase)
+    gestor.conn = sqlite3.connect(":memory:")
+    gestor.conn.row_factory = sqlite3.Row
+    gestor.conn.executescript("""
+        CREATE TABLE documentos_contenido (hash_archivo TEXT PRIMARY KEY, ruta_objeto TEXT NOT NULL,
+                                           tamano INTEGER, referencias INTEGER NOT NULL DEFAULT 0,
+                                           created_at TEXT NOT NULL, updated_at TEXT NOT NULL);
+        CREATE TABLE documentos_ocr (id TEXT PRIMARY KEY, empresa_id TEXT NOT NULL, ruta_original TEXT,
+                                     nombre_archivo TEXT, hash_archivo TEXT, tipo_documento TEXT,
+                                     estado TEXT, fecha_alta TEXT, fecha_procesado TEXT, motor_ocr TEXT,
+                                     confianza_global REAL, error_ocr TEXT, texto_extraido TEXT,
+                                     json_ocr TEXT, ruta_objeto TEXT);
+        CREATE TABLE documentos_archivo (id TEXT PRIMARY KEY, ocr_documento_id TEXT, estado TEXT,
+                                         updated_at TEXT);
+        CREATE TABLE facturas_recibidas_ocr (id TEXT PRIMARY KEY, documento_id TEXT);
+    """)
+    return gestor
+
+
+def _referencias(gestor, digest):
+    row = gestor.conn.execute(
+        "SELECT referencias FROM documentos_contenido WHERE hash_archivo=?", (digest,),
+    ).fetchone()
+    return row["referencias"] if row else None
+
+
 def _service(empresa: str = "E01006", ejercicio: int = 2026):
     service = object.__new__(OcrService)
     service._empresa = empresa
     service._ejercicio = ejercicio
+    service._gestor = None
     return service
 
 
@@ -31,3 +65,96 @@ def test_no_duplica_un_documento_ya_archivado(tmp_path, monkeypatch):
     source.write_bytes(b"pdf compartido")
 
     assert _service()._archivar_en_repositorio_compartido(source) == source
+
+
+def test_copias_logicas_comparten_un_objeto_del_almacen(tmp_path, monkeypatch):
+    root = tmp_path / "Empresas"
+    monkeypatch.setattr("services.ocr.ocr_service.get_default_received_documents_dir", lambda: root)
+    source = tmp_path / "puesto" / "Factura.pdf"
+    source.parent.mkdir()
+    source.write_bytes(b"pdf repetido")
+
+    first = _service()._archivar_en_repositorio_compartido(source)
+    second = _service(empresa="E02000")._archivar_en_repositorio_compartido(source)
+
+    stored = AlmacenDocumental(tmp_path / "_contenido").ruta_objeto(hashlib.sha256(b"pdf repetido").hexdigest())
+    assert first.stat().st_ino == second.stat().st_ino == stored.stat().st_ino
+    assert not list(stored.parent.glob("*.tmp"))
+
+
+def test_liberar_ultima_referencia_borra_fila_y_objeto_en_la_misma_transaccion(tmp_path):
+    gestor = _gestor_sqlite()
+    almacen = AlmacenDocumental(tmp_path / "_contenido")
+    stored = almacen.guardar_bytes(b"pdf")
+    digest = stored.name
+    gestor.referenciar_contenido_documental(digest, str(stored), 3)
+    gestor.referenciar_contenido_documental(digest, str(stored), 3)
+
+    assert gestor.liberar_contenido_documental(digest, al_eliminar_objeto=eliminar_ruta_objeto) == 1
+    assert stored.exists()
+
+    def _falla(_ruta):
+        raise OSError("volumen no disponible")
+
+    with pytest.raises(OSError):
+        gestor.liberar_contenido_documental(digest, al_eliminar_objeto=_falla)
+    assert _referencias(gestor, digest) == 1
+
+    assert gestor.liberar_contenido_documental(digest, al_eliminar_objeto=eliminar_ruta_objeto) == 0
+    assert _referencias(gestor, digest) is None
+    assert not stored.exists()
+
+
+def test_documento_ocr_referencia_una_vez_y_libera_al_eliminarse(tmp_path):
+    gestor = _gestor_sqlite()
+    almacen = AlmacenDocumental(tmp_path / "_contenido")
+    stored = almacen.guardar_bytes(b"factura")
+    digest = stored.name
+    doc = {"id": "D1", "empresa_id": "E00001", "hash_archivo": digest, "ruta_objeto": str(stored)}
+
+    gestor.upsert_documento_ocr(doc)
+    gestor.upsert_documento_ocr(dict(gestor.get_documento_ocr("D1"), estado="pendiente_revision"))
+    gestor.upsert_documento_ocr({"id": "D1", "empresa_id": "E00001", "hash_archivo": digest})
+
+    assert _referencias(gestor, digest) == 1
+    assert gestor.get_documento_ocr("D1")["ruta_objeto"] == str(stored)
+    assert gestor.eliminar_documento_ocr("D1", al_eliminar_objeto=eliminar_ruta_objeto)
+    assert _referencias(gestor, digest) is None
+    assert not stored.exists()
+
+
+def test_referencia_provisional_borra_el_objeto_si_nadie_lo_adopta(tmp_path):
+    gestor = _gestor_sqlite()
+    almacen = AlmacenDocumental(tmp_path / "_contenido")
+    digest = hashlib.sha256(b"duplicado").hexdigest()
+
+    with referencia_provisional(gestor, almacen, digest) as objeto:
+        almacen.guardar_bytes(b"duplicado", digest)
+        assert _referencias(gestor, digest) == 1
+    assert not objeto.exists()
+
+    with referencia_provisional(gestor, almacen, digest) as objeto:
+        almacen.guardar_bytes(b"duplicado", digest)
+        gestor.upsert_documento_ocr({
+            "id": "D1", "empresa_id": "E00001", "hash_archivo": digest, "ruta_objeto": str(objeto),
+        })
+    assert objeto.exists()
+    assert _referencias(gestor, digest) == 1
+
+
+def test_almacen_copia_si_el_volumen_no_admite_enlaces(tmp_path, monkeypatch):
+    almacen = AlmacenDocumental(tmp_path / "_contenido")
+    stored = almacen.guardar_bytes(b"contenido")
+    assert almacen.guardar_bytes(b"contenido") == stored
+
+    def _sin_enlaces(*_args):
+        raise OSError("no soportado")
+
+    monkeypatch.setattr("services.almacen_documental.os.link", _sin_enlaces)
+    destination = almacen.materializar(stored, tmp_path / "Empresas" / "copia.pdf")
+
+    assert destination.read_bytes() == b"contenido"
+    assert destination.stat().st_ino != stored.stat().st_ino
+    almacen.eliminar_objeto(stored.name)
+    assert not stored.exists()
+    assert destination.read_bytes() == b"contenido"
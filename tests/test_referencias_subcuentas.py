@@ -0,0 +1,71 @@
+from models.gestor_base import GestorBase
+
+
+class _Cursor:
+    def __init__(self, filas=()):
+        self._filas = list(filas)
+
+    def fetchall(self):
+        return self._filas
+
+
+class _Conexion:
+    def __init__(self):
+        self.sentencias = []
+
+    def execute(self, sql, params=()):
+        sql = " ".join(sql.split())
+        self.sentencias.append((sql, params))
+        if sql.startswith("SELECT tipo_doc, doc_id, campo FROM referencias_subcuentas"):
+            return _Cursor([
+                {"tipo_doc": "factura_recibida", "doc_id": "R1", "campo": "linea_base"},
+                {"tipo_doc": "factura_recibida", "doc_id": "R1", "campo": "linea_iva"},
+                {"tipo_doc": "factura_recibida", "doc_id": "R2", "campo": "proveedor"},
+                {"tipo_doc": "factura_recibida", "doc_id": "R2", "campo": "linea_base"},
+                {"tipo_doc": "factura_emitida", "doc_id": "E1", "campo": "cliente"},
+            ])
+        if "FROM facturas_emitidas_docs WHERE codigo_empresa=? AND id IN" in sql:
+            return _Cursor([{"id": "E1", "ejercicio": 2026, "serie": "A", "numero": "7", "nombre": "Cliente"}])
+        if "FROM facturas_recibidas_docs WHERE codigo_empresa=? AND id IN" in sql:
+            return _Cursor([
+                {"id": "R1", "ejercicio": 2026, "numero_factura": "F-1", "proveedor_nombre": "Uno"},
+                {"id": "R2", "ejercicio": 2026, "numero_factura": "F-2", "proveedor_nombre": "Dos"},
+            ])
+        return _Cursor()
+
+    def commit(self):
+        pass
+
+
+def _gestor():
+    gestor = GestorBase.__new__(GestorBase)
+    gestor.conn = _Conexion()
+    return gestor
+
+
+def test_referencias_se_leen_del_indice_sin_recorrer_facturas():
+    gestor = _gestor()
+
+    refs = gestor.get_referencias_subcuenta_en_facturas("E00001", "40000001")
+
+    assert [(r["tipo"], r["id"], r.get("campos")) for r in refs] == [
+        ("factura_emitida", "E1", None),
+        ("factura_recibida", "R1", ["base", "IVA"]),
+        ("factura_recibida", "R2", ["proveedor"]),
+    ]
+    assert refs[0]["descripcion"] == "Factura emitida A7"
+    consultas = [sql for sql, _ in gestor.conn.sentencias]
+    assert not any("cuenta_gasto=?" in sql or "ocr_lineas_fiscales" in sql for sql in consultas)
+
+
+def test_guardar_factura_recibida_reindexa_solo_ese_documento():
+    gestor = _gestor()
+
+    gestor._indexar_referencias_subcuenta("factura_recibida", 42)
+
+    (borrado, borrado_params), (alta, alta_params) = gestor.conn.sentencias
+    assert borrado.startswith("DELETE FROM referencias_subcuentas")
+    assert borrado_params == ("factura_recibida", "42")
+    assert alta.startswith("INSERT OR IGNORE INTO referencias_subcuentas")
+    assert alta.count("d.id=?") == len(alta_params) == 6
+    assert set(alta_params) == {"42"}
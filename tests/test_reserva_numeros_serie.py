@@ -0,0 +1,70 @@
+import sqlite3
+import threading
+
+from models.gestor_base import GestorBase
+
+
+def _gestor(ruta):
+    gestor = GestorBase.__new__(GestorBase)
+    gestor.conn = sqlite3.connect(ruta, timeout=10, check_same_thread=False)
+    gestor.conn.row_factory = sqlite3.Row
+    return gestor
+
+
+def _crear_series(ruta):
+    conn = sqlite3.connect(ruta)
+    conn.executescript("""
+        CREATE TABLE series_emitidas (codigo_empresa TEXT, ejercicio INTEGER, nombre TEXT, siguiente_num INTEGER);
+        INSERT INTO series_emitidas VALUES ('E00001', 2026, 'A', 7), ('E00001', 2026, 'R', 1);
+    """)
+    conn.commit()
+    conn.close()
+
+
+def test_reservar_numeros_serie_devuelve_rangos_consecutivos(tmp_path):
+    ruta = str(tmp_path / "series.db")
+    _crear_series(ruta)
+    gestor = _gestor(ruta)
+
+    assert gestor.reservar_numeros_serie("E00001", 2026, "A", 3) == range(7, 10)
+    assert gestor.reservar_numeros_serie("E00001", 2026, "A") == range(10, 11)
+    assert gestor.incrementar_serie_num("E00001", 2026, "A") == 12
+    assert gestor.get_siguiente_serie_num("E00001", 2026, "A") == 12
+    assert gestor.reservar_numeros_serie("E00001", 2026, "NO") is None
+
+
+def test_reservas_de_varios_puestos_no_se_solapan(tmp_path):
+    ruta = str(tmp_path / "series.db")
+    _crear_series(ruta)
+    reservados = []
+    lock = threading.Lock()
+
+    def puesto():
+        gestor = _gestor(ruta)
+        for _ in range(20):
+            rango = gestor.reservar_numeros_serie("E00001", 2026, "R", 5)
+            with lock:
+                reservados.extend(rango)
+
+    hilos = [threading.Thread(target=puesto) for _ in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert sorted(reservados) == list(range(1, 401))
+
+
+def test_devolver_numeros_solo_si_nadie_ha_reservado_despues(tmp_path):
+    ruta = str(tmp_path / "series.db")
+    _crear_series(ruta)
+    gestor = _gestor(ruta)
+
+    rango = gestor.reservar_numeros_serie("E00001", 2026, "A", 3)
+    assert gestor.devolver_numeros_serie("E00001", 2026, "A", rango) is True
+    assert gestor.get_siguiente_serie_num("E00001", 2026, "A") == 7
+
+    rango = gestor.reservar_numeros_serie("E00001", 2026, "A", 2)
+    gestor.reservar_numeros_serie("E00001", 2026, "A", 1)
+    assert gestor.devolver_numeros_serie("E00001", 2026, "A", rango) is False
+    assert gestor.get_siguiente_serie_num("E00001", 2026, "A") == 10
@@ -0,0 +1,147 @@
+from services.terceros_ocr_service import TercerosOcrService
+
+
+class _GestorTerceros:
+    def __init__(self):
+        self.generacion = 0
+        self.cargas = 0
+        self.cargas_globales = 0
+        self.subcuentas = [
+            {"tercero_id": "t1", "tercero_nombre": "Suministros Levante, S.L.",
+             "tercero_nif": "B-11111111", "tipo_subcuenta": "proveedor",
+             "subcuenta": "40000001"},
+            {"tercero_id": "t2", "tercero_nombre": "Transportes Garcia Hermanos S.A.",
+             "tercero_nif": "A22222222", "tipo_subcuenta": "acreedor",
+             "subcuenta": "41000001"},
+        ]
+        self.legacy = [{"id": "t3", "nombre": "Papeleria Centro", "nif": "",
+                        "subcuenta_proveedor": "40000003"}]
+        self.globales = [{"id": "g9", "nombre": "Global", "nif": "B99999999"}]
+
+    def generacion_terceros(self):
+        return self.generacion
+
+    def listar_subcuentas_facturacion(self, _codigo, _tipos, activo=True):
+        self.cargas += 1
+        return [dict(item) for item in self.subcuentas]
+
+    def listar_terceros_por_empresa(self, _codigo, _ejercicio):
+        return [dict(item) for item in self.legacy]
+
+    def listar_terceros(self):
+        self.cargas_globales += 1
+        return [dict(item) for item in self.globales]
+
+
+def test_resolver_tercero_usa_el_indice_entre_documentos():
+    gestor = _GestorTerceros()
+    svc = TercerosOcrService()
+
+    por_nif = svc.resolver_tercero(gestor, "B11111111", "", "00001", 2026)
+    por_nombre = svc.resolver_tercero(gestor, "", "suministros levante sl", "00001", 2026)
+    parcial = svc.resolver_tercero(gestor, "", "Transportes Garcia", "00001", 2026)
+    contenido = svc.resolver_tercero(gestor, "", "Papeleria Centro Valencia", "00001", 2026)
+    global_ = svc.resolver_tercero(gestor, "B99999999", "", "00001", 2026)
+    ninguno = svc.resolver_tercero(gestor, "", "Otra empresa", "00001", 2026)
+
+    assert por_nif["id"] == "t1" and por_nif["subcuenta_proveedor"] == "40000001"
+    assert por_nombre["id"] == "t1"
+    assert parcial["id"] == "t2"
+    assert contenido["id"] == "t3"
+    assert global_["id"] == "g9"
+    assert ninguno is None
+    assert gestor.cargas == 1
+    assert gestor.cargas_globales == 1
+    assert svc.nif_ya_existe(gestor, "B-99999999")
+    assert gestor.cargas_globales == 1
+
+
+def test_indice_se_reconstruye_al_cambiar_terceros():
+    gestor = _GestorTerceros()
+    svc = TercerosOcrService()
+    assert svc.resolver_tercero(gestor, "B33333333", "", "00001", 2026) is None
+
+    gestor.subcuentas.append({"tercero_id": "t4", "tercero_nombre": "Nuevo",
+                              "tercero_nif": "B33333333", "tipo_subcuenta": "proveedor",
+                              "subcuenta": "40000004"})
+    gestor.generacion += 1
+
+    assert svc.resolver_tercero(gestor, "B33333333", "", "00001", 2026)["id"] == "t4"
+    assert gestor.cargas == 2
+    # Cada ejercicio tiene su propio indice.
+    svc.resolver_tercero(gestor, "B33333333", "", "00001", 2025)
+    assert gestor.cargas == 3
+
+
+def test_generacion_terceros_avanza_con_los_upserts():
+    from models.gestor_base import GestorBase
+
+    gestor = GestorBase.__new__(GestorBase)
+    assert gestor.generacion_terceros() == 0
+    gestor._invalidar_terceros()
+    assert gestor.generacion_terceros() == 1
+
+
+class _CursorSubcuenta:
+    def __init__(self, fila):
+        self._fila = fila
+
+    def fetchone(self):
+        return self._fila
+
+
+class _ConexionSubcuenta:
+    def __init__(self, filas):
+        self.filas = list(filas)
+        self.sentencias = []
+        self.commits = 0
+
+    def execute(self, sql, params):
+        self.sentencias.append((sql, list(params)))
+        return _CursorSubcuenta(self.filas.pop(0))
+
+    def commit(self):
+        self.commits += 1
+
+
+def _gestor_subcuentas(filas):
+    from models.gestor_base import GestorBase
+
+    gestor = GestorBase.__new__(GestorBase)
+    gestor.conn = _ConexionSubcuenta(filas)
+    return gestor
+
+
+def test_proponer_subcuenta_reserva_en_una_sentencia():
+    gestor = _gestor_subcuentas([{"n": 40000004, "reservada": "40000004"}])
+    gestor.get_empresa = lambda _codigo, _ejercicio: {"digitos_plan": 8}
+
+    sub = TercerosOcrService().proponer_subcuenta(gestor, "proveedor", "00001", 2026)
+
+    assert sub == "40000004"
+    assert len(gestor.conn.sentencias) == 1
+    sql, params = gestor.conn.sentencias[0]
+    assert "LEAD(n) OVER (ORDER BY n)" in sql
+    assert "FROM terceros_empresas" in sql and "subcuenta_proveedor BETWEEN" in sql
+    assert "INSERT INTO reservas_subcuentas" in sql
+    assert params[:4] == ["00001", "40000001", "40099999", "400_____"]
+    assert gestor.conn.commits == 1
+
+
+def test_proponer_subcuenta_libre_reintenta_y_detecta_rango_agotado():
+    import pytest
+
+    # Otro puesto reservo el numero entre la busqueda y la insercion.
+    gestor = _gestor_subcuentas([
+        {"n": 43000002, "reservada": None},
+        {"n": 43000003, "reservada": "43000003"},
+    ])
+    assert gestor.proponer_subcuenta_libre("00001", "430", 8, reservar=True) == "43000003"
+    assert len(gestor.conn.sentencias) == 2
+    assert "terceros_empresas" not in gestor.conn.sentencias[0][0]
+
+    lleno = _gestor_subcuentas([{"n": 4310, "reservada": None}])
+    with pytest.raises(ValueError):
+        lleno.proponer_subcuenta_libre("00001", "430", 4)
+    with pytest.raises(ValueError):
+        lleno.proponer_subcuenta_libre("00001", "430", 8, campo_terceros="nif")
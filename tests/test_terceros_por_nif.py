@@ -0,0 +1,101 @@
+from types import SimpleNamespace
+
+import pytest
+
+from models.auth import CompanyPermission, UserRecord, UserRole, UserSession
+from models.gestor_base import GestorBase
+from services.auth_service import AuthorizationService
+from services.secured_gestor import SecuredGestor
+from services.ocr_recibidas_service import build_terceros_by_nif
+
+
+class _Cursor:
+    def __init__(self, filas):
+        self._filas = filas
+
+    def fetchall(self):
+        return self._filas
+
+
+class _Conexion:
+    def __init__(self):
+        self.consultas = []
+
+    def execute(self, sql, params=()):
+        sql = " ".join(sql.split())
+        self.consultas.append((sql, params))
+        if sql.startswith("SELECT * FROM terceros WHERE nif_normalizado IN"):
+            return _Cursor([
+                {"id": "T1", "nif": "B-1234", "nif_normalizado": "B1234", "nombre": "Global"},
+                {"id": "T2", "nif": "X9", "nif_normalizado": "X9", "nombre": "Solo global"},
+            ])
+        return _Cursor([
+            {"id": "T1", "nif_normalizado": "B1234", "subcuenta_cliente": "43000009", "ejercicio": 2025},
+            {"id": "T1", "nif_normalizado": "B1234", "subcuenta_cliente": "43000001", "ejercicio": 0},
+        ])
+
+
+def test_terceros_por_nifs_solo_consulta_los_nif_pedidos():
+    gestor = GestorBase.__new__(GestorBase)
+    gestor.conn = _Conexion()
+
+    terceros = gestor.get_terceros_by_nifs("E00001", 2026, ["b-1234", "X9", "B1234", "", None])
+
+    assert terceros["B1234"]["subcuenta_cliente"] == "43000001"
+    assert terceros["X9"]["nombre"] == "Solo global"
+    (_, globales), (sql_empresa, empresa) = gestor.conn.consultas
+    assert globales == ("B1234", "X9")
+    assert "t.nif_normalizado IN (?,?)" in sql_empresa
+    assert empresa == ("E00001", "B1234", "X9")
+    assert gestor.get_terceros_by_nifs("E00001", 2026, []) == {}
+    assert len(gestor.conn.consultas) == 2
+
+
+def test_suenlace_recibidas_pide_los_nif_de_las_filas():
+    class Gestor:
+        def get_terceros_by_nifs(self, codigo, ejercicio, nifs):
+            self.pedidos = (codigo, ejercicio, nifs)
+            return {}
+
+    gestor = Gestor()
+    build_terceros_by_nif(gestor, "E00001", 2026, [{"NIF Cliente Proveedor": "B1"}, {"NIF": "C2"}])
+
+    assert gestor.pedidos == ("E00001", 2026, ["B1", "C2"])
+
+
+def test_renormaliza_los_nif_guardados_con_el_criterio_antiguo():
+    import sqlite3
+
+    gestor = GestorBase.__new__(GestorBase)
+    gestor.conn = sqlite3.connect(":memory:")
+    gestor.conn.row_factory = sqlite3.Row
+    gestor.conn.executescript("""
+        CREATE TABLE terceros (id TEXT PRIMARY KEY, nif TEXT, nif_normalizado TEXT);
+        INSERT INTO terceros VALUES ('T1', 'B.123/45', 'B.123/45'), ('T2', 'x-9', 'X9'), ('T3', ' ', ' ');
+    """)
+
+    gestor._renormalizar_nif_terceros()
+
+    filas = gestor.conn.execute("SELECT id, nif_normalizado FROM terceros ORDER BY id").fetchall()
+    assert [tuple(f) for f in filas] == [("T1", "B12345"), ("T2", "X9"), ("T3", None)]
+
+
+def test_suenlace_recibidas_busca_el_tercero_con_el_mismo_normalizador():
+    from procesos.facturas_recibidas import _datos_tercero
+
+    datos = _datos_tercero({"NIF Cliente Proveedor": "b.123/45"}, {"B12345": {"nombre": "Proveedor SL"}})
+
+    assert (datos["nif"], datos["nombre"]) == ("B12345", "Proveedor SL")
+
+
+def test_secured_gestor_exige_lectura_para_buscar_terceros_por_nif():
+    sesion = UserSession(
+        user=UserRecord(7, "empleado", "Ana", UserRole.EMPLEADO, True),
+        company_permissions={"E00702": CompanyPermission.READ},
+    )
+    base = SimpleNamespace(get_terceros_by_nifs=lambda codigo, ejercicio, nifs: {"B1": {"id": "T1"}})
+    gestor = SecuredGestor(base, AuthorizationService(sesion))
+
+    assert gestor.get_terceros_by_nifs("E00702", 2026, ["B1"]) == {"B1": {"id": "T1"}}
+    with pytest.raises(PermissionError):
+        gestor.get_terceros_by_nifs("E00999", 2026, ["B1"])
@@ -185,8 +185,22 @@ class UIBuzonesGlobal(ttk.Frame):
         self._set_busy(True)
         import threading
 
+        total = len(activos)
+        hechos = [0]
+
+        def _progreso(res):
+            hechos[0] += 1
+            n = hechos[0]
+            estado = "OK" if res.ok else "ERROR"
+            self.after(0, lambda: self._lbl_status.configure(
+                text=f"Sincronizando {n}/{total}: '{res.buzon_nombre}' {estado} "
+                     f"({res.nuevas} nueva(s), {res.duracion_ms / 1000:.1f} s)"
+            ))
+
         def _worker():
-            glob = sincronizar_buzones(self._gestor, activos, OpcionesSync(headless=True))
+            glob = sincronizar_buzones(
+                self._gestor, activos, OpcionesSync(headless=True), on_resultado=_progreso,
+            )
             self.after(0, lambda: self._sync_todos_fin(glob))
 
         threading.Thread(target=_worker, daemon=True).start()
@@ -3317,6 +3317,9 @@ class UIFacturasEmitidas(ttk.Frame):
             filetypes=[("XML Facturae", "*.xml")],
         )
 
+    def ask_facturae_directory(self):
+        return filedialog.askdirectory(title="Carpeta destino de los XML Facturae/FACe")
+
     def ask_save_dat_path(self, initialfile):
         return filedialog.asksaveasfilename(
             title="Guardar fichero suenlace.dat",
@@ -26,6 +26,7 @@ from pathlib import Path
 from tkinter import filedialog, messagebox, ttk
 import tkinter as tk
 
+from services.almacen_documental import eliminar_ruta_objeto
 from services.terceros_empresa_fiscal_service import PROVEEDOR_TIPOS_IVA
 from services.ocr_contabilidad_service import OcrContabilidadService
 from services.ocr_emitidas_contabilidad_service import OcrEmitContabilidadService
@@ -211,6 +212,7 @@ class UIFacturasRecibidasOcr(ttk.Frame):
 
         self._build()
         self.after_idle(self._refresh_all)
+        self.after_idle(self._reanudar_cola_ocr)
 
     # ── Construccion de la UI ─────────────────────────────────────────────────
 
@@ -936,41 +938,17 @@ class UIFacturasRecibidasOcr(ttk.Frame):
         prefijos = ("430",) if es_emitida else ("400", "410")
         self._cuentas_plan_por_etiqueta.clear()
         etiquetas = []
-        codigos_vistos: set[str] = set()
         try:
-            # Fuente principal: maestro_subcuentas_empresa. Es el plan local
-            # de la empresa enriquecido durante la importacion de A3.
-            cuentas = self._gestor.listar_maestro_subcuentas_empresa(
-                self._codigo, activo=None,
-            ) or []
+            # maestro_subcuentas_empresa (enriquecido al importar de A3) y,
+            # para instalaciones antiguas, plan_cuentas de cualquier ejercicio.
+            indice = self._gestor.indice_cuentas(self._codigo)
+            cuentas = [c for prefijo in prefijos for c in indice.por_prefijo(prefijo)]
         except Exception:
             cuentas = []
-        for cuenta in cuentas:
-            codigo = str(cuenta.get("subcuenta") or cuenta.get("cuenta") or "").strip()
-            if not codigo.startswith(prefijos):
-                continue
-            codigos_vistos.add(codigo)
-            texto = f"{codigo} - {str(cuenta.get('nombre_subcuenta') or cuenta.get('descripcion') or '').strip()}".rstrip(" -")
+        for codigo, descripcion in cuentas:
+            texto = f"{codigo} - {descripcion}".rstrip(" -")
             self._cuentas_plan_por_etiqueta[texto] = codigo
             etiquetas.append(texto)
-        # Compatibilidad con instalaciones que solo tengan plan_cuentas.
-        try:
-            cur = self._gestor.conn.execute(
-                "SELECT DISTINCT cuenta, descripcion FROM plan_cuentas "
-                "WHERE codigo_empresa=? ORDER BY cuenta",
-                (self._codigo,),
-            )
-            columnas = [c[0] for c in cur.description]
-            for fila in cur.fetchall():
-                cuenta = dict(zip(columnas, fila))
-                codigo = str(cuenta.get("cuenta") or "").strip()
-                if codigo in codigos_vistos or not codigo.startswith(prefijos):
-                    continue
-                texto = f"{codigo} - {str(cuenta.get('descripcion') or '').strip()}".rstrip(" -")
-                self._cuentas_plan_por_etiqueta[texto] = codigo
-                etiquetas.append(texto)
-        except Exception:
-            pass
         self._cb_subcuenta_plan.configure(values=etiquetas)
         etiqueta = next((e for e, c in self._cuentas_plan_por_etiqueta.items() if c == str(seleccionada or "")), "")
         self._subcuenta_plan_var.set(etiqueta)
@@ -983,27 +961,13 @@ class UIFacturasRecibidasOcr(ttk.Frame):
         es_emitida = str((self._doc_seleccionado or {}).get("tipo_documento") or "") == "factura_emitida"
         iniciales = "7" if es_emitida else "6"
         self._cuentas_gasto_por_etiqueta.clear()
-        cuentas = []
-        try:
-            cuentas = list(self._gestor.listar_maestro_subcuentas_empresa(self._codigo, activo=None) or [])
-        except Exception:
-            pass
         try:
-            cur = self._gestor.conn.execute(
-                "SELECT DISTINCT cuenta, descripcion FROM plan_cuentas WHERE codigo_empresa=? ORDER BY cuenta",
-                (self._codigo,),
-            )
-            columnas = [c[0] for c in cur.description]
-            cuentas.extend(dict(zip(columnas, fila)) for fila in cur.fetchall())
+            cuentas = self._gestor.indice_cuentas(self._codigo).por_prefijo(iniciales)
         except Exception:
-            pass
-        etiquetas, vistos = [], set()
-        for cuenta in cuentas:
-            codigo = str(cuenta.get("subcuenta") or cuenta.get("cuenta") or "").strip()
-            if not codigo or codigo in vistos or codigo[0] not in iniciales:
-                continue
-            vistos.add(codigo)
-            texto = f"{codigo} - {str(cuenta.get('nombre_subcuenta') or cuenta.get('descripcion') or '').strip()}".rstrip(" -")
+            cuentas = []
+        etiquetas = []
+        for codigo, descripcion in cuentas:
+            texto = f"{codigo} - {descripcion}".rstrip(" -")
             self._cuentas_gasto_por_etiqueta[texto] = codigo
             etiquetas.append(texto)
         self._cb_subcuenta_gasto.configure(values=etiquetas)
@@ -1894,11 +1858,35 @@ class UIFacturasRecibidasOcr(ttk.Frame):
             state="disabled" if bloquear else "readonly"
         )
 
+    def _reanudar_cola_ocr(self):
+        """Retoma documentos que quedaron en cola al cerrar la aplicacion."""
+        if self._ocr_thread and self._ocr_thread.is_alive():
+            return
+        try:
+            pendientes = self._gestor.listar_documentos_ocr(self._empresa_id, "procesando")
+        except Exception:
+            return
+        if not pendientes:
+            return
+        self._lbl_status.configure(text=f"Reanudando {len(pendientes)} documento(s) en cola...")
+        self._ocr_mensajes = []
+        self._bloquear_opciones_importacion(True)
+        t = threading.Thread(
+            target=self._worker_ocr,
+            args=([], self._tipo_doc_var.get(), ""),
+            daemon=True,
+        )
+        self._ocr_thread = t
+        t.start()
+        self.after(75, self._poll_ocr)
+
     def _worker_ocr(
         self, paths: list[str], tipo_documento: str, fecha_contable: str,
     ):
+        # Registrar cada fichero es rapido (hash y copia); el analisis lo
+        # hace en paralelo la cola OCR, que ademas sobrevive a un cierre.
         try:
-            from services.ocr import OcrService
+            from services.ocr import ColaOcr, OcrDocumentState, OcrService
             svc = OcrService(
                 gestor=self._gestor,
                 empresa_id=self._codigo,
@@ -1909,15 +1897,21 @@ class UIFacturasRecibidasOcr(ttk.Frame):
             )
             for path in paths:
                 try:
-                    resultado = svc.procesar_archivo(
+                    resultado = svc.encolar_archivo(
                         path,
                         progress_callback=lambda documento: self._ocr_q.put(
                             ("progress", documento)
                         ),
                     )
-                    self._ocr_q.put(("ok", resultado))
+                    if resultado.get("estado") != OcrDocumentState.EN_COLA.value:
+                        self._ocr_q.put(("ok", resultado))
                 except Exception as exc:
                     self._ocr_q.put(("error", str(exc)))
+            ColaOcr(
+                self._gestor,
+                empresa_id=self._codigo,
+                on_resultado=lambda resultado: self._ocr_q.put(("ok", resultado)),
+            ).procesar_pendientes()
         except Exception as exc:
             self._ocr_q.put(("error", f"Error al iniciar OcrService: {exc}"))
         finally:
@@ -2291,7 +2285,7 @@ class UIFacturasRecibidasOcr(ttk.Frame):
         if not messagebox.askyesno("OCR", "Eliminar el documento? No se puede deshacer."):
             return
         try:
-            self._gestor.eliminar_documento_ocr(doc_id)
+            self._gestor.eliminar_documento_ocr(doc_id, al_eliminar_objeto=eliminar_ruta_objeto)
         except Exception as exc:
             messagebox.showerror("OCR", f"Error al eliminar: {exc}")
             return
@@ -10,6 +10,7 @@ from tkinter import filedialog, messagebox, ttk
 from services.gestion_documental_service import GestionDocumentalService
 from services.firma.firma_service import FirmaService
 from services.firma.provider import build_firma_provider
+from services.ocr.cola_ocr import ColaOcr
 from utils.utilidades import load_app_config
 from views.ui_firma_dialog import UIFirmaDialog
 
@@ -235,10 +236,16 @@ class UIGestionDocumental(ttk.Frame):
                     self._service.enviar_a_ocr(
                         document_id,
                         getattr(getattr(self._session, "user", None), "nombre", ""),
+                        en_cola=True,
                     )
                     sent += 1
                 except Exception as exc:
                     errors.append(f"{self._rows[document_id]['nombre_original']}: {exc}")
+            if sent:
+                try:
+                    ColaOcr(self._gestor, empresa_id=self._codigo).procesar_pendientes()
+                except Exception as exc:
+                    errors.append(f"Cola OCR: {exc}")
             self.after(0, self._finish_ocr, sent, errors)
 
         threading.Thread(target=worker, daemon=True).start()
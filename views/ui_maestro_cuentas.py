@@ -1279,42 +1279,22 @@ class _ProgressGuardadoPlanDialog(tk.Toplevel):
         ).start())
 
     def _run(self, plan, gestor, codigo, ejercicio, digitos):
-        n = 0
         total = len(plan)
-        for i, cuenta_dict in enumerate(plan, 1):
-            try:
-                nif_snapshot = normalizar_nif_cif(cuenta_dict.get("nif") or "") or None
-                tercero_id = None
-                if nif_snapshot:
-                    try:
-                        ter = gestor.get_tercero_by_nif_normalizado(nif_snapshot)
-                        if ter:
-                            tercero_id = str(ter.get("id") or "").strip() or None
-                    except Exception:
-                        pass
-                gestor.upsert_maestro_subcuenta({
-                    "codigo_empresa": codigo,
-                    "subcuenta": cuenta_dict["cuenta"],
-                    "nombre_subcuenta": cuenta_dict["descripcion"],
-                    "tipo_subcuenta": clasificar_tipo_subcuenta(cuenta_dict["cuenta"]),
-                    "nif_snapshot": nif_snapshot,
-                    "tercero_id": tercero_id,
-                    "activo": 1,
-                    "origen": "a3",
-                    "creado_en_gest2a3eco": 0,
-                    "pendiente_alta_a3": 0,
-                })
-                n += 1
-            except Exception:
-                pass
-            if i % 20 == 0 or i == total:
-                pct = int(i * 100 / total)
-                self.after(0, lambda v=i, p=pct: (
-                    self.pb.configure(value=v),
-                    self.lbl_estado.configure(text=f"Cuenta {v} de {total}..."),
-                    self.lbl_pct.configure(text=f"{p} %"),
-                ))
+        self.after(0, lambda: self.lbl_estado.configure(text=f"Guardando {total} cuentas..."))
+        try:
+            recuento = MaestroContableEmpresaService().cargar_subcuentas_a3(gestor, codigo, plan)
+            n = recuento["insertadas"] + recuento["actualizadas"] + recuento["sin_cambios"]
+        except Exception as exc:
+            self.after(0, lambda e=exc: (
+                self.destroy(),
+                messagebox.showerror("Gest2A3Eco", f"No se pudo importar el plan:\n{e}"),
+            ))
+            return
         self._n = n
+        self.after(0, lambda: (
+            self.pb.configure(value=total),
+            self.lbl_pct.configure(text="100 %"),
+        ))
         self.after(0, lambda: self._finalizar(n, ejercicio, digitos))
 
     def _finalizar(self, n, ejercicio, digitos):
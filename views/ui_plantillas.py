@@ -179,17 +179,7 @@ class SubcuentaPickerDialog(Dialog):
     def _load_cuentas(self):
         codigo = self.empresa.get("codigo")
         ejercicio = self.empresa.get("ejercicio")
-        seen = {}
-        for row in (self.gestor.get_plan_cuentas(codigo, ejercicio) or []):
-            cuenta = str(row.get("cuenta") or "").strip()
-            if cuenta:
-                seen[cuenta] = str(row.get("descripcion") or "").strip()
-        for row in (self.gestor.listar_maestro_subcuentas_empresa(codigo, activo=None) or []):
-            sub = str(row.get("subcuenta") or "").strip()
-            if sub:
-                nombre = str(row.get("nombre_subcuenta") or "").strip()
-                seen[sub] = nombre or seen.get(sub, "")
-        self._cuentas = sorted(seen.items(), key=lambda x: x[0])
+        self._cuentas = self.gestor.indice_cuentas(codigo, ejercicio).por_prefijo("")
 
     def _filter(self):
         texto = self.var_search.get().strip().lower()
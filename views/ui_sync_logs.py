@@ -23,6 +23,7 @@ class UISyncLogs(ttk.Frame):
         ("buzon",       "Buzon",              150, "w"),
         ("resultado",   "Resultado",           80, "center"),
         ("detectadas",  "Notif. detectadas",  110, "center"),
+        ("duracion",    "Duracion",            80, "center"),
         ("error",       "Error",              260, "w"),
     ]
 
@@ -159,6 +160,7 @@ class UISyncLogs(ttk.Frame):
             self._tv.insert("", tk.END, values=(
                 fecha_lbl, cliente, org, log.get("buzon_nombre") or "",
                 resultado, log.get("notificaciones_detectadas", 0),
+                _fmt_duracion(log.get("duracion_ms")),
                 log.get("error_detalle") or "",
             ), tags=(resultado,))
 
@@ -167,3 +169,9 @@ class UISyncLogs(ttk.Frame):
         ok = sum(1 for l in self._cache if l.get("resultado") == "OK")
         error = sum(1 for l in self._cache if l.get("resultado") == "ERROR")
         self._lbl_status.configure(text=f"Total: {len(self._cache)}  |  OK: {ok}  |  ERROR: {error}")
+
+
+def _fmt_duracion(ms) -> str:
+    if ms in (None, ""):
+        return ""
+    return f"{int(ms) / 1000:.1f} s"